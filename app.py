@@ -1,17 +1,36 @@
 import os
-import json
+import uuid
+import socket
 import logging
-import threading
-from flask import Flask, render_template, jsonify, request, session, send_from_directory
-from flask_socketio import SocketIO, emit
+import atexit
+from flask import Flask, Response, render_template, jsonify, request, session
+from flask_socketio import SocketIO, emit, join_room, leave_room
+from assets import GameAssetServer
+from catalog import GameCatalog, GAMES_JSON_PATH, ACTION_FIELDS
+from journal import EventJournal, JOURNAL_DIR
+from catalog_cache import CatalogResponseCache, negotiate_encoding
+from broadcast import UpdateBroadcaster, ALL_GAMES_ROOM, game_room
+from leaderboard import Leaderboards, LEADERBOARD_ROOM
+from presence import PresenceTracker
+from ingest import EventIngestor, BatchError, MAX_BATCH, IDEMPOTENCY_TTL
+from profiles import ProfileStore, PROFILES_DATABASE_URL
+from shared_state import create_shared_state, REDIS_SCHEMES
+from search import SearchIndex, DEFAULT_LIMIT
+from thumbnails import ThumbnailStore, THUMBNAILS_DIR
+from models import db, Game, DEFAULT_DATABASE_URL
+from metrics import (default_registry as metrics, install_queue_logging, instrument_flask, instrument_socketio,
+                     SamplingProfiler)
 
-# Setup logging
-logging.basicConfig(level=logging.DEBUG)
+# Setup logging: request threads only enqueue records, a background thread
+# formats and writes them. LOG_LEVEL=DEBUG brings back the per-event lines.
+log_listener = install_queue_logging(os.environ.get("LOG_LEVEL", "INFO").upper())
+atexit.register(log_listener.stop)
 logger = logging.getLogger(__name__)
 
 # Initialize Flask app
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "fluxion_secret_key")
+instrument_flask(app)  # latency histogram and counter per route
 
 @app.errorhandler(404)
 def page_not_found(e):
@@ -21,52 +40,192 @@ def page_not_found(e):
 def server_error(e):
     return render_template('maintenance.html'), 500
 
-# Direct route to serve files from the games folder
+# Game files are served pre-compressed, range-aware and with content-hash ETags
+game_assets = GameAssetServer('games')
+game_assets.build_in_background()
+
 @app.route('/games/<path:filename>')
 def serve_game_file(filename):
     """Serve files directly from the games folder"""
-    return send_from_directory('games', filename)
+    return game_assets.send(filename)
+
+# Running several workers: SHARED_STATE_URL moves connection counts, machine
+# IDs and active players out of the process (sqlite:///path for workers on one
+# host, redis://... across hosts) and SOCKETIO_MESSAGE_QUEUE relays emits to
+# clients connected to the other workers (defaults to a redis:// state URL)
+SHARED_STATE_URL = os.environ.get("SHARED_STATE_URL", "")
+SOCKETIO_MESSAGE_QUEUE = os.environ.get("SOCKETIO_MESSAGE_QUEUE") or (
+    SHARED_STATE_URL if SHARED_STATE_URL.startswith(REDIS_SCHEMES) else None)
 
 # Initialize SocketIO with a simpler configuration
-socketio = SocketIO(app, cors_allowed_origins="*")
+socketio = SocketIO(app, cors_allowed_origins="*", message_queue=SOCKETIO_MESSAGE_QUEUE)
+instrument_socketio(socketio)  # every @socketio.on handler below is timed per event
 
-# Global variables
-connected_users = 0
-games_data = {}
-active_players = {}  # Track {session_id: {machine_id: str, game: str}}
-user_profiles = {}  # Track {machine_id: {likes: [], favorites: [], played: []}}
-machine_counter = 0  # Counter for generating unique machine IDs
+# Connection counts per worker ('connections'), machine_N numbering
+# ('machine_counter'), {session_id: {machine_id, game, since}} ('active_players'),
+# players per game ('presence_counts') and claimed batch event ids ('event_keys')
+shared_state = create_shared_state(SHARED_STATE_URL)
+worker_id = f"{socket.gethostname()}:{os.getpid()}"
 
-# Lock for thread-safe operations on the games data
-data_lock = threading.Lock()
+# Player sessions: joined on 'play', kept alive by 'presence_heartbeat', expired
+# after PRESENCE_TTL seconds without one; count changes are pushed at most once
+# per PRESENCE_PUSH_INTERVAL
+presence = PresenceTracker(
+    shared_state, socketio,
+    ttl=float(os.environ.get("PRESENCE_TTL", "60")),
+    push_interval=float(os.environ.get("PRESENCE_PUSH_INTERVAL", "1")),
+)
 
-def load_games_data():
-    """Load games data from JSON file"""
-    try:
-        with open('games/games.json', 'r') as f:
-            data = json.load(f)
-            return data
-    except FileNotFoundError:
-        logger.error("games.json file not found")
-        # Create a default structure if the file doesn't exist
-        return {"games": {}}
-    except json.JSONDecodeError:
-        logger.error("Error decoding games.json")
-        return {"games": {}}
-
-def save_games_data():
-    """Save games data to JSON file"""
+# Played/liked/favorited games per machine: bitsets in a bounded LRU, persisted to SQLite
+user_profiles = ProfileStore(
+    os.environ.get("PROFILES_DATABASE_URL", PROFILES_DATABASE_URL),
+    max_profiles=int(os.environ.get("PROFILES_MAX_RESIDENT", "50000")),
+    idle_ttl=float(os.environ.get("PROFILES_IDLE_TTL", "3600")),
+    flush_interval=float(os.environ.get("PROFILES_FLUSH_INTERVAL", "5")),
+    shared=bool(SHARED_STATE_URL),
+)
+user_profiles.start()
+atexit.register(user_profiles.close)
+# New machine IDs continue after the persisted ones so they do not reuse old profiles
+shared_state.set_max('machine_counter', user_profiles.highest_machine_number())
+
+def release_worker_state():
+    """Drop this worker's connections and players from the shared state on shutdown"""
     try:
-        with open('games/games.json', 'w') as f:
-            json.dump(games_data, f, indent=2)
-        logger.debug("Games data saved successfully")
-        return True
-    except Exception as e:
-        logger.error(f"Error saving games data: {e}")
-        return False
+        shared_state.hdel('connections', worker_id)
+        presence.release()
+    finally:
+        shared_state.close()
+
+atexit.register(release_worker_state)
+
+def user_count():
+    return sum(shared_state.hgetall('connections').values())
+
+# CATALOG_BACKEND=sql serves the catalog from DATABASE_URL (migrated from
+# games.json on first start) instead of games.json
+CATALOG_BACKEND = os.environ.get("CATALOG_BACKEND", "json")
+flush_interval = float(os.environ.get("CATALOG_FLUSH_INTERVAL", "5"))
+flush_threshold = int(os.environ.get("CATALOG_FLUSH_THRESHOLD", "100"))
+
+if CATALOG_BACKEND == "sql":
+    from sqlalchemy.exc import OperationalError
+    from catalog_sql import SQLCatalog
+    from migrations import migrate_games_from_json
+
+    app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", DEFAULT_DATABASE_URL)
+    db.init_app(app)
+    with app.app_context():
+        try:
+            db.create_all()
+        except OperationalError:
+            db.create_all()  # another worker created the tables first
+        if db.session.query(Game.id).first() is None and os.path.exists(GAMES_JSON_PATH):
+            migrate_games_from_json(db.engine, GAMES_JSON_PATH)
+        # Counter increments are atomic UPDATEs in the database, the durable record in this mode
+        journal = None
+        catalog = SQLCatalog(db.engine, flush_interval=flush_interval, flush_threshold=flush_threshold)
+else:
+    if SHARED_STATE_URL:
+        logger.warning("games.json and the event journal belong to one process; "
+                       "use CATALOG_BACKEND=sql when running several workers")
+    # Every play/like/favorite is appended to an event log (batched fsync) that
+    # counters are rebuilt from on startup; games.json is rewritten behind it
+    journal = EventJournal(
+        os.environ.get("JOURNAL_DIR", JOURNAL_DIR),
+        fsync_interval=float(os.environ.get("JOURNAL_FSYNC_INTERVAL", "0.05")),
+        snapshot_every=int(os.environ.get("JOURNAL_SNAPSHOT_EVERY", "100000")),
+        retain_segments=os.environ.get("JOURNAL_RETAIN_SEGMENTS", "") == "1",
+    )
+
+    # Load games data once on startup; counters are sharded and flushed in the background
+    catalog = GameCatalog(
+        GAMES_JSON_PATH,
+        flush_interval=flush_interval,
+        flush_threshold=flush_threshold,
+        journal=journal,
+    )
+
+catalog.start()
+atexit.register(catalog.close)
+
+# Remote thumbnails are fetched once, resized to WebP/PNG variants and served
+# from /thumbs/; the catalog API points at them once they are ready. Fetching
+# starts with the first request, so importing the app makes no outbound calls
+thumbnails = ThumbnailStore(
+    os.environ.get("THUMBNAILS_DIR", THUMBNAILS_DIR),
+    workers=int(os.environ.get("THUMBNAIL_WORKERS", "2")),
+)
+atexit.register(thumbnails.close)
+thumbnails_started = False
+
+@app.before_request
+def start_thumbnails():
+    global thumbnails_started
+    if not thumbnails_started:
+        thumbnails_started = True
+        if thumbnails.start():
+            thumbnails.ingest_catalog(catalog.games())
+
+# Batched actions from /api/games/events and 'game_actions', applied once per client key
+ingestor = EventIngestor(
+    catalog, user_profiles, shared_state,
+    ttl=float(os.environ.get("EVENTS_IDEMPOTENCY_TTL", str(IDEMPOTENCY_TTL))),
+    max_batch=int(os.environ.get("EVENTS_MAX_BATCH", str(MAX_BATCH))),
+)
+
+catalog_cache = CatalogResponseCache(catalog, thumbnails=thumbnails, assets=game_assets)
+search_index = SearchIndex(catalog)
+
+# Counter changes reach clients as one batched 'game_updates' emit per tick
+broadcaster = UpdateBroadcaster(
+    socketio, catalog,
+    interval=float(os.environ.get("BROADCAST_INTERVAL", "0.2")),
+)
+# All-time and trending top games, updated from the same per-tick deltas
+leaderboards = Leaderboards(
+    catalog, socketio,
+    k=int(os.environ.get("LEADERBOARD_SIZE", "100")),
+    push_n=int(os.environ.get("LEADERBOARD_PUSH_SIZE", "10")),
+)
+broadcaster.add_listener(leaderboards.on_deltas)
+broadcaster.add_listener(presence.tick)  # heartbeat expiry and throttled count pushes
+broadcaster.start()
 
-# Load games data on startup
-games_data = load_games_data()
+metrics.gauge('connected_users', user_count)
+metrics.gauge('catalog_version', catalog.version)
+metrics.gauge('profiles_resident', lambda: len(user_profiles))
+metrics.gauge('presence_sessions', lambda: len(presence))
+
+# PROFILER_ENABLED=1 allows starting a sampling profiler through /metrics/profile
+profiler = SamplingProfiler(interval=float(os.environ.get("PROFILER_INTERVAL", "0.005"))) \
+    if os.environ.get("PROFILER_ENABLED") == "1" else None
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Counters, latency histograms and gauges in the Prometheus text format"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/metrics/profile', methods=['GET', 'POST'])
+def profile_endpoint():
+    """POST ``?action=start|stop`` toggles the sampling profiler; GET returns collapsed stacks"""
+    if profiler is None:
+        return jsonify({"error": "profiler disabled (set PROFILER_ENABLED=1)"}), 404
+    if request.method == 'POST':
+        action = request.args.get('action')
+        if action == 'start':
+            profiler.start()
+        elif action == 'stop':
+            profiler.stop()
+        else:
+            return jsonify({"error": "action must be start or stop"}), 400
+        return jsonify({"running": profiler.running, "samples": sum(profiler.samples.values())})
+    return Response(profiler.collapsed(), mimetype='text/plain')
+
+@app.route('/thumbs/<name>')
+def serve_thumbnail(name):
+    """Resized catalog thumbnail, ``<content hash>-<width>x<height>``"""
+    return thumbnails.send(name)
 
 @app.route('/')
 def index():
@@ -75,14 +234,40 @@ def index():
 
 @app.route('/active-players')
 def active_players_page():
-    """Show currently active players"""
-    return render_template('active_players.html', players=active_players)
+    """Show currently active players, one page at a time
+
+    ``?limit=`` (max 500) and ``?cursor=`` (the ``next_cursor`` of the previous
+    page); JSON for ``?format=json`` or an ``Accept: application/json`` request.
+    """
+    try:
+        limit = max(1, min(int(request.args.get('limit', 60)), 500))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    try:
+        players, next_cursor = presence.players(request.args.get('cursor') or None, limit)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    counts = presence.counts()
+    if request.args.get('format') == 'json' or \
+            request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json':
+        return jsonify({"players": players, "next_cursor": next_cursor,
+                        "total": sum(counts.values()), "games": counts})
+    return render_template('active_players.html', players=players, next_cursor=next_cursor,
+                           limit=limit, counts=counts, total=sum(counts.values()))
+
+@app.route('/api/presence', methods=['GET'])
+def presence_counts():
+    """Players in each game right now; ``?game=`` for one (0 when nobody plays it)"""
+    game_name = request.args.get('game')
+    if game_name:
+        return jsonify({"games": presence.counts([game_name])})
+    return jsonify({"games": presence.counts()})
 
 @app.route('/profile/<machine_id>')
 def user_profile(machine_id):
     """Show user profile for given machine ID"""
-    profile = user_profiles.get(machine_id, {'likes': [], 'favorites': [], 'played': []})
-    return render_template('profile.html', machine_id=machine_id, profile=profile, games=games_data['games'])
+    profile = user_profiles.get(machine_id)
+    return render_template('profile.html', machine_id=machine_id, profile=profile, games=catalog.games())
 
 @app.route('/test')
 def test_route():
@@ -91,12 +276,86 @@ def test_route():
 
 @app.route('/api/games', methods=['GET'])
 def get_games():
-    """API endpoint to get all games"""
-    global games_data
-    
-    with data_lock:
-        games_data = load_games_data()
-        return jsonify(games_data)
+    """API endpoint to get all games
+
+    Serves a cached, pre-compressed body with an ETag derived from the catalog
+    version (304 on If-None-Match). ``?since=<version>`` returns only the games
+    changed since that version when it is still known.
+    """
+    since = request.args.get('since')
+    if since:
+        bodies = catalog_cache.delta(since)
+        if bodies is not None:
+            encoding = negotiate_encoding(request.accept_encodings, bodies)
+            return _catalog_response(bodies[encoding], encoding)
+
+    rendition = catalog_cache.current()
+    for encoding in rendition.bodies:
+        if request.if_none_match.contains_weak(rendition.etag_for(encoding)):
+            response = Response(status=304)
+            response.set_etag(rendition.etag_for(encoding))
+            response.headers['Cache-Control'] = 'no-cache'
+            response.headers['Vary'] = 'Accept-Encoding'
+            return response
+
+    encoding = negotiate_encoding(request.accept_encodings, rendition.bodies)
+    response = _catalog_response(rendition.bodies[encoding], encoding)
+    response.set_etag(rendition.etag_for(encoding))
+    response.headers['Last-Modified'] = rendition.last_modified
+    return response
+
+def _catalog_response(body, encoding):
+    response = Response(body, mimetype='application/json')
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+@app.route('/api/games/search', methods=['GET'])
+def search_games():
+    """Search the catalog server-side
+
+    ``?tags=a,b`` (games with all of them), ``?q=`` (name contains, or a word
+    starts with it for one or two characters), ``?sort=plays|likes|favorites|name``,
+    ``?limit=`` and ``?cursor=`` (the ``next_cursor`` of the previous page).
+    """
+    tags = [tag.strip() for tag in request.args.get('tags', '').split(',') if tag.strip()]
+    try:
+        limit = int(request.args.get('limit', DEFAULT_LIMIT))
+        names, total, next_cursor = search_index.search(
+            tags=tags,
+            query=request.args.get('q', ''),
+            sort=request.args.get('sort', 'plays'),
+            limit=limit,
+            cursor=request.args.get('cursor'),
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    games = []
+    for name in names:
+        entry = catalog.get(name)
+        if entry is not None:
+            games.append(dict(game_assets.rewrite(thumbnails.rewrite(entry)), Name=name))
+    return jsonify({"games": games, "total": total, "next_cursor": next_cursor})
+
+@app.route('/api/games/tags', methods=['GET'])
+def game_tags_counts():
+    """Every tag with the number of games carrying it"""
+    return jsonify({"tags": search_index.tag_counts()})
+
+@app.route('/api/games/top', methods=['GET'])
+def top_games():
+    """Top games: ``?field=plays|likes|favorites``, ``?window=all|1h|24h``, ``?n=``, ``?trending=1``"""
+    field = request.args.get('field', 'plays')
+    window = request.args.get('window', 'all')
+    trending = request.args.get('trending') in ('1', 'true')
+    try:
+        ranking = leaderboards.top(field, window, int(request.args.get('n', 10)), trending=trending)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"field": field, "window": window, "trending": trending,
+                    "games": [{"name": name, "score": score} for name, score in ranking]})
 
 @app.route('/api/games/update', methods=['POST'])
 def update_game():
@@ -108,70 +367,59 @@ def update_game():
     if not game_name or not action:
         return jsonify({"error": "Invalid request - missing game or action"}), 400
     
-    with data_lock:
-        # Reload data to ensure we have the latest
-        global games_data
-        games_data = load_games_data()
-        
-        # Validate game exists
-        if game_name not in games_data['games']:
-            return jsonify({"error": f"Invalid game name: {game_name}"}), 400
-        
-        # Process action
-        if action == 'play':
-            games_data['games'][game_name]['Plays'] += 1
-        elif action == 'like':
-            games_data['games'][game_name]['Likes'] += 1
-        elif action == 'favorite':
-            games_data['games'][game_name]['Favorites'] += 1
-        else:
-            return jsonify({"error": f"Invalid action: {action}"}), 400
-        
-        # Save updated data
-        success = save_games_data()
-        
-        if not success:
-            return jsonify({"error": "Failed to save game data"}), 500
-        
-        try:
-            # Emit update to all clients
-            socketio.emit('game_update', {
-                'game': game_name,
-                'action': action,
-                'data': games_data['games'][game_name]
-            })
-        except Exception as e:
-            logger.error(f"Error emitting Socket.IO event: {e}")
+    # Process action
+    field = ACTION_FIELDS.get(action)
+    if field is None:
+        return jsonify({"error": f"Invalid action: {action}"}), 400
     
+    if not catalog.increment(game_name, field):
+        return jsonify({"error": f"Invalid game name: {game_name}"}), 400
+    
+    # Clients are notified by the broadcaster's next batched tick
     return jsonify({"success": True, "message": f"Updated {action} for {game_name}"})
 
+def event_client(data):
+    """Scope for a batch's idempotency keys: its "client" id, else this browser session's"""
+    if isinstance(data, dict) and data.get('client') is not None:
+        return data['client']
+    if 'client_id' not in session:
+        session['client_id'] = uuid.uuid4().hex
+    return session['client_id']
+
+@app.route('/api/games/events', methods=['POST'])
+def ingest_game_events():
+    """Apply a batch of actions: {"client": id, "events": [{"id", "game", "action"}, ...]}"""
+    data = request.get_json(silent=True)
+    events = data.get('events') if isinstance(data, dict) else data
+    try:
+        result = ingestor.ingest(events, event_client(data), machine_id=session.get('machine_id'))
+    except BatchError as e:
+        return jsonify({"error": str(e), "errors": e.errors}), 400
+    return jsonify({"success": True, "accepted": len(result['accepted']), "duplicates": result['duplicates']})
+
 # Socket.IO event handlers
 @socketio.on('connect')
 def handle_connect():
     """Handle client connection"""
-    global connected_users, machine_counter
     try:
-        with data_lock:
-            connected_users += 1
-            machine_counter += 1
-            machine_id = f"machine_{machine_counter}"
-            session['machine_id'] = machine_id
-            emit('user_count', {'count': connected_users}, broadcast=True)
-            logger.debug(f"Client connected. Machine ID: {machine_id}, Total users: {connected_users}")
+        shared_state.hincr('connections', worker_id)
+        machine_id = f"machine_{shared_state.incr('machine_counter')}"
+        session['machine_id'] = machine_id
+        connected_users = user_count()
+        emit('user_count', {'count': connected_users}, broadcast=True)
+        logger.debug("Client connected. Machine ID: %s, Total users: %s", machine_id, connected_users)
     except Exception as e:
         logger.error(f"Error in handle_connect: {e}")
 
 @socketio.on('disconnect')
 def handle_disconnect():
     """Handle client disconnection"""
-    global connected_users
     try:
-        with data_lock:
-            connected_users = max(0, connected_users - 1)  # Ensure we don't go negative
-            if request.sid in active_players:
-                del active_players[request.sid]
-            emit('user_count', {'count': connected_users}, broadcast=True)
-            logger.debug(f"Client disconnected. Total users: {connected_users}")
+        shared_state.hincr('connections', worker_id, -1)
+        presence.leave(request.sid)
+        connected_users = max(0, user_count())  # Ensure we don't go negative
+        emit('user_count', {'count': connected_users}, broadcast=True)
+        logger.debug("Client disconnected. Total users: %s", connected_users)
     except Exception as e:
         logger.error(f"Error in handle_disconnect: {e}")
 
@@ -182,64 +430,98 @@ def handle_game_action(data):
         game_name = data.get('game')
         action = data.get('action')
         
-        if action == 'play':
-            active_players[request.sid] = {
-                'machine_id': session.get('machine_id', 'unknown'),
-                'game': game_name
-            }
-        
         if not game_name or not action:
             logger.warning(f"Invalid game action: {data}")
             return
         
-        with data_lock:
-            # Reload data to ensure we have the latest
-            global games_data
-            games_data = load_games_data()
-            
-            # Validate game exists
-            if game_name not in games_data['games']:
-                logger.warning(f"Game not found: {game_name}")
-                return
-            
-            # Process action and update user profile
-            machine_id = session.get('machine_id', 'unknown')
-            if machine_id not in user_profiles:
-                user_profiles[machine_id] = {'likes': [], 'favorites': [], 'played': []}
-
-            if action == 'play':
-                games_data['games'][game_name]['Plays'] += 1
-                if game_name not in user_profiles[machine_id]['played']:
-                    user_profiles[machine_id]['played'].append(game_name)
-            elif action == 'like':
-                games_data['games'][game_name]['Likes'] += 1
-                if game_name not in user_profiles[machine_id]['likes']:
-                    user_profiles[machine_id]['likes'].append(game_name)
-            elif action == 'favorite':
-                games_data['games'][game_name]['Favorites'] += 1
-                if game_name not in user_profiles[machine_id]['favorites']:
-                    user_profiles[machine_id]['favorites'].append(game_name)
-            else:
-                logger.warning(f"Invalid action: {action}")
-                return
-            
-            # Save updated data
-            success = save_games_data()
-            
-            if not success:
-                logger.error(f"Failed to save games data after {action} for {game_name}")
-                return
-            
-            logger.debug(f"Game action processed in JSON: {action} for {game_name}")
-            
-            # Emit update to all clients
-            emit('game_update', {
-                'game': game_name,
-                'action': action,
-                'data': games_data['games'][game_name]
-            }, broadcast=True)
+        field = ACTION_FIELDS.get(action)
+        if field is None:
+            logger.warning(f"Invalid action: {action}")
+            return
+        
+        machine_id = session.get('machine_id', 'unknown')
+        if not catalog.increment(game_name, field, machine_id=machine_id):
+            logger.warning(f"Game not found: {game_name}")
+            return
+        
+        # Playing puts this session in the game's presence; any action keeps it alive
+        if action == 'play':
+            presence.join(request.sid, machine_id, game_name)
+        else:
+            presence.heartbeat(request.sid)
+
+        # Update user profile
+        user_profiles.record(machine_id, action, game_name)
+        
+        logger.debug("Game action processed in memory: %s for %s", action, game_name)
     except Exception as e:
         logger.error(f"Error in handle_game_action: {e}")
 
+@socketio.on('game_actions')
+def handle_game_actions(data):
+    """Batched game_action: {'events': [...]} as for /api/games/events, acknowledged with the result"""
+    events = data.get('events') if isinstance(data, dict) else data
+    machine_id = session.get('machine_id', 'unknown')
+    # A reconnect gets a new machine ID, so resent batches name their client
+    client = data.get('client') if isinstance(data, dict) and data.get('client') is not None else machine_id
+    try:
+        result = ingestor.ingest(events, client, machine_id=machine_id)
+    except BatchError as e:
+        logger.warning(f"Invalid game_actions batch: {e.errors[:5]}")
+        return {"success": False, "error": str(e), "errors": e.errors}
+    except Exception as e:
+        logger.error(f"Error in handle_game_actions: {e}")
+        # Nothing was applied and the ids were released: the same batch can be sent again
+        return {"success": False, "error": "Could not apply the batch", "retry": True}
+    plays = [game_name for action, game_name in result['accepted'] if action == 'play']
+    if plays:
+        presence.join(request.sid, machine_id, plays[-1])
+    elif result['accepted']:
+        presence.heartbeat(request.sid)
+    return {"success": True, "accepted": len(result['accepted']), "duplicates": result['duplicates']}
+
+@socketio.on('presence_heartbeat')
+def handle_presence_heartbeat(data=None):
+    """Keep the player's session alive; ``{'game': name}`` rejoins it after a reconnect or expiry"""
+    if presence.heartbeat(request.sid):
+        return
+    game_name = (data or {}).get('game')
+    if game_name and game_name in catalog:
+        presence.join(request.sid, session.get('machine_id', 'unknown'), game_name)
+
+@socketio.on('leave_game')
+def handle_leave_game(data=None):
+    """The player closed the game"""
+    presence.leave(request.sid)
+
+@socketio.on('subscribe_games')
+def handle_subscribe_games(data):
+    """Join update rooms: {'all': true} for every game or {'games': [...]} for a few"""
+    data = data or {}
+    if data.get('all'):
+        join_room(ALL_GAMES_ROOM)
+    for game_name in data.get('games') or []:
+        if game_name in catalog:
+            join_room(game_room(game_name))
+
+@socketio.on('subscribe_leaderboards')
+def handle_subscribe_leaderboards(data=None):
+    """Join the leaderboard room and get every board once; later emits carry only changed boards"""
+    join_room(LEADERBOARD_ROOM)
+    emit('leaderboard_updates', leaderboards.snapshot())
+
+@socketio.on('unsubscribe_leaderboards')
+def handle_unsubscribe_leaderboards(data=None):
+    leave_room(LEADERBOARD_ROOM)
+
+@socketio.on('unsubscribe_games')
+def handle_unsubscribe_games(data):
+    """Leave update rooms joined with subscribe_games"""
+    data = data or {}
+    if data.get('all'):
+        leave_room(ALL_GAMES_ROOM)
+    for game_name in data.get('games') or []:
+        leave_room(game_room(game_name))
+
 if __name__ == '__main__':
     socketio.run(app, host='0.0.0.0', port=5000, debug=True)
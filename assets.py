@@ -0,0 +1,210 @@
+import os
+import re
+import gzip
+import hashlib
+import logging
+import mimetypes
+import tempfile
+import threading
+
+from flask import abort, request, send_file
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # optional: only .gz siblings are built without it
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Extensions worth pre-compressing; media formats are already compressed
+COMPRESSIBLE_EXTENSIONS = ('.html', '.htm', '.js', '.mjs', '.css', '.json', '.svg', '.txt', '.wasm', '.xml')
+# Sibling suffix for each content-coding, in order of preference
+ENCODING_SUFFIXES = (('br', '.br'), ('gzip', '.gz'))
+
+# Length of the content-hash prefix in ``?v=`` URLs and sibling names
+VERSION_LENGTH = 16
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+
+def _write_atomic(path, data):
+    fd, tmp_path = tempfile.mkstemp(prefix='.asset-', suffix='.tmp', dir=os.path.dirname(path) or '.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class GameAssetServer:
+    """Serves large single-file games with pre-compressed siblings.
+
+    ``build()`` writes ``<file>.<hash>.gz`` (and ``.br`` when the optional
+    brotli package is installed) next to every compressible file, named
+    after the first ``VERSION_LENGTH`` hex digits of the source's sha256, so
+    a sibling can only ever be served for the content it was built from.
+    ``send()`` picks the best sibling for the request's Accept-Encoding,
+    tags it with a content-hash ETag and hands the file to werkzeug's
+    ``send_file``, which answers conditional and Range requests and streams
+    through the server's ``wsgi.file_wrapper`` (sendfile where available)
+    instead of reading the game into Python buffers.
+
+    ``rewrite_games`` adds ``?v=<hash>`` to catalog ``Location``s; requests
+    carrying the current hash are cached as immutable.
+    """
+
+    def __init__(self, root='games', min_size=1024):
+        self.root = root
+        self.min_size = min_size
+        self._hashes = {}  # {path: (mtime_ns, size, sha256 hex)}
+        self._builder = None
+
+    # -- pre-compression ------------------------------------------------
+
+    def _sources(self):
+        for dirpath, _dirnames, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.startswith('.') or not filename.endswith(COMPRESSIBLE_EXTENSIONS):
+                    continue
+                yield os.path.join(dirpath, filename)
+
+    def _sibling(self, source, digest, suffix):
+        return f'{source}.{digest[:VERSION_LENGTH]}{suffix}'
+
+    def _remove_stale_siblings(self, source, digest):
+        """Delete siblings built from older contents of ``source`` (and unversioned ones)"""
+        directory, name = os.path.split(source)
+        pattern = re.compile(re.escape(name) + r'(\.[0-9a-f]{%d})?(\.gz|\.br)$' % VERSION_LENGTH)
+        current = {os.path.basename(self._sibling(source, digest, suffix)) for _, suffix in ENCODING_SUFFIXES}
+        for entry in os.listdir(directory or '.'):
+            if entry not in current and pattern.fullmatch(entry):
+                try:
+                    os.unlink(os.path.join(directory, entry))
+                except OSError:
+                    pass
+
+    def build(self):
+        """Create or refresh .gz/.br siblings; returns the number of files written"""
+        written = 0
+        for source in self._sources():
+            if os.path.getsize(source) < self.min_size:
+                continue
+            digest = self.content_hash(source)
+            self._remove_stale_siblings(source, digest)
+            raw = None
+            for encoding, suffix in ENCODING_SUFFIXES:
+                if encoding == 'br' and brotli is None:
+                    continue
+                sibling = self._sibling(source, digest, suffix)
+                if os.path.exists(sibling):
+                    continue
+                if raw is None:
+                    with open(source, 'rb') as f:
+                        raw = f.read()
+                    if hashlib.sha256(raw).hexdigest() != digest:
+                        break  # changed while building; the next build picks it up
+                if encoding == 'br':
+                    data = brotli.compress(raw, quality=11)
+                else:
+                    data = gzip.compress(raw, compresslevel=9, mtime=0)
+                _write_atomic(sibling, data)
+                written += 1
+                logger.debug(f"Pre-compressed {source} -> {sibling} ({len(raw)} -> {len(data)} bytes)")
+        return written
+
+    def build_in_background(self):
+        """Run ``build()`` on a daemon thread so startup isn't delayed"""
+        if self._builder is not None and self._builder.is_alive():
+            return self._builder
+
+        def run():
+            try:
+                count = self.build()
+                logger.info(f"Pre-compressed {count} game asset variants")
+            except Exception as e:
+                logger.error(f"Error pre-compressing game assets: {e}")
+
+        self._builder = threading.Thread(target=run, name='asset-builder', daemon=True)
+        self._builder.start()
+        return self._builder
+
+    # -- hashing --------------------------------------------------------
+
+    def content_hash(self, path):
+        """sha256 of a file, cached until its mtime or size change"""
+        st = os.stat(path)
+        cached = self._hashes.get(path)
+        if cached is not None and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            return cached[2]
+        with open(path, 'rb') as f:
+            digest = hashlib.file_digest(f, 'sha256').hexdigest()
+        self._hashes[path] = (st.st_mtime_ns, st.st_size, digest)
+        return digest
+
+    def url_version(self, filename):
+        """Short content hash to append as ``?v=`` for immutable caching, or None"""
+        path = safe_join(self.root, filename)
+        if path is None or not os.path.isfile(path):
+            return None
+        return self.content_hash(path)[:VERSION_LENGTH]
+
+    def rewrite(self, game):
+        """Copy of a catalog entry whose ``Location`` carries ``?v=<content hash>``"""
+        location = game.get('Location')
+        if not location or '?' in location:
+            return game
+        version = self.url_version(location)
+        if version is None:
+            return game
+        return dict(game, Location=f'{location}?v={version}')
+
+    def rewrite_games(self, games):
+        return {name: self.rewrite(game) for name, game in games.items()}
+
+    # -- serving --------------------------------------------------------
+
+    def _pick_variant(self, path, digest):
+        """Return (path to send, content-coding) for the current request"""
+        accept = request.accept_encodings
+        for encoding, suffix in ENCODING_SUFFIXES:
+            if not accept[encoding]:
+                continue
+            sibling = self._sibling(path, digest, suffix)
+            if os.path.isfile(sibling):
+                return sibling, encoding
+        return path, None
+
+    def send(self, filename):
+        """Flask response for ``filename`` under the asset root"""
+        path = safe_join(self.root, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+
+        digest = self.content_hash(path)
+        variant, encoding = self._pick_variant(path, digest)
+        etag = digest if encoding is None else f'{digest}-{encoding}'
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+        response = send_file(variant, mimetype=mimetype, etag=etag, conditional=True, max_age=None)
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Accept-Ranges'] = 'bytes'
+        # Only a URL pinned to this exact content may be cached forever
+        if request.args.get('v') == digest[:VERSION_LENGTH]:
+            response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        else:
+            response.headers['Cache-Control'] = REVALIDATE_CACHE_CONTROL
+        return response
+
+
+if __name__ == '__main__':
+    # Offline build step: python assets.py [root]
+    import sys
+    logging.basicConfig(level=logging.DEBUG)
+    server = GameAssetServer(sys.argv[1] if len(sys.argv) > 1 else 'games')
+    print(f"Wrote {server.build()} pre-compressed files")
@@ -0,0 +1,91 @@
+"""Increments/sec for the sharded counter vs. a single global lock.
+
+Run from the repository root:
+
+    python benchmarks/bench_counters.py --threads 1 2 4 8 16
+
+Flask-SocketIO runs handlers on one thread per client event in its default
+``threading`` async mode, so each worker thread here stands in for a
+concurrent ``game_action`` handler bumping a game counter.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from counters import ShardedCounter  # noqa: E402
+
+GAMES = [f"game_{i}" for i in range(50)]
+FIELDS = ('Plays', 'Likes', 'Favorites')
+
+
+class LockedCounter:
+    """The previous scheme: one dict behind one process-wide lock"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def add(self, key, amount=1):
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts)
+
+
+def run(counter, threads, increments):
+    keys = [(game, field) for game in GAMES for field in FIELDS]
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(offset):
+        add = counter.add
+        n = len(keys)
+        barrier.wait()
+        for i in range(increments):
+            add(keys[(i + offset) % n])
+
+    pool = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    for t in pool:
+        t.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    total = sum(counter.snapshot().values())
+    assert total == threads * increments, (total, threads * increments)
+    return threads * increments / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--increments', type=int, default=200_000,
+                        help='increments per thread')
+    args = parser.parse_args()
+
+    results = []
+    for threads in args.threads:
+        locked = run(LockedCounter(), threads, args.increments)
+        sharded = run(ShardedCounter(), threads, args.increments)
+        results.append({
+            'threads': threads,
+            'locked_ops_per_sec': round(locked),
+            'sharded_ops_per_sec': round(sharded),
+            'speedup': round(sharded / locked, 2),
+        })
+        print(f"{threads:>3} threads  locked {locked:>12,.0f}/s  "
+              f"sharded {sharded:>12,.0f}/s  x{sharded / locked:.2f}", file=sys.stderr)
+
+    print(json.dumps({'benchmark': 'counters', 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
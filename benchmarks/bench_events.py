@@ -0,0 +1,198 @@
+"""Batched game actions: /api/games/events and 'game_actions' vs one message per action.
+
+Run from the repository root:
+
+    python benchmarks/bench_events.py --events 20000 --batch 50
+
+Through app.py with a SQL catalog in a temporary directory, the script
+first checks the batch path: counters and profiles move by exactly the
+accepted events, a batch resent by the same client is all duplicates and changes
+nothing while another client's equal ids are not, a key repeated inside a
+batch counts once, a batch with one bad event is
+rejected whole (its keys stay unclaimed), and oversized batches are
+refused. It then sends seeded streams of ``--events`` actions
+per event (POST /api/games/update, 'game_action') and in batches of
+``--batch`` (POST /api/games/events, 'game_actions'), checks the catalog
+totals after each run and reports events/sec, plus the in-process cost
+per event of EventIngestor vs catalog.increment + profiles.record.
+
+``--shared-state-url`` keeps idempotency keys in sqlite:///path or
+redis://... instead of the in-process state.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import atexit
+import random
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.standin import REPO_ROOT  # noqa: E402
+
+ACTIONS = ('play', 'like', 'favorite')
+ACTION_WEIGHTS = (8, 3, 1)
+
+
+def totals(app_module):
+    games, _ = app_module.catalog.games_with_totals()
+    return {(name, field): game.get(field, 0) for name, game in games.items()
+            for field in app_module.ACTION_FIELDS.values()}
+
+
+def expected(before, events, fields):
+    after = dict(before)
+    for event in events:
+        key = (event['game'], fields[event['action']])
+        after[key] += 1
+    return after
+
+
+def events_for(rng, games, count):
+    return [{'id': uuid.UUID(int=rng.getrandbits(128)).hex, 'game': rng.choice(games),
+             'action': rng.choices(ACTIONS, ACTION_WEIGHTS)[0]} for _ in range(count)]
+
+
+def check(app_module, rng, games):
+    fields = app_module.ACTION_FIELDS
+    http = app_module.app.test_client()
+    socket = app_module.socketio.test_client(app_module.app)
+    machine_id = f"machine_{app_module.shared_state.incr('machine_counter', 0)}"  # the one it was just given
+
+    batch = events_for(rng, games, 40)
+    before = totals(app_module)
+    resp = http.post('/api/games/events', json={'client': 'bench', 'events': batch})
+    assert resp.status_code == 200 and resp.get_json()['accepted'] == 40, resp.get_json()
+    assert totals(app_module) == expected(before, batch, fields)
+    # A retry of the same batch by the same client, over either transport, changes nothing
+    for again in (http.post('/api/games/events', json={'client': 'bench', 'events': batch}).get_json(),
+                  socket.emit('game_actions', {'client': 'bench', 'events': batch}, callback=True)):
+        assert again['success'] and again['accepted'] == 0 and again['duplicates'] == [e['id'] for e in batch]
+    assert totals(app_module) == expected(before, batch, fields)
+    # The same ids from another client (the HTTP session's own id here) are not duplicates
+    assert http.post('/api/games/events', json={'events': batch}).get_json()['accepted'] == 40
+    before = totals(app_module)
+
+    # One bad event rejects the batch; the same ids go through once it is fixed
+    before = totals(app_module)
+    batch = events_for(rng, games, 10)
+    broken = [dict(event) for event in batch]
+    broken[3]['game'] = 'no such game'
+    broken[7]['action'] = 'dislike'
+    resp = http.post('/api/games/events', json={'events': broken})
+    assert resp.status_code == 400 and [e['index'] for e in resp.get_json()['errors']] == [3, 7]
+    assert totals(app_module) == before
+    assert http.post('/api/games/events', json={'events': batch}).get_json()['accepted'] == 10
+    assert totals(app_module) == expected(before, batch, fields)
+    assert http.post('/api/games/events', json=batch).status_code == 200  # a bare list is accepted too
+    too_many = events_for(rng, games, app_module.ingestor.max_batch + 1)
+    assert http.post('/api/games/events', json={'events': too_many}).status_code == 400
+    assert http.post('/api/games/events', json={'events': 'nope'}).status_code == 400
+
+    # Socket.IO: profile and presence follow the batch; a repeated key counts once
+    before = totals(app_module)
+    batch = [{'id': 'k1', 'game': games[0], 'action': 'play'}, {'id': 'k1', 'game': games[0], 'action': 'play'},
+             {'id': 'k2', 'game': games[1], 'action': 'like'}, {'id': 'k3', 'game': games[2], 'action': 'play'}]
+    ack = socket.emit('game_actions', {'events': batch}, callback=True)
+    assert ack == {'success': True, 'accepted': 3, 'duplicates': ['k1']}, ack
+    assert totals(app_module) == expected(before, [batch[0], batch[2], batch[3]], fields)
+    profile = app_module.user_profiles.get(machine_id)
+    assert profile['played'] == [games[0], games[2]] and profile['likes'] == [games[1]], profile
+    assert app_module.presence.counts([games[2]]) == {games[2]: 1}
+    rejected = socket.emit('game_actions', {'events': [{'id': 'x', 'game': games[0]}]}, callback=True)
+    assert rejected['success'] is False and rejected['errors'][0]['index'] == 0
+    socket.disconnect()
+
+
+def timed_run(app_module, events, batch_size, transport):
+    """Events per second for one transport; the catalog totals are checked afterwards"""
+    fields = app_module.ACTION_FIELDS
+    before = totals(app_module)
+    client = app_module.app.test_client() if transport == 'http' else app_module.socketio.test_client(app_module.app)
+    start = time.perf_counter()
+    if batch_size == 1 and transport == 'http':
+        for event in events:
+            assert client.post('/api/games/update', json=event).status_code == 200
+    elif batch_size == 1:
+        for event in events:
+            client.emit('game_action', event)
+            client.queue = []
+    elif transport == 'http':
+        for index in range(0, len(events), batch_size):
+            resp = client.post('/api/games/events', json={'events': events[index:index + batch_size]})
+            assert resp.status_code == 200
+    else:
+        for index in range(0, len(events), batch_size):
+            ack = client.emit('game_actions', {'events': events[index:index + batch_size]}, callback=True)
+            assert ack['success'], ack
+            client.queue = []
+    elapsed = time.perf_counter() - start
+    if transport == 'socketio':
+        client.disconnect()
+    assert totals(app_module) == expected(before, events, fields), transport
+    return round(len(events) / elapsed)
+
+
+def in_process(app_module, events, batch_size):
+    """(per-event us, batched us) calling the catalog/profiles/ingestor directly"""
+    fields = app_module.ACTION_FIELDS
+    catalog, profiles, ingestor = app_module.catalog, app_module.user_profiles, app_module.ingestor
+    start = time.perf_counter()
+    for event in events:
+        catalog.increment(event['game'], fields[event['action']], machine_id='machine_bench')
+        profiles.record('machine_bench', event['action'], event['game'])
+    single = time.perf_counter() - start
+    fresh = [dict(event, id=event['id'] + '-direct') for event in events]
+    start = time.perf_counter()
+    for index in range(0, len(fresh), batch_size):
+        ingestor.ingest(fresh[index:index + batch_size], 'bench', machine_id='machine_bench')
+    batched = time.perf_counter() - start
+    return round(single / len(events) * 1e6, 2), round(batched / len(events) * 1e6, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=20000)
+    parser.add_argument('--batch', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--shared-state-url', default='')
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    # app.py flushes into the temp directory from atexit handlers; remove it after them
+    tmp = tempfile.mkdtemp(prefix='fluxion-events-')
+    atexit.register(shutil.rmtree, tmp, ignore_errors=True)
+    os.environ.update(
+        CATALOG_BACKEND='sql',
+        DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'catalog.db')}",
+        PROFILES_DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'profiles.db')}",
+        JOURNAL_DIR=os.path.join(tmp, 'journal'),
+        SHARED_STATE_URL=args.shared_state_url,
+        THUMBNAIL_WORKERS='0',
+        LOG_LEVEL='WARNING',
+    )
+    os.chdir(REPO_ROOT)
+    import app as app_module
+
+    games = sorted(app_module.catalog.games())
+    check(app_module, rng, games)
+
+    results = {'events': args.events, 'batch': args.batch}
+    for transport in ('http', 'socketio'):
+        events = events_for(rng, games, args.events)
+        results[f'{transport}_per_event_events_per_sec'] = timed_run(app_module, events, 1, transport)
+        events = events_for(rng, games, args.events)
+        results[f'{transport}_batched_events_per_sec'] = timed_run(app_module, events, args.batch, transport)
+    single_us, batched_us = in_process(app_module, events_for(rng, games, args.events), args.batch)
+    results['in_process_per_event_us'] = single_us
+    results['in_process_batched_us'] = batched_us
+    print(json.dumps({'benchmark': 'events', 'shared_state': args.shared_state_url or 'local',
+                      'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""Fluxify CSS/JS rewriting: streamed chunk rewriter vs. whole-body regex.
+
+Run from the repository root:
+
+    python benchmarks/bench_fluxify_assets.py
+
+Checks that a stylesheet and an ES module rewritten from randomly sized
+chunks match the same text rewritten in one piece (so tokens split across
+chunk boundaries are handled), that ``/go/<encoded_url>`` serves the
+rewritten bodies from a local stand-in origin, then reports rewrite
+throughput in MB/s.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.standin import StandInOrigin, load_sub_server  # noqa: E402
+
+CSS_RULE = (
+    '@import "theme/{i}.css";\n'
+    '.tile-{i} {{ background: url("img/tile-{i}.png") no-repeat; }}\n'
+    '.icon-{i}::before {{ content: ""; mask: url(icons/{i}.svg); }}\n'
+    '@font-face {{ font-family: f{i}; src: url(\'fonts/{i}.woff2\') format("woff2"); }}\n'
+)
+JS_MODULE = (
+    'import {{ render{i} }} from "./render/{i}.js";\n'
+    'import state from \'../state.js\';\n'
+    'import React from "react";\n'
+    'export * from "./parts/{i}.js";\n'
+    'const lazy{i} = () => import("./lazy/{i}.js");\n'
+    'function update{i}(x) {{ return x.map(v => v * {i}).filter(Boolean); }}\n'
+)
+
+
+def build(template, count):
+    return ''.join(template.format(i=i) for i in range(count))
+
+
+def random_chunks(text, seed, max_size=4096):
+    rng = random.Random(seed)
+    pos = 0
+    while pos < len(text):
+        size = rng.randint(1, max_size)
+        yield text[pos:pos + size]
+        pos += size
+
+
+def measure(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rules', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    fluxify = load_sub_server('fluxify')
+    from server_fluxify import rewrite
+
+    base_url = 'https://example.com/app/'
+    rewrite_url = lambda url, base: 'P(' + url + ')'
+    cases = {
+        'css': (build(CSS_RULE, args.rules), rewrite.rewrite_css_urls, rewrite.rewrite_css_stream),
+        'js': (build(JS_MODULE, args.rules), rewrite.rewrite_js_imports, rewrite.rewrite_js_stream),
+    }
+
+    results = {}
+    for kind, (text, whole_fn, stream_fn) in cases.items():
+        expected = whole_fn(text, base_url, rewrite_url)
+        assert expected != text
+        for seed in range(20):
+            streamed = ''.join(stream_fn(random_chunks(text, seed, max_size=64 if seed < 10 else 8192),
+                                         base_url, rewrite_url))
+            assert streamed == expected, f'{kind}: chunked output differs (seed {seed})'
+
+        mb = len(text.encode('utf-8')) / 1e6
+        whole = measure(lambda: whole_fn(text, base_url, rewrite_url), args.repeat)
+        chunks = list(random_chunks(text, 0, max_size=64 * 1024))
+        streamed = measure(lambda: ''.join(stream_fn(chunks, base_url, rewrite_url)), args.repeat)
+        results[kind] = {
+            'bytes': len(text),
+            'whole_mb_per_sec': round(mb / whole, 1),
+            'stream_mb_per_sec': round(mb / streamed, 1),
+        }
+
+    # End to end: the proxy rewrites by Content-Type and leaves other types alone
+    client = fluxify.app.test_client()
+    css, js = build(CSS_RULE, 50), build(JS_MODULE, 50)
+    routes = {
+        '/app/site.css': (200, {'Content-Type': 'text/css'}, css.encode()),
+        '/app/main.js': (200, {'Content-Type': 'text/javascript; charset=utf-8'}, js.encode()),
+        '/app/data.json': (200, {'Content-Type': 'application/json'}, b'{"url": "url(x.png)"}'),
+    }
+    with StandInOrigin(routes) as origin:
+        for path, checks in (('/app/site.css', ('@import "', '/go/', 'url(')),
+                             ('/app/main.js', ('from "', '/go/', 'from "react"'))):
+            resp = client.get('/go/' + fluxify.encode_url(origin.url + path))
+            body = resp.get_data(as_text=True)
+            assert resp.status_code == 200 and all(c in body for c in checks), path
+            assert 'img/tile-0.png"' not in body and '"./render/0.js"' not in body, path
+        resp = client.get('/go/' + fluxify.encode_url(origin.url + '/app/data.json'))
+        assert resp.data == routes['/app/data.json'][2]
+
+    print(json.dumps({'benchmark': 'fluxify_assets', 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,193 @@
+"""Fluxify under a slow origin: the threaded WSGI app against async_server.py.
+
+Run from the repository root:
+
+    python benchmarks/bench_fluxify_async.py
+
+A local stand-in origin answers every request after ``--delay`` seconds.
+``--clients`` concurrent clients fetch a stylesheet through ``/go/`` from
+the threaded app (werkzeug's threaded server, as ``socketio.run`` uses in
+threading mode) and then from the aiohttp front end. The script reports
+requests/sec, latency percentiles and the peak number of server-side
+threads for each, and the heap the async server holds while it streams a
+large asset. Lower ``--per-origin`` and ``--max-waiting`` to watch the
+async server queue requests and answer the overflow with 503.
+"""
+import os
+import sys
+import json
+import asyncio
+import logging
+import time
+import argparse
+import socket
+import threading
+import tracemalloc
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+from werkzeug.serving import make_server
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.standin import StandInOrigin, load_sub_server  # noqa: E402
+
+CSS = b'@import "theme.css";\n.tile { background: url(img/tile.png); }\n' * 200
+LARGE = bytes(range(256)) * (4096 * 16)  # 16 MiB
+CLIENT_PREFIX = 'bench-client'
+
+
+def get(port, path):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        conn.request('GET', path)
+        resp = conn.getresponse()
+        return resp.status, resp.read()
+    finally:
+        conn.close()
+
+
+def drain(port, path):
+    """Read a response in small pieces, so the client side holds no copy of the body"""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        conn.request('GET', path)
+        resp = conn.getresponse()
+        size = 0
+        while chunk := resp.read(64 * 1024):
+            size += len(chunk)
+        return size
+    finally:
+        conn.close()
+
+
+def serves(thread, port):
+    # socketserver's per-connection threads get the accepted socket as their first argument
+    args = getattr(thread, '_args', ())
+    try:
+        return bool(args) and isinstance(args[0], socket.socket) and args[0].getsockname()[1] == port
+    except OSError:
+        return False
+
+
+def server_threads(origin_port):
+    """Threads in this process other than the clients' and the stand-in origin's"""
+    return sum(1 for t in threading.enumerate()
+               if not t.name.startswith(CLIENT_PREFIX) and not serves(t, origin_port))
+
+
+def run_load(port, path, clients, per_client, origin_port):
+    latencies, statuses = [], {}
+    peak_threads = server_threads(origin_port)
+    lock = threading.Lock()
+
+    def client():
+        nonlocal peak_threads
+        for _ in range(per_client):
+            start = time.perf_counter()
+            status, _body = get(port, path)
+            elapsed = time.perf_counter() - start
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == 200:
+                    latencies.append(elapsed)
+                peak_threads = max(peak_threads, server_threads(origin_port))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(clients, thread_name_prefix=CLIENT_PREFIX) as pool:
+        for future in [pool.submit(client) for _ in range(clients)]:
+            future.result()
+    wall = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'requests': sum(statuses.values()),
+        'statuses': statuses,
+        'req_per_sec': round(len(latencies) / wall, 1),
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 1),
+        'p95_ms': round(latencies[max(int(len(latencies) * 0.95) - 1, 0)] * 1000, 1),
+        'peak_server_threads': peak_threads,
+    }
+
+
+class AsyncServer:
+    """async_server's app on its own loop in a background thread"""
+
+    def __init__(self, async_server, **options):
+        self.app = async_server.create_app(prefix='', **options)
+        self.loop = asyncio.new_event_loop()
+        self.port = None
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.runner = web.AppRunner(self.app)
+        self.loop.run_until_complete(self.runner.setup())
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        self.loop.run_until_complete(site.start())
+        self.port = self.runner.addresses[0][1]
+        self.ready.set()
+        self.loop.run_forever()
+        self.loop.run_until_complete(self.runner.cleanup())
+
+    def __enter__(self):
+        self.thread.start()
+        self.ready.wait()
+        return self
+
+    def __exit__(self, *exc):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=64)
+    parser.add_argument('--per-client', type=int, default=4)
+    parser.add_argument('--delay', type=float, default=0.25)
+    parser.add_argument('--per-origin', type=int, default=100)
+    parser.add_argument('--max-waiting', type=int, default=1000)
+    args = parser.parse_args()
+
+    fluxify = load_sub_server('fluxify')
+    import server_fluxify.async_server as async_server
+    fluxify.response_cache = fluxify.ResponseCache(max_bytes=0)  # measure the origin path, not cache hits
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)  # no access log
+    threaded = make_server('127.0.0.1', 0, fluxify.app, threaded=True)
+    threading.Thread(target=threaded.serve_forever, daemon=True).start()
+    routes = {
+        '/style.css': (200, {'Content-Type': 'text/css'}, CSS),
+        '/big.bin': (200, {'Content-Type': 'application/octet-stream'}, LARGE),
+    }
+    results = {}
+    try:
+        with StandInOrigin(routes) as origin, \
+                AsyncServer(async_server, per_origin=args.per_origin, max_waiting=args.max_waiting) as aio:
+            css_path = '/go/' + fluxify.encode_url(origin.url + '/style.css')
+            big_path = '/go/' + fluxify.encode_url(origin.url + '/big.bin')
+            for port in (threaded.server_port, aio.port):
+                assert get(port, css_path) == get(threaded.server_port, css_path)
+                assert get(port, big_path) == (200, LARGE)
+
+            # Heap held by the async server while it streams a large body
+            tracemalloc.start()
+            size = drain(aio.port, big_path)
+            results['async_stream_peak_heap_bytes'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            assert size == len(LARGE)
+
+            origin.delay = args.delay
+            origin_port = int(origin.url.rsplit(':', 1)[1])
+            results['threaded'] = run_load(threaded.server_port, css_path, args.clients, args.per_client, origin_port)
+            results['async'] = run_load(aio.port, css_path, args.clients, args.per_client, origin_port)
+    finally:
+        threaded.shutdown()
+
+    print(json.dumps({'benchmark': 'fluxify_async', 'clients': args.clients, 'per_origin': args.per_origin,
+                      'origin_delay_s': args.delay, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
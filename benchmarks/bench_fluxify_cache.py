@@ -0,0 +1,147 @@
+"""Fluxify response cache: repeated proxied fetches with and without caching.
+
+Run from the repository root:
+
+    python benchmarks/bench_fluxify_cache.py
+
+A local stand-in origin serves an HTML page, a stylesheet and an image with
+different caching headers. The script first checks the freshness rules
+(max-age hits, no-store bypass, ETag revalidation, Vary, LRU eviction and
+the disk tier), then reports requests/sec and origin requests for a popular
+page fetched repeatedly with the cache on and off.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.standin import StandInOrigin, load_sub_server  # noqa: E402
+
+PAGE = ('<!DOCTYPE html><html><head><link rel="stylesheet" href="/site.css"></head><body>'
+        + ''.join(f'<p><a href="/item/{i}">item {i}</a><img src="/img/{i}.png"></p>' for i in range(300))
+        + '</body></html>').encode()
+CSS = b'body { background: url(bg.png); }\n' * 100
+IMAGE = bytes(range(256)) * 64
+
+ROUTES = {
+    '/page.html': (200, {'Content-Type': 'text/html; charset=utf-8', 'Cache-Control': 'max-age=60'}, PAGE),
+    '/site.css': (200, {'Content-Type': 'text/css', 'Cache-Control': 'no-cache', 'ETag': '"css-1"'}, CSS),
+    '/img.png': (200, {'Content-Type': 'image/png', 'Cache-Control': 'public, max-age=0', 'ETag': '"img-1"'}, IMAGE),
+    '/private.html': (200, {'Content-Type': 'text/html', 'Cache-Control': 'private, max-age=60'}, b'<p>me</p>'),
+    '/nostore.css': (200, {'Content-Type': 'text/css', 'Cache-Control': 'no-store'}, b'a{}'),
+    '/lang.css': (200, {'Content-Type': 'text/css', 'Cache-Control': 'max-age=60', 'Vary': 'User-Agent'}, b'b{}'),
+}
+
+
+def fetch(client, fluxify, url, **headers):
+    resp = client.get('/go/' + fluxify.encode_url(url), headers=headers)
+    return resp.status_code, resp.headers.get('X-Fluxify-Cache'), resp.data
+
+
+def check_semantics(fluxify, origin):
+    from server_fluxify.cache import CacheEntry, ResponseCache
+
+    client = fluxify.app.test_client()
+    fluxify.response_cache = ResponseCache()
+    base = origin.url
+
+    # max-age: second fetch is served without touching the origin
+    origin.requests = 0
+    first = fetch(client, fluxify, base + '/page.html')
+    second = fetch(client, fluxify, base + '/page.html')
+    assert first[1] == 'MISS' and second[1] == 'HIT' and first[2] == second[2], (first[1], second[1])
+    assert origin.requests == 1
+    # a client reload revalidates; without a validator that is a full refetch
+    assert fetch(client, fluxify, base + '/page.html', **{'Cache-Control': 'no-cache'})[1] == 'MISS'
+    assert fetch(client, fluxify, base + '/page.html', **{'Cache-Control': 'no-store'})[1] == 'BYPASS'
+
+    # no-cache / max-age=0 with an ETag: stored, then revalidated with a 304
+    for path, body in (('/site.css', None), ('/img.png', IMAGE)):
+        origin.not_modified = 0
+        first = fetch(client, fluxify, base + path)
+        second = fetch(client, fluxify, base + path)
+        assert first[1] == 'MISS' and second[1] == 'REVALIDATED', (path, first[1], second[1])
+        assert origin.not_modified == 1 and first[2] == second[2]
+        assert body is None or second[2] == body
+
+    # never stored: private and no-store responses
+    for path in ('/private.html', '/nostore.css'):
+        fetch(client, fluxify, base + path)
+        assert fetch(client, fluxify, base + path)[1] == 'MISS', path
+
+    # Vary: User-Agent keeps one variant per agent
+    assert fetch(client, fluxify, base + '/lang.css', **{'User-Agent': 'a'})[1] == 'MISS'
+    assert fetch(client, fluxify, base + '/lang.css', **{'User-Agent': 'a'})[1] == 'HIT'
+    assert fetch(client, fluxify, base + '/lang.css', **{'User-Agent': 'b'})[1] == 'MISS'
+
+    # Byte-bounded LRU: the least recently used entry goes first
+    cache = ResponseCache(max_bytes=3 * 1300, max_entry_bytes=2000)
+    for name in 'abc':
+        cache.put(name, CacheEntry(200, 'text/plain', b'x' * 1000, {'Cache-Control': 'max-age=60'}))
+    cache.get('a')
+    cache.put('d', CacheEntry(200, 'text/plain', b'x' * 1000))
+    assert cache.get('b') is None and cache.get('a') is not None
+    assert cache.stats()['evictions'] == 1 and cache.stats()['bytes'] <= cache.max_bytes
+    cache.put('huge', CacheEntry(200, 'text/plain', b'x' * 5000))
+    assert cache.get('huge') is None and cache.stats()['too_large'] == 1
+
+    # Disk tier: a fresh process-level cache finds entries written by another
+    with tempfile.TemporaryDirectory() as disk_dir:
+        writer = ResponseCache(disk_dir=disk_dir)
+        entry = CacheEntry.from_response(200, 'text/css', {'Cache-Control': 'max-age=60', 'ETag': '"x"'}, {})
+        entry.body = CSS
+        writer.put('k', entry)
+        reader = ResponseCache(disk_dir=disk_dir)
+        found = reader.get('k')
+        assert found is not None and found.body == CSS and found.is_fresh()
+        assert found.validators() == {'If-None-Match': '"x"'}
+        assert reader.stats()['disk_hits'] == 1
+
+    stats = json.loads(client.get('/cache/stats').data)
+    assert stats['hits'] >= 2 and stats['revalidated'] == 2
+
+
+def throughput(fluxify, origin, requests, max_bytes):
+    from server_fluxify.cache import ResponseCache
+
+    fluxify.response_cache = ResponseCache(max_bytes=max_bytes)
+    client = fluxify.app.test_client()
+    path = '/go/' + fluxify.encode_url(origin.url + '/page.html')
+    origin.requests = 0
+    start = time.perf_counter()
+    for _ in range(requests):
+        resp = client.get(path)
+        assert resp.status_code == 200 and resp.data
+    elapsed = time.perf_counter() - start
+    return round(requests / elapsed, 1), origin.requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    fluxify = load_sub_server('fluxify')
+    with StandInOrigin(ROUTES) as origin:
+        check_semantics(fluxify, origin)
+        uncached_rps, uncached_upstream = throughput(fluxify, origin, args.requests, 0)
+        cached_rps, cached_upstream = throughput(fluxify, origin, args.requests, 64 * 1024 * 1024)
+        stats = fluxify.response_cache.stats()
+
+    print(json.dumps({'benchmark': 'fluxify_cache', 'results': {
+        'page_bytes': len(PAGE),
+        'requests': args.requests,
+        'uncached_req_per_sec': uncached_rps,
+        'cached_req_per_sec': cached_rps,
+        'uncached_upstream_requests': uncached_upstream,
+        'cached_upstream_requests': cached_upstream,
+        'cache_stats': stats,
+    }}, indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""Fluxify upstream fetch: pooled streaming session vs. one-shot requests.get.
+
+Run from the repository root:
+
+    python benchmarks/bench_fluxify_upstream.py
+
+A local stand-in origin serves a small stylesheet and a large binary. The
+script reports requests/sec and upstream TCP connections for repeated
+small fetches through ``/go/<encoded_url>``, and peak Python heap while
+streaming the large asset. Correctness is covered by
+tests/test_fluxify_upstream.py.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.standin import StandInOrigin, load_sub_server  # noqa: E402
+
+SMALL = b'body { color: red; }\n' * 64
+LARGE = bytes(range(256)) * (32 * 1024 * 4)  # 32 MiB
+
+
+def legacy_fetch(url):
+    """What /go did before: a fresh connection and a fully buffered body"""
+    resp = requests.get(url, stream=True, allow_redirects=True)
+    return resp.content
+
+
+def drain(client, path):
+    resp = client.get(path, buffered=False)
+    for _chunk in resp.response:
+        pass
+    resp.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=300)
+    args = parser.parse_args()
+
+    fluxify = load_sub_server('fluxify')
+    client = fluxify.app.test_client()
+    routes = {
+        '/style.css': (200, {'Content-Type': 'text/css'}, SMALL),
+        '/big.bin': (200, {'Content-Type': 'application/octet-stream'}, LARGE),
+    }
+    results = {}
+    with StandInOrigin(routes) as origin:
+        small_url = origin.url + '/style.css'
+        big_url = origin.url + '/big.bin'
+
+        # Throughput and connection reuse for many small assets
+        origin.connections = 0
+        start = time.perf_counter()
+        for _ in range(args.requests):
+            legacy_fetch(small_url)
+        legacy_elapsed = time.perf_counter() - start
+        legacy_connections = origin.connections
+
+        origin.connections = 0
+        path = '/go/' + fluxify.encode_url(small_url)
+        start = time.perf_counter()
+        for _ in range(args.requests):
+            drain(client, path)
+        pooled_elapsed = time.perf_counter() - start
+        pooled_connections = origin.connections
+
+        results['small_asset'] = {
+            'requests': args.requests,
+            'legacy_req_per_sec': round(args.requests / legacy_elapsed, 1),
+            'pooled_req_per_sec': round(args.requests / pooled_elapsed, 1),
+            'legacy_upstream_connections': legacy_connections,
+            'pooled_upstream_connections': pooled_connections,
+        }
+
+        # Memory held while moving a large body
+        tracemalloc.start()
+        legacy_fetch(big_url)
+        legacy_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+        drain(client, '/go/' + fluxify.encode_url(big_url))
+        streamed_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        results['large_asset'] = {
+            'bytes': len(LARGE),
+            'legacy_peak_heap_bytes': legacy_peak,
+            'streamed_peak_heap_bytes': streamed_peak,
+        }
+
+    print(json.dumps({'benchmark': 'fluxify_upstream', 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""Fluxify HTML rewriting: streaming tokenizer vs. whole-document BeautifulSoup.
+
+Run from the repository root:
+
+    python benchmarks/bench_html_rewriter.py
+
+Every page in benchmarks/fixtures/html plus a generated catalog page is
+rewritten by both implementations; the script fails if the outputs differ
+(whole document or fed in random-sized chunks). It then reports MB/s and
+time-to-first-byte for each rewriter on the generated page.
+"""
+import os
+import sys
+import json
+import glob
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.standin import load_sub_server  # noqa: E402
+from tests.soup_reference import rewrite_html_soup  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'html')
+BASE_URL = 'https://example.com/dir/page.html'
+
+
+def synthetic_page(cards=2500, seed=7):
+    """A large, repetitive catalog page"""
+    rng = random.Random(seed)
+    parts = ['<!DOCTYPE html>\n<html><head><title>Catalog</title>\n'
+             '<link rel="stylesheet" href="/c.css">\n</head>\n<body>\n<div class="grid">\n']
+    for i in range(cards):
+        parts.append(
+            f'  <div class="card card-{i % 7}" style="background-image: url(/thumbs/{i}.jpg)">\n'
+            f'    <a href="/item/{i}?ref=list&amp;p={i // 50}"><img src="/img/{i}.png" '
+            f'srcset="/img/{i}-1x.png 1x, /img/{i}-2x.png 2x" alt="Item {i} &mdash; '
+            f'{rng.choice(["red", "blue", "green"])}"></a>\n'
+            f'    <p>Item number {i} costs &pound;{rng.randint(1, 99)}.{rng.randint(10, 99)} '
+            f'&amp; ships free.</p>\n'
+            f'  </div>\n')
+    parts.append('</div>\n<script src="/app.js"></script>\n</body>\n</html>\n')
+    return ''.join(parts)
+
+
+def chunked(text, rng, max_size=64):
+    i = 0
+    while i < len(text):
+        size = rng.randint(1, max_size)
+        yield text[i:i + size]
+        i += size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    fluxify = load_sub_server('fluxify')
+    from server_fluxify.rewrite import rewrite_html_stream
+
+    pages = {os.path.basename(p): open(p, encoding='utf-8').read()
+             for p in sorted(glob.glob(os.path.join(FIXTURES, '*.html')))}
+    large = synthetic_page()
+    pages['synthetic-catalog'] = large
+
+    rng = random.Random(1)
+    for name, page in pages.items():
+        expected = rewrite_html_soup(fluxify, page, BASE_URL)
+        whole = ''.join(rewrite_html_stream([page], BASE_URL, fluxify.rewrite_url, fluxify.INJECTED_SCRIPT))
+        pieces = ''.join(rewrite_html_stream(chunked(page, rng), BASE_URL, fluxify.rewrite_url,
+                                             fluxify.INJECTED_SCRIPT))
+        if whole != expected or pieces != expected:
+            raise SystemExit(f'{name}: streaming output differs from BeautifulSoup output')
+
+    def measure(rewrite):
+        best_total = best_first = float('inf')
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            first = None
+            for _chunk in rewrite():
+                if first is None:
+                    first = time.perf_counter() - start
+            best_total = min(best_total, time.perf_counter() - start)
+            best_first = min(best_first, first)
+        return best_total, best_first
+
+    soup_total, soup_first = measure(lambda: [rewrite_html_soup(fluxify, large, BASE_URL)])
+    feed = [large[i:i + 64 * 1024] for i in range(0, len(large), 64 * 1024)]
+    stream_total, stream_first = measure(
+        lambda: rewrite_html_stream(feed, BASE_URL, fluxify.rewrite_url, fluxify.INJECTED_SCRIPT))
+
+    megabytes = len(large.encode('utf-8')) / 1e6
+    results = {
+        'fixtures_identical': sorted(pages),
+        'page_bytes': len(large.encode('utf-8')),
+        'soup_mb_per_sec': round(megabytes / soup_total, 2),
+        'stream_mb_per_sec': round(megabytes / stream_total, 2),
+        'soup_first_byte_ms': round(soup_first * 1000, 1),
+        'stream_first_byte_ms': round(stream_first * 1000, 1),
+    }
+    print(json.dumps({'benchmark': 'html_rewriter', 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
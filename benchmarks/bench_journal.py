@@ -0,0 +1,132 @@
+"""Durable counter writes: games.json rewrite per event vs. journal.EventJournal.
+
+Run from the repository root:
+
+    python benchmarks/bench_journal.py --events 200000
+
+Measures events/sec for the old durability scheme (an atomic rewrite of
+games.json for every event) against appends to the event log with batched
+fsync, then startup recovery time from the log tail and from a compacted
+snapshot. Before timing it checks that a torn final line (a crash mid-write)
+is cut off and that snapshot + tail reproduce the exact counter totals.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import COUNTER_FIELDS, save_games_data  # noqa: E402
+from journal import EventJournal  # noqa: E402
+
+GAMES = [f'Game {i}' for i in range(300)]
+
+
+def events(count, seed=1):
+    rng = random.Random(seed)
+    return [(rng.choice(GAMES), rng.choice(COUNTER_FIELDS), f'machine_{rng.randrange(1000)}')
+            for _ in range(count)]
+
+
+def expected_totals(base, stream):
+    totals = dict(base)
+    for game, field, _ in stream:
+        totals[(game, field)] = totals.get((game, field), 0) + 1
+    return totals
+
+
+def check_recovery(directory):
+    base = {(game, field): 10 for game in GAMES for field in COUNTER_FIELDS}
+    stream = events(5000, seed=2)
+    journal = EventJournal(directory, snapshot_every=10 ** 9)
+    assert journal.recover() is None
+    journal.seed(base)
+    for game, field, machine_id in stream[:3000]:
+        journal.append(game, field, 1, machine_id)
+    journal.sync()
+    journal.compact()
+    for game, field, machine_id in stream[3000:]:
+        journal.append(game, field, 1, machine_id)
+    journal.close()
+
+    # Crash mid-write: half a line at the end of the newest segment
+    segment = sorted(name for name in os.listdir(directory) if name.startswith('events-'))[-1]
+    with open(os.path.join(directory, segment), 'ab') as f:
+        f.write(b'[5001,1700000000.0,"Game 1","Pl')
+
+    reopened = EventJournal(directory)
+    assert reopened.recover() == expected_totals(base, stream)
+    assert reopened.seq == 5000 and reopened.snapshot_seq == 3000
+    assert [event['seq'] for event in reopened.replay(since_seq=4990)] == list(range(4991, 5001))
+    reopened.append('Game 1', 'Plays', 1, 'machine_1')
+    reopened.close()
+    again = EventJournal(directory)
+    assert again.recover()[('Game 1', 'Plays')] == expected_totals(base, stream)[('Game 1', 'Plays')] + 1
+
+
+def legacy_rate(directory, stream):
+    """One atomic games.json rewrite (write + fsync + rename) per event"""
+    path = os.path.join(directory, 'games.json')
+    data = {'games': {game: {'Location': f'{game}.html', 'Thumbnail': '', 'Tags': ['arcade'],
+                             'Plays': 0, 'Likes': 0, 'Favorites': 0} for game in GAMES}}
+    start = time.perf_counter()
+    for game, field, _ in stream:
+        data['games'][game][field] += 1
+        assert save_games_data(data, path)
+    return len(stream) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=200000)
+    parser.add_argument('--legacy-events', type=int, default=300)
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        check_recovery(os.path.join(tmp, 'check'))
+
+        results['legacy_rewrite_per_event'] = {
+            'events_per_sec': round(legacy_rate(tmp, events(args.legacy_events, seed=3)))}
+
+        stream = events(args.events)
+        directory = os.path.join(tmp, 'journal')
+        journal = EventJournal(directory, snapshot_every=10 ** 9)
+        journal.recover()
+        journal.seed({})
+        journal.start()
+        start = time.perf_counter()
+        for game, field, machine_id in stream:
+            journal.append(game, field, 1, machine_id)
+        append_s = time.perf_counter() - start
+        journal.close()
+        durable_s = time.perf_counter() - start
+        results['journal'] = {
+            'append_events_per_sec': round(args.events / append_s),
+            'durable_events_per_sec': round(args.events / durable_s),
+            'fsyncs': journal.fsyncs,
+        }
+
+        start = time.perf_counter()
+        totals = EventJournal(directory).recover()
+        tail_s = time.perf_counter() - start
+        assert totals == expected_totals({}, stream)
+
+        compacting = EventJournal(directory)
+        compacting.recover()
+        compacting.compact()
+        compacting.close()
+        start = time.perf_counter()
+        assert EventJournal(directory).recover() == totals
+        snapshot_s = time.perf_counter() - start
+        results['recovery_ms'] = {'log_tail': round(tail_s * 1000, 1), 'snapshot': round(snapshot_s * 1000, 1)}
+
+    print(json.dumps({'benchmark': 'journal', 'events': args.events, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
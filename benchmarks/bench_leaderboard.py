@@ -0,0 +1,132 @@
+"""Top-N games: full scan + sort per request vs. leaderboard.Leaderboards.
+
+Run from the repository root:
+
+    python benchmarks/bench_leaderboard.py --games 100000
+
+Replays a synthetic stream of play/like/favorite deltas (a skewed
+popularity distribution, one batch per broadcaster tick, on a simulated
+clock spanning two hours) into Leaderboards over a GameCatalog of
+``--games`` games. The all-time, windowed and decayed boards are checked
+against brute-force recomputation from the raw events along the way. It
+then reports the per-tick maintenance cost, the latency of a top-10 query
+against sorting the catalog, and how many ticks actually pushed an update.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import GameCatalog, COUNTER_FIELDS  # noqa: E402
+from leaderboard import Leaderboards  # noqa: E402
+
+
+class RecordingSocketIO:
+    def __init__(self):
+        self.emits = []
+
+    def emit(self, event, payload, to=None):
+        self.emits.append((event, payload, to))
+
+
+def brute_window(events, field, now, bucket_seconds, buckets, decay, n):
+    head_start = now - now % bucket_seconds
+    totals, decayed = {}, {}
+    for t, name, f, amount in events:
+        if f != field:
+            continue
+        age = int((head_start - (t - t % bucket_seconds)) // bucket_seconds)
+        if 0 <= age < buckets:
+            totals[name] = totals.get(name, 0) + amount
+            decayed[name] = decayed.get(name, 0.0) + amount * decay ** age
+    top = sorted(totals.items(), key=lambda kv: (-kv[1], kv[0]))[:n]
+    trending = sorted(decayed.items(), key=lambda kv: (-kv[1], kv[0]))[:n]
+    return top, trending
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--games', type=int, default=100000)
+    parser.add_argument('--ticks', type=int, default=3600)
+    parser.add_argument('--events-per-tick', type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    games = {f'Game {i:06d}': {'Location': 'x.html', 'Thumbnail': '', 'Tags': [],
+                               'Plays': rng.randrange(1000), 'Likes': rng.randrange(100),
+                               'Favorites': rng.randrange(50)} for i in range(args.games)}
+    names = list(games)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'games.json')
+        with open(path, 'w') as f:
+            json.dump({'games': games}, f)
+        catalog = GameCatalog(path, reload_check_interval=3600)
+        clock = [1_700_000_000.0]
+        socketio = RecordingSocketIO()
+        boards = Leaderboards(catalog, socketio, k=100, push_n=10, decay=0.9, clock=lambda: clock[0])
+
+        events = []
+        tick_seconds = 7200 / args.ticks
+        tick_cost = 0.0
+        for tick in range(args.ticks):
+            clock[0] += tick_seconds
+            deltas = {}
+            for _ in range(args.events_per_tick):
+                # Popularity shifts over time so the window boards churn
+                hot = (tick * 37) % len(names)
+                name = names[(hot + int(rng.paretovariate(1.2))) % len(names)]
+                field = rng.choice(COUNTER_FIELDS)
+                catalog.increment(name, field)
+                deltas.setdefault(name, {})
+                deltas[name][field] = deltas[name].get(field, 0) + 1
+                events.append((clock[0], name, field, 1))
+            start = time.perf_counter()
+            boards.on_deltas(deltas)
+            tick_cost += time.perf_counter() - start
+
+            if tick % (args.ticks // 6) == 0 or tick == args.ticks - 1:
+                live = catalog.games()
+                for field in COUNTER_FIELDS:
+                    expected = sorted(((n, g[field]) for n, g in live.items()), key=lambda kv: (-kv[1], kv[0]))[:10]
+                    assert boards.top(field.lower(), 'all', 10) == expected, (tick, field)
+                    for window, (bucket_seconds, buckets) in boards.windows.items():
+                        top, trending = brute_window(events, field, clock[0], bucket_seconds, buckets, 0.9, 10)
+                        assert boards.top(field.lower(), window, 10) == top, (tick, field, window)
+                        got = boards.top(field.lower(), window, 10, trending=True)
+                        assert [n for n, _ in got] == [n for n, _ in trending] or \
+                            all(abs(a[1] - b[1]) < 1e-6 for a, b in zip(got, trending)), (tick, field, window)
+
+        # A tick with nothing new and no expired bucket pushes nothing
+        pushed = len(socketio.emits)
+        assert boards.on_deltas({}) == {} and len(socketio.emits) == pushed
+
+        live = catalog.games()
+        rounds = 20
+        start = time.perf_counter()
+        for _ in range(rounds):
+            sorted(live.items(), key=lambda kv: -kv[1]['Plays'])[:10]
+        sort_us = (time.perf_counter() - start) / rounds * 1e6
+        start = time.perf_counter()
+        for _ in range(rounds * 100):
+            boards.top('plays', '1h', 10)
+        top_us = (time.perf_counter() - start) / (rounds * 100) * 1e6
+        catalog.close()
+
+    results = {
+        'tick_update_us': round(tick_cost / args.ticks * 1e6, 1),
+        'events_per_tick': args.events_per_tick,
+        'full_sort_top10_us': round(sort_us, 1),
+        'leaderboard_top10_us': round(top_us, 1),
+        'ticks_pushed': len(socketio.emits),
+        'ticks': args.ticks,
+    }
+    print(json.dumps({'benchmark': 'leaderboard', 'games': args.games, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,171 @@
+"""Cost of the instrumentation layer on the request path.
+
+Run from the repository root:
+
+    python benchmarks/bench_metrics.py
+
+Measures, per call on the calling thread:
+* MetricsRegistry.observe / inc and an uncontended TimedLock vs threading.Lock;
+* a Flask request with and without instrument_flask;
+* a Socket.IO-style debug line at INFO level, f-string vs lazy %-args;
+* an emitted log line through a StreamHandler on a file (formatting plus
+  the write) vs the queue handler app.py now installs.
+Histogram counts, sums and the rendered text are checked along the way.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, jsonify  # noqa: E402
+from metrics import MetricsRegistry, TimedLock, install_queue_logging, instrument_flask  # noqa: E402
+
+
+def per_call_ns(fn, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - start) / rounds * 1e9
+
+
+def flask_app(registry=None):
+    app = Flask(f'bench_{id(registry)}')
+    if registry is not None:
+        instrument_flask(app, registry)
+
+    @app.route('/api/games/<name>')
+    def game(name):
+        return jsonify({'name': name})
+
+    return app
+
+
+def request_us(app, rounds):
+    client = app.test_client()
+    start = time.perf_counter()
+    for i in range(rounds):
+        assert client.get(f'/api/games/g{i % 10}').status_code == 200
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def log_line_us(handler, rounds):
+    bench_logger = logging.getLogger(f'bench.{id(handler)}')
+    bench_logger.propagate = False
+    bench_logger.setLevel(logging.DEBUG)
+    bench_logger.addHandler(handler)
+    start = time.perf_counter()
+    for i in range(rounds):
+        bench_logger.debug("Game action processed in memory: %s for %s", 'play', f'Game {i}')
+    elapsed = time.perf_counter() - start
+    bench_logger.removeHandler(handler)
+    return elapsed / rounds * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=200000)
+    parser.add_argument('--requests', type=int, default=3000)
+    args = parser.parse_args()
+
+    registry = MetricsRegistry()
+    observe_ns = per_call_ns(lambda: registry.observe('h', 0.003, route='/x'), args.rounds)
+    inc_ns = per_call_ns(lambda: registry.inc('c', route='/x'), args.rounds)
+    histogram = registry.histogram('h', route='/x')
+    assert histogram['count'] == args.rounds and abs(histogram['sum'] - 0.003 * args.rounds) < 1e-6
+    assert histogram['buckets'][registry.buckets.index(0.0025)] == 0
+    assert histogram['buckets'][registry.buckets.index(0.005)] == args.rounds
+    assert registry.value('c', route='/x') == args.rounds
+
+    plain, timed = threading.Lock(), TimedLock('bench', registry)
+
+    def with_plain():
+        with plain:
+            pass
+
+    def with_timed():
+        with timed:
+            pass
+
+    lock_ns = per_call_ns(with_plain, args.rounds)
+    timed_lock_ns = per_call_ns(with_timed, args.rounds)
+
+    # Contended: the waits show up in lock_wait_seconds
+    def hold():
+        for _ in range(50):
+            with timed:
+                time.sleep(0.001)
+    threads = [threading.Thread(target=hold) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    waits = registry.histogram('lock_wait_seconds', lock='bench')
+    assert waits['count'] > 0 and waits['sum'] > 0
+
+    # Interleaved, best of five: the difference is smaller than run-to-run noise
+    bare, instrumented = flask_app(), flask_app(registry)
+    bare_us = instrumented_us = float('inf')
+    for _ in range(5):
+        bare_us = min(bare_us, request_us(bare, args.requests // 5))
+        instrumented_us = min(instrumented_us, request_us(instrumented, args.requests // 5))
+    assert registry.value('http_requests_total', app=f'bench_{id(registry)}', route='/api/games/<name>',
+                          method='GET', status=200) == args.requests
+    text = registry.render()
+    assert f'http_request_duration_seconds_count{{app="bench_{id(registry)}",method="GET",' \
+           f'route="/api/games/<name>"}} {args.requests}' in text
+    assert 'lock_waiters{lock="bench"} 0' in text
+
+    quiet = logging.getLogger('bench.quiet')
+    quiet.setLevel(logging.INFO)
+    machine_id, users = 'machine_42', 17
+    fstring_ns = per_call_ns(lambda: quiet.debug(f"Client connected. Machine ID: {machine_id}, Total users: {users}"),
+                             args.rounds)
+    lazy_ns = per_call_ns(lambda: quiet.debug("Client connected. Machine ID: %s, Total users: %s", machine_id, users),
+                          args.rounds)
+
+    log_rounds = args.rounds // 10
+    with tempfile.TemporaryDirectory() as tmp:
+        direct_path, queued_path = os.path.join(tmp, 'direct.log'), os.path.join(tmp, 'queued.log')
+        with open(direct_path, 'w') as sink:
+            stream_handler = logging.StreamHandler(sink)
+            stream_handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+            stream_us = log_line_us(stream_handler, log_rounds)
+
+        # install_queue_logging hooks the root logger; the bench logger propagates to it here
+        root = logging.getLogger()
+        saved_handlers, saved_level = root.handlers[:], root.level
+        with open(queued_path, 'w') as sink:
+            listener = install_queue_logging(logging.DEBUG, logging.StreamHandler(sink))
+            queue_handler = root.handlers[-1]
+            root.removeHandler(queue_handler)
+            queued_us = log_line_us(queue_handler, log_rounds)
+            listener.stop()
+        root.handlers[:], root.level = saved_handlers, saved_level
+        for path in (direct_path, queued_path):
+            with open(path) as f:
+                lines = f.read().splitlines()
+            assert len(lines) == log_rounds and lines[-1].endswith(f'play for Game {log_rounds - 1}'), path
+
+    results = {
+        'observe_ns': round(observe_ns),
+        'inc_ns': round(inc_ns),
+        'lock_ns': round(lock_ns),
+        'timed_lock_ns': round(timed_lock_ns),
+        'flask_request_us': round(bare_us, 1),
+        'flask_request_instrumented_us': round(instrumented_us, 1),
+        'disabled_debug_fstring_ns': round(fstring_ns),
+        'disabled_debug_lazy_ns': round(lazy_ns),
+        'log_line_stream_handler_us': round(stream_us, 2),
+        'log_line_queue_handler_us': round(queued_us, 2),
+    }
+    print(json.dumps({'benchmark': 'metrics', 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,166 @@
+"""Node.js sub-server proxy: legacy per-request requests.get vs. node_proxy.NodeProxy.
+
+Run from the repository root:
+
+    python benchmarks/bench_node_proxy.py
+
+A local stand-in backend plays the Node.js server; its port is published in
+a temporary ``port.txt`` as ``servers/<name>/port.txt`` would be. Both
+proxies are mounted under ``/other/node`` in a Flask app served by werkzeug's
+threaded server. The script reports latency, requests/sec under concurrency,
+and peak Python heap while a large response streams through; what the proxy
+forwards is covered by tests/test_node_proxy.py.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import threading
+import tracemalloc
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from flask import Flask, Blueprint
+from werkzeug.serving import make_server
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.standin import StandInOrigin  # noqa: E402
+from node_proxy import create_node_proxy  # noqa: E402
+
+SMALL = b'{"ok": true}' * 32
+LARGE = bytes(range(256)) * (4096 * 32)  # 32 MiB
+
+
+def legacy_blueprint(name, root):
+    """The proxy main.load_sub_server used to build for Node.js servers"""
+    bp = Blueprint(name, __name__, url_prefix=f'/other/{name}')
+
+    @bp.route('/', defaults={'path': ''})
+    @bp.route('/<path:path>')
+    def proxy(path):
+        node_port = 3000  # Default Node.js port
+        try:
+            with open(os.path.join(root, name, 'port.txt'), 'r') as f:
+                node_port = int(f.read().strip())
+        except:
+            pass
+
+        url = f'http://localhost:{node_port}/{path}'
+        resp = requests.get(url)
+        return resp.content, resp.status_code, resp.headers.items()
+
+    return bp
+
+
+ROUTES = {
+    '/small': (200, {'Content-Type': 'application/json'}, SMALL),
+    '/big': (200, {'Content-Type': 'application/octet-stream'}, LARGE),
+}
+
+
+def serve(app):
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def request(port, method, path, body=None, headers=None):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    try:
+        conn.request(method, path, body=body, headers=headers or {})
+        resp = conn.getresponse()
+        return resp.status, resp.getheaders(), resp.read()
+    finally:
+        conn.close()
+
+
+def measure(port, clients, requests_per_client):
+    latencies = []
+    lock = threading.Lock()
+
+    def client():
+        for _ in range(requests_per_client):
+            start = time.perf_counter()
+            status, _, body = request(port, 'GET', '/other/node/small')
+            elapsed = time.perf_counter() - start
+            assert status == 200 and body == SMALL
+            with lock:
+                latencies.append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(clients) as pool:
+        for future in [pool.submit(client) for _ in range(clients)]:
+            future.result()
+    wall = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'req_per_sec': round(len(latencies) / wall, 1),
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 2),
+        'p99_ms': round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+    }
+
+
+def large_peak(port):
+    tracemalloc.start()
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    conn.request('GET', '/other/node/big')
+    resp = conn.getresponse()
+    size = 0
+    while True:
+        chunk = resp.read(64 * 1024)
+        if not chunk:
+            break
+        size += len(chunk)
+    conn.close()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert size == len(LARGE)
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=50, help='per client')
+    args = parser.parse_args()
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    results = {}
+    with tempfile.TemporaryDirectory() as root, StandInOrigin(ROUTES) as origin:
+        os.makedirs(os.path.join(root, 'node'))
+        with open(os.path.join(root, 'node', 'port.txt'), 'w') as f:
+            f.write(str(origin.server.server_address[1]))
+
+        new_app = Flask('node_proxy_bench')
+        bp = create_node_proxy('node', root=root)
+        new_app.register_blueprint(bp)
+        legacy_app = Flask('legacy_proxy_bench')
+        legacy_app.register_blueprint(legacy_blueprint('node', root))
+
+        servers = {'legacy': serve(legacy_app), 'pooled': serve(new_app)}
+        try:
+            for label, server in servers.items():
+                port = server.server_port
+                origin.connections = 0
+                sequential = measure(port, 1, args.requests * 4)
+                concurrent = measure(port, args.clients, args.requests)
+                results[label] = {
+                    'sequential': sequential,
+                    'concurrent': dict(concurrent, clients=args.clients),
+                    'backend_connections': origin.connections,
+                    'large_response_peak_heap_bytes': large_peak(port),
+                }
+        finally:
+            for server in servers.values():
+                server.shutdown()
+
+    print(json.dumps({'benchmark': 'node_proxy', 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
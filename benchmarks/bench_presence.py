@@ -0,0 +1,213 @@
+"""Presence: heartbeat expiry, per-game counts and /active-players at scale.
+
+Run from the repository root:
+
+    python benchmarks/bench_presence.py --sessions 50000
+
+* TimerWheel: a random schedule of heartbeats, moves and leaves is checked
+  against a brute-force model of deadlines. Then the cost of one expiry
+  pass over ``--sessions`` live sessions is compared with scanning every
+  deadline.
+* PresenceTracker: join/heartbeat cost, and counts checked against a
+  model after joins, game switches, leaves and expiry.
+* /active-players through app.py with ``--sessions`` players, the
+  paginated JSON and HTML pages vs rendering every player (the old page).
+  Also /api/presence.
+
+``--shared-state-url`` runs the tracker and app on sqlite:///path or
+redis://... instead of the in-process state.
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import random
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.standin import REPO_ROOT  # noqa: E402
+from presence import TimerWheel, PresenceTracker  # noqa: E402
+from shared_state import create_shared_state  # noqa: E402
+
+OLD_PAGE = """{% for sid, data in players.items() %}<div class="col-md-4 mb-3"><div class="card"><div class="card-body">
+<h5 class="card-title">Player {{ loop.index }}</h5><p class="card-text"><a href="/profile/{{ data.machine_id }}">
+<small class="text-muted">Machine ID: {{ data.machine_id }}</small></a><br>Playing: <strong>{{ data.game }}</strong>
+</p></div></div></div>{% endfor %}"""
+
+
+def check_wheel(rng, rounds=20000):
+    wheel = TimerWheel(resolution=1.0, slots=8, now=0.0)
+    model = {}
+    now = 0.0
+    for _ in range(rounds):
+        now += rng.random() * 0.5
+        key = rng.randrange(300)
+        roll = rng.random()
+        if roll < 0.6:
+            deadline = now + rng.random() * 20  # often more than one turn of the 8-slot wheel
+            wheel.schedule(key, deadline)
+            model[key] = deadline
+        elif roll < 0.7:
+            wheel.cancel(key)
+            model.pop(key, None)
+        else:
+            expired = set(wheel.advance(now))
+            due = {k for k, deadline in model.items() if deadline <= now}
+            assert expired == due, (now, expired ^ due)
+            for k in due:
+                del model[k]
+    assert len(wheel) == len(model)
+
+
+def expiry_pass(sessions, rng):
+    """(wheel advance us, full scan us) for one pass with ``sessions`` live deadlines"""
+    ttl = 60.0
+    wheel = TimerWheel(1.0, int(ttl) + 2, now=0.0)
+    deadlines = {}
+    for sid in range(sessions):
+        deadline = rng.uniform(1.0, ttl)
+        wheel.schedule(sid, deadline)
+        deadlines[sid] = deadline
+    wheel_total = scan_total = 0.0
+    for second in range(1, 31):
+        now = float(second)
+        start = time.perf_counter()
+        expired = wheel.advance(now)
+        wheel_total += time.perf_counter() - start
+        start = time.perf_counter()
+        due = [sid for sid, deadline in deadlines.items() if deadline <= now]
+        scan_total += time.perf_counter() - start
+        for sid in due:
+            del deadlines[sid]
+        assert sorted(expired) == sorted(due)
+    return round(wheel_total / 30 * 1e6, 1), round(scan_total / 30 * 1e6, 1)
+
+
+def check_tracker(shared, rng, games):
+    clock = [0.0]
+    tracker = PresenceTracker(shared, ttl=10.0, push_interval=1.0, clock=lambda: clock[0])
+    model = {}  # {sid: (game, last heartbeat)}
+    for step in range(5000):
+        clock[0] += 0.01
+        sid = f'sid-{rng.randrange(400)}'
+        roll = rng.random()
+        if roll < 0.5:
+            game = rng.choice(games)
+            tracker.join(sid, f'machine_{sid}', game)
+            model[sid] = (game, clock[0])
+        elif roll < 0.8:
+            assert tracker.heartbeat(sid) == (sid in model)
+            if sid in model:
+                model[sid] = (model[sid][0], clock[0])
+        elif roll < 0.9:
+            assert tracker.leave(sid) == (sid in model)
+            model.pop(sid, None)
+        else:
+            clock[0] += rng.random() * 3
+            tracker.tick()
+            for other, (_, seen) in list(model.items()):
+                if seen + 10.0 <= clock[0]:
+                    del model[other]
+        if step % 500 == 0:
+            clock[0] += 1.0
+            pushed = tracker.tick()
+            for other, (_, seen) in list(model.items()):
+                if seen + 10.0 <= clock[0]:
+                    del model[other]
+            expected = {game: sum(1 for g, _ in model.values() if g == game) for game in pushed}
+            assert pushed == expected, (pushed, expected)
+    expected = {}
+    for game, _ in model.values():
+        expected[game] = expected.get(game, 0) + 1
+    assert tracker.counts() == expected, (tracker.counts(), expected)
+    assert len(tracker) == len(model) and len(shared.hgetall('active_players')) == len(model)
+    tracker.release()
+    assert tracker.counts() == {} and shared.hgetall('active_players') == {}
+
+
+def per_call_us(fn, rounds):
+    start = time.perf_counter()
+    for i in range(rounds):
+        fn(i)
+    return round((time.perf_counter() - start) / rounds * 1e6, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=50000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--shared-state-url', default='')
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    # app.py flushes into the temp directory from atexit handlers; remove it after them
+    tmp = tempfile.mkdtemp(prefix='fluxion-presence-')
+    atexit.register(shutil.rmtree, tmp, ignore_errors=True)
+    os.environ.update(
+        CATALOG_BACKEND='sql',
+        DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'catalog.db')}",
+        PROFILES_DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'profiles.db')}",
+        JOURNAL_DIR=os.path.join(tmp, 'journal'),
+        SHARED_STATE_URL=args.shared_state_url,
+        THUMBNAIL_WORKERS='0',
+        LOG_LEVEL='WARNING',
+    )
+    os.chdir(REPO_ROOT)
+
+    check_wheel(rng)
+    wheel_us, scan_us = expiry_pass(args.sessions, rng)
+
+    shared = create_shared_state(args.shared_state_url)
+    with open(os.path.join(REPO_ROOT, 'games', 'games.json')) as f:
+        games = sorted(json.load(f)['games'])
+    check_tracker(shared, rng, games)
+    tracker = PresenceTracker(shared, ttl=60.0)
+    join_us = per_call_us(lambda i: tracker.join(f'bench-{i}', f'machine_{i}', games[i % len(games)]), 20000)
+    heartbeat_us = per_call_us(lambda i: tracker.heartbeat(f'bench-{i}'), 20000)
+    tracker.release()
+    shared.close()
+
+    import app as app_module
+    from flask import render_template_string
+    for i in range(args.sessions):
+        app_module.presence.join(f'sid-{i}', f'machine_{i}', games[i % len(games)])
+    assert sum(app_module.presence.counts().values()) == args.sessions
+    client = app_module.app.test_client()
+
+    def page_ms(path, rounds=50, **headers):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            resp = client.get(path, headers=headers)
+            assert resp.status_code == 200
+        return round((time.perf_counter() - start) / rounds * 1000, 3)
+
+    first = client.get('/active-players?format=json&limit=500').get_json()
+    assert len(first['players']) == 500 and first['total'] == args.sessions and first['next_cursor']
+    with app_module.app.test_request_context():
+        start = time.perf_counter()
+        for _ in range(3):
+            render_template_string(OLD_PAGE, players=app_module.shared_state.hgetall('active_players'))
+        old_page_ms = round((time.perf_counter() - start) / 3 * 1000, 3)
+    results = {
+        'sessions': args.sessions,
+        'expiry_pass_wheel_us': wheel_us,
+        'expiry_pass_full_scan_us': scan_us,
+        'join_us': join_us,
+        'heartbeat_us': heartbeat_us,
+        'active_players_json_page_ms': page_ms('/active-players?limit=60', Accept='application/json'),
+        'active_players_html_page_ms': page_ms('/active-players?limit=60'),
+        'active_players_render_all_ms': old_page_ms,
+        'api_presence_ms': page_ms('/api/presence'),
+    }
+    app_module.presence.release()
+    assert app_module.presence.counts() == {}
+    print(json.dumps({'benchmark': 'presence', 'shared_state': args.shared_state_url or 'local',
+                      'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,141 @@
+"""User profile memory and membership cost: dict of lists vs. profiles.ProfileStore.
+
+Run from the repository root:
+
+    python benchmarks/bench_profiles.py --users 100000
+
+Both stores are filled with the same synthetic activity (each user plays,
+likes and favorites a few of ``--games`` games) and the Python heap they
+hold is measured with tracemalloc to report bytes per profile. The script
+also times the per-event "already recorded?" check for a heavy user and
+checks that the store's eviction, persistence and reload round-trip.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from profiles import ProfileStore  # noqa: E402
+
+ACTIONS = (('play', 'played', 6), ('like', 'likes', 2), ('favorite', 'favorites', 1))
+
+
+def activity(users, games, seed=1):
+    rng = random.Random(seed)
+    names = [f'Game {i}' for i in range(games)]
+    for n in range(1, users + 1):
+        machine_id = f'machine_{n}'
+        for action, _kind, count in ACTIONS:
+            for game in rng.sample(names, count):
+                yield machine_id, action, game
+
+
+def legacy_fill(events):
+    """What app.handle_game_action used to keep"""
+    profiles = {}
+    for machine_id, action, game in events:
+        key = dict((a, k) for a, k, _ in ACTIONS)[action]
+        if machine_id not in profiles:
+            profiles[machine_id] = {'likes': [], 'favorites': [], 'played': []}
+        if game not in profiles[machine_id][key]:
+            profiles[machine_id][key].append(game)
+    return profiles
+
+
+def measure_heap(fill):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = fill()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return kept, after - before
+
+
+def membership_ns(check, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        check()
+    return round((time.perf_counter() - start) / rounds * 1e9, 1)
+
+
+def check_round_trip(db_url):
+    store = ProfileStore(db_url, max_profiles=2, idle_ttl=60, flush_interval=60)
+    assert store.record('machine_1', 'play', 'Alpha') and not store.record('machine_1', 'play', 'Alpha')
+    store.record('machine_1', 'like', 'Beta')
+    store.record('machine_2', 'play', 'Beta')
+    store.record('machine_3', 'favorite', 'Gamma')  # pushes machine_1 out of the LRU
+    assert len(store) == 2 and store.stats()['evictions'] == 1
+    assert store.get('machine_1') == {'played': ['Alpha'], 'likes': ['Beta'], 'favorites': []}
+    assert store.flush() == 3
+    assert store.evict_idle(now=time.time() + 120) == 2 and len(store) == 0
+    store.close()
+
+    reopened = ProfileStore(db_url, max_profiles=10)
+    assert reopened.get('machine_3') == {'played': [], 'likes': [], 'favorites': ['Gamma']}
+    assert reopened.has('machine_1', 'like', 'Beta') and not reopened.has('machine_2', 'like', 'Beta')
+    assert reopened.highest_machine_number() == 3 and reopened.count_persisted() == 3
+    reopened.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--games', type=int, default=300)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        check_round_trip(f"sqlite:///{os.path.join(tmp, 'check.db')}")
+
+        events = list(activity(args.users, args.games))
+        legacy, legacy_bytes = measure_heap(lambda: legacy_fill(events))
+
+        store = ProfileStore(f"sqlite:///{os.path.join(tmp, 'bench.db')}", max_profiles=args.users)
+        for game in sorted({game for _, _, game in events}):
+            store.game_id(game)  # intern up front so only profile memory is measured
+
+        def fill():
+            for machine_id, action, game in events:
+                store.record(machine_id, action, game)
+            return store
+
+        _, store_bytes = measure_heap(fill)
+        assert store.get('machine_7')['played'] == sorted(legacy['machine_7']['played'],
+                                                          key=lambda name: store.game_id(name))
+
+        start = time.perf_counter()
+        written = store.flush()
+        flush_s = time.perf_counter() - start
+        assert written == args.users == store.count_persisted()
+
+        # A heavy user: every game played, checking the last one
+        heavy = [f'Game {i}' for i in range(args.games)]
+        legacy['heavy'] = {'likes': [], 'favorites': [], 'played': list(heavy)}
+        for game in heavy:
+            store.record('heavy', 'play', game)
+        last = heavy[-1]
+        rounds = 20000
+        results = {
+            'legacy_dict_of_lists': {
+                'bytes_per_profile': round(legacy_bytes / args.users),
+                'heavy_user_membership_ns': membership_ns(lambda: last in legacy['heavy']['played'], rounds),
+            },
+            'profile_store': {
+                'bytes_per_profile': round(store_bytes / args.users),
+                'heavy_user_membership_ns': membership_ns(lambda: store.has('heavy', 'play', last), rounds),
+                'flush_all_s': round(flush_s, 2),
+            },
+        }
+        store.close()
+
+    print(json.dumps({'benchmark': 'profiles', 'users': args.users, 'games': args.games,
+                      'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
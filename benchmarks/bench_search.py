@@ -0,0 +1,166 @@
+"""Catalog search latency: full scan + sort (what main.js does) vs. search.SearchIndex.
+
+Run from the repository root:
+
+    python benchmarks/bench_search.py --sizes 10000 100000
+
+For each synthetic catalog size, a GameCatalog is loaded from a temporary
+games.json and a mix of queries (tag intersections, name substrings, short
+word prefixes, cursor pages, sorts by each counter) is timed against a
+linear filter-and-sort of the whole catalog. Every query's pages are first
+checked against that linear answer, including after counter increments and
+after games.json is edited on disk (games added, removed and re-tagged).
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import GameCatalog  # noqa: E402
+from search import SearchIndex, SORT_FIELDS  # noqa: E402
+
+WORDS = ['space', 'tower', 'defense', 'racer', 'quest', 'dungeon', 'pixel', 'super', 'mega', 'ninja',
+         'cube', 'run', 'jump', 'zombie', 'city', 'farm', 'puzzle', 'battle', 'star', 'world']
+TAGS = [f'tag{i}' for i in range(60)]
+
+
+def synthetic_catalog(count, seed=1):
+    rng = random.Random(seed)
+    games = {}
+    while len(games) < count:
+        name = ' '.join(rng.sample(WORDS, 3)).title() + f' {len(games)}'
+        games[name] = {'Location': 'x.html', 'Thumbnail': '', 'Likes': rng.randrange(100),
+                       'Favorites': rng.randrange(50), 'Plays': rng.randrange(1000),
+                       'Tags': rng.sample(TAGS, rng.randrange(1, 5))}
+    return {'games': games}
+
+
+def linear(games, tags=(), query='', sort='plays'):
+    """Filter and sort the whole catalog on every query"""
+    query = query.lower()
+    field = SORT_FIELDS[sort]
+    matches = []
+    for name, game in games.items():
+        if tags and not all(tag in game['Tags'] for tag in tags):
+            continue
+        if query:
+            lowered = name.lower()
+            if len(query) >= 3:
+                if query not in lowered:
+                    continue
+            elif not any(word.startswith(query) for word in lowered.split()):
+                continue
+        matches.append(name)
+    if field is None:
+        matches.sort(key=lambda name: (name.lower(), name))
+    else:
+        matches.sort(key=lambda name: (-games[name][field], name))
+    return matches
+
+
+def all_pages(index, limit, **query):
+    names, cursor = [], None
+    while True:
+        page, total, cursor = index.search(limit=limit, cursor=cursor, **query)
+        names += page
+        if cursor is None:
+            return names, total
+
+
+QUERIES = [
+    {'sort': 'plays'},
+    {'tags': ['tag3'], 'sort': 'likes'},
+    {'tags': ['tag3', 'tag7'], 'sort': 'plays'},
+    {'query': 'tower', 'sort': 'favorites'},
+    {'query': 'er d', 'sort': 'name'},
+    {'query': 'ni', 'tags': ['tag1'], 'sort': 'plays'},
+    {'query': 'zzz'},
+]
+
+
+def check(catalog, index):
+    games = catalog.games()
+    for query in QUERIES:
+        expected = linear(games, **query)
+        got, total = all_pages(index, 97, **query)
+        assert got == expected and total == len(expected), query
+
+
+def time_queries(fn, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for query in QUERIES:
+            fn(query)
+    return round((time.perf_counter() - start) / (rounds * len(QUERIES)) * 1e6, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    results = {}
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'games.json')
+            data = synthetic_catalog(size)
+            with open(path, 'w') as f:
+                json.dump(data, f)
+            catalog = GameCatalog(path, reload_check_interval=0)
+            index = SearchIndex(catalog)
+            start = time.perf_counter()
+            index.refresh()
+            build_s = time.perf_counter() - start
+            check(catalog, index)
+
+            # Counter increments are applied incrementally
+            rng = random.Random(2)
+            names = list(data['games'])
+            for _ in range(2000):
+                catalog.increment(rng.choice(names), rng.choice(['Plays', 'Likes', 'Favorites']), rng.randrange(1, 50))
+            start = time.perf_counter()
+            index.refresh()
+            counters_ms = (time.perf_counter() - start) * 1000
+            check(catalog, index)
+
+            # An edit on disk: a few games removed, added and re-tagged
+            catalog.flush()
+            with open(path) as f:
+                edited = json.load(f)
+            for name in names[:5]:
+                del edited['games'][name]
+            for name in names[5:10]:
+                edited['games'][name]['Tags'] = ['tag59', 'retagged']
+            edited['games']['Brand New Ninja Game'] = {'Location': 'n.html', 'Thumbnail': '', 'Likes': 5000,
+                                                       'Favorites': 0, 'Plays': 1, 'Tags': ['tag1']}
+            time.sleep(0.01)
+            with open(path, 'w') as f:
+                json.dump(edited, f)
+            assert 'Brand New Ninja Game' in catalog  # triggers the reload
+            start = time.perf_counter()
+            index.refresh()
+            reload_ms = (time.perf_counter() - start) * 1000
+            check(catalog, index)
+            assert index.rebuilds == 1
+
+            games = catalog.games()
+            results[size] = {
+                'index_build_ms': round(build_s * 1000, 1),
+                'refresh_after_2000_increments_ms': round(counters_ms, 1),
+                'refresh_after_reload_ms': round(reload_ms, 1),
+                'linear_query_us': time_queries(lambda q: linear(games, **q)[:50], max(1, args.rounds // 10)),
+                'indexed_query_us': time_queries(lambda q: index.search(limit=50, **q), args.rounds),
+            }
+            catalog.close()
+
+    print(json.dumps({'benchmark': 'search', 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""SQL catalog backend on SQLite: N+1 vs. bulk migration, then serving and counting.
+
+Run from the repository root:
+
+    python benchmarks/bench_sql_catalog.py --games 100000
+
+Generates a synthetic games.json, migrates it the old way (one SELECT per
+tag and per game through the ORM, on ``--legacy-games`` games) and with
+migrations.migrate_games (bulk upserts in batched transactions), then loads
+it into catalog_sql.SQLCatalog and times building and serving the
+``/api/games`` body and flushing counter increments. Checks that re-running
+the migration is idempotent, that the database reproduces games.json, and
+that two workers flushing the same counters add up instead of overwriting.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func, select  # noqa: E402
+
+from catalog_cache import CatalogResponseCache  # noqa: E402
+from catalog_sql import SQLCatalog  # noqa: E402
+from migrations import create_db_app, migrate_games_from_json  # noqa: E402
+from models import db, Game, Tag  # noqa: E402
+
+TAGS = [f'tag{i}' for i in range(200)]
+
+
+def synthetic_catalog(count, seed=1):
+    rng = random.Random(seed)
+    return {'games': {f'Game {i:06d}': {
+        'Location': f'game-{i}.html',
+        'Thumbnail': f'https://example.com/thumbs/{i}.png',
+        'Likes': rng.randrange(100),
+        'Favorites': rng.randrange(50),
+        'Plays': rng.randrange(1000),
+        'Tags': rng.sample(TAGS, rng.randrange(1, 5)),
+    } for i in range(count)}}
+
+
+def legacy_migrate(games):
+    """The old migrations.py loop: a query per tag and per game, ORM objects for everything"""
+    tag_objects = {}
+    for tag_name in {tag for game in games.values() for tag in game['Tags']}:
+        tag = Tag.query.filter_by(name=tag_name).first()
+        if not tag:
+            tag = Tag(name=tag_name)
+            db.session.add(tag)
+        tag_objects[tag_name] = tag
+    db.session.commit()
+    for game_name, game_data in games.items():
+        game = Game.query.filter_by(name=game_name).first()
+        if not game:
+            game = Game(name=game_name, location=game_data['Location'], thumbnail=game_data['Thumbnail'],
+                        likes=game_data['Likes'], favorites=game_data['Favorites'], plays=game_data['Plays'])
+            for tag_name in game_data['Tags']:
+                game.tags.append(tag_objects[tag_name])
+            db.session.add(game)
+    db.session.commit()
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--games', type=int, default=100000)
+    parser.add_argument('--legacy-games', type=int, default=5000)
+    parser.add_argument('--increments', type=int, default=100000)
+    args = parser.parse_args()
+
+    data = synthetic_catalog(args.games)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, 'games.json')
+        with open(json_path, 'w') as f:
+            json.dump(data, f)
+
+        legacy_games = dict(list(data['games'].items())[:args.legacy_games])
+        legacy_app = create_db_app(f"sqlite:///{os.path.join(tmp, 'legacy.db')}")
+        with legacy_app.app_context():
+            db.create_all()
+            _, legacy_s = timed(lambda: legacy_migrate(legacy_games))
+            db.engine.dispose()
+        results['legacy_migration'] = {'games': args.legacy_games,
+                                       'games_per_sec': round(args.legacy_games / legacy_s)}
+
+        app = create_db_app(f"sqlite:///{os.path.join(tmp, 'catalog.db')}")
+        with app.app_context():
+            db.create_all()
+            engine = db.engine
+        count, migrate_s = timed(lambda: migrate_games_from_json(engine, json_path))
+        assert count == args.games
+        results['bulk_migration'] = {'games': args.games, 'seconds': round(migrate_s, 2),
+                                     'games_per_sec': round(args.games / migrate_s)}
+
+        catalog, load_s = timed(lambda: SQLCatalog(engine, reload_check_interval=3600))
+        assert catalog.data() == data, 'database does not reproduce games.json'
+        cache = CatalogResponseCache(catalog)
+        rendition, build_s = timed(cache.current)
+        _, serve_s = timed(lambda: [cache.current() for _ in range(1000)])
+        results['serving'] = {
+            'load_s': round(load_s, 2),
+            'build_body_ms': round(build_s * 1000, 1),
+            'cached_body_us': round(serve_s / 1000 * 1e6, 2),
+            'body_bytes': {encoding: len(body) for encoding, body in rendition.bodies.items()},
+        }
+
+        # Re-running the migration changes nothing, and keeps counters the database owns
+        catalog.increment('Game 000001', 'Plays', 5)
+        assert catalog.flush()
+        migrate_games_from_json(engine, json_path)
+        with engine.connect() as conn:
+            assert conn.execute(select(func.count()).select_from(Game.__table__)).scalar() == args.games
+            plays = conn.execute(select(Game.__table__.c.plays)
+                                 .where(Game.__table__.c.name == 'Game 000001')).scalar()
+        assert plays == data['games']['Game 000001']['Plays'] + 5
+
+        # Two workers on one database: increments add up
+        other = SQLCatalog(engine, reload_check_interval=0)
+        names = list(data['games'])
+        rng = random.Random(2)
+        touched = [rng.choice(names) for _ in range(args.increments)]
+        start = time.perf_counter()
+        for name in touched:
+            catalog.increment(name, 'Likes')
+        increment_s = time.perf_counter() - start
+        _, flush_s = timed(catalog.flush)
+        other.increment('Game 000002', 'Likes', 7)
+        assert other.flush()
+        expected = data['games']['Game 000002']['Likes'] + touched.count('Game 000002') + 7
+        with engine.connect() as conn:
+            assert conn.execute(select(Game.__table__.c.likes)
+                                .where(Game.__table__.c.name == 'Game 000002')).scalar() == expected
+        assert other.get('Game 000002')['Likes'] == expected  # other picked up catalog's flush
+        results['counters'] = {
+            'increments': args.increments,
+            'increments_per_sec': round(args.increments / increment_s),
+            'flush_s': round(flush_s, 2),
+            'games_updated': len(set(touched)),
+        }
+
+    print(json.dumps({'benchmark': 'sql_catalog', 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
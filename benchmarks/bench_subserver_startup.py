@@ -0,0 +1,121 @@
+"""Sub-server boot cost: legacy serial import-everything vs. subservers.SubServerRegistry.
+
+Run from the repository root:
+
+    python benchmarks/bench_subserver_startup.py
+
+A temporary ``servers/`` directory holds ``--copies`` copies of Fluxify plus
+a small sub-server with a POST route and an ``<int:>`` converter. Each mode
+runs in a fresh interpreter (Flask already imported, as it is by ``app``)
+and reports the time until the main app can serve, then the latency of the
+first request to a sub-server. The script first checks that the dispatcher
+keeps the methods and converters the legacy per-rule Blueprint copy loses.
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.standin import REPO_ROOT  # noqa: E402
+
+EXTRA_SERVER = '''
+from flask import Flask, request
+
+app = Flask(__name__)
+
+
+@app.route('/items/<int:item_id>', methods=['POST'])
+def item(item_id):
+    return f'{request.method} {item_id + 1}'
+'''
+
+CHILD = r'''
+import sys, json, time
+sys.path.insert(0, REPO_ROOT)
+import flask
+from flask import Flask, Blueprint
+import os
+from subservers import import_python_server
+
+def legacy_boot(root, app):
+    """main.init_sub_servers before the registry: exec and copy every server"""
+    for name in os.listdir(root):
+        path = os.path.join(root, name, 'main.py')
+        if not os.path.exists(path):
+            continue
+        module = import_python_server(name, path)
+        bp = Blueprint(name, __name__, url_prefix=f'/other/{name}')
+        for rule in module.app.url_map.iter_rules():
+            bp.add_url_rule(str(rule), rule.endpoint, module.app.view_functions[rule.endpoint])
+        app.register_blueprint(bp)
+
+app = Flask('bench_main')
+start = time.perf_counter()
+if MODE == 'legacy':
+    legacy_boot(ROOT, app)
+else:
+    from subservers import SubServerRegistry, SubServerDispatcher
+    registry = SubServerRegistry(ROOT)
+    registry.discover()
+    app.wsgi_app = SubServerDispatcher(app.wsgi_app, registry)
+    if MODE == 'parallel':
+        registry.preload(list(registry.servers), workers=4)
+boot = time.perf_counter() - start
+
+client = app.test_client()
+start = time.perf_counter()
+status = client.get('/other/fluxify0/').status_code
+first = time.perf_counter() - start
+post = client.post('/other/extra/items/41')
+result = {'boot_ms': round(boot * 1000, 1), 'first_request_ms': round(first * 1000, 1),
+          'first_status': status, 'post': [post.status_code, post.get_data(as_text=True)[:40]]}
+if MODE != 'legacy':
+    result['import_ms'] = {name: s['load_ms'] for name, s in registry.stats()['servers'].items()}
+print(json.dumps(result))
+'''
+
+
+def run(mode, root):
+    code = f'REPO_ROOT = {REPO_ROOT!r}\nROOT = {root!r}\nMODE = {mode!r}\n' + CHILD
+    out = subprocess.run([sys.executable, '-c', code], cwd=REPO_ROOT, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--copies', type=int, default=4, help='copies of Fluxify to mount')
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as root:
+        for i in range(args.copies):
+            shutil.copytree(os.path.join(REPO_ROOT, 'servers', 'fluxify'), os.path.join(root, f'fluxify{i}'),
+                            ignore=shutil.ignore_patterns('__pycache__'))
+        os.makedirs(os.path.join(root, 'extra'))
+        with open(os.path.join(root, 'extra', 'main.py'), 'w') as f:
+            f.write(EXTRA_SERVER)
+
+        for mode in ('legacy', 'lazy', 'parallel'):
+            runs = [run(mode, root) for _ in range(args.runs)]
+            for r in runs:
+                assert r['first_status'] == 200, (mode, r)
+            best = min(runs, key=lambda r: r['boot_ms'])
+            results[mode] = best
+
+    # The per-rule copy dropped methods=['POST']; dispatch keeps the sub-app's own routing
+    assert results['legacy']['post'][0] == 405, results['legacy']
+    assert results['lazy']['post'] == [200, 'POST 42'] and results['parallel']['post'] == [200, 'POST 42']
+    assert results['lazy']['boot_ms'] < results['legacy']['boot_ms']
+
+    print(json.dumps({'benchmark': 'subserver_startup', 'sub_servers': args.copies + 1,
+                      'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
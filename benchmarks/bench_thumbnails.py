@@ -0,0 +1,188 @@
+"""Thumbnail pipeline: ingestion, catalog rewriting and serving, offline.
+
+Run from the repository root:
+
+    python benchmarks/bench_thumbnails.py
+
+A local stand-in origin serves generated 480x360 PNG/JPEG/GIF fixtures in
+place of uploads.scratch.mit.edu. The script checks that every source is
+fetched once and stored content-addressed (two URLs with the same image
+share one set of variants), that variants fit their box with the aspect
+ratio kept, that a restart reuses the index without fetching, that
+/api/games rewrites Thumbnail and changes its ETag once thumbnails are
+ready, and that /thumbs/ picks WebP or PNG from Accept with immutable
+caching. It then reports ingest throughput for 1 and --workers workers and
+bytes per card image, remote original vs the local default size.
+
+Pillow is needed (pip install pillow).
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.standin import StandInOrigin  # noqa: E402
+from catalog import GameCatalog  # noqa: E402
+from catalog_cache import CatalogResponseCache  # noqa: E402
+from thumbnails import ThumbnailStore, THUMBNAIL_SIZES, DEFAULT_SIZE, Image  # noqa: E402
+
+
+def fixture(seed, fmt, size=(480, 360)):
+    """A screenshot-like image: gradient background with random shapes"""
+    from PIL import ImageDraw
+
+    rng = random.Random(seed)
+    image = Image.new('RGB', size)
+    pixels = image.load()
+    base = [rng.randrange(256) for _ in range(3)]
+    for y in range(size[1]):
+        for x in range(0, size[0], 4):
+            color = tuple((channel + x // 3 + y // 2) % 256 for channel in base)
+            for dx in range(4):
+                pixels[x + dx, y] = color
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        draw.rectangle([x, y, x + rng.randrange(20, 120), y + rng.randrange(20, 90)],
+                       fill=tuple(rng.randrange(256) for _ in range(3)))
+    out = io.BytesIO()
+    image.save(out, fmt)
+    return out.getvalue()
+
+
+def build_fixtures(count):
+    routes = {}
+    formats = (('PNG', 'image/png'), ('JPEG', 'image/jpeg'), ('GIF', 'image/gif'))
+    for i in range(count):
+        fmt, content_type = formats[i % len(formats)]
+        routes[f'/get_image/project/{i}_480x360.png'] = (200, {'Content-Type': content_type}, fixture(i, fmt))
+    return routes
+
+
+def write_catalog(path, origin, names):
+    games = {name: {'Location': f'{name}.html', 'Thumbnail': origin.url + route, 'Likes': 0, 'Favorites': 0,
+                    'Plays': 0, 'Tags': []} for name, route in names.items()}
+    with open(path, 'w') as f:
+        json.dump({'games': games}, f)
+    return games
+
+
+def check(origin, tmp):
+    routes = list(origin.routes)
+    # game-0 and game-dup share an image under two URLs; one URL is broken
+    origin.routes['/copy.png'] = origin.routes[routes[0]]
+    origin.routes['/broken.png'] = (200, {'Content-Type': 'image/png'}, b'not a png')
+    names = {f'game-{i}': route for i, route in enumerate(routes[:3])}
+    names.update({'game-dup': '/copy.png', 'game-broken': '/broken.png'})
+    catalog_path = os.path.join(tmp, 'games.json')
+    games = write_catalog(catalog_path, origin, names)
+    root = os.path.join(tmp, 'thumbs')
+
+    store = ThumbnailStore(root, workers=2)
+    store.start()
+    catalog = GameCatalog(catalog_path)
+    cache = CatalogResponseCache(catalog, thumbnails=store)
+    app = Flask(__name__)
+
+    @app.route('/thumbs/<name>')
+    def thumb(name):
+        return store.send(name)
+
+    before = cache.current()
+    assert before.games['game-0']['Thumbnail'] == games['game-0']['Thumbnail']  # not ready yet: remote URL
+    origin.requests = 0
+    assert store.wait(30)
+    assert origin.requests == 5, origin.requests  # one fetch per source URL
+    assert store.ingest_catalog(catalog.games()) == 0  # ready or recently failed: nothing queued
+
+    after = cache.current()
+    assert after.token != before.token and cache.delta(before.token) is None
+    entry = after.games['game-0']
+    digest = entry['Thumbnail'].rsplit('/', 1)[1].split('-')[0]
+    assert entry['Thumbnail'] == f'/thumbs/{digest}-{DEFAULT_SIZE}'
+    assert set(entry['Thumbnails']) == set(THUMBNAIL_SIZES)
+    assert after.games['game-dup']['Thumbnail'] == entry['Thumbnail']  # content-addressed
+    assert after.games['game-broken']['Thumbnail'] == games['game-broken']['Thumbnail']
+    assert len(os.listdir(os.path.join(root, digest[:2]))) == 2 * len(THUMBNAIL_SIZES)
+
+    client = app.test_client()
+    for size, (width, height) in THUMBNAIL_SIZES.items():
+        resp = client.get(f'/thumbs/{digest}-{size}', headers={'Accept': 'image/avif,image/webp,*/*'})
+        assert resp.status_code == 200 and resp.mimetype == 'image/webp'
+        assert resp.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+        assert resp.headers['Vary'] == 'Accept'
+        with Image.open(io.BytesIO(resp.data)) as image:
+            assert image.size[0] <= width and image.size[1] <= height
+            assert abs(image.size[0] / image.size[1] - 480 / 360) < 0.02, image.size
+        png = client.get(f'/thumbs/{digest}-{size}', headers={'Accept': 'image/png,image/*;q=0.8'})
+        assert png.status_code == 200 and png.mimetype == 'image/png' and png.data.startswith(b'\x89PNG')
+        again = client.get(f'/thumbs/{digest}-{size}', headers={'Accept': 'image/webp',
+                                                                 'If-None-Match': resp.headers['ETag']})
+        assert again.status_code == 304
+    for bad in (f'{digest}-999x999', f'{digest[:8]}-{DEFAULT_SIZE}', '0' * 16 + f'-{DEFAULT_SIZE}', '..%2Findex.json'):
+        assert client.get(f'/thumbs/{bad}').status_code == 404, bad
+    store.close()
+
+    # Restart: the index is reused, nothing is fetched again
+    origin.requests = 0
+    restarted = ThumbnailStore(root, workers=2)
+    restarted.start()
+    assert restarted.ingest_catalog(catalog.games()) == 1  # only the broken one is retried
+    assert restarted.wait(30) and origin.requests == 1
+    assert restarted.url_for(games['game-1']['Thumbnail']) is not None
+    restarted.close()
+
+
+def ingest_rate(origin, tmp, workers):
+    store = ThumbnailStore(os.path.join(tmp, f'rate-{workers}'), workers=workers)
+    store.start()
+    start = time.perf_counter()
+    queued = store.ingest(origin.url + route for route in origin.routes if route.startswith('/get_image/'))
+    assert store.wait(300)
+    elapsed = time.perf_counter() - start
+    store.close()
+    return round(queued / elapsed, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--images', type=int, default=24)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+    if Image is None:
+        sys.exit('Pillow is not installed (pip install pillow)')
+
+    with tempfile.TemporaryDirectory() as tmp, StandInOrigin(build_fixtures(args.images)) as origin:
+        check(origin, tmp)
+        rates = {workers: ingest_rate(origin, tmp, workers) for workers in sorted({1, args.workers})}
+
+        store = ThumbnailStore(os.path.join(tmp, f'rate-{args.workers}'))
+        remote = local_webp = local_png = 0
+        for route, (_, _, body) in origin.routes.items():
+            if not route.startswith('/get_image/'):
+                continue
+            digest = store._index[origin.url + route]
+            remote += len(body)
+            local_webp += os.path.getsize(store._path(digest, DEFAULT_SIZE, 'webp'))
+            local_png += os.path.getsize(store._path(digest, DEFAULT_SIZE, 'png'))
+
+    results = {
+        'images': args.images,
+        'ingest_images_per_sec': rates,
+        'bytes_per_card_remote_480x360': remote // args.images,
+        f'bytes_per_card_local_{DEFAULT_SIZE}_webp': local_webp // args.images,
+        f'bytes_per_card_local_{DEFAULT_SIZE}_png': local_png // args.images,
+    }
+    print(json.dumps({'benchmark': 'thumbnails', 'cpus': os.cpu_count(), 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
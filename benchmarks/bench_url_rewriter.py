@@ -0,0 +1,96 @@
+"""Fluxify URL rewriting: legacy rewrite_url vs. the memoized URLRewriter.
+
+Run from the repository root:
+
+    python benchmarks/bench_url_rewriter.py
+
+Replays the links of an asset-heavy page (a few hundred distinct URLs, each
+repeated, relative and absolute) through the old per-call function and the
+memoized rewriter, checks they produce the same links for the same prefix,
+and reports URLs rewritten per second. The legacy function printed every
+URL; its stdout goes to /dev/null here, as it would behind a log collector.
+"""
+import os
+import sys
+import json
+import time
+import base64
+import random
+import argparse
+import contextlib
+import urllib.parse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.standin import load_sub_server  # noqa: E402
+
+PREFIX = '/other/fluxify/go/'
+BASE_URL = 'https://example.com/games/index.html'
+
+
+def legacy_rewrite_url(url, base_url):
+    """rewrite_url as it was: urljoin + base64 + a print on every call"""
+    if url.startswith('//'):
+        url = 'https:' + url
+    if url.startswith(('http://', 'https://')):
+        encoded_url = base64.b64encode(url.encode()).decode()
+        final_url = f'{PREFIX}{encoded_url}'
+    else:
+        full_url = urllib.parse.urljoin(base_url, url)
+        encoded_url = base64.b64encode(full_url.encode()).decode()
+        final_url = f'{PREFIX}{encoded_url}'
+
+    print(f"Rewritten URL: {final_url}")  # Debug print to check URL
+    return final_url
+
+
+def page_links(distinct, total, seed=7):
+    shapes = ('/static/img/{i}.png', 'thumbs/{i}.webp', '../css/{i}.css', '//cdn.example.net/js/{i}.js',
+              'https://fonts.example.org/{i}.woff2', '/play/{i}?ref=home')
+    urls = [shapes[i % len(shapes)].format(i=i) for i in range(distinct)]
+    rng = random.Random(seed)
+    return [rng.choice(urls) for _ in range(total)]
+
+
+def rate(fn, links, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for url in links:
+            fn(url, BASE_URL)
+        best = min(best, time.perf_counter() - start)
+    return round(len(links) / best)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--distinct', type=int, default=400)
+    parser.add_argument('--links', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    load_sub_server('fluxify')
+    from server_fluxify.urls import URLRewriter
+
+    rewriter = URLRewriter(PREFIX)
+    links = page_links(args.distinct, args.links)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for url in set(links):
+            assert rewriter(url, BASE_URL) == legacy_rewrite_url(url, BASE_URL), url
+        legacy = rate(legacy_rewrite_url, links, args.repeat)
+    memoized = rate(rewriter, links, args.repeat)
+    rewriter.clear()
+    cold = rate(URLRewriter(PREFIX, cache_size=0), links, args.repeat)
+
+    print(json.dumps({'benchmark': 'url_rewriter', 'results': {
+        'links': args.links,
+        'distinct_urls': args.distinct,
+        'legacy_urls_per_sec': legacy,
+        'unmemoized_urls_per_sec': cold,
+        'memoized_urls_per_sec': memoized,
+        'speedup': round(memoized / legacy, 1),
+    }}, indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""Socket.IO game events/sec as app.py workers go from 1 to N.
+
+Run from the repository root:
+
+    python benchmarks/bench_workers.py --workers 4
+
+For every worker count, starts that many real app.py processes (SQL
+catalog in a temp database, SHARED_STATE_URL and the Socket.IO
+message_queue both pointing at a local Redis stand-in) and spreads
+``--senders`` polling clients over them, each sending ``--events``
+'play' game_action events (one at a time, waiting for the ack). One listener per worker subscribes to every
+game's updates; the run ends when each listener has seen all the plays,
+so every event has crossed the message queue to every worker. The
+shared connection count, machine ID numbering and active players are
+checked along the way.
+
+The redis package is needed for the stand-in's clients (pip install redis).
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+
+import requests
+import socketio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.standin import REPO_ROOT, StandInRedis  # noqa: E402
+from migrations import create_db_app, migrate_games_from_json  # noqa: E402
+from models import db  # noqa: E402
+from shared_state import RedisState  # noqa: E402
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_workers(count, env):
+    workers = []
+    for _ in range(count):
+        port = free_port()
+        process = subprocess.Popen(
+            [sys.executable, '-c',
+             'import app; app.socketio.run(app.app, host="127.0.0.1", port=%d, '
+             'allow_unsafe_werkzeug=True, log_output=False)' % port],
+            cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        workers.append((process, f'http://127.0.0.1:{port}'))
+    deadline = time.monotonic() + 60
+    for process, url in workers:
+        while True:
+            try:
+                requests.get(url + '/test', timeout=1)
+                break
+            except requests.ConnectionError:
+                if process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError(f'worker at {url} did not start')
+                time.sleep(0.1)
+    return workers
+
+
+def stop_workers(workers):
+    for process, _ in workers:
+        process.terminate()
+    for process, _ in workers:
+        process.wait(timeout=30)
+
+
+def connect(url):
+    client = socketio.Client(reconnection=False)
+    client.connect(url, transports=['polling'])
+    return client
+
+
+def run(count, args, env, game, redis_url):
+    state = RedisState(redis_url)
+    state.redis.flushall()
+    workers = start_workers(count, env)
+    try:
+        listeners = []
+        for _, url in workers:
+            listener = connect(url)
+            seen = {'plays': 0}
+
+            def on_updates(payload, seen=seen):
+                for update in payload['games'].values():
+                    seen['plays'] += update['delta'].get('Plays', 0)
+
+            listener.on('game_updates', on_updates)
+            listener.emit('subscribe_games', {'all': True})
+            listeners.append((listener, seen))
+        senders = [connect(workers[i % count][1]) for i in range(args.senders)]
+        clients = len(listeners) + len(senders)
+        assert sum(state.hgetall('connections').values()) == clients
+        assert state.incr('machine_counter', 0) == clients  # one fresh ID per connection, no reuse
+        time.sleep(0.5)  # let the subscriptions settle
+
+        total = args.senders * args.events
+        start = time.perf_counter()
+
+        def send(client):
+            # Wait for each ack: unpaced emits pile up past engine.io's packets-per-POST limit
+            for _ in range(args.events):
+                client.call('game_action', {'game': game, 'action': 'play'}, timeout=30)
+
+        threads = [threading.Thread(target=send, args=(client,)) for client in senders]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        deadline = time.monotonic() + 120
+        while any(seen['plays'] < total for _, seen in listeners):
+            if time.monotonic() > deadline:
+                raise AssertionError(f"listeners saw {[seen['plays'] for _, seen in listeners]} of {total} plays")
+            time.sleep(0.01)
+        elapsed = time.perf_counter() - start
+        assert all(seen['plays'] == total for _, seen in listeners)
+        assert len(state.hgetall('active_players')) == args.senders
+
+        for client in senders + [listener for listener, _ in listeners]:
+            client.disconnect()
+        time.sleep(0.5)
+        assert sum(state.hgetall('connections').values()) == 0
+        assert state.hgetall('active_players') == {}
+        return {'events': total, 'seconds': round(elapsed, 3), 'events_per_sec': round(total / elapsed)}
+    finally:
+        stop_workers(workers)
+        state.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--senders', type=int, default=8)
+    parser.add_argument('--events', type=int, default=250)
+    args = parser.parse_args()
+
+    with open(os.path.join(REPO_ROOT, 'games', 'games.json')) as f:
+        game = next(iter(json.load(f)['games']))
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp, StandInRedis() as stand_in:
+        database_url = f"sqlite:///{os.path.join(tmp, 'catalog.db')}"
+        db_app = create_db_app(database_url)
+        with db_app.app_context():
+            db.create_all()
+            migrate_games_from_json(db.engine, os.path.join(REPO_ROOT, 'games', 'games.json'))
+        env = dict(os.environ,
+                   PYTHONPATH=REPO_ROOT,
+                   CATALOG_BACKEND='sql',
+                   DATABASE_URL=database_url,
+                   SHARED_STATE_URL=stand_in.url,
+                   BROADCAST_INTERVAL='0.05',
+                   THUMBNAIL_WORKERS='0')
+        counts = sorted({1, args.workers} | {2 ** i for i in range(args.workers.bit_length()) if 2 ** i < args.workers})
+        for count in counts:
+            # Fresh profiles per run, so machine IDs start over
+            env['PROFILES_DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, f'profiles-{count}.db')}"
+            results[count] = run(count, args, env, game, stand_in.url)
+        redis_commands = stand_in.commands
+
+    print(json.dumps({'benchmark': 'workers', 'cpus': os.cpu_count(), 'senders': args.senders,
+                      'redis_commands': redis_commands, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,320 @@
+"""Load test of the real server: simulated Socket.IO clients, HTTP and Fluxify.
+
+Run from the repository root:
+
+    python benchmarks/loadtest.py --out baseline.json
+    python benchmarks/loadtest.py --baseline baseline.json
+
+Everything runs offline in this process. app.py is imported with its
+catalog in a temporary SQL database (games/games.json is only read),
+profiles and the journal in the same temp directory. Scenarios:
+
+* socketio: ``--clients`` app.socketio test clients connect and stay
+  connected, subscribe to a game, send ``--actions`` play/like/favorite
+  game_action events each and disconnect, spread over ``--threads``
+  threads;
+* http: GET /api/games (identity, gzip and a 304 revalidation), a search
+  and /games/<file> through the Flask test client;
+* fluxify: the pages in benchmarks/fixtures/html proxied through /go/ from
+  a stand-in origin.
+
+Every operation reports p50/p99/max latency in ms and ops/sec, every
+scenario the peak RSS so far; each scenario runs ``--repeat`` times and
+the median of every figure is kept. Catalog totals, the connection count
+and the proxied pages are checked along the way. ``--seed`` fixes the
+sequence of games and actions.
+
+With ``--baseline``, p50, ops/sec and RSS are compared with a stored run
+(``--out``) and the exit status is 1 when one is worse by more than
+``--tolerance``; p99 gets ``--p99-tolerance``, since with more threads
+than cores the tail is mostly scheduling noise.
+"""
+import os
+import sys
+import atexit
+import shutil
+import json
+import time
+import random
+import statistics
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.standin import REPO_ROOT, StandInOrigin, load_sub_server, peak_rss_kb  # noqa: E402
+
+FIXTURES = os.path.join(REPO_ROOT, 'benchmarks', 'fixtures', 'html')
+ACTIONS = ('play', 'like', 'favorite')
+ACTION_WEIGHTS = (7, 2, 1)
+
+
+def summarize(latencies, elapsed):
+    """{count, p50_ms, p99_ms, max_ms, ops_per_sec} for a list of seconds"""
+    ordered = sorted(latencies)
+    count = len(ordered)
+
+    def percentile(p):
+        return round(ordered[min(count - 1, int(p * count))] * 1000, 3)
+
+    return {'count': count, 'p50_ms': percentile(0.5), 'p99_ms': percentile(0.99),
+            'max_ms': round(ordered[-1] * 1000, 3), 'ops_per_sec': round(count / elapsed, 1)}
+
+
+def median_results(runs):
+    """Per-figure median of several runs of one scenario (peak RSS: the last run's)"""
+    merged = {}
+    for name, value in runs[-1].items():
+        if isinstance(value, dict):
+            merged[name] = {stat: statistics.median(run[name][stat] for run in runs) for stat in value}
+        elif name == 'peak_rss_kb':
+            merged[name] = value
+        else:
+            merged[name] = statistics.median(run[name] for run in runs)
+    return merged
+
+
+def run_phase(workers, fn):
+    """Run ``fn(worker_index, latencies)`` on every worker thread; returns (latencies, seconds)"""
+    per_thread = [[] for _ in range(workers)]
+    errors = []
+
+    def target(index):
+        try:
+            fn(index, per_thread[index])
+        except BaseException as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=target, args=(index,)) for index in range(workers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    if errors:
+        raise errors[0]
+    return [latency for latencies in per_thread for latency in latencies], elapsed
+
+
+def timed(latencies, fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    latencies.append(time.perf_counter() - start)
+    return result
+
+
+def socketio_scenario(app_module, args, rng):
+    games = sorted(app_module.catalog.games())
+    before, _ = app_module.catalog.games_with_totals()
+    slices = [list(range(index, args.clients, args.threads)) for index in range(args.threads)]
+    plan = {client: [(rng.choice(games), rng.choices(ACTIONS, ACTION_WEIGHTS)[0]) for _ in range(args.actions)]
+            for client in range(args.clients)}
+    clients = {}
+    received = [0] * args.threads
+
+    def drain(index, client):
+        # Same as get_received() without its per-packet namespace filtering, which is
+        # quadratic in the backlog and would dominate the client side
+        received[index] += len(client.queue)
+        client.queue = []
+
+    def connect(index, latencies):
+        for client_id in slices[index]:
+            client = timed(latencies, app_module.socketio.test_client, app_module.app)
+            clients[client_id] = client
+            drain(index, client)
+
+    def subscribe(index, latencies):
+        for client_id in slices[index]:
+            client = clients[client_id]
+            timed(latencies, client.emit, 'subscribe_games', {'games': [plan[client_id][0][0]]})
+            drain(index, client)
+
+    def act(index, latencies):
+        for step in range(args.actions):
+            for client_id in slices[index]:
+                game, action = plan[client_id][step]
+                client = clients[client_id]
+                timed(latencies, client.emit, 'game_action', {'game': game, 'action': action})
+                drain(index, client)
+
+    def disconnect(index, latencies):
+        for client_id in slices[index]:
+            client = clients[client_id]
+            drain(index, client)
+            timed(latencies, client.disconnect)
+
+    results = {}
+    for name, phase in (('connect', connect), ('subscribe', subscribe), ('game_action', act)):
+        results[name] = summarize(*run_phase(args.threads, phase))
+    assert app_module.user_count() == args.clients, app_module.user_count()
+    time.sleep(3 * app_module.broadcaster.interval)  # let the last batched game_updates go out
+    results['disconnect'] = summarize(*run_phase(args.threads, disconnect))
+    assert app_module.user_count() == 0, app_module.user_count()
+
+    app_module.catalog.flush()
+    after, _ = app_module.catalog.games_with_totals()
+    for game in games:
+        for action, field in app_module.ACTION_FIELDS.items():
+            sent = sum(1 for steps in plan.values() for planned in steps if planned == (game, action))
+            assert after[game].get(field, 0) - before[game].get(field, 0) == sent, (game, field)
+    results['messages_received'] = sum(received)
+    results['peak_rss_kb'] = peak_rss_kb()
+    return results
+
+
+def http_scenario(app_module, args):
+    game_files = sorted(name for name in os.listdir(os.path.join(REPO_ROOT, 'games'))
+                        if name.endswith('.html'))
+    etag = app_module.app.test_client().get('/api/games').headers['ETag']
+    requests = [
+        ('api_games', '/api/games', {}, 200),
+        ('api_games_gzip', '/api/games', {'Accept-Encoding': 'gzip'}, 200),
+        ('api_games_304', '/api/games', {'If-None-Match': etag}, 304),
+        ('api_games_search', '/api/games/search?q=a', {}, 200),
+    ] + [('game_file', f'/games/{name}', {'Accept-Encoding': 'gzip'}, 200) for name in game_files]
+    results = {}
+    for name in dict.fromkeys(label for label, *_ in requests):
+        batch = [request for request in requests if request[0] == name]
+
+        def fetch(index, latencies):
+            client = app_module.app.test_client()
+            for i in range(args.requests // args.threads):
+                _, path, headers, status = batch[i % len(batch)]
+                response = timed(latencies, client.get, path, headers=headers)
+                assert response.status_code == status, (path, response.status_code)
+                response.close()
+
+        results[name] = summarize(*run_phase(args.threads, fetch))
+    results['peak_rss_kb'] = peak_rss_kb()
+    return results
+
+
+def fluxify_scenario(fluxify, args):
+    pages = {}
+    for name in sorted(os.listdir(FIXTURES)):
+        with open(os.path.join(FIXTURES, name), 'rb') as f:
+            pages['/' + name] = (200, {'Content-Type': 'text/html; charset=utf-8', 'Cache-Control': 'no-store'},
+                                 f.read())
+    with StandInOrigin(pages) as origin:
+        paths = ['/go/' + fluxify.encode_url(origin.url + page) for page in pages]
+
+        def fetch(index, latencies):
+            client = fluxify.app.test_client()
+            for i in range(args.requests // args.threads):
+                response = timed(latencies, client.get, paths[i % len(paths)])
+                assert response.status_code == 200 and origin.url.encode() not in response.data
+                response.close()
+
+        results = {'proxy_page': summarize(*run_phase(args.threads, fetch))}
+        assert origin.requests >= results['proxy_page']['count']
+    results['peak_rss_kb'] = peak_rss_kb()
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    return {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+            'commit': commit}
+
+
+def compare(results, baseline, tolerance, p99_tolerance):
+    """[regression descriptions] for every figure worse than the baseline by more than its tolerance"""
+    regressions = []
+    for scenario, operations in results.items():
+        for operation, stats in operations.items():
+            old = baseline.get(scenario, {}).get(operation)
+            if old is None:
+                continue
+            if operation == 'peak_rss_kb':
+                checks = [('peak_rss_kb', stats, old, True, tolerance)]
+            elif isinstance(stats, dict):
+                checks = [(f'{operation}.{metric}', stats[metric], old[metric], metric != 'ops_per_sec',
+                           p99_tolerance if metric == 'p99_ms' else tolerance)
+                          for metric in ('p50_ms', 'p99_ms', 'ops_per_sec') if metric in old]
+            else:
+                continue
+            for metric, new, before, higher_is_worse, allowed in checks:
+                if not before:
+                    continue
+                change = (new - before) / before
+                if (change if higher_is_worse else -change) > allowed:
+                    regressions.append(f'{scenario}.{metric}: {before} -> {new} ({change:+.0%})')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--actions', type=int, default=5, help='game_action events per client')
+    parser.add_argument('--requests', type=int, default=4000, help='HTTP requests per operation')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=3, help='runs per scenario; medians are reported')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--scenarios', default='http,fluxify,socketio')
+    parser.add_argument('--out', help='also write the results to this file')
+    parser.add_argument('--baseline', help='results file of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative regression')
+    parser.add_argument('--p99-tolerance', type=float, default=1.0, help='allowed relative p99 regression')
+    args = parser.parse_args()
+    scenarios = args.scenarios.split(',')
+
+    results = {}
+    # app.py flushes profiles and the catalog from atexit handlers; registered
+    # first, the cleanup runs after them
+    tmp = tempfile.mkdtemp(prefix='fluxion-loadtest-')
+    atexit.register(shutil.rmtree, tmp, ignore_errors=True)
+    if 'socketio' in scenarios or 'http' in scenarios:
+        os.environ.update(
+            CATALOG_BACKEND='sql',
+            DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'catalog.db')}",
+            PROFILES_DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'profiles.db')}",
+            JOURNAL_DIR=os.path.join(tmp, 'journal'),
+            BROADCAST_INTERVAL='0.05',
+            LOG_LEVEL='WARNING',
+            THUMBNAIL_WORKERS='0',  # keep the remote thumbnail URLs; no network
+        )
+        os.chdir(REPO_ROOT)  # app.py serves games/ and reads games.json relative to the cwd
+        import app as app_module
+    # socketio last: its thousands of clients leave the largest heap behind
+    if 'http' in scenarios:
+        results['http'] = median_results([http_scenario(app_module, args) for _ in range(args.repeat)])
+    if 'fluxify' in scenarios:
+        fluxify = load_sub_server('fluxify')
+        results['fluxify'] = median_results([fluxify_scenario(fluxify, args) for _ in range(args.repeat)])
+    if 'socketio' in scenarios:
+        rng = random.Random(args.seed)
+        results['socketio'] = median_results(
+            [socketio_scenario(app_module, args, rng) for _ in range(args.repeat)])
+
+    report = {'benchmark': 'loadtest', 'environment': environment(),
+              'params': {name: getattr(args, name) for name in ('clients', 'actions', 'requests', 'threads', 'repeat', 'seed')},
+              'results': results}
+    exit_status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline['results'], args.tolerance, args.p99_tolerance)
+        report['baseline'] = {'file': args.baseline, 'commit': baseline.get('environment', {}).get('commit'),
+                              'tolerance': args.tolerance, 'p99_tolerance': args.p99_tolerance,
+                              'regressions': regressions}
+        if baseline.get('params') != report['params']:
+            report['baseline']['warning'] = 'baseline was recorded with different parameters'
+        exit_status = 1 if regressions else 0
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    return exit_status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,96 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Clients in this room receive every game's updates
+ALL_GAMES_ROOM = 'games:all'
+
+
+def game_room(game_name):
+    """Socket.IO room for clients that follow a single game"""
+    return f'game:{game_name}'
+
+
+class UpdateBroadcaster:
+    """Coalesces counter changes into one ``game_updates`` emit per tick.
+
+    Instead of emitting on every play/like/favorite, a background task wakes
+    every ``interval`` seconds, diffs the catalog's counter snapshot against
+    the previous tick and emits the changed games once: the whole batch to
+    ``ALL_GAMES_ROOM`` and each game's entry to its own ``game_room``.
+    Payload: ``{'games': {name: {'data': entry, 'delta': {field: n}}}}``.
+    """
+
+    def __init__(self, socketio, catalog, interval=0.2):
+        self.socketio = socketio
+        self.catalog = catalog
+        self.interval = interval
+        self._last_version = catalog.counters.version()
+        self._last_totals = catalog.counters.snapshot()
+        self._task = None
+        self._running = False
+        self._listeners = []
+
+    def add_listener(self, listener):
+        """Call ``listener(deltas)`` every tick with {game: {field: delta}} (possibly empty)"""
+        self._listeners.append(listener)
+
+    def start(self):
+        """Start the background emit loop (idempotent)"""
+        if self._task is not None:
+            return
+        self._running = True
+        self._task = self.socketio.start_background_task(self._run)
+
+    def stop(self):
+        self._running = False
+
+    def _run(self):
+        while self._running:
+            self.socketio.sleep(self.interval)
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error(f"Error broadcasting game updates: {e}")
+
+    def collect(self):
+        """Return {game: {field: delta}} for counters changed since the last call"""
+        counters = self.catalog.counters
+        version = counters.version()
+        if version == self._last_version:
+            return {}
+        totals = counters.snapshot()
+        previous = self._last_totals
+        deltas = {}
+        for (name, field), value in totals.items():
+            delta = value - previous.get((name, field), 0)
+            if delta:
+                deltas.setdefault(name, {})[field] = delta
+        self._last_version = version
+        self._last_totals = totals
+        return deltas
+
+    def tick(self):
+        """Emit one batched update for everything that changed since the last tick"""
+        deltas = self.collect()
+        for listener in self._listeners:
+            try:
+                listener(deltas)
+            except Exception as e:
+                logger.error(f"Error in game update listener: {e}")
+        if not deltas:
+            return
+        games = self.catalog.games()
+        batch = {}
+        for name, delta in deltas.items():
+            entry = games.get(name)
+            if entry is not None:
+                batch[name] = {'data': entry, 'delta': delta}
+        if not batch:
+            return
+
+        self.socketio.emit('game_updates', {'games': batch}, to=ALL_GAMES_ROOM)
+        for name, update in batch.items():
+            self.socketio.emit('game_updates', {'games': {name: update}}, to=game_room(name))
+        logger.debug(f"Broadcast updates for {len(batch)} games")
+
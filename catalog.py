@@ -0,0 +1,312 @@
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+
+from counters import ShardedCounter
+from metrics import default_registry
+
+logger = logging.getLogger(__name__)
+
+GAMES_JSON_PATH = os.path.join('games', 'games.json')
+
+# Map socket/API actions to the counter field they bump
+ACTION_FIELDS = {
+    'play': 'Plays',
+    'like': 'Likes',
+    'favorite': 'Favorites',
+}
+COUNTER_FIELDS = tuple(ACTION_FIELDS.values())
+
+
+@default_registry.timed('games_json_load_seconds')
+def load_games_data(path=GAMES_JSON_PATH):
+    """Load games data from JSON file"""
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+            return data
+    except FileNotFoundError:
+        logger.error("games.json file not found")
+        # Create a default structure if the file doesn't exist
+        return {"games": {}}
+    except json.JSONDecodeError:
+        logger.error("Error decoding games.json")
+        return {"games": {}}
+
+
+@default_registry.timed('games_json_save_seconds')
+def save_games_data(data, path=GAMES_JSON_PATH):
+    """Save games data to JSON file atomically (temp file + rename)"""
+    directory = os.path.dirname(path) or '.'
+    try:
+        fd, tmp_path = tempfile.mkstemp(prefix='.games-', suffix='.json.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        logger.debug("Games data saved successfully")
+        return True
+    except Exception as e:
+        logger.error(f"Error saving games data: {e}")
+        return False
+
+
+class GameCatalog:
+    """Authoritative in-memory copy of games.json.
+
+    The file is parsed once and then only re-read when its mtime/size change
+    (checked at most every ``reload_check_interval`` seconds). Plays, Likes and
+    Favorites are kept in a ``ShardedCounter`` so increments never take a lock;
+    reads add the counter deltas that have not been folded into the file data
+    yet. A background flusher folds and writes them back every
+    ``flush_interval`` seconds, or sooner once ``flush_threshold`` increments
+    are pending.
+
+    With a ``journal`` (journal.EventJournal) every increment is also
+    appended to the event log, which becomes the durable record of the
+    counters: on startup its snapshot plus log tail replace the counter
+    fields read from games.json, and games.json is only a materialized view.
+    """
+
+    def __init__(self, path=GAMES_JSON_PATH, flush_interval=5.0, flush_threshold=100,
+                 reload_check_interval=1.0, journal=None):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.reload_check_interval = reload_check_interval
+
+        self.counters = ShardedCounter()  # {(game_name, field): delta}
+        # (file data, counter totals already folded into it); swapped as a whole
+        self._state = ({"games": {}}, {})
+        self._view = (None, -1, None)
+        self._saved_version = 0
+        self._generation = 0  # bumped on every (re)load from disk
+
+        self._lock = threading.RLock()  # guards reload/flush, never increments
+        self._stat = None
+        self._last_check = 0.0
+
+        self._stop_event = threading.Event()
+        self._flusher = None
+
+        self.journal = journal
+        self._load()
+        if journal is not None:
+            self._recover_journal()
+
+    # -- file state -----------------------------------------------------
+
+    def _file_stat(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def _load(self):
+        """(Re)read the file; unfolded counter deltas keep applying on top of it"""
+        with self._lock:
+            stat = self._file_stat()
+            data = load_games_data(self.path)
+            data.setdefault('games', {})
+            self._state = (data, self._state[1])
+            self._generation += 1
+            self._stat = stat
+            self._last_check = time.monotonic()
+
+    def _maybe_reload(self):
+        """Pick up external edits to games.json without re-parsing every call"""
+        now = time.monotonic()
+        if now - self._last_check < self.reload_check_interval:
+            return
+        self._last_check = now
+        stat = self._file_stat()
+        if stat is not None and stat != self._stat:
+            logger.info("games.json changed on disk, reloading catalog")
+            self._load()
+
+    def _recover_journal(self):
+        """Take counter values from the journal, or seed an empty journal from games.json"""
+        totals = self.journal.recover()
+        data = self._state[0]
+        if totals is None:
+            self.journal.seed({(name, field): game.get(field, 0)
+                               for name, game in data['games'].items() for field in COUNTER_FIELDS})
+            return
+        changed = 0
+        for (name, field), value in totals.items():
+            game = data['games'].get(name)
+            if game is not None and game.get(field, 0) != value:
+                game[field] = value
+                changed += 1
+        if changed:
+            logger.info(f"Restored {changed} counter values from the event journal")
+
+    # -- reads ----------------------------------------------------------
+
+    def _merged(self, data, folded, totals):
+        games = {}
+        for name, game in data['games'].items():
+            entry = dict(game)
+            for field in COUNTER_FIELDS:
+                key = (name, field)
+                delta = totals.get(key, 0) - folded.get(key, 0)
+                if delta:
+                    entry[field] = entry.get(field, 0) + delta
+            games[name] = entry
+        merged = dict(data)
+        merged['games'] = games
+        return merged
+
+    def version(self):
+        """Monotonic catalog version; changes on every increment and every reload"""
+        return self._generation + self.counters.version()
+
+    def generation(self):
+        """Number of times the file has been (re)loaded from disk"""
+        return self._generation
+
+    def data(self):
+        """Return the catalog dict ({"games": {...}}) with live counters; treat it as read-only"""
+        self._maybe_reload()
+        state = self._state
+        version = self.counters.version()
+        cached_state, cached_version, view = self._view
+        if cached_state is state and cached_version == version:
+            return view
+        data, folded = state
+        view = self._merged(data, folded, self.counters.snapshot())
+        self._view = (state, version, view)
+        return view
+
+    def games(self):
+        """Return the {name: entry} mapping with live counters; treat it as read-only"""
+        return self.data()['games']
+
+    def games_with_totals(self):
+        """Return ({name: entry}, counter totals) where the entries include exactly those totals"""
+        self._maybe_reload()
+        data, folded = self._state
+        totals = self.counters.snapshot()
+        return self._merged(data, folded, totals)['games'], totals
+
+    def get(self, name):
+        """Return a copy of a single game entry with live counters, or None"""
+        self._maybe_reload()
+        data, folded = self._state
+        game = data['games'].get(name)
+        if game is None:
+            return None
+        entry = dict(game)
+        for field in COUNTER_FIELDS:
+            key = (name, field)
+            delta = self.counters.value(key) - folded.get(key, 0)
+            if delta:
+                entry[field] = entry.get(field, 0) + delta
+        return entry
+
+    def __contains__(self, name):
+        self._maybe_reload()
+        return name in self._state[0]['games']
+
+    # -- writes ---------------------------------------------------------
+
+    def increment(self, name, field, amount=1, machine_id=None):
+        """Bump a counter without locking; returns False if the game is unknown"""
+        self._maybe_reload()
+        if name not in self._state[0]['games']:
+            return False
+        self.counters.add((name, field), amount)
+        if self.journal is not None:
+            self.journal.append(name, field, amount, machine_id)
+        return True
+
+    def missing(self, names):
+        """The names in ``names`` that are not games, checked against one catalog state"""
+        self._maybe_reload()
+        games = self._state[0]['games']
+        return {name for name in names if name not in games}
+
+    def increment_many(self, events, machine_id=None):
+        """Bump [(name, field, amount)] as one unit; unknown games are skipped, returns the number applied"""
+        self._maybe_reload()
+        games = self._state[0]['games']
+        applied = [event for event in events if event[0] in games]
+        amounts = {}
+        for name, field, amount in applied:
+            amounts[(name, field)] = amounts.get((name, field), 0) + amount
+        if amounts:
+            self.counters.add_many(amounts)
+            if self.journal is not None:
+                self.journal.append_many(applied, machine_id)
+        return len(applied)
+
+    def flush(self):
+        """Fold pending counter deltas into the file data and save; False if the save failed"""
+        with self._lock:
+            version = self.counters.version()
+            if version == self._saved_version:
+                return True
+            # Fold in any edit made on disk since the last check before overwriting it
+            stat = self._file_stat()
+            if stat is not None and stat != self._stat:
+                self._load()
+
+            old_state = self._state
+            data, folded = old_state
+            totals = self.counters.snapshot()
+            new_state = (self._merged(data, folded, totals), totals)
+            self._state = new_state
+            if not save_games_data(new_state[0], self.path):
+                # Unfold so the deltas are still pending for the next attempt
+                self._state = old_state
+                return False
+            self._saved_version = version
+            self._stat = self._file_stat()
+            return True
+
+    # -- background flusher ---------------------------------------------
+
+    def start(self):
+        """Start the write-behind flusher thread (idempotent)"""
+        if self._flusher is not None:
+            return
+        if self.journal is not None:
+            self.journal.start()
+        self._flusher = threading.Thread(target=self._run_flusher, name='catalog-flusher', daemon=True)
+        self._flusher.start()
+
+    def _run_flusher(self):
+        # Poll often enough to honour flush_threshold without touching the hot path
+        poll = min(self.flush_interval, 0.25)
+        last_flush = time.monotonic()
+        while not self._stop_event.wait(poll):
+            pending = self.counters.version() - self._saved_version
+            if not pending:
+                last_flush = time.monotonic()
+                continue
+            if pending < self.flush_threshold and time.monotonic() - last_flush < self.flush_interval:
+                continue
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing games catalog: {e}")
+            last_flush = time.monotonic()
+
+    def close(self):
+        """Stop the flusher and write out anything still pending"""
+        self._stop_event.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=self.flush_interval)
+            self._flusher = None
+        if self.journal is not None:
+            self.journal.close()
+        self.flush()
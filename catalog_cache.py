@@ -0,0 +1,152 @@
+import json
+import gzip
+import uuid
+import threading
+from collections import OrderedDict
+from email.utils import formatdate
+
+from catalog import COUNTER_FIELDS
+
+try:
+    import brotli
+except ImportError:  # optional: only gzip is offered without it
+    brotli = None
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 1024
+# Bodies are rebuilt on the request thread whenever the catalog changes; brotli's
+# default quality 11 costs far more CPU there than its last few percent save
+BROTLI_QUALITY = 5
+
+# Changes every process start so ETags/versions never collide across restarts
+BOOT_ID = uuid.uuid4().hex[:8]
+
+
+def _serialize(payload):
+    return json.dumps(payload, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+def _compress(body):
+    """Return {encoding: bytes} for every encoding we can offer"""
+    encoded = {'identity': body}
+    if len(body) >= MIN_COMPRESS_SIZE:
+        encoded['gzip'] = gzip.compress(body, compresslevel=6)
+        if brotli is not None:
+            encoded['br'] = brotli.compress(body, quality=BROTLI_QUALITY)
+    return encoded
+
+
+def _counter_values(games):
+    return {name: tuple(game.get(field, 0) for field in COUNTER_FIELDS) for name, game in games.items()}
+
+
+class Rendition:
+    """One serialized catalog version with its pre-compressed bodies"""
+    __slots__ = ('version', 'token', 'last_modified', 'games', 'bodies', 'deltas')
+
+    def __init__(self, version, token, last_modified, games, bodies):
+        self.version = version
+        self.token = token
+        self.last_modified = last_modified
+        self.games = games
+        self.bodies = bodies
+        self.deltas = {}  # {since token: compressed delta bodies} up to this version
+
+    def etag_for(self, encoding):
+        """Unquoted strong ETag; each content-coding gets its own"""
+        return self.token if encoding == 'identity' else f'{self.token}-{encoding}'
+
+
+class CatalogResponseCache:
+    """Pre-serialized, pre-compressed ``/api/games`` bodies keyed by catalog version.
+
+    A body is built at most once per catalog version. The counter values of the
+    last ``history`` versions handed out are kept so a client that already has
+    version N can be sent only the games that changed since N.
+
+    With a ``thumbnails`` store, entries point at local thumbnails once they
+    are ingested; newly ready thumbnails count as a new version and, like a
+    reload, make older versions ineligible for deltas. With ``assets`` (a
+    GameAssetServer), ``Location``s carry the game file's content hash so
+    the files can be cached as immutable.
+    """
+
+    def __init__(self, catalog, history=16, thumbnails=None, assets=None):
+        self.catalog = catalog
+        self.history = history
+        self.thumbnails = thumbnails
+        self.assets = assets
+        self._lock = threading.Lock()
+        self._current = None
+        self._versions = OrderedDict()  # {version token: (generation, counter values)}
+
+    def token(self, version):
+        return f'{BOOT_ID}-{version}'
+
+    def _version(self):
+        if self.thumbnails is None:
+            return self.catalog.version()
+        return f'{self.catalog.version()}.{self.thumbnails.version}'
+
+    def current(self):
+        """Return the Rendition for the catalog as it is now"""
+        version = self._version()
+        rendition = self._current
+        if rendition is not None and rendition.version == version:
+            return rendition
+        with self._lock:
+            rendition = self._current
+            if rendition is not None and rendition.version == version:
+                return rendition
+            generation = self.catalog.generation()
+            data = self.catalog.data()
+            if self.thumbnails is not None:
+                generation = (generation, self.thumbnails.version)
+                self.thumbnails.ingest_catalog(data['games'])  # new games after a reload, retries
+                data = dict(data, games=self.thumbnails.rewrite_games(data['games']))
+            if self.assets is not None:
+                data = dict(data, games=self.assets.rewrite_games(data['games']))
+            token = self.token(version)
+            body = _serialize(dict(data, version=token))
+            rendition = Rendition(version, token, formatdate(usegmt=True), data['games'], _compress(body))
+            self._versions[token] = (generation, _counter_values(data['games']))
+            while len(self._versions) > self.history:
+                self._versions.popitem(last=False)
+            self._current = rendition
+        return rendition
+
+    def delta(self, since):
+        """Return {encoding: body} holding only games changed since version token ``since``
+
+        Returns None when ``since`` is unknown (too old, from another process
+        or from before a reload), in which case the full catalog should be sent.
+        Bodies are built once per (``since``, current version) and kept on the
+        current Rendition, so every client polling from the same version
+        shares them until the catalog changes.
+        """
+        rendition = self.current()
+        bodies = rendition.deltas.get(since)
+        if bodies is not None:
+            return bodies
+        with self._lock:
+            known = self._versions.get(since)
+            current = self._versions.get(rendition.token)
+        if known is None or current is None or known[0] != current[0]:
+            return None
+        old_values, new_values = known[1], current[1]
+        changed = {name: rendition.games[name]
+                   for name, values in new_values.items() if old_values.get(name) != values}
+        payload = {
+            'delta': True,
+            'since': since,
+            'version': rendition.token,
+            'games': changed,
+        }
+        # Two threads may build the same delta; both results are identical
+        return rendition.deltas.setdefault(since, _compress(_serialize(payload)))
+
+
+def negotiate_encoding(accept_encodings, bodies):
+    """Pick the best encoding in ``bodies`` for a werkzeug Accept-Encoding header"""
+    offered = [encoding for encoding in ('br', 'gzip') if encoding in bodies]
+    return accept_encodings.best_match(offered, default='identity') or 'identity'
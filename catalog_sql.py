@@ -0,0 +1,106 @@
+import time
+import logging
+
+from sqlalchemy import bindparam, select, update
+
+from catalog import GameCatalog
+from models import Game, Tag, game_tags, catalog_meta, FIELD_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+
+class SQLCatalog(GameCatalog):
+    """GameCatalog whose games live in the SQL tables of models.py.
+
+    Reads, versions and the lock-free counters work as in GameCatalog; only
+    the storage differs. Flushing turns the pending counter deltas into one
+    batched ``UPDATE games SET plays = plays + :plays, ...`` per changed
+    game, so workers sharing the database never overwrite each other's
+    increments. Each flush bumps ``catalog_meta.version``; a worker that
+    sees a version it did not write reloads the games (checked at most every
+    ``reload_check_interval`` seconds).
+    """
+
+    def __init__(self, engine, flush_interval=5.0, flush_threshold=100, reload_check_interval=1.0):
+        self.engine = engine
+        super().__init__(path=None, flush_interval=flush_interval, flush_threshold=flush_threshold,
+                         reload_check_interval=reload_check_interval)
+
+    # -- storage --------------------------------------------------------
+
+    def _file_stat(self):
+        try:
+            with self.engine.connect() as conn:
+                return conn.execute(select(catalog_meta.c.version).where(catalog_meta.c.id == 1)).scalar()
+        except Exception as e:
+            logger.error(f"Error reading catalog version: {e}")
+            return None
+
+    def _read_games(self):
+        games_table = Game.__table__
+        tags = {}
+        games = {}
+        with self.engine.connect() as conn:
+            for game_id, tag in conn.execute(
+                    select(game_tags.c.game_id, Tag.__table__.c.name)
+                    .join(Tag.__table__, Tag.__table__.c.id == game_tags.c.tag_id)
+                    .order_by(game_tags.c.game_id, game_tags.c.position)):
+                tags.setdefault(game_id, []).append(tag)
+            for row in conn.execute(select(games_table).order_by(games_table.c.id)):
+                games[row.name] = {
+                    'Location': row.location,
+                    'Thumbnail': row.thumbnail,
+                    'Likes': row.likes,
+                    'Favorites': row.favorites,
+                    'Plays': row.plays,
+                    'Tags': tags.get(row.id, []),
+                }
+        return {'games': games}
+
+    def _load(self):
+        """(Re)read the games; unflushed counter deltas keep applying on top of them"""
+        with self._lock:
+            stat = self._file_stat()
+            data = self._read_games()
+            self._state = (data, self._state[1])
+            self._generation += 1
+            self._stat = stat
+            self._last_check = time.monotonic()
+
+    def flush(self):
+        """Apply pending counter deltas with atomic increments; False if the update failed"""
+        with self._lock:
+            version = self.counters.version()
+            if version == self._saved_version:
+                return True
+            data, folded = self._state
+            totals = self.counters.snapshot()
+            rows = {}
+            for (name, field), value in totals.items():
+                delta = value - folded.get((name, field), 0)
+                if delta:
+                    deltas = rows.setdefault(name, dict.fromkeys(FIELD_COLUMNS.values(), 0))
+                    deltas[FIELD_COLUMNS[field]] = delta
+            if rows:
+                games_table = Game.__table__
+                stmt = (update(games_table).where(games_table.c.name == bindparam('game_name'))
+                        .values({column: games_table.c[column] + bindparam(f'delta_{column}')
+                                  for column in FIELD_COLUMNS.values()}))
+                try:
+                    with self.engine.begin() as conn:
+                        conn.execute(stmt, [dict({f'delta_{column}': n for column, n in deltas.items()}, game_name=name)
+                                            for name, deltas in rows.items()])
+                        conn.execute(update(catalog_meta).where(catalog_meta.c.id == 1)
+                                     .values(version=catalog_meta.c.version + 1))
+                        db_version = conn.execute(select(catalog_meta.c.version)
+                                                  .where(catalog_meta.c.id == 1)).scalar()
+                except Exception as e:
+                    logger.error(f"Error flushing catalog counters: {e}")
+                    return False
+                # Another worker flushed in between: pick up its increments at the next check
+                expected = None if self._stat is None else self._stat + 1
+                self._stat = db_version if db_version == expected else None
+            self._state = (self._merged(data, folded, totals), totals)
+            self._saved_version = version
+            logger.debug(f"Flushed counter deltas for {len(rows)} games")
+            return True
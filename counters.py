@@ -0,0 +1,94 @@
+import weakref
+import threading
+
+
+class _Shard:
+    __slots__ = ('counts', 'ops')
+
+    def __init__(self):
+        self.counts = {}
+        self.ops = 0
+
+
+class _ShardHandle:
+    """Thread-local owner of a shard; retires it when the thread goes away"""
+    __slots__ = ('shard', '__weakref__')
+
+    def __init__(self, shard):
+        self.shard = shard
+
+
+class ShardedCounter:
+    """Counters split into one shard per thread and summed on read.
+
+    Each thread only ever writes to its own shard, so ``add`` takes no lock.
+    Readers aggregate all live shards plus the totals of shards whose threads
+    have exited. The registry lock is only taken when a thread creates or
+    retires its shard and by readers, never on the increment path.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.RLock()
+        self._shards = {}  # {id(shard): shard} for live threads
+        self._retired = {}  # totals folded in from exited threads
+        self._retired_ops = 0
+
+    def _new_shard(self):
+        shard = _Shard()
+        handle = _ShardHandle(shard)
+        with self._lock:
+            self._shards[id(shard)] = shard
+        weakref.finalize(handle, self._retire, shard)
+        self._local.handle = handle
+        return shard
+
+    def _retire(self, shard):
+        with self._lock:
+            self._shards.pop(id(shard), None)
+            for key, value in shard.counts.items():
+                self._retired[key] = self._retired.get(key, 0) + value
+            self._retired_ops += shard.ops
+
+    def add(self, key, amount=1):
+        """Add ``amount`` to ``key`` in the calling thread's shard"""
+        try:
+            shard = self._local.handle.shard
+        except AttributeError:
+            shard = self._new_shard()
+        counts = shard.counts
+        counts[key] = counts.get(key, 0) + amount
+        shard.ops += 1
+
+    def add_many(self, amounts):
+        """Add every {key: amount} at once; readers see all of them or none"""
+        try:
+            shard = self._local.handle.shard
+        except AttributeError:
+            shard = self._new_shard()
+        counts = shard.counts
+        # One dict.update publishes the whole batch to snapshot()'s copy of the shard
+        counts.update({key: counts.get(key, 0) + amount for key, amount in amounts.items()})
+        shard.ops += len(amounts)
+
+    def value(self, key):
+        """Return the aggregated value for a single key"""
+        with self._lock:
+            total = self._retired.get(key, 0)
+            for shard in list(self._shards.values()):
+                total += shard.counts.get(key, 0)
+        return total
+
+    def snapshot(self):
+        """Return {key: total} aggregated across all shards"""
+        with self._lock:
+            totals = dict(self._retired)
+            for shard in list(self._shards.values()):
+                for key, value in list(shard.counts.items()):
+                    totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def version(self):
+        """Monotonic count of ``add`` calls; changes whenever a snapshot would"""
+        with self._lock:
+            return self._retired_ops + sum(shard.ops for shard in list(self._shards.values()))
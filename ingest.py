@@ -0,0 +1,103 @@
+import logging
+
+from catalog import ACTION_FIELDS
+from metrics import default_registry
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH = 500
+MAX_KEY_LENGTH = 128
+MAX_SCOPE_LENGTH = 64
+IDEMPOTENCY_TTL = 24 * 3600  # seconds a key is remembered; client retries must come sooner
+
+
+class BatchError(ValueError):
+    """A batch that failed validation; nothing in it was applied"""
+
+    def __init__(self, errors):
+        super().__init__(f"{len(errors)} invalid events")
+        self.errors = errors  # [{'index': i or None, 'error': message}]
+
+
+class EventIngestor:
+    """Batches of play/like/favorite actions, applied as one unit and at most once per key.
+
+    A batch is a list of ``{'id': key, 'game': name, 'action': action}``;
+    ``id`` is generated by the client (a UUID) and sent again unchanged on
+    a retry; ids are scoped per client (``scope``), so two clients using
+    the same id never dedupe each other. ``ingest`` validates every event
+    in one pass (one catalog state, no side effects) and rejects the whole
+    batch on any error. It then claims the keys in the shared state, so a
+    key already applied by any worker in the last ``ttl`` seconds is
+    reported as a duplicate instead, and applies the rest with one profile
+    update and one counter/journal update. If applying raises, the claims
+    are released so the client's retry goes through.
+    """
+
+    def __init__(self, catalog, profiles, shared_state, ttl=IDEMPOTENCY_TTL, max_batch=MAX_BATCH):
+        self.catalog = catalog
+        self.profiles = profiles
+        self.shared = shared_state
+        self.ttl = ttl
+        self.max_batch = max_batch
+
+    def validate(self, events):
+        """[(key, action, game)] for a valid batch; raises BatchError otherwise"""
+        if not isinstance(events, list):
+            raise BatchError([{'index': None, 'error': 'events must be a list'}])
+        if len(events) > self.max_batch:
+            raise BatchError([{'index': None, 'error': f'at most {self.max_batch} events per batch'}])
+        parsed = []
+        errors = []
+        for index, event in enumerate(events):
+            if not isinstance(event, dict):
+                errors.append({'index': index, 'error': 'event must be an object'})
+                continue
+            key, game_name, action = event.get('id'), event.get('game'), event.get('action')
+            if not isinstance(key, str) or not 0 < len(key) <= MAX_KEY_LENGTH:
+                errors.append({'index': index, 'error': f'id must be a string of 1-{MAX_KEY_LENGTH} characters'})
+            elif not isinstance(game_name, str) or not game_name:
+                errors.append({'index': index, 'error': 'missing game'})
+            elif action not in ACTION_FIELDS:
+                errors.append({'index': index, 'error': f'Invalid action: {action}'})
+            else:
+                parsed.append((index, key, action, game_name))
+        missing = self.catalog.missing({game_name for _, _, _, game_name in parsed})
+        errors.extend({'index': index, 'error': f'Invalid game name: {game_name}'}
+                      for index, _, _, game_name in parsed if game_name in missing)
+        if errors:
+            raise BatchError(sorted(errors, key=lambda error: error['index']))
+        return [(key, action, game_name) for _, key, action, game_name in parsed]
+
+    def ingest(self, events, scope, machine_id=None):
+        """Apply a batch from client ``scope``; returns {'accepted': [(action, game)], 'duplicates': [key]}"""
+        if not isinstance(scope, str) or not 0 < len(scope) <= MAX_SCOPE_LENGTH:
+            error = f'client must be a string of 1-{MAX_SCOPE_LENGTH} characters'
+            raise BatchError([{'index': None, 'error': error}])
+        parsed = self.validate(events)
+        claimed = set(self.shared.claim('event_keys', [f'{scope}:{key}' for key, _, _ in parsed], self.ttl))
+        pending = set(claimed)
+        accepted = []
+        duplicates = []
+        for key, action, game_name in parsed:
+            if f'{scope}:{key}' in pending:
+                pending.discard(f'{scope}:{key}')  # a key repeated within the batch counts once
+                accepted.append((action, game_name))
+            else:
+                duplicates.append(key)
+        if accepted:
+            try:
+                # Profiles first: recording a game again is a no-op, so a failure in
+                # the counters after them is safe to retry
+                if machine_id is not None:
+                    self.profiles.record_many(machine_id, accepted)
+                self.catalog.increment_many([(game_name, ACTION_FIELDS[action], 1) for action, game_name in accepted],
+                                            machine_id=machine_id)
+            except BaseException:
+                self.shared.release('event_keys', claimed)
+                raise
+        default_registry.inc('ingested_events_total', len(accepted))
+        if duplicates:
+            default_registry.inc('ingested_duplicate_events_total', len(duplicates))
+            logger.debug("Skipped %s events already ingested", len(duplicates))
+        return {'accepted': accepted, 'duplicates': duplicates}
@@ -0,0 +1,302 @@
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_DIR = os.path.join('instance', 'journal')
+SEGMENT_PREFIX = 'events-'
+SNAPSHOT_PREFIX = 'snapshot-'
+
+
+def _numbered(directory, prefix, suffix):
+    """[(number, file name)] for ``<prefix><number><suffix>`` files, oldest first"""
+    found = []
+    for name in os.listdir(directory):
+        if name.startswith(prefix) and name.endswith(suffix):
+            number = name[len(prefix):-len(suffix)]
+            if number.isdigit():
+                found.append((int(number), name))
+    return sorted(found)
+
+
+def _fsync_dir(directory):
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class EventJournal:
+    """Append-only log of counter events plus periodic snapshots.
+
+    ``append`` only pushes onto a deque, so callers never wait on disk. A
+    writer thread drains it every ``fsync_interval`` seconds (sooner once
+    ``fsync_batch`` events are queued), writes one JSON line per event to the
+    current ``events-<first seq>.log`` segment and fsyncs once per batch; an
+    event is durable at most ``fsync_interval`` seconds after it was
+    appended. The writer keeps running totals, and every
+    ``snapshot_every`` events it writes ``snapshot-<seq>.json`` atomically
+    and deletes the segments the snapshot covers (``retain_segments`` keeps
+    them for replay). Startup state is the newest snapshot plus the events
+    after it; a torn last line from a crash is cut off.
+
+    Line format: ``[seq, unix time, game, field, amount, machine_id]``.
+    """
+
+    def __init__(self, directory=JOURNAL_DIR, fsync_interval=0.05, fsync_batch=1000,
+                 segment_bytes=16 * 1024 * 1024, snapshot_every=100000, retain_segments=False):
+        self.directory = directory
+        self.fsync_interval = fsync_interval
+        self.fsync_batch = fsync_batch
+        self.segment_bytes = segment_bytes
+        self.snapshot_every = snapshot_every
+        self.retain_segments = retain_segments
+
+        self._queue = deque()
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._writer = None
+        self._write_lock = threading.RLock()  # one drain at a time (writer thread or sync())
+
+        self.seq = 0  # last sequence number written
+        self.snapshot_seq = 0
+        self.totals = {}  # {(game, field): total} as of ``seq``
+        self._segment = None
+        self._segment_size = 0
+        self.written = 0
+        self.fsyncs = 0
+
+        os.makedirs(directory, exist_ok=True)
+
+    # -- recovery -------------------------------------------------------
+
+    def recover(self):
+        """Load the newest snapshot and replay the log after it.
+
+        Returns {(game, field): total}, or None for a journal with no
+        snapshot and no events (call ``seed`` with the starting totals).
+        """
+        snapshots = _numbered(self.directory, SNAPSHOT_PREFIX, '.json')
+        segments = _numbered(self.directory, SEGMENT_PREFIX, '.log')
+        if not snapshots and not segments:
+            return None
+
+        totals = {}
+        seq = 0
+        for snapshot_seq, name in reversed(snapshots):
+            try:
+                with open(os.path.join(self.directory, name), 'r') as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.error(f"Skipping unreadable journal snapshot {name}: {e}")
+                continue
+            seq = snapshot['seq']
+            for game, fields in snapshot['totals'].items():
+                for field, value in fields.items():
+                    totals[(game, field)] = value
+            break
+        self.snapshot_seq = seq
+
+        replayed = 0
+        for index, (first_seq, name) in enumerate(segments):
+            # Segments wholly covered by the snapshot need not be read
+            if index + 1 < len(segments) and segments[index + 1][0] <= seq + 1:
+                continue
+            path = os.path.join(self.directory, name)
+            good_bytes = 0
+            with open(path, 'rb') as f:
+                for line in f:
+                    try:
+                        event_seq, _ts, game, field, amount, _machine = json.loads(line)
+                    except ValueError:
+                        break
+                    if not line.endswith(b'\n'):
+                        break
+                    good_bytes += len(line)
+                    if event_seq <= seq:
+                        continue
+                    totals[(game, field)] = totals.get((game, field), 0) + amount
+                    seq = event_seq
+                    replayed += 1
+            if good_bytes < os.path.getsize(path):
+                logger.warning(f"Truncating torn tail of journal segment {name} at byte {good_bytes}")
+                with open(path, 'r+b') as f:
+                    f.truncate(good_bytes)
+                    os.fsync(f.fileno())
+
+        self.seq = seq
+        self.totals = totals
+        logger.info(f"Journal recovered at seq {seq} (snapshot {self.snapshot_seq}, {replayed} events replayed)")
+        return dict(totals)
+
+    def seed(self, totals):
+        """Start an empty journal from existing totals (written as snapshot 0)"""
+        self.totals = dict(totals)
+        self._write_snapshot()
+
+    # -- appends --------------------------------------------------------
+
+    def append(self, game, field, amount=1, machine_id=None):
+        """Queue one event; never blocks on I/O"""
+        self._queue.append((time.time(), game, field, amount, machine_id))
+        if len(self._queue) >= self.fsync_batch:
+            self._wake.set()
+
+    def append_many(self, events, machine_id=None):
+        """Queue [(game, field, amount)] together, so they reach the same fsync'd batch"""
+        ts = time.time()
+        self._queue.extend([(ts, game, field, amount, machine_id) for game, field, amount in events])
+        if len(self._queue) >= self.fsync_batch:
+            self._wake.set()
+
+    def _open_segment(self):
+        if self._segment is not None:
+            self._segment.close()
+        name = f'{SEGMENT_PREFIX}{self.seq + 1:020d}.log'
+        self._segment = open(os.path.join(self.directory, name), 'ab')
+        self._segment_size = self._segment.tell()
+        _fsync_dir(self.directory)
+
+    def sync(self):
+        """Write and fsync everything queued so far; returns the number of events written"""
+        with self._write_lock:
+            queue = self._queue
+            if not queue:
+                return 0
+            if self._segment is None or self._segment_size >= self.segment_bytes:
+                self._open_segment()
+            batch = []
+            while queue:
+                batch.append(queue.popleft())
+            seq = self.seq
+            lines = []
+            for ts, game, field, amount, machine_id in batch:
+                seq += 1
+                lines.append(json.dumps([seq, round(ts, 3), game, field, amount, machine_id],
+                                        separators=(',', ':')))
+            data = ('\n'.join(lines) + '\n').encode('utf-8')
+            try:
+                self._segment.write(data)
+                self._segment.flush()
+                os.fsync(self._segment.fileno())
+            except BaseException:
+                # Keep the events queued (in order) and reopen the segment next time
+                queue.extendleft(reversed(batch))
+                try:
+                    self._segment.truncate(self._segment_size)  # drop a partly written batch
+                    self._segment.close()
+                except OSError:
+                    pass
+                self._segment = None
+                raise
+            self.fsyncs += 1
+            self._segment_size += len(data)
+            totals = self.totals
+            for _ts, game, field, amount, _machine_id in batch:
+                totals[(game, field)] = totals.get((game, field), 0) + amount
+            self.seq = seq
+            self.written += len(lines)
+            if seq - self.snapshot_seq >= self.snapshot_every:
+                self.compact()
+            return len(lines)
+
+    # -- snapshots ------------------------------------------------------
+
+    def _write_snapshot(self):
+        snapshot = {'seq': self.seq, 'time': time.time(), 'totals': {}}
+        for (game, field), value in self.totals.items():
+            snapshot['totals'].setdefault(game, {})[field] = value
+        fd, tmp_path = tempfile.mkstemp(prefix='.snapshot-', suffix='.json.tmp', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(snapshot, f, separators=(',', ':'))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, os.path.join(self.directory, f'{SNAPSHOT_PREFIX}{self.seq:020d}.json'))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        _fsync_dir(self.directory)
+        self.snapshot_seq = self.seq
+
+    def compact(self):
+        """Snapshot the current totals and drop the snapshots and segments it replaces"""
+        with self._write_lock:
+            self._write_snapshot()
+            # Later events go to a fresh segment so every older one is fully covered
+            self._open_segment()
+            for snapshot_seq, name in _numbered(self.directory, SNAPSHOT_PREFIX, '.json'):
+                if snapshot_seq < self.snapshot_seq:
+                    os.unlink(os.path.join(self.directory, name))
+            if not self.retain_segments:
+                for first_seq, name in _numbered(self.directory, SEGMENT_PREFIX, '.log'):
+                    if first_seq <= self.snapshot_seq:
+                        os.unlink(os.path.join(self.directory, name))
+            logger.info(f"Journal compacted at seq {self.snapshot_seq}")
+
+    # -- replay ---------------------------------------------------------
+
+    def replay(self, since_seq=0):
+        """Yield events after ``since_seq`` still on disk as dicts, oldest first"""
+        self.sync()
+        for first_seq, name in _numbered(self.directory, SEGMENT_PREFIX, '.log'):
+            with open(os.path.join(self.directory, name), 'rb') as f:
+                for line in f:
+                    try:
+                        seq, ts, game, field, amount, machine_id = json.loads(line)
+                    except ValueError:
+                        break
+                    if seq > since_seq:
+                        yield {'seq': seq, 'time': ts, 'game': game, 'field': field, 'amount': amount,
+                               'machine_id': machine_id}
+
+    def stats(self):
+        return {
+            'seq': self.seq,
+            'snapshot_seq': self.snapshot_seq,
+            'queued': len(self._queue),
+            'written': self.written,
+            'fsyncs': self.fsyncs,
+        }
+
+    # -- background writer ----------------------------------------------
+
+    def start(self):
+        """Start the batching writer thread (idempotent)"""
+        if self._writer is not None:
+            return
+        self._writer = threading.Thread(target=self._run_writer, name='journal-writer', daemon=True)
+        self._writer.start()
+
+    def _run_writer(self):
+        while not self._stop_event.is_set():
+            self._wake.wait(self.fsync_interval)
+            self._wake.clear()
+            try:
+                self.sync()
+            except Exception as e:
+                logger.error(f"Error writing game event journal: {e}")
+
+    def close(self):
+        """Stop the writer and fsync anything still queued"""
+        self._stop_event.set()
+        self._wake.set()
+        if self._writer is not None:
+            self._writer.join(timeout=5)
+            self._writer = None
+        self.sync()
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
@@ -0,0 +1,254 @@
+import time
+import bisect
+import heapq
+import logging
+
+from catalog import COUNTER_FIELDS
+from metrics import TimedLock
+
+logger = logging.getLogger(__name__)
+
+# Clients in this room receive 'leaderboard_updates'
+LEADERBOARD_ROOM = 'leaderboards'
+
+# ?field= value -> catalog counter field
+BOARD_FIELDS = {field.lower(): field for field in COUNTER_FIELDS}
+
+# Window name -> (bucket width in seconds, number of buckets)
+DEFAULT_WINDOWS = {
+    '1h': (60, 60),
+    '24h': (3600, 24),
+}
+
+
+class TopK:
+    """All-time top ``k`` for counts that only grow.
+
+    Keeps every game's total plus a sorted list of the best ``k`` keys
+    ``(-total, name)``. Since totals only increase, a game outside the list
+    can only enter by passing the current last entry, so an update is a
+    bisect and an insert instead of a sort of the whole catalog.
+    """
+
+    def __init__(self, k):
+        self.k = k
+        self.totals = {}
+        self.top = []  # [(-total, name)], best first
+        self._members = set()
+
+    def reset(self, totals):
+        self.totals = totals
+        self.top = heapq.nsmallest(self.k, ((-value, name) for name, value in self.totals.items()))
+        self._members = {name for _, name in self.top}
+
+    def add(self, name, amount):
+        old = self.totals.get(name, 0)
+        new = old + amount
+        self.totals[name] = new
+        if amount < 0:
+            self.reset(self.totals)  # a game may drop out; rare enough to re-rank
+            return
+        top = self.top
+        if name in self._members:
+            del top[bisect.bisect_left(top, (-old, name))]
+            bisect.insort(top, (-new, name))
+        elif len(top) < self.k or (-new, name) < top[-1]:
+            bisect.insort(top, (-new, name))
+            self._members.add(name)
+            if len(top) > self.k:
+                self._members.discard(top.pop()[1])
+
+    def best(self, n):
+        return [(name, -score) for score, name in self.top[:n]]
+
+
+class SlidingWindow:
+    """Counts over the last ``buckets`` x ``bucket_seconds`` seconds in a ring of buckets.
+
+    ``totals`` is the plain sum over the window; ``decayed`` weighs each
+    bucket by ``decay ** age`` (age in buckets), so recent activity ranks
+    higher. Between rotations both only grow, so each keeps a ``TopK`` that
+    is updated per add; a rotation subtracts the expired bucket's counts
+    (instead of re-summing the ring) and re-ranks once.
+    """
+
+    def __init__(self, bucket_seconds, buckets, decay=0.9, now=None, k=100):
+        self.bucket_seconds = bucket_seconds
+        self.buckets = buckets
+        self.decay = decay
+        self._expired_weight = decay ** buckets
+        self.ring = [{} for _ in range(buckets)]
+        self.head = 0
+        self.head_start = self._bucket_start(time.time() if now is None else now)
+        self._totals = TopK(k)
+        self._decayed = TopK(k)
+
+    @property
+    def totals(self):
+        return self._totals.totals
+
+    @property
+    def decayed(self):
+        return self._decayed.totals
+
+    def _bucket_start(self, now):
+        return now - now % self.bucket_seconds
+
+    def advance(self, now):
+        """Rotate the ring up to ``now``; returns True if any bucket expired"""
+        steps = int((now - self.head_start) // self.bucket_seconds)
+        if steps <= 0:
+            return False
+        totals, decayed = self.totals, self.decayed
+        if steps >= self.buckets:
+            self.ring = [{} for _ in range(self.buckets)]
+            self.head = 0
+            totals, decayed = {}, {}
+        else:
+            decay = self.decay
+            for _ in range(steps):
+                self.head = (self.head + 1) % self.buckets
+                for name in decayed:
+                    decayed[name] *= decay
+                for name, count in self.ring[self.head].items():
+                    total = totals[name] - count
+                    if total:
+                        totals[name] = total
+                        decayed[name] -= count * self._expired_weight
+                    else:
+                        del totals[name]
+                        del decayed[name]
+                self.ring[self.head] = {}
+        self._totals.reset(totals)
+        self._decayed.reset(decayed)
+        self.head_start = self._bucket_start(now)
+        return True
+
+    def add(self, name, amount, now):
+        self.advance(now)
+        bucket = self.ring[self.head]
+        bucket[name] = bucket.get(name, 0) + amount
+        self._totals.add(name, amount)
+        self._decayed.add(name, amount)
+
+    def best(self, n, decayed=False):
+        return (self._decayed if decayed else self._totals).best(n)
+
+
+class Leaderboards:
+    """All-time and sliding-window top games per counter, fed by the broadcaster's deltas.
+
+    ``on_deltas`` is registered as an UpdateBroadcaster listener, so it sees
+    the same play/like/favorite counts ``handle_game_action`` and
+    ``update_game`` record, once per broadcaster tick and off the request
+    path. After each tick the top ``push_n`` of every board is compared with
+    what was last pushed and only boards whose ranking changed are emitted
+    as ``leaderboard_updates`` to ``LEADERBOARD_ROOM``.
+
+    Boards are named ``<field>:all``, ``<field>:<window>`` and
+    ``<field>:<window>:trending`` (decayed), e.g. ``plays:1h``.
+    """
+
+    def __init__(self, catalog, socketio=None, k=100, push_n=10, windows=None, decay=0.9, clock=time.time):
+        self.catalog = catalog
+        self.socketio = socketio
+        self.k = k
+        self.push_n = push_n
+        self.clock = clock
+        self.windows = dict(DEFAULT_WINDOWS if windows is None else windows)
+        self._lock = TimedLock('leaderboards')
+        now = clock()
+        self._all_time = {field: TopK(k) for field in COUNTER_FIELDS}
+        self._sliding = {(field, window): SlidingWindow(bucket_seconds, buckets, decay, now, k)
+                         for field in COUNTER_FIELDS
+                         for window, (bucket_seconds, buckets) in self.windows.items()}
+        self._generation = None
+        self._pushed = {}
+        self._stale = set()  # windows rotated by a query since the last tick
+        self.emits = 0
+        with self._lock:
+            self._sync_generation()
+            self._pushed = self._rankings()
+
+    def _sync_generation(self):
+        """(Re)seed the all-time boards when the catalog was (re)loaded"""
+        generation = self.catalog.generation()
+        if generation == self._generation:
+            return
+        games, _totals = self.catalog.games_with_totals()
+        for field, board in self._all_time.items():
+            board.reset({name: game.get(field, 0) for name, game in games.items()})
+        self._generation = generation
+
+    def on_deltas(self, deltas, now=None):
+        """Apply {game: {field: delta}} and push the boards whose ranking changed"""
+        now = self.clock() if now is None else now
+        with self._lock:
+            dirty, self._stale = self._stale, set()
+            if self.catalog.generation() != self._generation:
+                self._sync_generation()  # the reloaded totals already include these deltas
+                dirty.update(COUNTER_FIELDS)
+            else:
+                for name, fields in deltas.items():
+                    for field, delta in fields.items():
+                        self._all_time[field].add(name, delta)
+                        dirty.add(field)
+            for name, fields in deltas.items():
+                for field, delta in fields.items():
+                    if delta > 0:
+                        for window in self.windows:
+                            self._sliding[(field, window)].add(name, delta, now)
+                            dirty.add((field, window))
+            for key, sliding in self._sliding.items():
+                if sliding.advance(now):
+                    dirty.add(key)
+            if not dirty:
+                return {}
+            rankings = dict(self._pushed)
+            rankings.update(self._rankings(dirty))
+            changed = {board: ranking for board, ranking in rankings.items()
+                       if [name for name, _ in ranking] != [name for name, _ in self._pushed.get(board, [])]}
+            self._pushed = rankings
+        if changed and self.socketio is not None:
+            self.socketio.emit('leaderboard_updates', {'boards': {
+                board: [{'name': name, 'score': score} for name, score in ranking]
+                for board, ranking in changed.items()}}, to=LEADERBOARD_ROOM)
+            self.emits += 1
+            logger.debug(f"Pushed {len(changed)} changed leaderboards")
+        return changed
+
+    def _rankings(self, dirty=None):
+        """Top ``push_n`` of every board, or only of the fields / (field, window) pairs in ``dirty``"""
+        rankings = {}
+        for field_name, field in BOARD_FIELDS.items():
+            if dirty is None or field in dirty:
+                rankings[f'{field_name}:all'] = self._all_time[field].best(self.push_n)
+            for window in self.windows:
+                if dirty is not None and (field, window) not in dirty:
+                    continue
+                sliding = self._sliding[(field, window)]
+                rankings[f'{field_name}:{window}'] = sliding.best(self.push_n)
+                rankings[f'{field_name}:{window}:trending'] = sliding.best(self.push_n, decayed=True)
+        return rankings
+
+    def snapshot(self):
+        """The payload of a 'leaderboard_updates' emit holding every board"""
+        with self._lock:
+            return {'boards': {board: [{'name': name, 'score': score} for name, score in ranking]
+                               for board, ranking in self._pushed.items()}}
+
+    def top(self, field='plays', window='all', n=10, trending=False):
+        """[(name, score)] best first; ValueError for an unknown field or window"""
+        if field not in BOARD_FIELDS:
+            raise ValueError(f'unknown field: {field}')
+        if window != 'all' and window not in self.windows:
+            raise ValueError(f'unknown window: {window}')
+        n = max(1, min(n, self.k))
+        with self._lock:
+            if window == 'all':
+                return self._all_time[BOARD_FIELDS[field]].best(n)
+            key = (BOARD_FIELDS[field], window)
+            sliding = self._sliding[key]
+            if sliding.advance(self.clock()):
+                self._stale.add(key)
+            return sliding.best(n, decayed=trending)
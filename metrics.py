@@ -0,0 +1,372 @@
+import sys
+import time
+import queue
+import bisect
+import inspect
+import logging
+import functools
+import threading
+from collections import Counter
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import request
+
+from counters import ShardedCounter
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds in seconds (Prometheus ``le``)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items())) if len(labels) > 1 else tuple(labels.items())
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class MetricsRegistry:
+    """Counters, latency histograms and gauges, rendered in the Prometheus text format.
+
+    Counter and histogram updates go to a ``ShardedCounter``, so recording
+    on a request thread never takes a lock; ``render`` sums the shards.
+    Gauges are callables evaluated at render time.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._values = ShardedCounter()  # {(name, labels, bucket index | 'sum' | None): value}
+        self._kinds = {}  # {name: 'counter' | 'histogram'}
+        self._help = {}
+        self._gauges = {}  # {(name, labels): callable}
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def inc(self, name, amount=1, **labels):
+        self._kinds.setdefault(name, 'counter')
+        self._values.add((name, _labels_key(labels), None), amount)
+
+    def observe(self, name, seconds, **labels):
+        self._observe(name, _labels_key(labels), seconds)
+
+    def _observe(self, name, labels, seconds):
+        self._kinds.setdefault(name, 'histogram')
+        values = self._values
+        values.add((name, labels, bisect.bisect_left(self.buckets, seconds)))
+        values.add((name, labels, 'sum'), seconds)
+
+    def gauge(self, name, fn, **labels):
+        """Report ``fn()`` as the gauge ``name`` on every render"""
+        self._gauges[(name, _labels_key(labels))] = fn
+
+    def timer(self, name, **labels):
+        """Context manager observing the time spent in its block"""
+        return _Timer(self, name, _labels_key(labels))
+
+    def timed(self, name, **labels):
+        """Decorator observing the duration of every call"""
+        key = _labels_key(labels)
+
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self._observe(name, key, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def histogram(self, name, **labels):
+        """{'buckets': [cumulative counts, +Inf last], 'count': n, 'sum': seconds} for one series"""
+        key = _labels_key(labels)
+        snapshot = self._values.snapshot()
+        counts = [snapshot.get((name, key, index), 0) for index in range(len(self.buckets) + 1)]
+        cumulative = [sum(counts[:index + 1]) for index in range(len(counts))]
+        return {'buckets': cumulative, 'count': cumulative[-1], 'sum': snapshot.get((name, key, 'sum'), 0.0)}
+
+    def value(self, name, **labels):
+        return self._values.value((name, _labels_key(labels), None))
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        series = {}
+        for (name, labels, slot), value in self._values.snapshot().items():
+            series.setdefault(name, {}).setdefault(labels, {})[slot] = value
+        lines = []
+        for name in sorted(series):
+            kind = self._kinds.get(name, 'counter')
+            if name in self._help:
+                lines.append(f'# HELP {name} {self._help[name]}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, slots in sorted(series[name].items()):
+                if kind == 'counter':
+                    lines.append(f'{name}{_format_labels(labels)} {slots.get(None, 0)}')
+                    continue
+                total = 0
+                for index, bound in enumerate(self.buckets + (float('inf'),)):
+                    total += slots.get(index, 0)
+                    le = '+Inf' if index == len(self.buckets) else repr(bound)
+                    lines.append(f'{name}_bucket{_format_labels(labels, [("le", le)])} {total}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {slots.get("sum", 0.0)}')
+                lines.append(f'{name}_count{_format_labels(labels)} {total}')
+        for (name, labels), fn in sorted(self._gauges.items(), key=lambda item: item[0]):
+            try:
+                value = fn()
+            except Exception as e:
+                logger.error(f"Error reading gauge {name}: {e}")
+                continue
+            if name in self._help:
+                lines.append(f'# HELP {name} {self._help[name]}')
+            lines.append(f'# TYPE {name} gauge')
+            lines.append(f'{name}{_format_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+class _Timer:
+    __slots__ = ('registry', 'name', 'labels', 'start')
+
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry._observe(self.name, self.labels, time.perf_counter() - self.start)
+
+
+class TimedIterator:
+    """Wraps an iterator and adds up the time spent producing its items.
+
+    ``elapsed`` is readable at any point; ``on_close(elapsed)`` runs once the
+    iterator is exhausted or closed, e.g. to record a streamed response.
+    """
+
+    def __init__(self, iterable, on_close=None):
+        self._iterator = iter(iterable)
+        self._on_close = on_close
+        self.elapsed = 0.0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            item = next(self._iterator)
+        except StopIteration:
+            self.elapsed += time.perf_counter() - start
+            self.close()
+            raise
+        self.elapsed += time.perf_counter() - start
+        return item
+
+    def close(self):
+        close = getattr(self._iterator, 'close', None)
+        if close is not None:
+            close()
+        on_close, self._on_close = self._on_close, None
+        if on_close is not None:
+            on_close(self.elapsed)
+
+
+class TimedLock:
+    """A ``threading.Lock`` that records how long callers waited for it.
+
+    An uncontended acquire only bumps a counter; when the lock is busy the
+    wait is observed in ``lock_wait_seconds{lock=name}`` and
+    ``lock_waiters{lock=name}`` reports how many threads are queued.
+    """
+
+    def __init__(self, name, registry=None, lock=None):
+        self.name = name
+        self.registry = registry or default_registry
+        self._lock = lock or threading.Lock()
+        self._labels = (('lock', name),)
+        self._waiters_lock = threading.Lock()  # only taken on the contended path
+        self.waiters = 0
+        self.registry.gauge('lock_waiters', lambda: self.waiters, lock=name)
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self._lock.acquire(False):
+            self.registry._values.add(('lock_acquisitions_total', self._labels, None))
+            return True
+        if not blocking:
+            return False
+        with self._waiters_lock:
+            self.waiters += 1
+        start = time.perf_counter()
+        try:
+            acquired = self._lock.acquire(True, timeout)
+        finally:
+            with self._waiters_lock:
+                self.waiters -= 1
+        self.registry._observe('lock_wait_seconds', self._labels, time.perf_counter() - start)
+        if acquired:
+            self.registry._values.add(('lock_acquisitions_total', self._labels, None))
+        return acquired
+
+    def release(self):
+        self._lock.release()
+
+    def locked(self):
+        return self._lock.locked()
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc):
+        self._lock.release()
+
+
+class SamplingProfiler:
+    """Opt-in wall-clock profiler: samples every thread's stack every ``interval`` seconds.
+
+    Samples are kept as collapsed stacks (``outer;inner;leaf count``, the
+    input format of flamegraph tools). It only runs between ``start`` and
+    ``stop``, so it costs nothing unless someone turns it on.
+    """
+
+    def __init__(self, interval=0.005, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = Counter()
+        self.started_at = None
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return False
+            self.samples = Counter()
+            self.started_at = time.time()
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+            self._thread.start()
+        logger.info(f"Sampling profiler started ({self.interval * 1000:.1f} ms interval)")
+        return True
+
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return False
+        self._stop_event.set()
+        thread.join()
+        logger.info(f"Sampling profiler stopped after {sum(self.samples.values())} samples")
+        return True
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({code.co_filename.rsplit("/", 1)[-1]}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        """The samples so far as collapsed stacks, most frequent first"""
+        return '\n'.join(f'{stack} {count}' for stack, count in self.samples.most_common()) + '\n'
+
+
+class _LogQueueHandler(QueueHandler):
+    """Enqueues records for the listener thread without formatting them first"""
+
+    def prepare(self, record):
+        # Merge the %-args now, while they still hold the values being logged
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def install_queue_logging(level=logging.INFO, handler=None):
+    """Send the root logger's records through a queue to ``handler`` on a background thread.
+
+    Logging calls on request threads then cost a level check and a queue put;
+    formatting and the write happen on the listener thread. Returns the
+    started ``QueueListener`` (stop it at exit to drain the queue).
+    """
+    handler = handler or logging.StreamHandler()
+    if handler.formatter is None:
+        handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    root = logging.getLogger()
+    root.addHandler(_LogQueueHandler(log_queue))
+    root.setLevel(level)
+    listener.start()
+    return listener
+
+
+def instrument_flask(app, registry=None):
+    """Count and time every request of ``app`` by route template, method and status"""
+    registry = registry or default_registry
+    registry.describe('http_request_duration_seconds', 'Time to produce a response, by route')
+    registry.describe('http_requests_total', 'Requests served, by route and status')
+
+    @app.before_request
+    def _start_timer():
+        request.environ['metrics.start'] = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        start = request.environ.pop('metrics.start', None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            registry.observe('http_request_duration_seconds', time.perf_counter() - start,
+                             app=app.name, route=route, method=request.method)
+            registry.inc('http_requests_total', app=app.name, route=route, method=request.method,
+                         status=response.status_code)
+        return response
+
+    return app
+
+
+def instrument_socketio(socketio, registry=None):
+    """Time every handler registered with ``socketio.on`` from now on, by event name"""
+    registry = registry or default_registry
+    registry.describe('socketio_event_duration_seconds', 'Time spent in a Socket.IO event handler')
+    on = socketio.on
+
+    def instrumented_on(message, namespace=None):
+        register = on(message, namespace)
+
+        def decorator(handler):
+            timed = registry.timed('socketio_event_duration_seconds', event=message)(handler)
+            if message == 'connect' and not inspect.signature(handler).parameters:
+                # Flask-SocketIO retries connect handlers without ``auth`` on TypeError;
+                # call the zero-argument form directly so it is timed once
+                register(functools.wraps(handler)(lambda auth=None: timed()))
+            else:
+                register(timed)
+            return handler
+        return decorator
+
+    socketio.on = instrumented_on
+    return socketio
+
+
+# Process-wide registry shared by the app, its modules and mounted sub-servers
+default_registry = MetricsRegistry()
@@ -1,78 +1,145 @@
-import json
 import os
-from app import app, db, Game, Tag, game_tags
+import json
+import time
+import logging
+import argparse
+
 from flask import Flask
+from sqlalchemy import delete, insert, select
+
+from catalog import GAMES_JSON_PATH
+from models import db, Game, Tag, game_tags, catalog_meta, DEFAULT_DATABASE_URL
+
+logger = logging.getLogger(__name__)
+
+# Rows per transaction; each IN (...) list stays well under SQLite's variable limit
+BATCH_SIZE = 2000
+
+
+def _upsert(engine, table):
+    """INSERT ... ON CONFLICT for SQLite and PostgreSQL; None elsewhere"""
+    if engine.dialect.name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert(table)
+
+
+def _batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _ensure_tags(conn, engine, names):
+    """Insert missing tag names and return {name: id}"""
+    tags = Tag.__table__
+    stmt = _upsert(engine, tags)
+    if stmt is not None:
+        for batch in _batches(sorted(names), BATCH_SIZE):
+            conn.execute(stmt.on_conflict_do_nothing(index_elements=['name']), [{'name': n} for n in batch])
+    else:
+        existing = set(conn.execute(select(tags.c.name)).scalars())
+        missing = sorted(set(names) - existing)
+        if missing:
+            conn.execute(insert(tags), [{'name': n} for n in missing])
+    return {name: tag_id for tag_id, name in conn.execute(select(tags.c.id, tags.c.name))}
+
+
+def migrate_games(engine, games, batch_size=BATCH_SIZE):
+    """Bulk upsert {name: game entry} into the catalog tables.
+
+    New games are inserted with their counters; games already in the
+    database get their location, thumbnail and tags updated but keep their
+    counters, which the database owns once it serves the catalog. Tags go in
+    first in one pass; games and their tag links follow in batched
+    transactions of ``batch_size`` rows.
+    """
+    games_table = Game.__table__
+    names = list(games)
+    all_tags = {tag for game in games.values() for tag in game.get('Tags', [])}
 
-def migrate_games_from_json():
+    with engine.begin() as conn:
+        tag_ids = _ensure_tags(conn, engine, all_tags)
+        conn.execute(_insert_meta(engine))
+
+    upsert = _upsert(engine, games_table)
+    for batch in _batches(names, batch_size):
+        rows = [{
+            'name': name,
+            'location': games[name].get('Location', ''),
+            'thumbnail': games[name].get('Thumbnail', ''),
+            'likes': games[name].get('Likes', 0),
+            'favorites': games[name].get('Favorites', 0),
+            'plays': games[name].get('Plays', 0),
+        } for name in batch]
+        with engine.begin() as conn:
+            if upsert is not None:
+                conn.execute(upsert.on_conflict_do_update(
+                    index_elements=['name'],
+                    set_={'location': upsert.excluded.location, 'thumbnail': upsert.excluded.thumbnail}), rows)
+            else:
+                existing = set(conn.execute(select(games_table.c.name).where(games_table.c.name.in_(batch)))
+                               .scalars())
+                new_rows = [row for row in rows if row['name'] not in existing]
+                if new_rows:
+                    conn.execute(insert(games_table), new_rows)
+                for row in rows:
+                    if row['name'] in existing:
+                        conn.execute(games_table.update().where(games_table.c.name == row['name'])
+                                     .values(location=row['location'], thumbnail=row['thumbnail']))
+
+            game_ids = dict(conn.execute(select(games_table.c.name, games_table.c.id)
+                                         .where(games_table.c.name.in_(batch))).all())
+            conn.execute(delete(game_tags).where(game_tags.c.game_id.in_(list(game_ids.values()))))
+            links = [{'game_id': game_ids[name], 'tag_id': tag_ids[tag], 'position': position}
+                     for name in batch
+                     for position, tag in enumerate(dict.fromkeys(games[name].get('Tags', [])))]
+            if links:
+                conn.execute(insert(game_tags), links)
+    return len(names)
+
+
+def _insert_meta(engine):
+    stmt = _upsert(engine, catalog_meta)
+    if stmt is not None:
+        return stmt.values(id=1, version=0).on_conflict_do_nothing(index_elements=['id'])
+    return insert(catalog_meta).from_select(
+        ['id', 'version'], select(1, 0).where(~select(catalog_meta.c.id).where(catalog_meta.c.id == 1).exists()))
+
+
+def migrate_games_from_json(engine, path=GAMES_JSON_PATH, batch_size=BATCH_SIZE):
     """Migrate games data from JSON file to database"""
-    # Create database tables
-    with app.app_context():
-        db.create_all()
-        
-        # Check if the database already has games
-        if Game.query.count() > 0:
-            print("Database already contains games. Skipping migration.")
-            return
-        
-        try:
-            # Load games from JSON file
-            with open('games/games.json', 'r') as f:
-                games_data = json.load(f)
-                
-            if 'games' not in games_data:
-                print("Invalid JSON structure. 'games' key not found.")
-                return
-                
-            # Get or create tags
-            tag_objects = {}
-            all_tags = set()
-            
-            # First collect all unique tags
-            for game_name, game_data in games_data['games'].items():
-                if 'Tags' in game_data:
-                    for tag in game_data['Tags']:
-                        all_tags.add(tag)
-            
-            # Create tags in database
-            for tag_name in all_tags:
-                tag = Tag.query.filter_by(name=tag_name).first()
-                if not tag:
-                    tag = Tag(name=tag_name)
-                    db.session.add(tag)
-                tag_objects[tag_name] = tag
-            
-            # Commit the tags first
-            db.session.commit()
-            
-            # Create games
-            for game_name, game_data in games_data['games'].items():
-                game = Game.query.filter_by(name=game_name).first()
-                
-                if not game:
-                    game = Game(
-                        name=game_name,
-                        location=game_data.get('Location', ''),
-                        thumbnail=game_data.get('Thumbnail', ''),
-                        likes=game_data.get('Likes', 0),
-                        favorites=game_data.get('Favorites', 0),
-                        plays=game_data.get('Plays', 0)
-                    )
-                    
-                    # Add tags to game
-                    for tag_name in game_data.get('Tags', []):
-                        if tag_name in tag_objects:
-                            game.tags.append(tag_objects[tag_name])
-                    
-                    db.session.add(game)
-            
-            # Commit all games
-            db.session.commit()
-            print(f"Successfully migrated {len(games_data['games'])} games to the database.")
-            
-        except Exception as e:
-            db.session.rollback()
-            print(f"Error migrating games: {e}")
-            raise e
+    with open(path, 'r') as f:
+        games_data = json.load(f)
+    if 'games' not in games_data:
+        raise ValueError(f"Invalid JSON structure in {path}: 'games' key not found")
+
+    start = time.perf_counter()
+    count = migrate_games(engine, games_data['games'], batch_size)
+    logger.info(f"Migrated {count} games to the database in {time.perf_counter() - start:.2f}s")
+    return count
+
+
+def create_db_app(database_url):
+    """Minimal Flask app bound to ``db``, for running migrations without the game server"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    db.init_app(app)
+    return app
+
 
 if __name__ == '__main__':
-    migrate_games_from_json()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Load games.json into the catalog database')
+    parser.add_argument('--json', default=GAMES_JSON_PATH)
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL', DEFAULT_DATABASE_URL))
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    app = create_db_app(args.database_url)
+    with app.app_context():
+        db.create_all()
+        count = migrate_games_from_json(db.engine, args.json, args.batch_size)
+    print(f"Successfully migrated {count} games to the database.")
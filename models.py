@@ -1,16 +1,67 @@
-# This file is kept for compatibility purposes but is no longer used
-# Game data is now stored in games/games.json
-#
-# JSON structure:
-# {
-#   "games": {
-#     "Game Name Here": {
-#       "Location": "game-file.html",  // From /games/
-#       "Thumbnail": "https://example.com/image.png",
-#       "Likes": 0,
-#       "Favorites": 0,
-#       "Plays": 0,
-#       "Tags": ["tag1", "tag2", "tag3"]
-#     }
-#   }
-# }
\ No newline at end of file
+"""SQL schema for the database-backed catalog (``CATALOG_BACKEND=sql``).
+
+games.json stays the default store; see catalog_sql.SQLCatalog for the
+database mode and migrations.py for loading games.json into it. The JSON
+structure maps onto these tables as:
+
+{
+  "games": {
+    "Game Name Here": {
+      "Location": "game-file.html",  // games.location
+      "Thumbnail": "https://example.com/image.png",  // games.thumbnail
+      "Likes": 0,  // games.likes
+      "Favorites": 0,  // games.favorites
+      "Plays": 0,  // games.plays
+      "Tags": ["tag1", "tag2", "tag3"]  // tags + game_tags
+    }
+  }
+}
+"""
+from flask_sqlalchemy import SQLAlchemy
+
+db = SQLAlchemy()
+
+# Relative SQLite paths are resolved inside the Flask instance folder
+DEFAULT_DATABASE_URL = 'sqlite:///catalog.db'
+
+# Catalog counter field -> games column
+FIELD_COLUMNS = {
+    'Plays': 'plays',
+    'Likes': 'likes',
+    'Favorites': 'favorites',
+}
+
+game_tags = db.Table(
+    'game_tags',
+    db.Column('game_id', db.Integer, db.ForeignKey('games.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('tag_id', db.Integer, db.ForeignKey('tags.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('position', db.Integer, nullable=False, default=0),  # order within the game's Tags
+)
+
+# Single row (id=1) whose version is bumped by every counter flush, so
+# other workers sharing the database know to reload
+catalog_meta = db.Table(
+    'catalog_meta',
+    db.Column('id', db.Integer, primary_key=True),
+    db.Column('version', db.Integer, nullable=False, default=0),
+)
+
+
+class Game(db.Model):
+    __tablename__ = 'games'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(255), unique=True, nullable=False)
+    location = db.Column(db.String(512), nullable=False, default='')
+    thumbnail = db.Column(db.String(1024), nullable=False, default='')
+    likes = db.Column(db.Integer, nullable=False, default=0)
+    favorites = db.Column(db.Integer, nullable=False, default=0)
+    plays = db.Column(db.Integer, nullable=False, default=0)
+    tags = db.relationship('Tag', secondary=game_tags, backref='games', lazy='selectin')
+
+
+class Tag(db.Model):
+    __tablename__ = 'tags'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), unique=True, nullable=False)
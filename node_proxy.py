@@ -0,0 +1,295 @@
+import os
+import time
+import socket
+import logging
+import selectors
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from flask import Blueprint, Response, request
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NODE_PORT = 3000
+PROXY_METHODS = ['GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS']
+POOL_MAXSIZE = int(os.environ.get('NODE_PROXY_POOL_MAXSIZE', '32'))
+CONNECT_TIMEOUT = float(os.environ.get('NODE_PROXY_CONNECT_TIMEOUT', '5'))
+READ_TIMEOUT = float(os.environ.get('NODE_PROXY_READ_TIMEOUT', '60'))
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# RFC 9110 7.6.1: meaningful for a single connection only, never forwarded
+HOP_BY_HOP_HEADERS = frozenset([
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization', 'proxy-connection',
+    'te', 'trailer', 'transfer-encoding', 'upgrade',
+])
+
+# Set for this hop by _forward_headers; the client's X-Forwarded-For is extended, not repeated
+FORWARDED_HEADERS = frozenset(['x-forwarded-for', 'x-forwarded-proto', 'x-forwarded-host', 'x-forwarded-prefix'])
+
+
+def strip_hop_by_hop(headers):
+    """Drop hop-by-hop headers, including any named in Connection, from (name, value) pairs"""
+    headers = list(headers)
+    dropped = set(HOP_BY_HOP_HEADERS)
+    for name, value in headers:
+        if name.lower() == 'connection':
+            dropped.update(token.strip().lower() for token in value.split(','))
+    return [(name, value) for name, value in headers if name.lower() not in dropped]
+
+
+class BackendPort:
+    """Port of a Node.js backend read from its port.txt, re-read when the file changes.
+
+    The file is stat'ed at most once per ``check_interval`` seconds instead
+    of being opened and parsed on every request.
+    """
+
+    def __init__(self, path, default=DEFAULT_NODE_PORT, check_interval=1.0):
+        self.path = path
+        self.default = default
+        self.check_interval = check_interval
+        self._port = default
+        self._stamp = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return self._port
+        with self._lock:
+            if now - self._checked < self.check_interval:
+                return self._port
+            self._checked = now
+            try:
+                st = os.stat(self.path)
+            except OSError:
+                self._stamp, self._port = None, self.default
+                return self._port
+            stamp = (st.st_mtime_ns, st.st_size)
+            if stamp != self._stamp:
+                try:
+                    with open(self.path, 'r') as f:
+                        port = int(f.read().strip())
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Ignoring unreadable port file {self.path}: {e}")
+                    port = self.default
+                if port != self._port:
+                    logger.info(f"Backend port for {self.path} is now {port}")
+                self._stamp, self._port = stamp, port
+        return self._port
+
+
+class _SizedBody:
+    """Streams a request body of known length (so it is sent with Content-Length, not chunked)"""
+
+    def __init__(self, stream, length):
+        self.stream = stream
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def read(self, size=STREAM_CHUNK_SIZE):
+        return self.stream.read(size)
+
+    def __iter__(self):
+        while True:
+            chunk = self.stream.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+
+class _TunnelClosed:
+    """Response body for a hijacked connection: ends the request without writing to it"""
+
+    def __init__(self, mode):
+        self.mode = mode
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.mode == 'werkzeug':
+            # werkzeug treats this as the client going away and writes nothing
+            raise ConnectionError('WebSocket tunnel closed')
+        raise StopIteration
+
+
+class NodeProxy:
+    """Reverse proxy from ``/other/<name>`` to a Node.js server on localhost.
+
+    Each backend has its own pooled ``requests.Session``. All methods are
+    forwarded with the query string; request and response bodies are
+    streamed without buffering, response bodies are passed through still
+    content-encoded, and hop-by-hop headers are stripped both ways.
+    WebSocket upgrades are tunnelled as raw bytes over the server socket
+    (werkzeug and gunicorn expose it in the WSGI environ).
+    """
+
+    def __init__(self, name, root='servers', host='127.0.0.1'):
+        self.name = name
+        self.host = host
+        self.prefix = f'/other/{name}'
+        self.port = BackendPort(os.path.join(root, name, 'port.txt'))
+        self._session = None
+        self._session_pid = None
+        self._session_lock = threading.Lock()
+
+    def session(self):
+        """This worker's pooled session for the backend (re-created after a fork)"""
+        pid = os.getpid()
+        if self._session is None or self._session_pid != pid:
+            with self._session_lock:
+                if self._session is None or self._session_pid != pid:
+                    session = requests.Session()
+                    session.trust_env = False  # never route localhost through an env proxy
+                    session.headers.clear()  # forward the client's headers, not requests' defaults
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE, max_retries=0)
+                    session.mount('http://', adapter)
+                    self._session, self._session_pid = session, pid
+        return self._session
+
+    def backend_origin(self):
+        return f'http://{self.host}:{self.port.get()}'
+
+    def _forward_headers(self):
+        headers = strip_hop_by_hop(
+            (name, value) for name, value in request.headers.items()
+            if name.lower() not in ('host', 'content-length') and name.lower() not in FORWARDED_HEADERS)
+        forwarded_for = request.headers.get('X-Forwarded-For')
+        remote = request.remote_addr or ''
+        headers += [
+            ('X-Forwarded-For', f'{forwarded_for}, {remote}' if forwarded_for else remote),
+            ('X-Forwarded-Proto', request.scheme),
+            ('X-Forwarded-Host', request.host),
+            ('X-Forwarded-Prefix', self.prefix),
+        ]
+        merged = {}
+        for name, value in headers:
+            merged[name] = f'{merged[name]}, {value}' if name in merged else value
+        return merged
+
+    def _rewrite_location(self, value, origin):
+        """Keep redirects to the backend itself inside the public prefix"""
+        for base in (origin, f'http://localhost:{self.port.get()}'):
+            if value.startswith(base + '/') or value == base:
+                return self.prefix + value[len(base):]
+        if value.startswith('/') and not value.startswith('//') and \
+                not (value == self.prefix or value.startswith(self.prefix + '/')):
+            return self.prefix + value
+        return value
+
+    def handle(self, path):
+        if request.headers.get('Upgrade', '').lower() == 'websocket':
+            return self.tunnel_websocket(path)
+
+        origin = self.backend_origin()
+        url = f'{origin}/{path}'
+        if request.query_string:
+            url += '?' + request.query_string.decode('latin-1')
+
+        body = None
+        if request.content_length:
+            body = _SizedBody(request.stream, request.content_length)
+        elif request.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            body = iter(lambda: request.stream.read(STREAM_CHUNK_SIZE), b'')
+
+        try:
+            resp = self.session().request(
+                request.method, url, headers=self._forward_headers(), data=body, stream=True,
+                allow_redirects=False, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+        except requests.Timeout as e:
+            logger.warning(f"Timeout proxying {request.method} {url}: {e}")
+            return 'Gateway Timeout', 504
+        except requests.ConnectionError as e:
+            logger.warning(f"Error proxying {request.method} {url}: {e}")
+            return 'Bad Gateway', 502
+
+        headers = strip_hop_by_hop(resp.raw.headers.items())
+        headers = [(name, self._rewrite_location(value, origin) if name.lower() == 'location' else value)
+                   for name, value in headers]
+
+        def stream():
+            try:
+                for chunk in resp.raw.stream(STREAM_CHUNK_SIZE, decode_content=False):
+                    yield chunk
+            finally:
+                resp.close()
+
+        return Response(stream(), resp.status_code, headers, direct_passthrough=True)
+
+    # -- WebSocket passthrough ------------------------------------------
+
+    def tunnel_websocket(self, path):
+        environ = request.environ
+        if 'werkzeug.socket' in environ:
+            client, mode = environ['werkzeug.socket'], 'werkzeug'
+        elif 'gunicorn.socket' in environ:
+            client, mode = environ['gunicorn.socket'], 'gunicorn'
+        else:
+            return 'WebSocket passthrough is not supported by this server', 501
+
+        target = f'/{path}'
+        if request.query_string:
+            target += '?' + request.query_string.decode('latin-1')
+        # Upgrade and Connection are hop-by-hop but are exactly what this hop needs
+        lines = [f'{request.method} {target} HTTP/1.1', f'Host: {self.host}:{self.port.get()}',
+                 'Connection: Upgrade', f"Upgrade: {request.headers['Upgrade']}"]
+        lines += [f'{name}: {value}' for name, value in self._forward_headers().items()]
+        try:
+            backend = socket.create_connection((self.host, self.port.get()), timeout=CONNECT_TIMEOUT)
+        except OSError as e:
+            logger.warning(f"Error opening WebSocket tunnel to {self.name}: {e}")
+            return 'Bad Gateway', 502
+        backend.settimeout(None)
+        try:
+            backend.sendall(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+            _relay(client, backend)
+        finally:
+            backend.close()
+            try:
+                client.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        return Response(_TunnelClosed(mode))
+
+
+def _relay(a, b):
+    """Copy bytes both ways between two sockets until either side closes"""
+    a.settimeout(None)
+    peers = {a: b, b: a}
+    with selectors.DefaultSelector() as selector:
+        selector.register(a, selectors.EVENT_READ)
+        selector.register(b, selectors.EVENT_READ)
+        while True:
+            for key, _events in selector.select():
+                try:
+                    data = key.fileobj.recv(STREAM_CHUNK_SIZE)
+                    if not data:
+                        return
+                    peers[key.fileobj].sendall(data)
+                except OSError:
+                    return
+
+
+def create_node_proxy(name, root='servers'):
+    """Blueprint mounting the Node.js server ``name`` under ``/other/<name>``"""
+    proxy = NodeProxy(name, root=root)
+    bp = Blueprint(name, __name__, url_prefix=proxy.prefix)
+
+    @bp.route('/', defaults={'path': ''}, methods=PROXY_METHODS)
+    @bp.route('/<path:path>', methods=PROXY_METHODS)
+    def proxy_view(path):
+        return proxy.handle(path)
+
+    # werkzeug routes Upgrade: websocket requests only to rules marked websocket=True
+    @bp.route('/', defaults={'path': ''}, websocket=True)
+    @bp.route('/<path:path>', websocket=True)
+    def proxy_websocket(path):
+        return proxy.tunnel_websocket(path)
+
+    bp.node_proxy = proxy
+    return bp
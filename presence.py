@@ -0,0 +1,196 @@
+import json
+import time
+import base64
+import logging
+
+from broadcast import ALL_GAMES_ROOM, game_room
+from metrics import TimedLock
+
+logger = logging.getLogger(__name__)
+
+
+def encode_cursor(position):
+    """Opaque page cursor around a shared-state hscan cursor"""
+    raw = json.dumps([position], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """The hscan cursor inside a page cursor; ValueError if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        position, = json.loads(raw)
+    except Exception:
+        raise ValueError('invalid cursor')
+    if not isinstance(position, str):
+        raise ValueError('invalid cursor')
+    return position
+
+
+class TimerWheel:
+    """Deadlines kept in a ring of ``slots`` buckets, each ``resolution`` seconds wide.
+
+    ``schedule`` and ``cancel`` move a key between two sets, so refreshing a
+    deadline on every heartbeat is O(1). ``advance`` only visits the buckets
+    whose time has come and returns the keys that are due; a deadline more
+    than one turn of the ring away waits in its bucket until its own turn.
+    """
+
+    def __init__(self, resolution=1.0, slots=64, now=0.0):
+        self.resolution = resolution
+        self.slots = [set() for _ in range(slots)]
+        self.deadlines = {}  # {key: (deadline, tick)}
+        self._tick = int(now // resolution)  # oldest tick that may still hold due keys
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def schedule(self, key, deadline):
+        """Set (or move) ``key``'s deadline"""
+        self.cancel(key)
+        # A deadline in an already visited tick goes in the current one so it is not skipped
+        tick = max(int(deadline // self.resolution), self._tick)
+        self.deadlines[key] = (deadline, tick)
+        self.slots[tick % len(self.slots)].add(key)
+
+    def cancel(self, key):
+        entry = self.deadlines.pop(key, None)
+        if entry is not None:
+            self.slots[entry[1] % len(self.slots)].discard(key)
+
+    def advance(self, now):
+        """Remove and return every key whose deadline is at or before ``now``"""
+        last = int(now // self.resolution)
+        expired = []
+        # Visiting every bucket once covers all keys, however long the gap
+        for tick in range(max(self._tick, last - len(self.slots) + 1), last + 1):
+            slot = self.slots[tick % len(self.slots)]
+            due = [key for key in slot if self.deadlines[key][0] <= now]
+            for key in due:
+                slot.discard(key)
+                del self.deadlines[key]
+            expired.extend(due)
+        self._tick = last  # the current bucket may hold keys due later in this tick
+        return expired
+
+
+class PresenceTracker:
+    """Who is playing what right now, with heartbeat expiry and live per-game counts.
+
+    A session (one Socket.IO sid) joins a game on 'play' and stays until it
+    leaves, disconnects or goes ``ttl`` seconds without a heartbeat. Expiry
+    runs on a ``TimerWheel``, so a tick costs the sessions actually expiring
+    rather than a scan of all of them.
+
+    Sessions are listed in the shared ``active_players`` hash and every join
+    or leave is one atomic increment of the game's field in
+    ``presence_counts``, so all workers read the same numbers. ``tick`` is an
+    UpdateBroadcaster listener: it expires sessions and, at most once per
+    ``push_interval``, emits ``presence_updates`` ``{'games': {name: players}}``
+    for the games whose count changed, batched to ``ALL_GAMES_ROOM`` and per
+    game to its ``game_room``.
+    """
+
+    def __init__(self, shared_state, socketio=None, ttl=60.0, push_interval=1.0, resolution=1.0,
+                 clock=time.monotonic):
+        self.shared = shared_state
+        self.socketio = socketio
+        self.ttl = ttl
+        self.push_interval = push_interval
+        self.clock = clock
+        self._lock = TimedLock('presence')
+        self._sessions = {}  # {sid: game}, this worker's sessions
+        self._wheel = TimerWheel(resolution, int(ttl / resolution) + 2, clock())
+        self._changed = set()  # games whose count changed since the last push
+        self._last_push = None
+        self.pushes = 0
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def join(self, sid, machine_id, game):
+        """Start a session in ``game`` or move it there; also counts as a heartbeat"""
+        with self._lock:
+            previous = self._sessions.get(sid)
+            self._sessions[sid] = game
+            self._wheel.schedule(sid, self.clock() + self.ttl)
+            if previous == game:
+                return
+            self.shared.hset('active_players', sid, {'machine_id': machine_id, 'game': game, 'since': time.time()})
+            if previous is not None:
+                self.shared.hincr('presence_counts', previous, -1)
+                self._changed.add(previous)
+            self.shared.hincr('presence_counts', game, 1)
+            self._changed.add(game)
+
+    def heartbeat(self, sid):
+        """Push back a session's expiry; False if it has none (never joined, left or expired)"""
+        with self._lock:
+            if sid not in self._sessions:
+                return False
+            self._wheel.schedule(sid, self.clock() + self.ttl)
+            return True
+
+    def leave(self, sid):
+        """End a session; returns True if there was one"""
+        with self._lock:
+            return self._remove([sid]) == 1
+
+    def _remove(self, sids):
+        removed = []
+        for sid in sids:
+            game = self._sessions.pop(sid, None)
+            if game is None:
+                continue
+            self._wheel.cancel(sid)
+            self.shared.hincr('presence_counts', game, -1)
+            self._changed.add(game)
+            removed.append(sid)
+        if removed:
+            self.shared.hdel('active_players', *removed)
+        return len(removed)
+
+    def expire(self, now=None):
+        """End the sessions whose last heartbeat is over ``ttl`` old; returns how many"""
+        with self._lock:
+            return self._remove(self._wheel.advance(self.clock() if now is None else now))
+
+    def release(self):
+        """End every session of this worker, e.g. on shutdown"""
+        with self._lock:
+            return self._remove(list(self._sessions))
+
+    def tick(self, deltas=None, now=None):
+        """Expire stale sessions and push changed counts when the push interval has passed"""
+        now = self.clock() if now is None else now
+        expired = self.expire(now)
+        if expired:
+            logger.debug("Expired %s presence sessions", expired)
+        with self._lock:
+            if not self._changed or (self._last_push is not None and now - self._last_push < self.push_interval):
+                return {}
+            changed, self._changed = self._changed, set()
+            self._last_push = now
+        counts = self.counts(changed)
+        if self.socketio is not None:
+            self.socketio.emit('presence_updates', {'games': counts}, to=ALL_GAMES_ROOM)
+            for name, players in counts.items():
+                self.socketio.emit('presence_updates', {'games': {name: players}}, to=game_room(name))
+            self.pushes += 1
+        return counts
+
+    def counts(self, games=None):
+        """{game: players} for ``games``, or for every game with players"""
+        counts = self.shared.hgetall('presence_counts')
+        if games is None:
+            return {name: players for name, players in counts.items() if players > 0}
+        return {name: max(0, counts.get(name, 0)) for name in games}
+
+    def players(self, cursor=None, limit=100):
+        """One page of [{'machine_id', 'game', 'since'}] across all workers, and the next cursor
+
+        Raises ValueError for a cursor that is not a ``next_cursor`` this returned.
+        """
+        position = decode_cursor(cursor) if cursor else None
+        page, next_position = self.shared.hscan('active_players', position, limit)
+        return list(page.values()), encode_cursor(next_position) if next_position is not None else None
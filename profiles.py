@@ -0,0 +1,384 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from sqlalchemy import (Column, Float, Integer, LargeBinary, MetaData, String, Table, create_engine, func,
+                        select)
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from metrics import TimedLock
+
+logger = logging.getLogger(__name__)
+
+PROFILES_DATABASE_URL = f"sqlite:///{os.path.join('instance', 'profiles.db')}"
+
+# Profile kinds in the order the profile page lists them, keyed by action
+PROFILE_KINDS = ('played', 'likes', 'favorites')
+ACTION_KINDS = {'play': 'played', 'like': 'likes', 'favorite': 'favorites'}
+
+metadata = MetaData()
+
+profile_games = Table(
+    'profile_games', metadata,
+    Column('id', Integer, primary_key=True, autoincrement=False),
+    Column('name', String(255), unique=True, nullable=False),
+)
+
+user_profiles = Table(
+    'user_profiles', metadata,
+    Column('machine_id', String(64), primary_key=True),
+    Column('played', LargeBinary, nullable=False),
+    Column('likes', LargeBinary, nullable=False),
+    Column('favorites', LargeBinary, nullable=False),
+    Column('last_seen', Float, nullable=False),
+)
+
+
+def bits_to_bytes(bits):
+    return bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+
+
+def bytes_to_bits(data):
+    return int.from_bytes(data, 'little')
+
+
+def iter_bits(bits):
+    """Yield the positions of the set bits, lowest first"""
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+class Profile:
+    """One user's games as bitsets over integer game IDs (an int per kind)"""
+    __slots__ = ('played', 'likes', 'favorites', 'last_seen')
+
+    def __init__(self, played=0, likes=0, favorites=0, last_seen=0.0):
+        self.played = played
+        self.likes = likes
+        self.favorites = favorites
+        self.last_seen = last_seen
+
+
+class ProfileStore:
+    """Per-machine played/liked/favorited games, bounded in memory and persisted.
+
+    Game names are interned to small integer IDs so each kind is one int
+    bitset: membership is a single AND instead of a list scan. Profiles live
+    in an LRU of at most ``max_profiles`` entries; anything idle for
+    ``idle_ttl`` seconds (or pushed out of the LRU) is written to the
+    database and dropped, then read back on its next access. Changes are
+    written behind every ``flush_interval`` seconds by a background thread.
+
+    With ``shared`` set, several worker processes use the same database. A
+    machine ID belongs to the one connection (and so the one worker) that
+    records into it; the other workers read its profile from the database on
+    every ``get`` instead of caching a copy that would go stale, so they see
+    it at most ``flush_interval`` seconds behind.
+
+    The lock taken by every action is never held across a database query:
+    profiles are read with it released (one reader per machine ID, the rest
+    wait for it) and new game IDs are assigned under a lock of their own.
+    """
+
+    def __init__(self, database_url=PROFILES_DATABASE_URL, max_profiles=50000, idle_ttl=3600.0,
+                 flush_interval=5.0, shared=False):
+        self.max_profiles = max_profiles
+        self.shared = shared
+        self.idle_ttl = idle_ttl
+        self.flush_interval = flush_interval
+
+        if database_url.startswith('sqlite:///') and not database_url.startswith('sqlite:///:memory:'):
+            directory = os.path.dirname(database_url[len('sqlite:///'):])
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        self.engine = create_engine(database_url)
+        try:
+            metadata.create_all(self.engine)
+        except OperationalError:
+            metadata.create_all(self.engine)  # another worker created the tables first
+
+        self._lock = TimedLock('profiles')  # taken by every game action
+        self._profiles = OrderedDict()  # {machine_id: Profile}, least recently used first
+        self._dirty = set()  # machine_ids changed since the last flush
+        self._evicted = {}  # dirty profiles pushed out before their flush
+        self._flushing = {}  # profiles being written right now, still newer than their rows
+        self._loading = {}  # {machine_id: Event} for profiles being read from the database
+        self._flushes = 0  # completed flushes; a row read as missing stays missing until the next one
+
+        self._game_ids = {}  # {game name: id}
+        self._game_names = []  # [name] indexed by id
+        self._game_id_lock = TimedLock('profile_game_ids')  # assigns new IDs, one at a time
+        self._load_game_ids()
+
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+
+        self._stop_event = threading.Event()
+        self._flusher = None
+
+    # -- game ids -------------------------------------------------------
+
+    def _load_game_ids(self):
+        with self.engine.connect() as conn:
+            rows = conn.execute(select(profile_games.c.id, profile_games.c.name).order_by(profile_games.c.id)).all()
+        self._game_ids = {name: game_id for game_id, name in rows}
+        self._game_names = [name for _, name in rows]
+
+    def game_id(self, name):
+        """Integer ID for a game name, assigned (and persisted) on first use"""
+        game_id = self._game_ids.get(name)
+        if game_id is not None:
+            return game_id
+        with self._game_id_lock:
+            while name not in self._game_ids:
+                game_id = len(self._game_names)
+                try:
+                    with self.engine.begin() as conn:
+                        conn.execute(profile_games.insert().values(id=game_id, name=name))
+                except IntegrityError:
+                    self._load_game_ids()  # another worker took this ID (or named this game) first
+                    continue
+                self._game_names.append(name)
+                self._game_ids[name] = game_id
+            return self._game_ids[name]
+
+    def game_names(self, bits):
+        return [self._game_names[game_id] for game_id in iter_bits(bits)]
+
+    # -- profiles -------------------------------------------------------
+
+    def _load(self, machine_id):
+        with self.engine.connect() as conn:
+            row = conn.execute(select(user_profiles.c.played, user_profiles.c.likes, user_profiles.c.favorites,
+                                      user_profiles.c.last_seen)
+                               .where(user_profiles.c.machine_id == machine_id)).first()
+        if row is None:
+            return None
+        self.loads += 1
+        return Profile(bytes_to_bits(row.played), bytes_to_bits(row.likes), bytes_to_bits(row.favorites),
+                       row.last_seen)
+
+    def _install(self, machine_id, profile):
+        self._profiles[machine_id] = profile
+        self._evict_over_capacity()
+        return profile
+
+    def _in_memory(self, machine_id):
+        """The profile if this process holds it, made resident again (call with the lock held)"""
+        profile = self._profiles.get(machine_id)
+        if profile is not None:
+            self.hits += 1
+            self._profiles.move_to_end(machine_id)
+            return profile
+        profile = self._evicted.pop(machine_id, None)
+        if profile is not None:
+            self._dirty.add(machine_id)  # still not written
+        else:
+            profile = self._flushing.get(machine_id)
+        if profile is not None:
+            self._install(machine_id, profile)
+        return profile
+
+    @contextmanager
+    def _resident(self, machine_id, create):
+        """Hold the lock with the profile for ``machine_id`` resident (None if it has none and not ``create``)"""
+        missing_at = None  # self._flushes when the database was found to have no row
+        while True:
+            with self._lock:
+                profile = self._in_memory(machine_id)
+                if profile is not None or missing_at == self._flushes:
+                    if profile is None and create:
+                        profile = self._install(machine_id, Profile())
+                    yield profile
+                    return
+                loading = self._loading.get(machine_id)
+                loader = loading is None
+                if loader:
+                    loading = self._loading[machine_id] = threading.Event()
+                    flushes = self._flushes
+            if not loader:
+                loading.wait()
+                continue
+            stored = None
+            try:
+                stored = self._load(machine_id)
+            finally:
+                with self._lock:
+                    del self._loading[machine_id]
+                    if stored is not None:
+                        self._install(machine_id, stored)
+                loading.set()
+            if stored is None:
+                missing_at = flushes
+
+    def record(self, machine_id, action, game_name):
+        """Add a game to the profile kind for ``action``; returns True if it was not there yet"""
+        kind = ACTION_KINDS[action]
+        bit = 1 << self.game_id(game_name)
+        with self._resident(machine_id, create=True) as profile:
+            profile.last_seen = time.time()
+            bits = getattr(profile, kind)
+            if bits & bit:
+                return False
+            setattr(profile, kind, bits | bit)
+            self._dirty.add(machine_id)
+        return True
+
+    def record_many(self, machine_id, actions):
+        """``record`` for [(action, game_name)] under one lock; returns how many were new"""
+        bits = {}
+        for action, game_name in actions:
+            kind = ACTION_KINDS[action]
+            bits[kind] = bits.get(kind, 0) | 1 << self.game_id(game_name)
+        if not bits:
+            return 0
+        with self._resident(machine_id, create=True) as profile:
+            profile.last_seen = time.time()
+            added = 0
+            for kind, new in bits.items():
+                current = getattr(profile, kind)
+                added += (new & ~current).bit_count()
+                setattr(profile, kind, current | new)
+            if added:
+                self._dirty.add(machine_id)
+        return added
+
+    def has(self, machine_id, action, game_name):
+        game_id = self._game_ids.get(game_name)
+        if game_id is None:
+            return False
+        with self._resident(machine_id, create=False) as profile:
+            return profile is not None and bool(getattr(profile, ACTION_KINDS[action]) >> game_id & 1)
+
+    def get(self, machine_id):
+        """{'played': [...], 'likes': [...], 'favorites': [...]} (game names, oldest game ID first)"""
+        if self.shared:
+            with self._lock:
+                local = machine_id in self._profiles or machine_id in self._evicted or machine_id in self._flushing
+            if not local:
+                profile = self._load(machine_id)  # owned by another worker; do not cache
+                if profile is None:
+                    return {kind: [] for kind in PROFILE_KINDS}
+                return {kind: self.game_names(getattr(profile, kind)) for kind in PROFILE_KINDS}
+        with self._resident(machine_id, create=False) as profile:
+            if profile is None:
+                return {kind: [] for kind in PROFILE_KINDS}
+            bits = {kind: getattr(profile, kind) for kind in PROFILE_KINDS}
+        return {kind: self.game_names(value) for kind, value in bits.items()}
+
+    def __len__(self):
+        return len(self._profiles)
+
+    def highest_machine_number(self):
+        """Largest N of the persisted ``machine_N`` IDs, so new IDs do not reuse old profiles"""
+        with self.engine.connect() as conn:
+            ids = conn.execute(select(user_profiles.c.machine_id)
+                               .where(user_profiles.c.machine_id.like('machine\\_%', escape='\\'))).scalars()
+            numbers = [int(mid[8:]) for mid in ids if mid[8:].isdigit()]
+        with self._lock:
+            numbers += [int(mid[8:]) for mid in self._profiles if mid.startswith('machine_') and mid[8:].isdigit()]
+        return max(numbers, default=0)
+
+    def count_persisted(self):
+        with self.engine.connect() as conn:
+            return conn.execute(select(func.count()).select_from(user_profiles)).scalar()
+
+    # -- eviction and persistence ---------------------------------------
+
+    def _evict(self, machine_id):
+        profile = self._profiles.pop(machine_id)
+        if machine_id in self._dirty:
+            self._dirty.discard(machine_id)
+            self._evicted[machine_id] = profile
+        self.evictions += 1
+
+    def _evict_over_capacity(self):
+        while len(self._profiles) > self.max_profiles:
+            self._evict(next(iter(self._profiles)))
+
+    def evict_idle(self, now=None):
+        """Drop profiles idle for longer than ``idle_ttl``; they are written out on the next flush"""
+        cutoff = (now or time.time()) - self.idle_ttl
+        evicted = 0
+        with self._lock:
+            # LRU order is access order, so idle profiles are at the front
+            for machine_id, profile in list(self._profiles.items()):
+                if profile.last_seen > cutoff:
+                    break
+                self._evict(machine_id)
+                evicted += 1
+        return evicted
+
+    def flush(self):
+        """Write changed and evicted profiles to the database; returns how many were written"""
+        with self._lock:
+            flushing = {machine_id: self._profiles[machine_id] for machine_id in self._dirty}
+            flushing.update(self._evicted)
+            rows = [(machine_id, p.played, p.likes, p.favorites, p.last_seen) for machine_id, p in flushing.items()]
+            dirty, evicted = self._dirty, self._evicted
+            self._dirty, self._evicted, self._flushing = set(), {}, flushing
+        if not rows:
+            return 0
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(user_profiles.delete().where(user_profiles.c.machine_id.in_([r[0] for r in rows])))
+                conn.execute(user_profiles.insert(), [
+                    {'machine_id': mid, 'played': bits_to_bytes(played), 'likes': bits_to_bytes(likes),
+                     'favorites': bits_to_bytes(favorites), 'last_seen': last_seen}
+                    for mid, played, likes, favorites, last_seen in rows])
+        except Exception:
+            # Keep the changes pending for the next attempt
+            with self._lock:
+                self._dirty |= {mid for mid in dirty if mid in self._profiles}
+                for mid, profile in evicted.items():
+                    if mid not in self._profiles:
+                        self._evicted.setdefault(mid, profile)
+                self._flushing = {}
+            raise
+        with self._lock:
+            self._flushing = {}
+            self._flushes += 1
+        logger.debug(f"Flushed {len(rows)} user profiles")
+        return len(rows)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'resident': len(self._profiles),
+                'dirty': len(self._dirty) + len(self._evicted),
+                'games': len(self._game_names),
+                'hits': self.hits,
+                'loads': self.loads,
+                'evictions': self.evictions,
+            }
+
+    # -- background flusher ---------------------------------------------
+
+    def start(self):
+        """Start the write-behind/eviction thread (idempotent)"""
+        if self._flusher is not None:
+            return
+        self._flusher = threading.Thread(target=self._run_flusher, name='profile-flusher', daemon=True)
+        self._flusher.start()
+
+    def _run_flusher(self):
+        while not self._stop_event.wait(self.flush_interval):
+            try:
+                self.evict_idle()
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing user profiles: {e}")
+
+    def close(self):
+        """Stop the flusher and write out anything still pending"""
+        self._stop_event.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=self.flush_interval)
+            self._flusher = None
+        self.flush()
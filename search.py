@@ -0,0 +1,284 @@
+import json
+import base64
+import bisect
+import logging
+import threading
+
+from catalog import COUNTER_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# ?sort= value -> catalog field (counters sort high to low, names A to Z)
+SORT_FIELDS = {
+    'plays': 'Plays',
+    'likes': 'Likes',
+    'favorites': 'Favorites',
+    'name': None,
+}
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def encode_cursor(sort, key):
+    raw = json.dumps([sort, key[0], key[1]], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    """The sort key a cursor points at; ValueError if it is malformed or for another sort"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_sort, first, name = json.loads(raw)
+    except Exception:
+        raise ValueError('invalid cursor')
+    if cursor_sort != sort:
+        raise ValueError('cursor belongs to a different sort')
+    # Keys are (-count, name) for counter sorts and (lowercase name, name) for names
+    if SORT_FIELDS.get(sort) is None:
+        valid = isinstance(first, str)
+    else:
+        valid = isinstance(first, int) and not isinstance(first, bool)
+    if not valid or not isinstance(name, str):
+        raise ValueError('invalid cursor')
+    return (first, name)
+
+
+class SearchIndex:
+    """Tag, name and counter indexes over the catalog for ``/api/games/search``.
+
+    * tags: inverted index {tag: set of names}; several tags intersect,
+      smallest posting set first.
+    * names: queries of three characters or more match anywhere in the name
+      through a trigram index (candidates from the rarest trigram, then
+      verified); shorter queries match the start of any word in the name.
+    * order: one sorted list of keys per sort, ``(-count, name)`` for
+      counters and ``(lowercase name, name)`` for names, so a page is a
+      bisect to the cursor plus a walk.
+
+    ``refresh`` brings the index up to date before each query. Games whose
+    counters moved since the last refresh are re-keyed in the counter
+    orders; after a catalog reload only added, removed or re-tagged games
+    touch the postings (a full rebuild once more than ``rebuild_ratio`` of
+    the catalog changed).
+    """
+
+    def __init__(self, catalog, rebuild_ratio=0.25):
+        self.catalog = catalog
+        self.rebuild_ratio = rebuild_ratio
+        self._lock = threading.Lock()
+        self._generation = None
+        self._counter_version = None
+        self._counter_totals = {}
+        self._entries = {}  # {name: tuple of tags} as indexed
+        self.rebuilds = 0
+        self.updates = 0
+
+    # -- maintenance ----------------------------------------------------
+
+    def _rebuild(self, games):
+        self._tags = {}
+        self._grams = {}
+        self._words = []
+        self._lowered = {}
+        self._entries = {}
+        self._values = {field: {} for field in COUNTER_FIELDS}
+        for name, game in games.items():
+            self._add_postings(name, game, sort_later=True)
+        self._words.sort()
+        self._orders = {'name': sorted((lowered, name) for name, lowered in self._lowered.items())}
+        for sort, field in SORT_FIELDS.items():
+            if field is not None:
+                self._orders[sort] = sorted((-value, name) for name, value in self._values[field].items())
+        self.rebuilds += 1
+        logger.debug(f"Search index rebuilt over {len(games)} games")
+
+    def _add_postings(self, name, game, sort_later=False):
+        tags = tuple(dict.fromkeys(game.get('Tags', [])))
+        self._entries[name] = tags
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(name)
+        lowered = name.lower()
+        self._lowered[name] = lowered
+        for gram in trigrams(lowered):
+            self._grams.setdefault(gram, []).append(name)
+        for field in COUNTER_FIELDS:
+            self._values[field][name] = game.get(field, 0)
+        if sort_later:
+            self._words.extend((word, name) for word in set(lowered.split()))
+            return
+        for word in set(lowered.split()):
+            bisect.insort(self._words, (word, name))
+        bisect.insort(self._orders['name'], (lowered, name))
+        for sort, field in SORT_FIELDS.items():
+            if field is not None:
+                bisect.insort(self._orders[sort], (-self._values[field][name], name))
+
+    def _remove_postings(self, name):
+        for tag in self._entries.pop(name):
+            self._discard_tag(tag, name)
+        lowered = self._lowered.pop(name)
+        for gram in trigrams(lowered):
+            self._grams[gram].remove(name)
+        for word in set(lowered.split()):
+            del self._words[bisect.bisect_left(self._words, (word, name))]
+        order = self._orders['name']
+        del order[bisect.bisect_left(order, (lowered, name))]
+        for sort, field in SORT_FIELDS.items():
+            if field is not None:
+                order = self._orders[sort]
+                del order[bisect.bisect_left(order, (-self._values[field].pop(name), name))]
+
+    def _discard_tag(self, tag, name):
+        posting = self._tags[tag]
+        posting.discard(name)
+        if not posting:
+            del self._tags[tag]
+
+    def _set_value(self, name, field, value):
+        old = self._values[field][name]
+        if old == value:
+            return
+        self._values[field][name] = value
+        order = self._orders[field.lower()]
+        del order[bisect.bisect_left(order, (-old, name))]
+        bisect.insort(order, (-value, name))
+        self.updates += 1
+
+    def _sync_entries(self, games):
+        """Apply a catalog reload: only games added, removed or re-tagged change postings"""
+        old_names = self._entries.keys()
+        removed = [name for name in old_names if name not in games]
+        added = [name for name in games if name not in self._entries]
+        retagged = [name for name, game in games.items()
+                    if name in self._entries and tuple(dict.fromkeys(game.get('Tags', []))) != self._entries[name]]
+        if len(removed) + len(added) + len(retagged) > self.rebuild_ratio * max(len(games), 1):
+            self._rebuild(games)
+            return
+        for name in removed:
+            self._remove_postings(name)
+        for name in added:
+            self._add_postings(name, games[name])
+        for name in retagged:
+            tags = tuple(dict.fromkeys(games[name].get('Tags', [])))
+            for tag in self._entries[name]:
+                self._discard_tag(tag, name)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(name)
+            self._entries[name] = tags
+        for name, game in games.items():
+            for field in COUNTER_FIELDS:
+                self._set_value(name, field, game.get(field, 0))
+
+    def _apply_counters(self):
+        counter_version = self.catalog.counters.version()
+        if counter_version == self._counter_version:
+            return
+        totals = self.catalog.counters.snapshot()
+        previous = self._counter_totals
+        for (name, field), total in totals.items():
+            delta = total - previous.get((name, field), 0)
+            if delta and name in self._entries:
+                self._set_value(name, field, self._values[field][name] + delta)
+        self._counter_version = counter_version
+        self._counter_totals = totals
+
+    def refresh(self):
+        """Bring the index up to date with the catalog"""
+        with self._lock:
+            generation = self.catalog.generation()
+            if generation == self._generation:
+                self._apply_counters()
+                return
+            counter_version = self.catalog.counters.version()
+            games, totals = self.catalog.games_with_totals()
+            if self._generation is None:
+                self._rebuild(games)
+            else:
+                self._sync_entries(games)
+            self._generation = generation
+            self._counter_version = counter_version
+            self._counter_totals = totals
+
+    # -- queries --------------------------------------------------------
+
+    def _name_matches(self, query):
+        query = query.lower()
+        if len(query) >= 3:
+            postings = [self._grams.get(gram, ()) for gram in trigrams(query)]
+            rarest = min(postings, key=len)
+            return {name for name in rarest if query in self._lowered[name]}
+        words = self._words
+        start = bisect.bisect_left(words, (query, ''))
+        matches = set()
+        for word, name in words[start:]:
+            if not word.startswith(query):
+                break
+            matches.add(name)
+        return matches
+
+    def _candidates(self, tags, query):
+        """Set of matching names, or None for "every game\""""
+        candidates = None
+        for tag in sorted(tags, key=lambda t: len(self._tags.get(t, ()))):
+            posting = self._tags.get(tag, set())
+            candidates = set(posting) if candidates is None else candidates & posting
+            if not candidates:
+                return candidates
+        if query:
+            matches = self._name_matches(query)
+            candidates = matches if candidates is None else candidates & matches
+        return candidates
+
+    def _key(self, sort, name):
+        field = SORT_FIELDS[sort]
+        if field is None:
+            return (self._lowered[name], name)
+        return (-self._values[field][name], name)
+
+    def search(self, tags=(), query='', sort='plays', limit=DEFAULT_LIMIT, cursor=None):
+        """Return ([names], total matches, next cursor or None)
+
+        Raises ValueError for an unknown sort or a bad cursor.
+        """
+        if sort not in SORT_FIELDS:
+            raise ValueError(f'unknown sort: {sort}')
+        limit = max(1, min(limit, MAX_LIMIT))
+        after = decode_cursor(cursor, sort) if cursor else None
+        self.refresh()
+        with self._lock:
+            candidates = self._candidates([t for t in tags if t], query.strip())
+            order = self._orders[sort]
+            if candidates is None:
+                total = len(order)
+                start = bisect.bisect_right(order, after) if after else 0
+                page = [name for _, name in order[start:start + limit + 1]]
+            elif len(candidates) * 8 < len(order):
+                # Few matches: sorting them beats walking the global order
+                total = len(candidates)
+                keys = sorted(self._key(sort, name) for name in candidates)
+                start = bisect.bisect_right(keys, after) if after else 0
+                page = [name for _, name in keys[start:start + limit + 1]]
+            else:
+                total = len(candidates)
+                start = bisect.bisect_right(order, after) if after else 0
+                page = []
+                for index in range(start, len(order)):
+                    name = order[index][1]
+                    if name in candidates:
+                        page.append(name)
+                        if len(page) > limit:
+                            break
+            next_cursor = None
+            if len(page) > limit:
+                page = page[:limit]
+                next_cursor = encode_cursor(sort, self._key(sort, page[-1]))
+        return page, total, next_cursor
+
+    def tag_counts(self):
+        self.refresh()
+        with self._lock:
+            return {tag: len(names) for tag, names in sorted(self._tags.items())}
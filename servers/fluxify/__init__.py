@@ -0,0 +1 @@
+"""Fluxify: a rewriting web proxy, mounted by the portal at /other/fluxify"""
@@ -0,0 +1,254 @@
+"""asyncio front end for Fluxify: ``/go/`` without a thread per request.
+
+The threaded app in main.py holds a WSGI thread for every upstream round
+trip, so a few slow origins use up the worker. This aiohttp application
+serves the same ``/other/fluxify`` prefix from an event loop instead:
+
+* upstream requests go through one aiohttp ``ClientSession``; at most
+  ``per_origin`` of them are in flight to one origin (scheme, host, port)
+  and ``max_connections`` in total;
+* a request waits for its origin's slot for at most ``queue_timeout``
+  seconds, and at most ``max_waiting`` wait per origin; beyond that it is
+  answered 503 with ``Retry-After`` instead of queueing without bound;
+* the body is relayed chunk by chunk and every write waits for the client
+  socket to drain, so a slow client slows the upstream reads rather than
+  the body piling up in memory.
+
+Rewriting and the response cache are main.py's. The other routes (the
+index page, ``/cache/stats``) run the Flask app on the loop's thread pool.
+
+Run it as the async-capable worker that receives ``/other/fluxify/`` from
+the front proxy; links it rewrites are the same as the threaded app's::
+
+    python -m servers.fluxify.async_server --port 5001
+    gunicorn 'servers.fluxify.async_server:create_app' --worker-class aiohttp.GunicornWebWorker
+
+It needs aiohttp, which the portal itself does not. Inside the portal
+process, ``main.load_sub_server`` keeps mounting the threaded WSGI app.
+"""
+import os
+import time
+import codecs
+import asyncio
+import argparse
+import urllib.parse
+from contextlib import asynccontextmanager
+
+from aiohttp import web
+import aiohttp
+from werkzeug.test import EnvironBuilder, run_wsgi_app
+
+from . import main as fluxify
+from .cache import ENTRY_OVERHEAD, CacheEntry, is_storable
+from .rewrite import content_kind, stream_rewriter
+
+MOUNT_PREFIX = os.environ.get('FLUXIFY_ASYNC_MOUNT', '/other/fluxify')
+PER_ORIGIN = int(os.environ.get('FLUXIFY_ASYNC_PER_ORIGIN', '100'))
+MAX_CONNECTIONS = int(os.environ.get('FLUXIFY_ASYNC_MAX_CONNECTIONS', '1000'))
+MAX_WAITING = int(os.environ.get('FLUXIFY_ASYNC_MAX_WAITING', '1000'))
+QUEUE_TIMEOUT = float(os.environ.get('FLUXIFY_ASYNC_QUEUE_TIMEOUT', '10'))
+
+PREFIX = web.AppKey('prefix', str)
+STREAMING = web.RequestKey('streaming', bool)  # set once the status line has been sent
+
+
+class OriginBusy(Exception):
+    """An origin's slots and waiting line are full, or the wait timed out"""
+
+
+class OriginLimiter:
+    """At most ``per_origin`` holders per origin; at most ``max_waiting`` queued behind them"""
+
+    def __init__(self, per_origin=PER_ORIGIN, max_waiting=MAX_WAITING, queue_timeout=QUEUE_TIMEOUT):
+        self.per_origin = per_origin
+        self.max_waiting = max_waiting
+        self.queue_timeout = queue_timeout
+        self._origins = {}  # {origin: [Semaphore, holders + waiters]}, dropped when unused
+        self.rejected = 0
+
+    def in_use(self, origin):
+        entry = self._origins.get(origin)
+        return 0 if entry is None else entry[1]
+
+    @asynccontextmanager
+    async def slot(self, origin):
+        entry = self._origins.get(origin)
+        if entry is None:
+            entry = self._origins[origin] = [asyncio.Semaphore(self.per_origin), 0]
+        semaphore = entry[0]
+        if entry[1] >= self.per_origin + self.max_waiting:
+            self.rejected += 1
+            raise OriginBusy(origin)
+        entry[1] += 1
+        try:
+            try:
+                await asyncio.wait_for(semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise OriginBusy(origin) from None
+            try:
+                yield
+            finally:
+                semaphore.release()
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._origins[origin]
+
+
+def origin_of(url):
+    parts = urllib.parse.urlsplit(url)
+    return f'{parts.scheme}://{parts.netloc}'.lower()
+
+
+def cached_response(entry, state):
+    return web.Response(body=entry.body, status=entry.status, headers={
+        'Content-Type': entry.content_type,
+        'Age': str(int(entry.age())),
+        'X-Fluxify-Cache': state,
+    })
+
+
+class AsyncFluxify:
+    """The ``/go/`` handler, its upstream session and its per-origin limiter"""
+
+    def __init__(self, per_origin=PER_ORIGIN, max_connections=MAX_CONNECTIONS, max_waiting=MAX_WAITING,
+                 queue_timeout=QUEUE_TIMEOUT):
+        self.max_connections = max_connections
+        self.limiter = OriginLimiter(per_origin, max_waiting, queue_timeout)
+        self.session = None
+
+    async def start(self, app):
+        connector = aiohttp.TCPConnector(limit=self.max_connections, limit_per_host=self.limiter.per_origin)
+        timeout = aiohttp.ClientTimeout(sock_connect=fluxify.CONNECT_TIMEOUT, sock_read=fluxify.READ_TIMEOUT)
+        # Bodies are decoded from their Content-Encoding, as requests does for the threaded app
+        self.session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    async def close(self, app):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def _cache(self, function, *args):
+        # The disk tier reads and writes files; keep that off the loop
+        if fluxify.response_cache.disk_dir:
+            return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+        return function(*args)
+
+    async def go(self, request):
+        url = fluxify.decode_url(request.match_info['encoded_url'])
+        if not url:
+            return web.Response(text='Invalid URL', status=400)
+        headers = fluxify.upstream_headers(request.headers)
+        cache_key, cached, fresh = await self._cache(fluxify.lookup_cached, url, headers, request.headers)
+        if fresh:
+            return cached_response(cached, 'HIT')
+        try:
+            async with self.limiter.slot(origin_of(url)):
+                return await self._relay(request, url, headers, cache_key, cached)
+        except OriginBusy:
+            return web.Response(text='Origin busy, try again', status=503, headers={'Retry-After': '1'})
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, LookupError) as e:
+            if request.get(STREAMING):
+                raise  # the status line is out; dropping the connection is all that is left
+            return web.Response(text=f'Error accessing URL: {e}', status=500)
+
+    async def _relay(self, request, url, headers, cache_key, cached):
+        start = time.perf_counter()
+        async with self.session.get(url, headers=headers, allow_redirects=True) as resp:
+            if fluxify.metrics is not None:
+                fluxify.metrics.observe('fluxify_upstream_seconds', time.perf_counter() - start)
+            if resp.status == 304 and cached is not None:
+                cached = await self._cache(fluxify.revalidated, cache_key, cached, resp.headers)
+                return cached_response(cached, 'REVALIDATED')
+
+            content_type = resp.headers.get('Content-Type', 'text/html')
+            kind = content_kind(content_type)
+            if kind is not None:
+                encoding = resp.charset if 'charset' in content_type.lower() else 'utf-8'
+                decoder = codecs.getincrementaldecoder(encoding or 'utf-8')(errors='replace')
+                rewriter = stream_rewriter(kind, url, fluxify.rewrite_url, fluxify.INJECTED_SCRIPT)
+                content_type = f"{content_type.split(';', 1)[0].strip()}; charset=utf-8"
+
+            entry = None
+            if cache_key is not None and is_storable(resp.status, resp.headers):
+                entry = CacheEntry.from_response(resp.status, content_type, resp.headers, headers)
+            parts, size = [], 0
+            limit = fluxify.response_cache.max_entry_bytes
+
+            out = web.StreamResponse(status=resp.status, headers={
+                'Content-Type': content_type,
+                'X-Fluxify-Cache': 'MISS' if cache_key is not None else 'BYPASS',
+            })
+            await out.prepare(request)
+            request[STREAMING] = True
+
+            async def write(data):
+                nonlocal parts, size
+                if not data:
+                    return
+                if entry is not None and parts is not None:
+                    size += len(data)
+                    if size + ENTRY_OVERHEAD > limit:
+                        parts = None
+                        fluxify.response_cache.count('too_large')
+                    else:
+                        parts.append(data)
+                await out.write(data)  # waits while the client's socket buffer is full
+
+            async for chunk in resp.content.iter_chunked(fluxify.STREAM_CHUNK_SIZE):
+                if kind is None:
+                    await write(chunk)
+                else:
+                    await write(rewriter.feed(decoder.decode(chunk)).encode('utf-8'))
+            if kind is not None:
+                text = rewriter.feed(decoder.decode(b'', final=True)) + rewriter.close()
+                await write(text.encode('utf-8'))
+            await out.write_eof()
+
+            if entry is not None and parts is not None:
+                entry.body = b''.join(parts)
+                await self._cache(fluxify.response_cache.put, cache_key, entry)
+            return out
+
+
+async def run_flask(request):
+    """Everything but ``/go/`` is served by the Flask app, off the loop"""
+    body = await request.read()
+    builder = EnvironBuilder(path='/' + request.match_info['tail'], base_url=f'{request.scheme}://{request.host}'
+                             f'{request.app[PREFIX]}', method=request.method, headers=list(request.headers.items()),
+                             query_string=request.query_string, data=body)
+    environ = builder.get_environ()
+    loop = asyncio.get_running_loop()
+
+    def call():
+        app_iter, status, headers = run_wsgi_app(fluxify.app, environ, buffered=True)
+        return status, headers, b''.join(app_iter)
+
+    status, headers, body = await loop.run_in_executor(None, call)
+    response = web.Response(body=body, status=int(status.split(' ', 1)[0]))
+    for name, value in headers.items():
+        if name.lower() not in ('content-length', 'transfer-encoding', 'connection'):
+            response.headers.add(name, value)
+    return response
+
+
+def create_app(prefix=MOUNT_PREFIX, **options):
+    """The aiohttp application; ``options`` go to AsyncFluxify"""
+    prefix = prefix.rstrip('/')
+    handler = AsyncFluxify(**options)
+    app = web.Application()
+    app[PREFIX] = prefix
+    app.on_startup.append(handler.start)
+    app.on_cleanup.append(handler.close)
+    app.router.add_get(f'{prefix}/go/{{encoded_url}}', handler.go)
+    app.router.add_route('*', f'{prefix}/{{tail:.*}}', run_flask)
+    return app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5001)
+    args = parser.parse_args()
+    web.run_app(create_app(), host=args.host, port=args.port)
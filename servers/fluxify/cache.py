@@ -0,0 +1,398 @@
+"""Shared response cache for proxied pages and assets.
+
+Entries hold the *rewritten* body, so a hit costs neither an upstream fetch
+nor a rewrite pass. Freshness follows HTTP caching rules for a shared cache
+(RFC 9111): ``s-maxage``/``max-age``/``Expires`` or a Last-Modified
+heuristic; ``no-store``/``private``/``Set-Cookie`` responses are never
+stored; ``no-cache`` responses and stale entries are revalidated upstream
+with ``If-None-Match``/``If-Modified-Since``.
+
+The memory tier is an LRU bounded by total body bytes. An optional disk tier
+(one file per entry, also LRU-bounded) is written through on every store so
+it survives restarts and is shared by all workers on the host.
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+
+logger = logging.getLogger(__name__)
+
+# Statuses a shared cache may store and give a heuristic lifetime (RFC 9110 15.1)
+CACHEABLE_STATUSES = frozenset([200, 203, 204, 300, 301, 308, 404, 405, 410, 414, 501])
+# Heuristic lifetime is 10% of the time since Last-Modified, at most a day
+HEURISTIC_FRACTION = 0.1
+HEURISTIC_MAX = 24 * 3600
+# Request headers forwarded upstream that can select a different variant
+KEY_HEADERS = ('Accept', 'Accept-Language')
+# Bookkeeping bytes charged per entry on top of the body
+ENTRY_OVERHEAD = 256
+DISK_SUFFIX = '.entry'
+# Upstream headers kept with an entry and merged from a 304 on revalidation
+FRESHNESS_HEADERS = ('Cache-Control', 'Expires', 'Date', 'Last-Modified', 'ETag')
+
+
+def parse_cache_control(value):
+    """Parse a Cache-Control header into {directive: value or None}"""
+    directives = {}
+    for part in (value or '').split(','):
+        name, sep, arg = part.strip().partition('=')
+        name = name.strip().lower()
+        if name:
+            directives[name] = arg.strip().strip('"') if sep else None
+    return directives
+
+
+def _seconds(directives, name):
+    try:
+        return max(0, int(directives[name]))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _http_date(value):
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+def is_storable(status, headers):
+    """Whether a response to a proxied GET may be kept in a shared cache"""
+    if status not in CACHEABLE_STATUSES:
+        return False
+    cc = parse_cache_control(headers.get('Cache-Control'))
+    if 'no-store' in cc or 'private' in cc or headers.get('Set-Cookie'):
+        return False
+    if headers.get('Vary', '').strip() == '*':
+        return False
+    if 'no-cache' in cc:
+        # Stored only to be revalidated, which needs a validator
+        return bool(headers.get('ETag') or headers.get('Last-Modified'))
+    return True
+
+
+def freshness_lifetime(headers, now):
+    """Seconds a response stays fresh for a shared cache"""
+    cc = parse_cache_control(headers.get('Cache-Control'))
+    if 'no-cache' in cc:
+        return 0
+    for name in ('s-maxage', 'max-age'):
+        seconds = _seconds(cc, name)
+        if seconds is not None:
+            return seconds
+    date = _http_date(headers.get('Date')) or now
+    if 'Expires' in headers:
+        expires = _http_date(headers.get('Expires'))
+        return max(0, expires - date) if expires is not None else 0
+    last_modified = _http_date(headers.get('Last-Modified'))
+    if last_modified is not None and last_modified < date:
+        return min(HEURISTIC_MAX, (date - last_modified) * HEURISTIC_FRACTION)
+    return 0
+
+
+def initial_age(headers, now):
+    """Age of a response when it was received (apparent age or the Age header)"""
+    date = _http_date(headers.get('Date'))
+    apparent = max(0, now - date) if date is not None else 0
+    try:
+        age = max(0, int(headers.get('Age', 0)))
+    except ValueError:
+        age = 0
+    return max(apparent, age)
+
+
+def _lowered(headers):
+    return {name.lower(): value for name, value in headers.items()}
+
+
+def request_wants_revalidation(request_headers):
+    """A client reload (``no-cache``/``max-age=0``) makes us revalidate upstream"""
+    cc = parse_cache_control(request_headers.get('Cache-Control'))
+    if 'no-cache' in cc or _seconds(cc, 'max-age') == 0:
+        return True
+    return 'no-cache' in request_headers.get('Pragma', '').lower()
+
+
+def request_bypasses_cache(request_headers):
+    return 'no-store' in parse_cache_control(request_headers.get('Cache-Control'))
+
+
+class CacheEntry:
+    """A stored response: rewritten body plus what freshness checks need"""
+    __slots__ = ('status', 'content_type', 'body', 'headers', 'stored_at', 'initial_age',
+                 'lifetime', 'vary')
+
+    def __init__(self, status, content_type, body=b'', headers=None, stored_at=0.0,
+                 initial_age=0.0, lifetime=0.0, vary=None):
+        self.status = status
+        self.content_type = content_type
+        self.body = body
+        self.headers = headers or {}  # upstream headers that freshness depends on
+        self.stored_at = stored_at
+        self.initial_age = initial_age
+        self.lifetime = lifetime
+        self.vary = vary or {}
+
+    @classmethod
+    def from_response(cls, status, content_type, headers, request_headers, now=None):
+        sent = _lowered(request_headers)
+        vary = {}
+        for name in headers.get('Vary', '').split(','):
+            name = name.strip().lower()
+            # Bodies are stored decoded, so Accept-Encoding never splits variants
+            if name and name != 'accept-encoding':
+                vary[name] = sent.get(name, '')
+        entry = cls(status, content_type, vary=vary)
+        entry._update(headers, now)
+        return entry
+
+    def _update(self, headers, now=None):
+        now = time.time() if now is None else now
+        for name in FRESHNESS_HEADERS:
+            value = headers.get(name)
+            if value is not None:
+                self.headers[name] = value
+        self.stored_at = now
+        self.initial_age = initial_age(headers, now)
+        self.lifetime = freshness_lifetime(self.headers, now)
+
+    @property
+    def size(self):
+        return len(self.body) + ENTRY_OVERHEAD
+
+    def age(self, now=None):
+        now = time.time() if now is None else now
+        return self.initial_age + max(0, now - self.stored_at)
+
+    def is_fresh(self, now=None):
+        return self.lifetime > self.age(now)
+
+    def matches(self, request_headers):
+        """Whether the request selects the same variant (per the stored Vary)"""
+        sent = _lowered(request_headers)
+        return all(sent.get(name, '') == value for name, value in self.vary.items())
+
+    def validators(self):
+        """Conditional request headers for revalidating this entry upstream"""
+        headers = {}
+        if self.headers.get('ETag'):
+            headers['If-None-Match'] = self.headers['ETag']
+        if self.headers.get('Last-Modified'):
+            headers['If-Modified-Since'] = self.headers['Last-Modified']
+        return headers
+
+    def refreshed(self, headers, now=None):
+        """A copy updated with the headers of a 304 Not Modified response"""
+        entry = CacheEntry(self.status, self.content_type, self.body, dict(self.headers),
+                           vary=self.vary)
+        entry._update(headers, now)
+        return entry
+
+    # -- disk format: one JSON metadata line, then the body -------------
+
+    def dumps(self):
+        meta = {name: getattr(self, name) for name in self.__slots__ if name != 'body'}
+        return json.dumps(meta).encode('utf-8') + b'\n' + self.body
+
+    @classmethod
+    def loads(cls, data):
+        meta, _, body = data.partition(b'\n')
+        return cls(body=body, **json.loads(meta))
+
+
+class ResponseCache:
+    """Byte-bounded LRU of CacheEntry objects with an optional disk tier.
+
+    ``namespace`` is folded into every key, so entries written under a
+    different configuration (e.g. another public prefix) are never served.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_entry_bytes=8 * 1024 * 1024,
+                 disk_dir=None, disk_max_bytes=512 * 1024 * 1024, namespace=''):
+        self.namespace = namespace
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_entry_bytes, max_bytes)
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # {key: CacheEntry}, least recently used first
+        self._bytes = 0
+        self._disk = OrderedDict()  # {file name: size}, least recently used first
+        self._disk_bytes = 0
+        self._stats = dict.fromkeys(
+            ('hits', 'disk_hits', 'misses', 'stale', 'revalidated', 'stores', 'too_large',
+             'bypassed', 'evictions', 'disk_evictions', 'disk_errors'), 0)
+        if disk_dir:
+            self._load_disk_index()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def key(self, url, request_headers):
+        parts = [self.namespace, url] + [request_headers.get(name, '') for name in KEY_HEADERS]
+        return '\n'.join(parts)
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update(entries=len(self._entries), bytes=self._bytes, max_bytes=self.max_bytes)
+            if self.disk_dir:
+                stats.update(disk_entries=len(self._disk), disk_bytes=self._disk_bytes,
+                             disk_max_bytes=self.disk_max_bytes)
+        lookups = stats['hits'] + stats['misses'] + stats['stale']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        return stats
+
+    # -- lookup and store -----------------------------------------------
+
+    def get(self, key):
+        """Return the stored entry for ``key`` (fresh or stale), or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+        if not self.disk_dir:
+            return None
+        entry = self._read_disk(key)
+        if entry is not None:
+            self.count('disk_hits')
+            self._store_memory(key, entry)
+        return entry
+
+    def put(self, key, entry):
+        if entry.size > self.max_entry_bytes:
+            self.count('too_large')
+            return
+        self._store_memory(key, entry)
+        self.count('stores')
+        if self.disk_dir:
+            self._write_disk(key, entry)
+
+    def _store_memory(self, key, entry):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.size
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+                self._stats['evictions'] += 1
+
+    def tee(self, key, entry, chunks):
+        """Yield ``chunks`` unchanged and store them as ``entry``'s body once complete.
+
+        Nothing is stored if the body outgrows ``max_entry_bytes`` or the
+        client goes away before the last chunk.
+        """
+        parts, size = [], 0
+        for chunk in chunks:
+            if parts is not None:
+                size += len(chunk)
+                if size + ENTRY_OVERHEAD > self.max_entry_bytes:
+                    parts = None
+                    self.count('too_large')
+                else:
+                    parts.append(chunk)
+            yield chunk
+        if parts is not None:
+            entry.body = b''.join(parts)
+            self.put(key, entry)
+
+    # -- disk tier ------------------------------------------------------
+
+    def _disk_name(self, key):
+        return hashlib.sha256(key.encode('utf-8')).hexdigest() + DISK_SUFFIX
+
+    def _load_disk_index(self):
+        os.makedirs(self.disk_dir, exist_ok=True)
+        files = []
+        for name in os.listdir(self.disk_dir):
+            if name.endswith(DISK_SUFFIX):
+                try:
+                    st = os.stat(os.path.join(self.disk_dir, name))
+                except OSError:
+                    continue
+                files.append((st.st_mtime, name, st.st_size))
+        for _mtime, name, size in sorted(files):
+            self._disk[name] = size
+            self._disk_bytes += size
+
+    def _read_disk(self, key):
+        name = self._disk_name(key)
+        path = os.path.join(self.disk_dir, name)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            entry = CacheEntry.loads(data)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning(f"Dropping unreadable cache file {path}: {e}")
+            self.count('disk_errors')
+            self._remove_disk(name)
+            return None
+        with self._lock:
+            if name in self._disk:
+                self._disk.move_to_end(name)
+            else:  # written by another worker
+                self._disk[name] = len(data)
+                self._disk_bytes += len(data)
+        return entry
+
+    def _write_disk(self, key, entry):
+        name = self._disk_name(key)
+        data = entry.dumps()
+        if len(data) > self.disk_max_bytes:
+            return
+        try:
+            fd, tmp_path = tempfile.mkstemp(prefix='.cache-', suffix='.tmp', dir=self.disk_dir)
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, os.path.join(self.disk_dir, name))
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError as e:
+            logger.warning(f"Error writing cache file for {key.splitlines()[0]}: {e}")
+            self.count('disk_errors')
+            return
+        evict = []
+        with self._lock:
+            self._disk_bytes -= self._disk.pop(name, 0)
+            self._disk[name] = len(data)
+            self._disk_bytes += len(data)
+            while self._disk_bytes > self.disk_max_bytes and self._disk:
+                old_name, size = self._disk.popitem(last=False)
+                self._disk_bytes -= size
+                self._stats['disk_evictions'] += 1
+                evict.append(old_name)
+        for old_name in evict:
+            self._unlink(old_name)
+
+    def _remove_disk(self, name):
+        with self._lock:
+            self._disk_bytes -= self._disk.pop(name, 0)
+        self._unlink(name)
+
+    def _unlink(self, name):
+        try:
+            os.unlink(os.path.join(self.disk_dir, name))
+        except OSError:
+            pass
@@ -1,102 +1,156 @@
-from flask import Flask, request, Response, render_template_string, redirect, url_for
+from flask import Flask, request, Response, render_template_string, redirect, url_for, jsonify
 import requests
-import base64
-from bs4 import BeautifulSoup
-import urllib.parse
+from requests.adapters import HTTPAdapter
+import os
+import time
+import codecs
+import threading
 import mimetypes
 import re
 
+from .cache import CacheEntry, ResponseCache, is_storable, request_bypasses_cache, request_wants_revalidation
+from .urls import DEFAULT_PREFIX, URLRewriter, decode_url, encode_url
+from .rewrite import STREAM_REWRITERS, content_kind, injected_script, rewrite_css_urls, rewrite_html_stream
+
+try:
+    # The portal's metrics registry, when Fluxify is mounted inside it
+    from metrics import default_registry as metrics, instrument_flask, TimedIterator
+except ImportError:
+    metrics = None
+
 app = Flask(__name__)
+if metrics is not None:
+    instrument_flask(app, metrics)
+
+# Upstream connection pooling and timeouts (seconds). A request waits for a free
+# connection once FLUXIFY_POOL_MAXSIZE are open to one host; a worker keeps up to
+# POOL_HOSTS * POOL_MAXSIZE sockets open. Each waiting request also holds a WSGI
+# thread, so many slow origins are better served by async_server.py
+POOL_HOSTS = int(os.environ.get('FLUXIFY_POOL_HOSTS', '32'))
+POOL_MAXSIZE = int(os.environ.get('FLUXIFY_POOL_MAXSIZE', '10'))
+CONNECT_TIMEOUT = float(os.environ.get('FLUXIFY_CONNECT_TIMEOUT', '5'))
+READ_TIMEOUT = float(os.environ.get('FLUXIFY_READ_TIMEOUT', '30'))
+STREAM_CHUNK_SIZE = 64 * 1024
+# Links in rewritten pages point at <prefix><base64 url>; relative by default so any host works
+PUBLIC_PREFIX = os.environ.get('FLUXIFY_PUBLIC_PREFIX', DEFAULT_PREFIX)
+INJECTED_SCRIPT = injected_script(PUBLIC_PREFIX)
+
+# Shared response cache; FLUXIFY_CACHE_BYTES=0 turns it off
+response_cache = ResponseCache(
+    max_bytes=int(os.environ.get('FLUXIFY_CACHE_BYTES', str(64 * 1024 * 1024))),
+    max_entry_bytes=int(os.environ.get('FLUXIFY_CACHE_MAX_ENTRY_BYTES', str(8 * 1024 * 1024))),
+    disk_dir=os.environ.get('FLUXIFY_CACHE_DIR') or None,
+    disk_max_bytes=int(os.environ.get('FLUXIFY_CACHE_DISK_BYTES', str(512 * 1024 * 1024))),
+    namespace=PUBLIC_PREFIX,  # stored bodies embed rewritten links
+)
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
 
-def decode_url(encoded_url):
+def get_session():
+    """Return this worker's pooled upstream session (re-created after a fork)"""
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                session = requests.Session()
+                # pool_block caps open connections per host at POOL_MAXSIZE
+                adapter = HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=POOL_MAXSIZE,
+                                      pool_block=True, max_retries=0)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session, _session_pid = session, pid
+    return _session
+
+def fetch_upstream(url, headers):
+    """GET ``url`` on the pooled session; returns once the response headers are in"""
+    start = time.perf_counter()
     try:
-        return base64.b64decode(encoded_url).decode()
-    except:
-        return None
+        return get_session().get(url, headers=headers, stream=True, allow_redirects=True,
+                                 timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+    finally:
+        if metrics is not None:
+            metrics.observe('fluxify_upstream_seconds', time.perf_counter() - start)
 
-def encode_url(url):
-    return base64.b64encode(url.encode()).decode()
+def stream_body(resp, chunk_size=STREAM_CHUNK_SIZE):
+    """Yield the upstream body chunk by chunk and release the connection afterwards"""
+    try:
+        for chunk in resp.iter_content(chunk_size):
+            if chunk:
+                yield chunk
+    finally:
+        resp.close()
 
 def is_binary_content(content_type):
     return any(t in content_type.lower() for t in ['image', 'audio', 'video', 'application', 'font', 'octet-stream'])
 
-def rewrite_url(url, base_url):
-    if url.startswith('//'):
-        url = 'https:' + url
-    if url.startswith(('http://', 'https://')):
-        # Encode the URL in base64 format
-        encoded_url = encode_url(url)
-        final_url = f'https://4a6f34c3-38a0-4055-bd43-ffddf7a236de-00-1ndzuewxr73an.kirk.replit.dev/other/fluxify/go/{encoded_url}'
-    else:
-        full_url = urllib.parse.urljoin(base_url, url)
-        encoded_url = encode_url(full_url)
-        final_url = f'https://4a6f34c3-38a0-4055-bd43-ffddf7a236de-00-1ndzuewxr73an.kirk.replit.dev/other/fluxify/go/{encoded_url}'
-
-    print(f"Rewritten URL: {final_url}")  # Debug print to check URL
-    return final_url
+rewrite_url = URLRewriter(
+    prefix=PUBLIC_PREFIX,
+    cache_size=int(os.environ.get('FLUXIFY_URL_CACHE_SIZE', '8192')),
+    log_sample=int(os.environ.get('FLUXIFY_URL_LOG_SAMPLE', '1000')),
+)
+
+# Rewriters by content kind; pages get the interception script for PUBLIC_PREFIX
+stream_rewriters = dict(STREAM_REWRITERS, html=lambda chunks, base_url, rewrite: rewrite_html_stream(
+    chunks, base_url, rewrite, INJECTED_SCRIPT))
 
 def rewrite_html(html_content, base_url):
-  soup = BeautifulSoup(html_content, 'html.parser')
-
-  # Rewrite various resource tags
-  for tag in soup.find_all(['a', 'link', 'script', 'img', 'form', 'iframe', 'source', 'video', 'audio']):
-    for attr in ['href', 'src', 'action', 'data-src', 'data-lazy_src']:
-      if tag.get(attr):
-        tag[attr] = rewrite_url(tag[attr], base_url)
-
-    # Handle srcset separately (because it's a comma-separated list)
-    if tag.get('srcset'):
-      parts = tag['srcset'].split(',')
-      rewritten = []
-      for part in parts:
-        tokens = part.strip().split(' ')
-        url = tokens[0]
-        descriptor = ' '.join(tokens[1:]) if len(tokens) > 1 else ''
-        rewritten_url = rewrite_url(url, base_url)
-        rewritten.append(f'{rewritten_url} {descriptor}'.strip())
-      tag['srcset'] = ', '.join(rewritten)
-
-  # Rewrite CSS urls in style tags and attributes
-  for style in soup.find_all(['style']):
-    if style.string:
-      style.string = re.sub(r'url\([\'"]?([^\'")]+)[\'"]?\)', 
-                            lambda m: f'url({rewrite_url(m.group(1), base_url)})',
-                            style.string)
-
-  for tag in soup.find_all(style=True):
-    tag['style'] = re.sub(r'url\([\'"]?([^\'")]+)[\'"]?\)',
-                          lambda m: f'url({rewrite_url(m.group(1), base_url)})',
-                          tag['style'])
-
-  # Inject our custom scripts
-  if soup.body:
-    custom_script = soup.new_tag('script')
-    custom_script.string = '''
-      document.addEventListener('DOMContentLoaded', function() {
-        document.querySelectorAll('form').forEach(form => {
-          form.addEventListener('submit', function(e) {
-            e.preventDefault();
-            let action = form.action || window.location.href;
-            let encoded = btoa(action);
-            form.action = '/other/fluxify/go/' + encoded;
-            form.submit();
-          });
-        });
-
-        document.addEventListener('click', function(e) {
-          if (e.target.tagName === 'A') {
-            let href = e.target.getAttribute('href');
-            if (href && !href.startsWith('/other/fluxify/go/')) {
-              e.preventDefault();
-              window.location.href = '/other/fluxify/go/' + btoa(href);
-            }
-          }
-        });
-      });
-    '''
-    soup.body.append(custom_script)
-
-  return str(soup)
+    """Rewrite a complete HTML document with the streaming rewriter"""
+    return ''.join(rewrite_html_stream([html_content], base_url, rewrite_url, INJECTED_SCRIPT))
+
+if metrics is not None:
+    rewrite_html = metrics.timed('fluxify_rewrite_html_seconds')(rewrite_html)
+
+def decode_stream(resp, encoding, chunk_size=STREAM_CHUNK_SIZE):
+    """Yield decoded text chunks of an upstream body and release the connection afterwards"""
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    for chunk in stream_body(resp, chunk_size):
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    text = decoder.decode(b'', final=True)
+    if text:
+        yield text
+
+def upstream_headers(request_headers):
+    """The client headers forwarded to the origin"""
+    return {
+        'User-Agent': request_headers.get('User-Agent', 'Mozilla/5.0'),
+        'Accept': request_headers.get('Accept', '*/*'),
+        'Accept-Language': request_headers.get('Accept-Language', 'en-US,en;q=0.5'),
+        'Accept-Encoding': request_headers.get('Accept-Encoding', 'gzip, deflate'),
+    }
+
+def lookup_cached(url, headers, request_headers):
+    """(cache key or None, usable cached entry or None, True if it can be served as is)
+
+    A stale entry's validators are added to ``headers`` for a conditional request.
+    """
+    if not response_cache.enabled or request_bypasses_cache(request_headers):
+        response_cache.count('bypassed')
+        return None, None, False
+    cache_key = response_cache.key(url, headers)
+    cached = response_cache.get(cache_key)
+    if cached is not None and not cached.matches(headers):
+        cached = None
+    if cached is None:
+        response_cache.count('misses')
+        return cache_key, None, False
+    if cached.is_fresh() and not request_wants_revalidation(request_headers):
+        response_cache.count('hits')
+        return cache_key, cached, True
+    response_cache.count('stale')
+    headers.update(cached.validators())
+    return cache_key, cached, False
+
+def revalidated(cache_key, cached, response_headers):
+    """The cached entry refreshed by a 304 and stored again"""
+    cached = cached.refreshed(response_headers)
+    response_cache.put(cache_key, cached)
+    response_cache.count('revalidated')
+    return cached
 
 @app.route('/')
 def index():
@@ -151,7 +205,7 @@ def index():
                         if (!url.startsWith('http')) {
                             url = 'https://' + url;
                         }
-                        window.location.href = '/other/fluxify/go/' + btoa(url);
+                        window.location.href = {{ prefix|tojson }} + btoa(url);
                     }
                     document.getElementById('url').addEventListener('keypress', function(e) {
                         if (e.key === 'Enter') go();
@@ -159,7 +213,18 @@ def index():
                 </script>
             </body>
         </html>
-    ''')
+    ''', prefix=PUBLIC_PREFIX)
+
+def cached_response(entry, state):
+    return Response(entry.body, entry.status, {
+        'Content-Type': entry.content_type,
+        'Age': str(int(entry.age())),
+        'X-Fluxify-Cache': state,
+    })
+
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify(dict(response_cache.stats(), url_rewrites=rewrite_url.stats()))
 
 @app.route('/go/<encoded_url>')
 def go(encoded_url):
@@ -168,33 +233,55 @@ def go(encoded_url):
         return "Invalid URL", 400
 
     try:
-        headers = {
-            'User-Agent': request.headers.get('User-Agent', 'Mozilla/5.0'),
-            'Accept': request.headers.get('Accept', '*/*'),
-            'Accept-Language': request.headers.get('Accept-Language', 'en-US,en;q=0.5'),
-            'Accept-Encoding': request.headers.get('Accept-Encoding', 'gzip, deflate'),
-        }
-
-        resp = requests.get(url, headers=headers, stream=True, allow_redirects=True)
+        headers = upstream_headers(request.headers)
+
+        # Serve fresh cached copies; revalidate stale ones with their validators
+        cache_key, cached, fresh = lookup_cached(url, headers, request.headers)
+        use_cache = cache_key is not None
+        if fresh:
+            return cached_response(cached, 'HIT')
+
+        resp = fetch_upstream(url, headers)
+        if resp.status_code == 304 and cached is not None:
+            resp.close()
+            return cached_response(revalidated(cache_key, cached, resp.headers), 'REVALIDATED')
+
         content_type = resp.headers.get('content-type', 'text/html')
 
-        # Handle binary content (images, videos, etc.)
-        if is_binary_content(content_type):
-            return Response(resp.content, resp.status_code, 
-                          {'Content-Type': content_type})
+        # HTML, CSS and JavaScript are rewritten chunk by chunk while they download
+        kind = content_kind(content_type)
+        if kind is not None:
+            encoding = resp.encoding if 'charset' in content_type.lower() else 'utf-8'
+            text = decode_stream(resp, encoding or 'utf-8')
+            if metrics is not None:
+                # Rewrite time: time spent producing output minus time spent waiting on upstream
+                text = TimedIterator(text)
+                chunks = TimedIterator(
+                    stream_rewriters[kind](text, url, rewrite_url),
+                    on_close=lambda elapsed, text=text, kind=kind: metrics.observe(
+                        'fluxify_rewrite_seconds', elapsed - text.elapsed, kind=kind))
+            else:
+                chunks = stream_rewriters[kind](text, url, rewrite_url)
+            content_type = f"{content_type.split(';', 1)[0].strip()}; charset=utf-8"
+            body = (chunk.encode('utf-8') for chunk in chunks)
+        else:
+            # Binary content (images, videos, etc.) and other text is streamed
+            # through without buffering the whole body
+            body = stream_body(resp)
 
-        # Handle HTML content
-        if 'text/html' in content_type:
-            content = rewrite_html(resp.text, url)
-            return Response(content, resp.status_code, 
-                          {'Content-Type': 'text/html'})
+        # The rewritten body is kept as it streams out, so hits skip the rewrite too
+        if use_cache and is_storable(resp.status_code, resp.headers):
+            entry = CacheEntry.from_response(resp.status_code, content_type, resp.headers, headers)
+            body = response_cache.tee(cache_key, entry, body)
 
-        # Handle other text content (CSS, JS, etc.)
-        return Response(resp.text, resp.status_code, 
-                      {'Content-Type': content_type})
+        return Response(body, resp.status_code, {
+            'Content-Type': content_type,
+            'X-Fluxify-Cache': 'MISS' if use_cache else 'BYPASS',
+        }, direct_passthrough=kind is None)
 
     except Exception as e:
         return f"Error accessing URL: {str(e)}", 500
 
+# Standalone, from the repository root: python -m servers.fluxify.main
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000)
@@ -0,0 +1,420 @@
+"""Streaming rewriters for proxied documents.
+
+``StreamingHTMLRewriter`` is driven by ``html.parser.HTMLParser`` callbacks
+and emits rewritten markup as soon as each token is complete, so a page can
+be forwarded while it is still downloading. Its output matches what
+``BeautifulSoup(html, 'html.parser')`` followed by ``str(soup)`` produces
+for the same rewrite rules: attributes sorted and re-quoted, void elements
+written as ``<br/>``, unclosed elements closed, stray end tags dropped and
+whitespace-only text collapsed outside ``<pre>``/``<textarea>``.
+
+Stylesheets and scripts go through ``ChunkedTextRewriter``, which applies a
+precompiled regex to each chunk and carries a possibly split token over to
+the next one. ``content_kind`` picks the rewriter from a Content-Type.
+"""
+import re
+import json
+import html
+from html.entities import html5
+from html.parser import HTMLParser
+
+from .urls import DEFAULT_PREFIX
+
+# Tags and attributes whose URLs are routed back through the proxy
+RESOURCE_TAGS = frozenset(['a', 'link', 'script', 'img', 'form', 'iframe', 'source', 'video', 'audio'])
+RESOURCE_ATTRS = ('href', 'src', 'action', 'data-src', 'data-lazy_src')
+
+# Precompiled once: url(...) references and @import "..." in CSS
+CSS_REF_RE = re.compile(r'url\([\'"]?([^\'")]+)[\'"]?\)|(@import\s+)([\'"])([^\'"\n]+)\3', re.IGNORECASE)
+# A url( or @import that may continue in the next chunk, or a partial keyword
+CSS_TAIL_RE = re.compile(
+    r'(?:url\([^)]*|@import\b[^;\'"]*(?:[\'"][^\'"\n]*)?|u(?:r(?:l)?)?|@(?:i(?:m(?:p(?:o(?:r(?:t)?)?)?)?)?)?)\Z',
+    re.IGNORECASE)
+
+# ES module specifiers: import/export ... from "x", import "x", import("x")
+JS_IMPORT_RE = re.compile(
+    r'(\b(?:import|export)\b[^\'";()]*?\bfrom\s*|\bimport\s*\(?\s*)([\'"])([^\'"\n]+)\2')
+JS_TAIL_RE = re.compile(
+    r'(?:\b(?:import|export)\b[^;\'"]*(?:[\'"][^\'"\n]*)?'
+    r'|\bi(?:m(?:p(?:o(?:r(?:t)?)?)?)?)?|\be(?:x(?:p(?:o(?:r(?:t)?)?)?)?)?)\Z')
+# Only specifiers that are URLs go through the proxy; bare names belong to import maps
+JS_URL_PREFIXES = ('./', '../', '/', 'http://', 'https://')
+
+# Text held back waiting for the rest of a token never grows past this
+MAX_CARRY = 64 * 1024
+
+INJECTED_SCRIPT_TEMPLATE = '''
+      document.addEventListener('DOMContentLoaded', function() {
+        const prefix = __PREFIX__;
+        document.querySelectorAll('form').forEach(form => {
+          form.addEventListener('submit', function(e) {
+            e.preventDefault();
+            let action = form.action || window.location.href;
+            let encoded = btoa(action);
+            form.action = prefix + encoded;
+            form.submit();
+          });
+        });
+
+        document.addEventListener('click', function(e) {
+          if (e.target.tagName === 'A') {
+            let href = e.target.getAttribute('href');
+            if (href && !href.startsWith(prefix)) {
+              e.preventDefault();
+              window.location.href = prefix + btoa(href);
+            }
+          }
+        });
+      });
+    '''
+
+
+def injected_script(prefix=DEFAULT_PREFIX):
+    """The form/link interception script for pages proxied under ``prefix``"""
+    # A JS string literal that cannot close the surrounding <script> element
+    return INJECTED_SCRIPT_TEMPLATE.replace('__PREFIX__', json.dumps(prefix).replace('</', '<\\/'))
+
+
+INJECTED_SCRIPT = injected_script()
+
+# Serialization rules shared with BeautifulSoup's html.parser tree builder
+VOID_ELEMENTS = frozenset([
+    'area', 'base', 'basefont', 'bgsound', 'br', 'col', 'command', 'embed', 'frame', 'hr',
+    'image', 'img', 'input', 'isindex', 'keygen', 'link', 'menuitem', 'meta', 'nextid',
+    'param', 'source', 'spacer', 'track', 'wbr',
+])
+PRESERVE_WHITESPACE_TAGS = frozenset(['pre', 'textarea'])
+RAW_TEXT_TAGS = frozenset(['script', 'style'])
+MULTI_VALUED_ATTRS = {
+    '*': frozenset(['class', 'accesskey', 'dropzone']),
+    'a': frozenset(['rel', 'rev']),
+    'link': frozenset(['rel', 'rev']),
+    'td': frozenset(['headers']),
+    'th': frozenset(['headers']),
+    'form': frozenset(['accept-charset']),
+    'object': frozenset(['archive']),
+    'area': frozenset(['rel']),
+    'icon': frozenset(['sizes']),
+    'iframe': frozenset(['sandbox']),
+    'output': frozenset(['for']),
+}
+ASCII_SPACES = frozenset(' \n\t\x0c\r')
+NON_WHITESPACE_RE = re.compile(r'\S+')
+
+
+def escape_text(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def quote_attr(value):
+    value = escape_text(value)
+    if '"' in value:
+        if "'" in value:
+            return '"' + value.replace('"', '&quot;') + '"'
+        return "'" + value + "'"
+    return '"' + value + '"'
+
+
+def rewrite_srcset(value, base_url, rewrite_url):
+    """Rewrite every candidate URL in a srcset attribute"""
+    rewritten = []
+    for part in value.split(','):
+        tokens = part.strip().split(' ')
+        url = tokens[0]
+        descriptor = ' '.join(tokens[1:]) if len(tokens) > 1 else ''
+        rewritten.append(f'{rewrite_url(url, base_url)} {descriptor}'.strip())
+    return ', '.join(rewritten)
+
+
+def rewrite_css_urls(text, base_url, rewrite_url):
+    """Rewrite url(...) and @import "..." references in a stylesheet or style attribute"""
+    def replace(m):
+        if m.group(1) is not None:
+            return f'url({rewrite_url(m.group(1), base_url)})'
+        return f'{m.group(2)}{m.group(3)}{rewrite_url(m.group(4), base_url)}{m.group(3)}'
+    return CSS_REF_RE.sub(replace, text)
+
+
+def rewrite_js_imports(text, base_url, rewrite_url):
+    """Rewrite URL specifiers of static and dynamic ES module imports"""
+    def replace(m):
+        specifier = m.group(3)
+        if not specifier.startswith(JS_URL_PREFIXES):
+            return m.group(0)
+        return f'{m.group(1)}{m.group(2)}{rewrite_url(specifier, base_url)}{m.group(2)}'
+    return JS_IMPORT_RE.sub(replace, text)
+
+
+def statement_tail_floor(text):
+    """Earliest offset an unfinished import statement can start at.
+
+    An open ``import``/``@import`` holds no ``;`` or quote before its
+    (possibly unterminated) specifier string, so it starts after the last of
+    those that precedes the final quote.
+    """
+    quote = max(text.rfind('"'), text.rfind("'"))
+    if quote < 0:
+        return text.rfind(';') + 1
+    return max(text.rfind(';', 0, quote), text.rfind('"', 0, quote), text.rfind("'", 0, quote)) + 1
+
+
+def css_tail_floor(text):
+    """Earliest offset an unfinished ``url(`` or ``@import`` can start at"""
+    return min(text.rfind(')') + 1, statement_tail_floor(text))
+
+
+class ChunkedTextRewriter:
+    """Applies a whole-token rewrite to streamed text.
+
+    Each chunk is rewritten up to the start of a token that may still be
+    incomplete (as matched by ``tail_re``); that tail is carried over and
+    prepended to the next chunk, so a ``url(`` split across two network reads
+    is still rewritten as one token. ``tail_floor(text)`` bounds where such a
+    tail can begin so the search only scans the end of each chunk. The carry
+    is capped at ``MAX_CARRY``.
+    """
+
+    def __init__(self, rewrite, tail_re, tail_floor, base_url, rewrite_url):
+        self.rewrite = rewrite
+        self.tail_re = tail_re
+        self.tail_floor = tail_floor
+        self.base_url = base_url
+        self.rewrite_url = rewrite_url
+        self._carry = ''
+
+    def feed(self, text):
+        text = self._carry + text
+        m = self.tail_re.search(text, max(self.tail_floor(text), len(text) - MAX_CARRY))
+        cut = m.start() if m else len(text)
+        ready, self._carry = text[:cut], text[cut:]
+        return self.rewrite(ready, self.base_url, self.rewrite_url) if ready else ''
+
+    def close(self):
+        text, self._carry = self._carry, ''
+        return self.rewrite(text, self.base_url, self.rewrite_url) if text else ''
+
+
+class StreamingHTMLRewriter(HTMLParser):
+    """Incremental HTML rewriter; ``feed`` returns the markup ready so far.
+
+    ``rewrite_url(url, base_url)`` is applied to resource attributes,
+    srcset candidates and CSS ``url()`` references; ``inject_script`` is
+    appended as the last child of the first ``<body>``.
+    """
+
+    def __init__(self, base_url, rewrite_url, inject_script=INJECTED_SCRIPT):
+        super().__init__(convert_charrefs=False)
+        self.base_url = base_url
+        self.rewrite_url = rewrite_url
+        self.inject_script = inject_script
+        self._out = []
+        self._text = []  # pending text pieces, flushed at the next non-text event
+        self._stack = []  # names of open elements
+        self._open_counts = {}
+        self._preserve_depth = 0
+        self._body_depth = None  # stack depth of the first <body>, while open
+        self._body_seen = False
+
+    # -- public API -----------------------------------------------------
+
+    def feed(self, data):
+        super().feed(data)
+        return self._drain()
+
+    def close(self):
+        super().close()
+        self._flush_text()
+        while self._stack:
+            self._pop()
+        return self._drain()
+
+    def _drain(self):
+        out = ''.join(self._out)
+        self._out = []
+        return out
+
+    # -- element stack --------------------------------------------------
+
+    def _push(self, tag):
+        self._stack.append(tag)
+        self._open_counts[tag] = self._open_counts.get(tag, 0) + 1
+        if tag in PRESERVE_WHITESPACE_TAGS:
+            self._preserve_depth += 1
+        if tag == 'body' and not self._body_seen:
+            self._body_seen = True
+            self._body_depth = len(self._stack)
+
+    def _pop(self):
+        depth = len(self._stack)
+        tag = self._stack.pop()
+        self._open_counts[tag] -= 1
+        if tag in PRESERVE_WHITESPACE_TAGS:
+            self._preserve_depth -= 1
+        if depth == self._body_depth:
+            self._body_depth = None
+            if self.inject_script is not None:
+                self._out.append(f'<script>{self.inject_script}</script>')
+        self._out.append(f'</{tag}>')
+
+    def _pop_to(self, tag):
+        if not self._open_counts.get(tag):
+            return
+        while self._stack:
+            name = self._stack[-1]
+            self._pop()
+            if name == tag:
+                break
+
+    # -- text -----------------------------------------------------------
+
+    def _collapse(self, pieces):
+        text = ''.join(pieces)
+        if not self._preserve_depth and all(c in ASCII_SPACES for c in text):
+            text = '\n' if '\n' in text else ' '
+        return text
+
+    def _flush_text(self):
+        if not self._text:
+            return
+        text = self._collapse(self._text)
+        self._text = []
+        parent = self._stack[-1] if self._stack else None
+        if parent == 'style':
+            text = rewrite_css_urls(text, self.base_url, self.rewrite_url)
+        if parent in RAW_TEXT_TAGS:
+            self._out.append(text)
+        else:
+            self._out.append(escape_text(text))
+
+    def handle_data(self, data):
+        self._text.append(data)
+
+    def handle_charref(self, name):
+        self._text.append(html.unescape(f'&#{name};'))
+        self._text.append('')
+
+    def handle_entityref(self, name):
+        self._text.append(html5.get(name + ';', '&' + name))
+
+    # -- tags -----------------------------------------------------------
+
+    def _attrs(self, tag, attrs):
+        values = {}
+        for key, value in attrs:
+            values[key] = '' if value is None else value
+
+        multi = MULTI_VALUED_ATTRS['*'] | MULTI_VALUED_ATTRS.get(tag, frozenset())
+        for key in multi.intersection(values):
+            values[key] = ' '.join(NON_WHITESPACE_RE.findall(values[key]))
+
+        if tag in RESOURCE_TAGS:
+            for key in RESOURCE_ATTRS:
+                if values.get(key):
+                    values[key] = self.rewrite_url(values[key], self.base_url)
+            if values.get('srcset'):
+                values['srcset'] = rewrite_srcset(values['srcset'], self.base_url, self.rewrite_url)
+        if 'style' in values:
+            values['style'] = rewrite_css_urls(values['style'], self.base_url, self.rewrite_url)
+
+        if not values:
+            return ''
+        return ' ' + ' '.join(f'{key}={quote_attr(value)}' for key, value in sorted(values.items()))
+
+    def handle_starttag(self, tag, attrs):
+        self._flush_text()
+        if tag in VOID_ELEMENTS:
+            self._out.append(f'<{tag}{self._attrs(tag, attrs)}/>')
+            return
+        self._out.append(f'<{tag}{self._attrs(tag, attrs)}>')
+        self._push(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self._flush_text()
+        if tag in VOID_ELEMENTS:
+            self._out.append(f'<{tag}{self._attrs(tag, attrs)}/>')
+            return
+        self._out.append(f'<{tag}{self._attrs(tag, attrs)}>')
+        self._push(tag)
+        self._pop()
+
+    def handle_endtag(self, tag):
+        self._flush_text()
+        if tag in VOID_ELEMENTS:
+            # Void elements are closed when opened; stray end tags are dropped
+            return
+        self._pop_to(tag)
+
+    # -- markup declarations --------------------------------------------
+
+    def _emit_special(self, prefix, data, suffix):
+        self._flush_text()
+        self._out.append(prefix + self._collapse([data]) + suffix)
+
+    def handle_comment(self, data):
+        self._emit_special('<!--', data, '-->')
+
+    def handle_decl(self, decl):
+        self._emit_special('<!DOCTYPE ', decl[len('DOCTYPE '):], '>\n')
+
+    def unknown_decl(self, data):
+        if data.upper().startswith('CDATA['):
+            self._emit_special('<![CDATA[', data[len('CDATA['):], ']]>')
+        else:
+            self._emit_special('<?', data, '?>')
+
+    def handle_pi(self, data):
+        self._emit_special('<?', data, '>')
+
+
+def _drive(rewriter, chunks):
+    for chunk in chunks:
+        out = rewriter.feed(chunk)
+        if out:
+            yield out
+    out = rewriter.close()
+    if out:
+        yield out
+
+
+def stream_rewriter(kind, base_url, rewrite_url, inject_script=INJECTED_SCRIPT):
+    """Incremental rewriter for a ``content_kind``: ``feed(text)`` and ``close()`` return output text"""
+    if kind == 'html':
+        return StreamingHTMLRewriter(base_url, rewrite_url, inject_script)
+    if kind == 'css':
+        return ChunkedTextRewriter(rewrite_css_urls, CSS_TAIL_RE, css_tail_floor, base_url, rewrite_url)
+    return ChunkedTextRewriter(rewrite_js_imports, JS_TAIL_RE, statement_tail_floor, base_url, rewrite_url)
+
+
+def rewrite_html_stream(chunks, base_url, rewrite_url, inject_script=INJECTED_SCRIPT):
+    """Yield rewritten markup for an iterable of decoded HTML text chunks"""
+    return _drive(stream_rewriter('html', base_url, rewrite_url, inject_script), chunks)
+
+
+def rewrite_css_stream(chunks, base_url, rewrite_url):
+    """Yield rewritten CSS for an iterable of decoded stylesheet chunks"""
+    return _drive(stream_rewriter('css', base_url, rewrite_url), chunks)
+
+
+def rewrite_js_stream(chunks, base_url, rewrite_url):
+    """Yield JavaScript with module import URLs rewritten, chunk by chunk"""
+    return _drive(stream_rewriter('js', base_url, rewrite_url), chunks)
+
+
+STREAM_REWRITERS = {
+    'html': rewrite_html_stream,
+    'css': rewrite_css_stream,
+    'js': rewrite_js_stream,
+}
+JS_CONTENT_TYPES = ('javascript', 'ecmascript')
+
+
+def content_kind(content_type):
+    """Map a Content-Type header to a key of STREAM_REWRITERS, or None to pass through"""
+    content_type = content_type.lower()
+    if 'text/html' in content_type:
+        return 'html'
+    if 'text/css' in content_type:
+        return 'css'
+    if any(t in content_type for t in JS_CONTENT_TYPES):
+        return 'js'
+    return None
@@ -0,0 +1,59 @@
+"""Proxy URL encoding and the memoized rewriter applied to every page link."""
+import base64
+import logging
+import itertools
+import urllib.parse
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# Where the proxy is mounted in the portal; rewritten links are <prefix><base64 url>
+DEFAULT_PREFIX = '/other/fluxify/go/'
+
+
+def decode_url(encoded_url):
+    try:
+        return base64.b64decode(encoded_url).decode()
+    except:
+        return None
+
+
+def encode_url(url):
+    return base64.b64encode(url.encode()).decode()
+
+
+class URLRewriter:
+    """Maps page URLs to ``<prefix><base64 absolute url>`` proxy links.
+
+    Call it as ``rewriter(url, base_url)``. Pages repeat the same links,
+    stylesheets and images many times over, so results are memoized in an
+    LRU of ``cache_size`` entries keyed on ``(base_url, url)``. One rewrite
+    in every ``log_sample`` is logged at DEBUG.
+    """
+
+    def __init__(self, prefix=DEFAULT_PREFIX, cache_size=8192, log_sample=1000):
+        self.prefix = prefix
+        self.log_sample = max(1, log_sample)
+        self._calls = itertools.count()
+        self._cached = lru_cache(maxsize=cache_size)(self._rewrite)
+
+    def __call__(self, url, base_url):
+        final_url = self._cached(base_url, url)
+        if logger.isEnabledFor(logging.DEBUG) and next(self._calls) % self.log_sample == 0:
+            logger.debug(f"url_rewrite base={base_url!r} url={url!r} result={final_url!r} "
+                         f"cache={self._cached.cache_info()}")
+        return final_url
+
+    def _rewrite(self, base_url, url):
+        if url.startswith('//'):
+            url = 'https:' + url
+        if not url.startswith(('http://', 'https://')):
+            url = urllib.parse.urljoin(base_url, url)
+        return self.prefix + encode_url(url)
+
+    def stats(self):
+        info = self._cached.cache_info()
+        return {'hits': info.hits, 'misses': info.misses, 'size': info.currsize, 'max_size': info.maxsize}
+
+    def clear(self):
+        self._cached.cache_clear()
@@ -0,0 +1,309 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from bisect import bisect_right, insort
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # only needed for redis:// shared state
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+REDIS_SCHEMES = ('redis://', 'rediss://', 'unix://')
+
+
+class LocalState:
+    """Counters and hashes in this process only; the single-worker default.
+
+    Every backend offers the same small set of atomic operations the
+    connection bookkeeping in app.py needs: integer counters (``incr``,
+    ``set_max``), hashes of JSON values (``hincr``, ``hset``, ``hdel``,
+    ``hgetall``, ``hscan``) and keys that can be claimed once within a TTL
+    (``claim``, ``release``).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._hashes = {}
+        self._fields = {}  # {name: sorted [field]}, the keyset order for hscan
+        self._claims = {}  # {name: OrderedDict {key: expiry}}, oldest claim first
+
+    def incr(self, key, amount=1):
+        """Add ``amount`` to a counter and return the new value"""
+        with self._lock:
+            value = self._counters[key] = self._counters.get(key, 0) + amount
+            return value
+
+    def set_max(self, key, value):
+        """Raise a counter to at least ``value``; returns the resulting value"""
+        with self._lock:
+            value = self._counters[key] = max(self._counters.get(key, 0), value)
+            return value
+
+    def _hash(self, name, field):
+        """The hash holding ``field``, indexing the field if it is new (call with the lock held)"""
+        values = self._hashes.setdefault(name, {})
+        if field not in values:
+            insort(self._fields.setdefault(name, []), field)
+        return values
+
+    def hincr(self, name, field, amount=1):
+        with self._lock:
+            fields = self._hash(name, field)
+            value = fields[field] = fields.get(field, 0) + amount
+            return value
+
+    def hset(self, name, field, value):
+        with self._lock:
+            self._hash(name, field)[field] = value
+
+    def hdel(self, name, *fields):
+        with self._lock:
+            values = self._hashes.get(name, {})
+            order = self._fields.get(name, [])
+            for field in fields:
+                if field in values:
+                    del values[field]
+                    del order[bisect_right(order, field) - 1]
+
+    def hgetall(self, name):
+        with self._lock:
+            return dict(self._hashes.get(name, {}))
+
+    def hscan(self, name, cursor=None, count=100):
+        """One page of a hash: ({field: value}, next cursor or None after the last page)
+
+        Keyset pagination in field order: the cursor is the last field of the
+        previous page, so a page costs O(log n + count) however deep it is.
+        As with Redis HSCAN, fields added or removed between pages may be
+        missed; the cursors of different backends differ. A malformed cursor
+        raises ValueError.
+        """
+        if cursor is not None and not isinstance(cursor, str):
+            raise ValueError('invalid cursor')
+        with self._lock:
+            values = self._hashes.get(name, {})
+            order = self._fields.get(name, [])
+            start = bisect_right(order, cursor) if cursor else 0
+            fields = order[start:start + count]
+            page = {field: values[field] for field in fields}
+            more = start + count < len(order)
+        return page, fields[-1] if more else None
+
+    def claim(self, name, keys, ttl):
+        """Claim each key for ``ttl`` seconds; returns the keys nobody else holds (now claimed)"""
+        now = time.monotonic()
+        with self._lock:
+            claims = self._claims.setdefault(name, OrderedDict())
+            # Claims usually share one TTL, so the expired ones are at the front
+            while claims and next(iter(claims.values())) <= now:
+                claims.popitem(last=False)
+            claimed = [key for key in dict.fromkeys(keys) if claims.get(key, now) <= now]
+            for key in claimed:
+                claims.pop(key, None)  # re-inserted at the end, in expiry order
+                claims[key] = now + ttl
+        return claimed
+
+    def release(self, name, keys):
+        """Give up claims, e.g. when the work they guarded failed"""
+        with self._lock:
+            claims = self._claims.get(name, {})
+            for key in keys:
+                claims.pop(key, None)
+
+    def close(self):
+        pass
+
+
+class SQLiteState:
+    """Counters and hashes in a SQLite file shared by the worker processes of one host.
+
+    Each operation is a single upsert in autocommit mode (WAL journal), so
+    concurrent workers serialize on SQLite's write lock rather than on
+    anything in Python. Hash values are stored as JSON text.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS counters (key TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+        conn.execute('CREATE TABLE IF NOT EXISTS hashes (name TEXT NOT NULL, field TEXT NOT NULL, '
+                     'value TEXT NOT NULL, PRIMARY KEY (name, field))')
+        conn.execute('CREATE TABLE IF NOT EXISTS claims (name TEXT NOT NULL, key TEXT NOT NULL, '
+                     'expires REAL NOT NULL, PRIMARY KEY (name, key))')
+        conn.execute('CREATE INDEX IF NOT EXISTS claims_expires ON claims (name, expires)')
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def incr(self, key, amount=1):
+        return self._conn().execute(
+            'INSERT INTO counters (key, value) VALUES (?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value = value + excluded.value RETURNING value',
+            (key, amount)).fetchall()[0][0]
+
+    def set_max(self, key, value):
+        return self._conn().execute(
+            'INSERT INTO counters (key, value) VALUES (?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value = max(value, excluded.value) RETURNING value',
+            (key, value)).fetchall()[0][0]
+
+    def hincr(self, name, field, amount=1):
+        return int(self._conn().execute(
+            'INSERT INTO hashes (name, field, value) VALUES (?, ?, ?) '
+            'ON CONFLICT (name, field) DO UPDATE SET value = CAST(CAST(value AS INTEGER) + ? AS TEXT) '
+            'RETURNING value',
+            (name, field, str(amount), amount)).fetchall()[0][0])
+
+    def hset(self, name, field, value):
+        self._conn().execute(
+            'INSERT INTO hashes (name, field, value) VALUES (?, ?, ?) '
+            'ON CONFLICT (name, field) DO UPDATE SET value = excluded.value',
+            (name, field, json.dumps(value)))
+
+    def hdel(self, name, *fields):
+        if fields:
+            self._conn().executemany('DELETE FROM hashes WHERE name = ? AND field = ?',
+                                     [(name, field) for field in fields])
+
+    def hgetall(self, name):
+        rows = self._conn().execute('SELECT field, value FROM hashes WHERE name = ?', (name,))
+        return {field: json.loads(value) for field, value in rows}
+
+    def hscan(self, name, cursor=None, count=100):
+        # Keyset pagination on the (name, field) primary key; the cursor is the last field
+        if cursor is not None and not isinstance(cursor, str):
+            raise ValueError('invalid cursor')
+        rows = self._conn().execute(
+            'SELECT field, value FROM hashes WHERE name = ? AND field > ? ORDER BY field LIMIT ?',
+            (name, cursor or '', count + 1)).fetchall()
+        page = {field: json.loads(value) for field, value in rows[:count]}
+        return page, rows[count - 1][0] if len(rows) > count else None
+
+    def claim(self, name, keys, ttl):
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return []
+        now = time.time()
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM claims WHERE name = ? AND expires <= ?', (name, now))
+            claimed = set()
+            # One multi-row insert per chunk; RETURNING names the rows that did not exist
+            for start in range(0, len(keys), 300):
+                chunk = keys[start:start + 300]
+                rows = conn.execute(
+                    'INSERT INTO claims (name, key, expires) VALUES '
+                    + ', '.join(['(?, ?, ?)'] * len(chunk)) + ' ON CONFLICT DO NOTHING RETURNING key',
+                    [value for key in chunk for value in (name, key, now + ttl)]).fetchall()
+                claimed.update(key for key, in rows)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return [key for key in keys if key in claimed]
+
+    def release(self, name, keys):
+        keys = list(keys)
+        if keys:
+            self._conn().executemany('DELETE FROM claims WHERE name = ? AND key = ?', [(name, key) for key in keys])
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class RedisState:
+    """Counters and hashes in Redis, shared by workers on any number of hosts.
+
+    The same server usually doubles as the Socket.IO ``message_queue``.
+    Keys are namespaced with ``prefix``; hash values are stored as JSON.
+    """
+
+    def __init__(self, url, prefix='fluxion:'):
+        if redis is None:
+            raise RuntimeError('redis:// shared state needs the redis package (pip install redis)')
+        self.url = url
+        self.prefix = prefix
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+
+    def incr(self, key, amount=1):
+        return self.redis.incrby(self.prefix + key, amount)
+
+    def set_max(self, key, value):
+        key = self.prefix + key
+
+        def raise_to(pipe):
+            current = int(pipe.get(key) or 0)
+            if current < value:
+                pipe.multi()
+                pipe.set(key, value)
+            return max(current, value)
+
+        return self.redis.transaction(raise_to, key, value_from_callable=True)
+
+    def hincr(self, name, field, amount=1):
+        return self.redis.hincrby(self.prefix + name, field, amount)
+
+    def hset(self, name, field, value):
+        self.redis.hset(self.prefix + name, field, json.dumps(value))
+
+    def hdel(self, name, *fields):
+        if fields:
+            self.redis.hdel(self.prefix + name, *fields)
+
+    def hgetall(self, name):
+        return {field: json.loads(value) for field, value in self.redis.hgetall(self.prefix + name).items()}
+
+    def hscan(self, name, cursor=None, count=100):
+        # COUNT is a hint: a page may hold more or fewer fields, even none before the end
+        if cursor is not None and not (isinstance(cursor, str) and cursor.isascii() and cursor.isdigit()):
+            raise ValueError('invalid cursor')
+        next_cursor, values = self.redis.hscan(self.prefix + name, int(cursor or 0), count=count)
+        return {field: json.loads(value) for field, value in values.items()}, str(next_cursor) if next_cursor else None
+
+    def claim(self, name, keys, ttl):
+        # SET NX EX per key, sent as one pipeline; each reply says whether that key was free
+        keys = list(dict.fromkeys(keys))
+        pipe = self.redis.pipeline(transaction=False)
+        for key in keys:
+            pipe.set(f'{self.prefix}{name}:{key}', 1, nx=True, ex=max(1, int(ttl)))
+        return [key for key, claimed in zip(keys, pipe.execute()) if claimed]
+
+    def release(self, name, keys):
+        keys = [f'{self.prefix}{name}:{key}' for key in keys]
+        if keys:
+            self.redis.delete(*keys)
+
+    def close(self):
+        self.redis.close()
+
+
+def create_shared_state(url=''):
+    """Backend for a SHARED_STATE_URL: '' (this process), sqlite:///path or redis://..."""
+    if not url or url == 'local':
+        return LocalState()
+    if url.startswith('sqlite:///'):
+        return SQLiteState(url[len('sqlite:///'):])
+    if url.startswith(REDIS_SCHEMES):
+        return RedisState(url)
+    raise ValueError(f'unsupported shared state URL: {url}')
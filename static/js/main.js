@@ -7,6 +7,30 @@ let socket = null;
 let searchQuery = '';
 let toast = null;
 
+// Map counter fields in game updates to the action that changed them
+const FIELD_ACTIONS = { Plays: 'play', Likes: 'like', Favorites: 'favorite' };
+
+// Players per game right now, from 'presence_updates'
+let playingCounts = {};
+// While a game is open the server is told every 20s (its session expires after 60s without)
+const PRESENCE_HEARTBEAT_MS = 20000;
+let presenceTimer = null;
+
+// Actions go out as 'game_actions' batches (up to 50, at most every 250ms). Each
+// carries a client-generated id, so a batch resent after a lost ack counts once
+const ACTION_BATCH_MS = 250;
+const ACTION_BATCH_SIZE = 50;
+const ACTION_ACK_TIMEOUT_MS = 10000;
+// A batch that timed out or failed on the server is resent after this, doubling up to the max
+const ACTION_RETRY_MS = 1000;
+const ACTION_RETRY_MAX_MS = 30000;
+let pendingActions = [];
+let actionsInFlight = false;
+let actionFlushTimer = null;
+let actionRetryMs = ACTION_RETRY_MS;
+// Ids are deduplicated per client; this one outlives reconnects (which get a new machine ID)
+const ACTION_CLIENT_ID = newActionId();
+
 // Initialize the application when the DOM is loaded
 document.addEventListener('DOMContentLoaded', function() {
     // Initialize toast notification
@@ -32,9 +56,29 @@ function initSocketConnection() {
     // Connection established
     socket.on('connect', function() {
         console.log('Socket.IO connection established');
-        // Only fetch games data on first connection, not on reconnects
+        // Receive batched counter updates for every game
+        socket.emit('subscribe_games', { all: true });
+        // Pushes only carry changes: start from the current counts
+        fetch('/api/presence')
+            .then(response => response.json())
+            .then(data => {
+                playingCounts = data.games;
+                Object.entries(playingCounts).forEach(([gameName, players]) => updatePlayingCount(gameName, players));
+            })
+            .catch(error => console.error('Error fetching player counts:', error));
+        // A reconnect gets a new session: rejoin the game that is still open
+        const openGame = currentGameName();
+        if (openGame) {
+            socket.emit('presence_heartbeat', { game: openGame });
+        }
+        // Send actions queued while disconnected
+        flushGameActions();
+        // Fetch the full catalog on first connection; on reconnects only ask
+        // for the games that changed since the version we already have
         if (!gamesData.games || Object.keys(gamesData.games).length === 0) {
             fetchGames();
+        } else if (gamesData.version) {
+            fetchGames(gamesData.version);
         }
     });
     
@@ -57,15 +101,27 @@ function initSocketConnection() {
         usersElement.textContent = data.count;
     });
     
-    // Handle game updates
-    socket.on('game_update', function(data) {
-        updateGameStats(data.game, data.action, data.data);
-        
-        // Show notification for updates from other users
-        if (!isUserInitiatedAction(data.game, data.action)) {
-            const actionMessage = getActionMessage(data.action, data.game);
-            showToast('Game Update', actionMessage, 'info');
-        }
+    // Players per game, pushed when counts change: {games: {name: players}}
+    socket.on('presence_updates', function(payload) {
+        Object.assign(playingCounts, payload.games);
+        Object.entries(payload.games).forEach(([gameName, players]) => updatePlayingCount(gameName, players));
+    });
+    
+    // Handle batched game updates: {games: {name: {data, delta: {Plays: n, ...}}}}
+    socket.on('game_updates', function(payload) {
+        Object.entries(payload.games).forEach(([gameName, update]) => {
+            Object.keys(update.delta).forEach(field => {
+                const action = FIELD_ACTIONS[field];
+                if (!action) return;
+                updateGameStats(gameName, action, update.data);
+                
+                // Show notification for updates from other users
+                if (!isUserInitiatedAction(gameName, action)) {
+                    const actionMessage = getActionMessage(action, gameName);
+                    showToast('Game Update', actionMessage, 'info');
+                }
+            });
+        });
     });
 }
 
@@ -122,8 +178,8 @@ function showToast(title, message, type = 'success') {
 // Track if a fetch is in progress to prevent duplicate requests
 let fetchInProgress = false;
 
-// Fetch games data from the server
-function fetchGames() {
+// Fetch games data from the server, optionally only the changes since a version
+function fetchGames(sinceVersion = null) {
     // Prevent multiple simultaneous fetch requests
     if (fetchInProgress) {
         console.log('Fetch already in progress, skipping');
@@ -139,10 +195,11 @@ function fetchGames() {
         document.getElementById('games-grid').innerHTML = loadingTemplate.innerHTML;
     }
     
-    // Add cache buster to prevent browser caching
-    const cacheBuster = new Date().getTime();
+    // The server sends an ETag, so 'no-cache' revalidates with a cheap 304
+    // instead of re-downloading an unchanged catalog
+    const url = sinceVersion ? `/api/games?since=${encodeURIComponent(sinceVersion)}` : '/api/games';
     
-    fetch(`/api/games?_=${cacheBuster}`, {
+    fetch(url, {
         headers: {
             'Cache-Control': 'no-cache'
         }
@@ -154,7 +211,13 @@ function fetchGames() {
             return response.json();
         })
         .then(data => {
-            gamesData = data;
+            if (data.delta && gamesData.games) {
+                // Merge only the games that changed since our version
+                Object.assign(gamesData.games, data.games);
+                gamesData.version = data.version;
+            } else {
+                gamesData = data;
+            }
             renderGames();
             extractAndRenderTags();
             fetchInProgress = false;
@@ -237,12 +300,20 @@ function renderGames() {
         // Set game data
         const thumbnail = gameCard.querySelector('.game-thumbnail');
         thumbnail.src = game.Thumbnail;
+        if (game.Thumbnails) {
+            // Local resized copies: let the browser pick the size for the card width
+            thumbnail.srcset = Object.entries(game.Thumbnails)
+                .map(([size, url]) => `${url} ${size.split('x')[0]}w`)
+                .join(', ');
+            thumbnail.sizes = '(min-width: 992px) 25vw, (min-width: 768px) 33vw, (min-width: 576px) 50vw, 100vw';
+        }
         thumbnail.alt = name;
         
         gameCard.querySelector('.game-title').textContent = name;
         gameCard.querySelector('.plays-count').textContent = game.Plays;
         gameCard.querySelector('.likes-count').textContent = game.Likes;
         gameCard.querySelector('.favorites-count').textContent = game.Favorites;
+        gameCard.querySelector('.playing-count').textContent = playingCounts[name] || 0;
         
         // Add tags
         const tagsContainer = gameCard.querySelector('.game-tags');
@@ -356,13 +427,49 @@ function loadGame(gameName, gameLocation) {
     // Scroll to game container
     gameContainer.scrollIntoView({ behavior: 'smooth' });
     
-    // Increment play count
+    // Increment play count; this also starts the player's presence session
     handleGameAction(gameName, 'play');
+    startPresenceHeartbeat();
     
     // Show toast notification
     showToast('Game Loaded', `Now playing: ${gameName}`, 'success');
 }
 
+// Name of the game in the open game container, or null
+function currentGameName() {
+    const gameContainer = document.getElementById('game-container');
+    if (!gameContainer || gameContainer.style.display === 'none') return null;
+    return gameContainer.dataset.gameName || null;
+}
+
+function startPresenceHeartbeat() {
+    stopPresenceHeartbeat();
+    presenceTimer = setInterval(() => {
+        const openGame = currentGameName();
+        if (openGame && socket && socket.connected) {
+            socket.emit('presence_heartbeat', { game: openGame });
+        }
+    }, PRESENCE_HEARTBEAT_MS);
+}
+
+function stopPresenceHeartbeat() {
+    if (presenceTimer !== null) {
+        clearInterval(presenceTimer);
+        presenceTimer = null;
+    }
+}
+
+// Show how many people are playing a game on its card
+function updatePlayingCount(gameName, players) {
+    document.querySelectorAll('.game-card').forEach(card => {
+        const title = card.querySelector('.game-title');
+        if (title && title.textContent === gameName) {
+            const element = card.querySelector('.playing-count');
+            if (element) element.textContent = players;
+        }
+    });
+}
+
 // Create a new iframe for game content
 function createGameIframe(gameLocation) {
     // Get container and clear existing content
@@ -452,11 +559,8 @@ function handleGameAction(gameName, action, buttonElement = null) {
         return;
     }
     
-    // Send action to server via Socket.IO
-    socket.emit('game_action', {
-        game: gameName,
-        action: action
-    });
+    // Send action to server via Socket.IO, batched with any others made meanwhile
+    queueGameAction(gameName, action);
     
     // For like and favorite, mark as interacted and update button
     if (action === 'like' || action === 'favorite') {
@@ -476,6 +580,61 @@ function handleGameAction(gameName, action, buttonElement = null) {
     }
 }
 
+function newActionId() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}-${Math.random().toString(36).slice(2)}`;
+}
+
+function queueGameAction(gameName, action) {
+    pendingActions.push({ id: newActionId(), game: gameName, action: action });
+    scheduleActionFlush(pendingActions.length >= ACTION_BATCH_SIZE ? 0 : ACTION_BATCH_MS);
+}
+
+function scheduleActionFlush(delay) {
+    if (actionFlushTimer !== null) {
+        if (delay > 0) {
+            return; // a flush is already due
+        }
+        clearTimeout(actionFlushTimer);
+    }
+    actionFlushTimer = setTimeout(flushGameActions, delay);
+}
+
+// Send the oldest queued actions; one batch is in flight at a time so they arrive in order
+function flushGameActions() {
+    if (actionFlushTimer !== null) {
+        clearTimeout(actionFlushTimer);
+        actionFlushTimer = null;
+    }
+    if (actionsInFlight || pendingActions.length === 0 || !socket || !socket.connected) {
+        return;
+    }
+    const batch = pendingActions.splice(0, ACTION_BATCH_SIZE);
+    actionsInFlight = true;
+    socket.timeout(ACTION_ACK_TIMEOUT_MS).emit('game_actions', { client: ACTION_CLIENT_ID, events: batch }, (err, result) => {
+        actionsInFlight = false;
+        if (err || !result || (!result.success && result.retry)) {
+            // No ack, or the server could not apply it: queue the batch again with the
+            // same ids, ahead of newer actions; the server skips what it already applied
+            console.warn('Game actions not applied, retrying in', actionRetryMs, 'ms:', err || (result && result.error));
+            pendingActions = batch.concat(pendingActions);
+            scheduleActionFlush(actionRetryMs);
+            actionRetryMs = Math.min(actionRetryMs * 2, ACTION_RETRY_MAX_MS);
+            return;
+        }
+        actionRetryMs = ACTION_RETRY_MS;
+        if (!result.success) {
+            // Invalid: resending the same events would be rejected again
+            console.error('Game actions rejected:', result.error, result.errors);
+        }
+        if (pendingActions.length > 0) {
+            scheduleActionFlush(0);
+        }
+    });
+}
+
 // Update game stats in the UI
 function updateGameStats(gameName, action, gameData) {
     console.log(`Updating stats for ${gameName} after ${action} action`);
@@ -543,6 +702,8 @@ function setupEventListeners() {
     document.getElementById('close-game-btn').addEventListener('click', () => {
         document.getElementById('game-container').style.display = 'none';
         document.getElementById('game-frame-container').innerHTML = '';
+        stopPresenceHeartbeat();
+        socket.emit('leave_game');
     });
     
     document.getElementById('refresh-game-btn').addEventListener('click', refreshGame);
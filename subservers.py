@@ -0,0 +1,263 @@
+import os
+import sys
+import json
+import time
+import logging
+import threading
+import importlib.util
+import importlib.machinery
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Flask
+
+from counters import ShardedCounter
+from node_proxy import create_node_proxy
+
+logger = logging.getLogger(__name__)
+
+SERVERS_DIR = 'servers'
+MANIFEST_NAME = 'manifest.json'
+# Seconds before a sub-server that failed to load is tried again, doubling per failure
+RETRY_BACKOFF = 1.0
+RETRY_BACKOFF_MAX = 300.0
+
+
+def import_python_server(name, path):
+    """Execute a sub-server's entry file as ``server_<name>.<module>`` and return the module
+
+    The sub-server's directory becomes the package ``server_<name>`` (from its
+    ``__init__.py`` if it has one), so the entry file imports its siblings
+    relatively instead of through sys.path. Each call runs the entry file
+    again; sibling modules are imported once.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    package_name = f'server_{name}'
+    if package_name not in sys.modules:
+        init = os.path.join(directory, '__init__.py')
+        if os.path.exists(init):
+            spec = importlib.util.spec_from_file_location(package_name, init, submodule_search_locations=[directory])
+        else:
+            spec = importlib.machinery.ModuleSpec(package_name, None, is_package=True)
+            spec.submodule_search_locations = [directory]
+        package = importlib.util.module_from_spec(spec)
+        sys.modules[package_name] = package
+        try:
+            if spec.loader is not None:
+                spec.loader.exec_module(package)
+        except BaseException:
+            del sys.modules[package_name]
+            raise
+    module_name = f'{package_name}.{os.path.splitext(os.path.basename(path))[0]}'
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    previous = sys.modules.get(module_name)
+    sys.modules[module_name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        if previous is None:
+            del sys.modules[module_name]
+        else:
+            sys.modules[module_name] = previous
+        raise
+    return module
+
+
+class SubServer:
+    """One entry of the registry: where a sub-server lives and, once loaded, its WSGI app.
+
+    A failed import is remembered in ``error`` and not retried for
+    ``RETRY_BACKOFF`` seconds, doubling with each further failure up to
+    ``RETRY_BACKOFF_MAX``, so a broken server neither re-imports on every
+    request nor stays down after it is fixed.
+    """
+    __slots__ = ('name', 'kind', 'path', 'prefix', 'attr', 'preload', 'app', 'error',
+                 'load_seconds', 'loaded_at', 'failures', 'retry_at', '_requests', '_lock')
+
+    def __init__(self, name, kind, path, prefix=None, attr='app', preload=False):
+        self.name = name
+        self.kind = kind  # 'python' or 'node'
+        self.path = path
+        self.prefix = prefix or f'/other/{name}'
+        self.attr = attr
+        self.preload = preload
+        self.app = None
+        self.error = None
+        self.load_seconds = None
+        self.loaded_at = None
+        self.failures = 0
+        self.retry_at = 0.0  # time.monotonic() after which a failed load is tried again
+        self._requests = ShardedCounter()
+        self._lock = threading.Lock()
+
+    @property
+    def requests(self):
+        return self._requests.value(self.name)
+
+    def count_request(self):
+        self._requests.add(self.name)
+
+    def _settled(self):
+        return self.app is not None or (self.error is not None and time.monotonic() < self.retry_at)
+
+    def load(self):
+        """Import the sub-server once and return its WSGI app (None while it fails to load)"""
+        if self._settled():
+            return self.app
+        with self._lock:
+            if self._settled():
+                return self.app
+            start = time.perf_counter()
+            try:
+                app = self._import()
+            except Exception as e:
+                self.error = f'{type(e).__name__}: {e}'
+                self.failures += 1
+                backoff = min(RETRY_BACKOFF * 2 ** (self.failures - 1), RETRY_BACKOFF_MAX)
+                self.retry_at = time.monotonic() + backoff
+                logger.exception(f"Error loading sub-server {self.name}; retrying in {backoff:.0f}s")
+            else:
+                self.app = app
+                self.error = None
+                self.load_seconds = time.perf_counter() - start
+                self.loaded_at = time.time()
+                logger.info(f"Loaded sub-server {self.name} ({self.kind}) in {self.load_seconds * 1000:.1f} ms")
+        return self.app
+
+    def _import(self):
+        if self.kind == 'node':
+            app = Flask(f'server_{self.name}')
+            app.register_blueprint(create_node_proxy(self.name, root=os.path.dirname(os.path.dirname(self.path))),
+                                   url_prefix='')
+            return app
+        module = import_python_server(self.name, self.path)
+        app = getattr(module, self.attr, None)
+        if app is None:
+            raise LookupError(f'{self.path} has no {self.attr!r} WSGI app')
+        return app
+
+    def stats(self):
+        return {
+            'kind': self.kind,
+            'prefix': self.prefix,
+            'loaded': self.app is not None,
+            'error': self.error,
+            'failures': self.failures,
+            'load_ms': round(self.load_seconds * 1000, 2) if self.load_seconds is not None else None,
+            'requests': self.requests,
+        }
+
+
+class SubServerRegistry:
+    """Sub-servers listed in ``servers/manifest.json``, imported on first use.
+
+    Manifest entries look like ``{"fluxify": {"kind": "python", "entry":
+    "main.py", "app": "app", "preload": false}}``; every key is optional.
+    Without a manifest the directory is scanned for ``main.py`` (Python) and
+    ``server.js`` (Node.js) as before. Scanning only stats files, so nothing
+    is imported until a request reaches a server's prefix or ``preload``
+    runs.
+    """
+
+    def __init__(self, root=SERVERS_DIR):
+        self.root = root
+        self.servers = {}
+        self.discover_seconds = None
+
+    def discover(self):
+        start = time.perf_counter()
+        manifest_path = os.path.join(self.root, MANIFEST_NAME)
+        servers = {}
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r') as f:
+                manifest = json.load(f)
+            for name, spec in manifest.items():
+                server = self._from_spec(name, spec or {})
+                if server is not None:
+                    servers[name] = server
+        elif os.path.isdir(self.root):
+            for name in sorted(os.listdir(self.root)):
+                if os.path.isdir(os.path.join(self.root, name)):
+                    server = self._from_spec(name, {})
+                    if server is not None:
+                        servers[name] = server
+        self.servers = servers
+        self.discover_seconds = time.perf_counter() - start
+        logger.info(f"Discovered {len(servers)} sub-servers in {self.discover_seconds * 1000:.1f} ms")
+        return servers
+
+    def _from_spec(self, name, spec):
+        kind = spec.get('kind')
+        entry = spec.get('entry')
+        if kind is None:
+            if os.path.exists(os.path.join(self.root, name, entry or 'main.py')):
+                kind = 'python'
+            elif os.path.exists(os.path.join(self.root, name, entry or 'server.js')):
+                kind = 'node'
+            else:
+                return None
+        entry = entry or ('main.py' if kind == 'python' else 'server.js')
+        path = os.path.join(self.root, name, entry)
+        if not os.path.exists(path):
+            logger.warning(f"Sub-server {name}: {path} does not exist")
+            return None
+        return SubServer(name, kind, path, prefix=spec.get('prefix'), attr=spec.get('app', 'app'),
+                         preload=bool(spec.get('preload')))
+
+    def match(self, path):
+        """Return (server, remaining path) for a request path, or (None, None)"""
+        for server in self.servers.values():
+            prefix = server.prefix
+            if path == prefix or path.startswith(prefix + '/'):
+                return server, path[len(prefix):]
+        return None, None
+
+    def preload(self, names=None, workers=4):
+        """Import sub-servers in parallel; by default the ones marked ``preload``"""
+        if names is None:
+            servers = [s for s in self.servers.values() if s.preload]
+        else:
+            servers = [self.servers[n] for n in names if n in self.servers]
+        if not servers:
+            return []
+        with ThreadPoolExecutor(max_workers=min(workers, len(servers))) as pool:
+            list(pool.map(SubServer.load, servers))
+        return servers
+
+    def preload_in_background(self, names=None, workers=4):
+        thread = threading.Thread(target=self.preload, args=(names, workers),
+                                  name='subserver-preload', daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self):
+        return {
+            'discover_ms': round(self.discover_seconds * 1000, 2) if self.discover_seconds is not None else None,
+            'servers': {name: server.stats() for name, server in self.servers.items()},
+        }
+
+
+class SubServerDispatcher:
+    """WSGI middleware sending ``<prefix>/...`` to the sub-server's own app.
+
+    The sub-app sees ``SCRIPT_NAME=<prefix>`` and the rest as ``PATH_INFO``,
+    so its routes keep their methods, converters and error handlers. Other
+    paths fall through to the main app.
+    """
+
+    def __init__(self, app, registry):
+        self.app = app
+        self.registry = registry
+
+    def __call__(self, environ, start_response):
+        server, rest = self.registry.match(environ.get('PATH_INFO', ''))
+        if server is None:
+            return self.app(environ, start_response)
+        app = server.load()
+        server.count_request()
+        if app is None:
+            start_response('503 Service Unavailable', [('Content-Type', 'text/plain; charset=utf-8')])
+            return [f'Sub-server {server.name} failed to load'.encode('utf-8')]
+        environ['SCRIPT_NAME'] = environ.get('SCRIPT_NAME', '') + server.prefix
+        environ['PATH_INFO'] = rest
+        return app(environ, start_response)
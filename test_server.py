@@ -1,7 +1,9 @@
-from flask import Flask, send_from_directory
+from flask import Flask
 import os
+from assets import GameAssetServer
 
 app = Flask(__name__)
+game_assets = GameAssetServer('games')
 
 @app.route("/")
 def hello():
@@ -9,7 +11,7 @@ def hello():
 
 @app.route('/games/<path:filename>')
 def serve_game_file(filename):
-    return send_from_directory('games', filename)
+    return game_assets.send(filename)
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=8080, debug=True)
\ No newline at end of file
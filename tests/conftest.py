@@ -0,0 +1,21 @@
+import os
+
+import pytest
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """app.py imported once, with its databases and journal in a temporary directory"""
+    tmp = tmp_path_factory.mktemp('app')
+    os.environ.update(
+        CATALOG_BACKEND='sql',
+        DATABASE_URL=f"sqlite:///{tmp / 'catalog.db'}",
+        PROFILES_DATABASE_URL=f"sqlite:///{tmp / 'profiles.db'}",
+        JOURNAL_DIR=str(tmp / 'journal'),
+        THUMBNAILS_DIR=str(tmp / 'thumbs'),
+        SHARED_STATE_URL='',
+        THUMBNAIL_WORKERS='0',
+        LOG_LEVEL='WARNING',
+    )
+    import app
+    return app
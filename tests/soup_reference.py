@@ -0,0 +1,45 @@
+"""Fluxify's original HTML rewriter, kept as the reference the streaming one must match.
+
+It parses the whole document with BeautifulSoup, so it needs bs4, which the
+proxy itself no longer does.
+"""
+from bs4 import BeautifulSoup
+
+TAGS = ['a', 'link', 'script', 'img', 'form', 'iframe', 'source', 'video', 'audio']
+ATTRIBUTES = ['href', 'src', 'action', 'data-src', 'data-lazy_src']
+
+
+def rewrite_html_soup(fluxify, html_content, base_url):
+    """Rewrite a document with ``fluxify``'s URL rewriter and injected script"""
+    soup = BeautifulSoup(html_content, 'html.parser')
+
+    # Rewrite various resource tags
+    for tag in soup.find_all(TAGS):
+        for attr in ATTRIBUTES:
+            if tag.get(attr):
+                tag[attr] = fluxify.rewrite_url(tag[attr], base_url)
+
+        # Handle srcset separately (because it's a comma-separated list)
+        if tag.get('srcset'):
+            rewritten = []
+            for part in tag['srcset'].split(','):
+                tokens = part.strip().split(' ')
+                descriptor = ' '.join(tokens[1:]) if len(tokens) > 1 else ''
+                rewritten.append(f'{fluxify.rewrite_url(tokens[0], base_url)} {descriptor}'.strip())
+            tag['srcset'] = ', '.join(rewritten)
+
+    # Rewrite CSS urls in style tags and attributes
+    for style in soup.find_all(['style']):
+        if style.string:
+            style.string = fluxify.rewrite_css_urls(style.string, base_url, fluxify.rewrite_url)
+
+    for tag in soup.find_all(style=True):
+        tag['style'] = fluxify.rewrite_css_urls(tag['style'], base_url, fluxify.rewrite_url)
+
+    # Inject our custom scripts
+    if soup.body:
+        custom_script = soup.new_tag('script')
+        custom_script.string = fluxify.INJECTED_SCRIPT
+        soup.body.append(custom_script)
+
+    return str(soup)
@@ -0,0 +1,391 @@
+"""Local stand-in HTTP origin, Redis server and helpers shared by the tests and benchmarks.
+
+Nothing here touches the network: stand-ins bind to 127.0.0.1 on an
+ephemeral port and serve from memory.
+"""
+import os
+import sys
+import time
+import socket
+import threading
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class _HeaderList(list):
+    """(name, value) pairs that also answer .get() and .items() like a dict"""
+
+    def get(self, name, default=None):
+        return next((value for key, value in self if key.lower() == name.lower()), default)
+
+    def items(self):
+        return iter(self)
+
+
+class StandInOrigin:
+    """Threaded HTTP server answering from a {path: (status, headers, body)} table.
+
+    ``headers`` is a dict or a list of (name, value) pairs. ``delay`` seconds
+    are slept before every response to imitate a slow origin. Bodies may be
+    bytes or a callable taking the request handler and returning bytes.
+    Routes with an ``ETag`` header answer a matching ``If-None-Match`` with
+    304.
+    """
+
+    def __init__(self, routes=None, delay=0.0):
+        self.routes = dict(routes or {})
+        self.delay = delay
+        self.requests = 0
+        self.connections = 0
+        self.not_modified = 0
+        origin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                origin.connections += 1
+
+            def _respond(self, include_body=True):
+                origin.requests += 1
+                if origin.delay:
+                    time.sleep(origin.delay)
+                path = self.path.split('?', 1)[0]
+                status, headers, body = origin.routes.get(
+                    path, (404, {'Content-Type': 'text/plain'}, b'not found'))
+                if callable(body):
+                    body = body(self)
+                if not isinstance(headers, dict):  # list of pairs, e.g. repeated Set-Cookie
+                    headers = _HeaderList(headers)
+                etag = headers.get('ETag')
+                if etag is not None and status == 200 and self.headers.get('If-None-Match') == etag:
+                    origin.not_modified += 1
+                    status, body = 304, b''
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if include_body:
+                    self.wfile.write(body)
+
+            def do_GET(self):
+                self._respond()
+
+            def do_HEAD(self):
+                self._respond(include_body=False)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                self.request_body = self.rfile.read(length)
+                self._respond()
+
+            do_PUT = do_POST
+            do_PATCH = do_POST
+            do_DELETE = do_POST
+            do_OPTIONS = do_GET
+
+            def log_message(self, format, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            request_queue_size = 1024  # bursts of new connections must not hit SYN retries
+
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f'http://{host}:{port}'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+
+class StandInRedis:
+    """Threaded server speaking enough of the Redis protocol (RESP2) for redis-py.
+
+    Covers what shared_state.RedisState and Socket.IO's RedisManager use:
+    strings (with SET NX/EX) and counters, hashes (with HSCAN), WATCH/MULTI/EXEC and PUBLISH/SUBSCRIBE.
+    Commands are applied one at a time under a single lock, like Redis.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.versions = {}  # {key: writes}, for WATCH
+        self.expiries = {}  # {key: time.monotonic() deadline}, for SET ... EX
+        self.channels = {}  # {channel: set of subscribed handlers}
+        self.commands = 0
+        self.lock = threading.Lock()
+        standin = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def setup(self):
+                super().setup()
+                self.write_lock = threading.Lock()
+                self.watched = None
+                self.queued = None
+                self.resp3 = False
+
+            def handle(self):
+                while True:
+                    try:
+                        args = self._read_command()
+                    except (ConnectionError, OSError):
+                        args = None
+                    if args is None:
+                        break
+                    self.send(standin.execute(self, args))
+                with standin.lock:
+                    for subscribers in standin.channels.values():
+                        subscribers.discard(self)
+
+            def _read_command(self):
+                line = self.rfile.readline()
+                if not line:
+                    return None
+                if not line.startswith(b'*'):
+                    return line.split()
+                args = []
+                for _ in range(int(line[1:])):
+                    length = int(self.rfile.readline()[1:])
+                    args.append(self.rfile.read(length + 2)[:-2])
+                return args
+
+            def send(self, payload):
+                with self.write_lock:
+                    self.wfile.write(payload)
+
+        class Server(socketserver.ThreadingTCPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+            request_queue_size = 1024
+
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f'redis://{host}:{port}/0'
+
+    @staticmethod
+    def push(items, resp3=False):
+        """A pub/sub message: a push frame in RESP3, an array in RESP2"""
+        encoded = StandInRedis.encode(list(items), resp3)
+        return b'>' + encoded[1:] if resp3 else encoded
+
+    @staticmethod
+    def encode(value, resp3=False):
+        if value is None:
+            return b'_\r\n' if resp3 else b'$-1\r\n'
+        if isinstance(value, Exception):
+            return f'-ERR {value}\r\n'.encode()
+        if isinstance(value, int):
+            return f':{value}\r\n'.encode()
+        if isinstance(value, str):
+            return f'+{value}\r\n'.encode()
+        if isinstance(value, bytes):
+            return b'$%d\r\n%s\r\n' % (len(value), value)
+        if isinstance(value, dict):
+            if resp3:
+                return b'%%%d\r\n' % len(value) + b''.join(
+                    StandInRedis.encode(item) for pair in value.items() for item in pair)
+            value = [item for pair in value.items() for item in pair]
+        return b'*%d\r\n' % len(value) + b''.join(StandInRedis.encode(item, resp3) for item in value)
+
+    def execute(self, client, args):
+        command = args[0].upper().decode()
+        if client.queued is not None and command not in ('EXEC', 'DISCARD', 'MULTI', 'WATCH'):
+            client.queued.append(args)
+            return b'+QUEUED\r\n'
+        if command == 'HELLO':
+            # RESP3 handshake; the replies stay RESP2 types, which RESP3 parsers accept too
+            proto = int(args[1]) if len(args) > 1 else 2
+            client.resp3 = proto == 3
+            return b'%%2\r\n+server\r\n+standin\r\n+proto\r\n:%d\r\n' % proto
+        if command in ('SUBSCRIBE', 'UNSUBSCRIBE'):
+            replies = []
+            with self.lock:
+                for count, channel in enumerate(args[1:], 1):
+                    subscribers = self.channels.setdefault(channel, set())
+                    if command == 'SUBSCRIBE':
+                        subscribers.add(client)
+                    else:
+                        subscribers.discard(client)
+                    replies.append(self.push([command.lower().encode(), channel, count], client.resp3))
+            return b''.join(replies)
+        if command == 'PUBLISH':
+            with self.lock:
+                subscribers = list(self.channels.get(args[1], ()))
+            for subscriber in subscribers:
+                try:
+                    subscriber.send(self.push([b'message', args[1], args[2]], subscriber.resp3))
+                except OSError:
+                    pass
+            return self.encode(len(subscribers))
+        with self.lock:
+            self.commands += 1
+            if command == 'WATCH':
+                client.watched = client.watched or {}
+                for key in args[1:]:
+                    client.watched[key] = self.versions.get(key, 0)
+                return self.encode('OK')
+            if command == 'UNWATCH':
+                client.watched = None
+                return self.encode('OK')
+            if command == 'MULTI':
+                client.queued = []
+                return self.encode('OK')
+            if command == 'DISCARD':
+                client.queued = client.watched = None
+                return self.encode('OK')
+            if command == 'EXEC':
+                queued, watched = client.queued or [], client.watched or {}
+                client.queued = client.watched = None
+                if any(self.versions.get(key, 0) != version for key, version in watched.items()):
+                    return self.encode(None, client.resp3) if client.resp3 else b'*-1\r\n'
+                return self.encode([self._apply(args) for args in queued], client.resp3)
+            return self.encode(self._apply(args), client.resp3)
+
+    def _apply(self, args):
+        """Run one data command (call with the lock held)"""
+        command = args[0].upper().decode()
+        data = self.data
+        try:
+            if command in ('PING', 'ECHO'):
+                return args[1] if len(args) > 1 else 'PONG'
+            if command in ('CLIENT', 'SELECT'):
+                return 'OK'
+            if command == 'FLUSHALL':
+                data.clear()
+                return 'OK'
+            if command == 'GET':
+                self._expire(args[1])
+                return data.get(args[1])
+            if command == 'SET':
+                # SET key value [NX] [EX seconds]
+                options = [arg.upper() for arg in args[3:]]
+                self._expire(args[1])
+                if b'NX' in options and args[1] in data:
+                    return None
+                self._touch(args[1])
+                data[args[1]] = args[2]
+                self.expiries.pop(args[1], None)
+                if b'EX' in options:
+                    self.expiries[args[1]] = time.monotonic() + int(options[options.index(b'EX') + 1])
+                return 'OK'
+            if command in ('INCR', 'INCRBY'):
+                value = int(data.get(args[1], 0)) + (int(args[2]) if len(args) > 2 else 1)
+                self._touch(args[1])
+                data[args[1]] = str(value).encode()
+                return value
+            if command == 'DEL':
+                removed = sum(data.pop(key, None) is not None for key in args[1:])
+                for key in args[1:]:
+                    self._touch(key)
+                return removed
+            if command == 'HINCRBY':
+                fields = data.setdefault(args[1], {})
+                value = int(fields.get(args[2], 0)) + int(args[3])
+                fields[args[2]] = str(value).encode()
+                self._touch(args[1])
+                return value
+            if command == 'HSET':
+                fields = data.setdefault(args[1], {})
+                added = 0
+                for field, value in zip(args[2::2], args[3::2]):
+                    added += field not in fields
+                    fields[field] = value
+                self._touch(args[1])
+                return added
+            if command == 'HDEL':
+                fields = data.get(args[1], {})
+                removed = sum(fields.pop(field, None) is not None for field in args[2:])
+                self._touch(args[1])
+                return removed
+            if command == 'HGETALL':
+                return dict(data.get(args[1], {}))
+            if command == 'HLEN':
+                return len(data.get(args[1], {}))
+            if command == 'HSCAN':
+                # Cursor = offset into the hash; COUNT is honoured exactly
+                options = {key.upper(): value for key, value in zip(args[3::2], args[4::2])}
+                start, count = int(args[2]), int(options.get(b'COUNT', 10))
+                items = list(data.get(args[1], {}).items())[start:start + count]
+                next_cursor = start + count if start + count < len(data.get(args[1], {})) else 0
+                return [str(next_cursor).encode(), [item for pair in items for item in pair]]
+        except (ValueError, IndexError) as e:
+            return ValueError(e)
+        return ValueError(f"unknown command '{command}'")
+
+    def _expire(self, key):
+        deadline = self.expiries.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            del self.expiries[key]
+            self.data.pop(key, None)
+
+    def _touch(self, key):
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class UpgradeEchoBackend:
+    """Answers one Upgrade request with 101, then echoes raw bytes back.
+
+    ``request`` holds the request head as received, for checking what a
+    proxy forwarded.
+    """
+
+    def __init__(self):
+        self.sock = socket.create_server(('127.0.0.1', 0))
+        self.port = self.sock.getsockname()[1]
+        self.request = b''
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        conn, _ = self.sock.accept()
+        with conn:
+            while b'\r\n\r\n' not in self.request:
+                self.request += conn.recv(4096)
+            conn.sendall(b'HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n\r\n')
+            while True:
+                data = conn.recv(4096)
+                if not data:
+                    return
+                conn.sendall(data)
+
+    def close(self):
+        self.sock.close()
+
+
+def load_sub_server(name):
+    """Import servers/<name>/main.py the same way main.load_sub_server does"""
+    from subservers import import_python_server
+    return import_python_server(name, os.path.join(REPO_ROOT, 'servers', name, 'main.py'))
+
+
+def peak_rss_kb():
+    """Peak resident set size of this process in KiB"""
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss
@@ -0,0 +1,76 @@
+import os
+import gzip
+
+import pytest
+from flask import Flask
+
+from assets import GameAssetServer, IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, VERSION_LENGTH
+
+
+@pytest.fixture
+def assets(tmp_path):
+    (tmp_path / 'game.html').write_text('<html>' + 'x' * 4000 + '</html>')
+    (tmp_path / 'tiny.js').write_text('1')
+    return GameAssetServer(str(tmp_path))
+
+
+@pytest.fixture
+def client(assets):
+    app = Flask(__name__)
+
+    @app.route('/games/<path:filename>')
+    def serve(filename):
+        return assets.send(filename)
+
+    return app.test_client()
+
+
+def test_versioned_url_is_immutable(assets, client):
+    game = assets.rewrite({'Location': 'game.html', 'Plays': 1})
+    location = game['Location']
+    assert location == f"game.html?v={assets.url_version('game.html')}"
+    assert len(location.rsplit('=', 1)[1]) == VERSION_LENGTH
+
+    resp = client.get(f'/games/{location}')
+    assert resp.status_code == 200
+    assert resp.headers['Cache-Control'] == IMMUTABLE_CACHE_CONTROL
+    resp = client.get('/games/game.html')
+    assert resp.headers['Cache-Control'] == REVALIDATE_CACHE_CONTROL
+    resp = client.get('/games/game.html?v=0000000000000000')
+    assert resp.headers['Cache-Control'] == REVALIDATE_CACHE_CONTROL
+
+
+def test_rewrite_leaves_unknown_locations(assets):
+    assert assets.rewrite({'Location': 'missing.html'}) == {'Location': 'missing.html'}
+    assert assets.rewrite({'Location': 'game.html?x=1'}) == {'Location': 'game.html?x=1'}
+    assert assets.rewrite({'Location': '../etc/passwd'}) == {'Location': '../etc/passwd'}
+    assert assets.rewrite_games({'a': {'Plays': 1}}) == {'a': {'Plays': 1}}
+
+
+def test_sibling_is_only_served_for_its_source(assets, client, tmp_path):
+    assert assets.build() >= 1
+    resp = client.get('/games/game.html', headers={'Accept-Encoding': 'gzip'})
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(resp.data) == (tmp_path / 'game.html').read_bytes()
+
+    # New contents: the old sibling must not be served under the new hash
+    source = tmp_path / 'game.html'
+    source.write_text('<html>' + 'y' * 4000 + '</html>')
+    os.utime(source, ns=(1, 1))  # even with an mtime older than the sibling's
+    resp = client.get('/games/game.html', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in resp.headers
+    assert resp.data == source.read_bytes()
+
+    assets.build()
+    resp = client.get('/games/game.html', headers={'Accept-Encoding': 'gzip'})
+    assert gzip.decompress(resp.data) == source.read_bytes()
+    assert resp.headers['ETag'].strip('"').startswith(assets.content_hash(str(source)))
+    siblings = sorted(name for name in os.listdir(tmp_path) if name.endswith(('.gz', '.br')))
+    assert all(assets.url_version('game.html') in name for name in siblings)
+    assert not any(name.startswith('tiny.js') for name in siblings)  # below min_size
+
+
+def test_build_removes_unversioned_siblings(assets, tmp_path):
+    (tmp_path / 'game.html.gz').write_bytes(gzip.compress(b'stale'))
+    assets.build()
+    assert not (tmp_path / 'game.html.gz').exists()
@@ -0,0 +1,58 @@
+import json
+import gzip
+
+import pytest
+
+import catalog_cache
+from catalog import GameCatalog, save_games_data
+from catalog_cache import CatalogResponseCache
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    path = str(tmp_path / 'games.json')
+    save_games_data({'games': {f'game-{i}': {'Location': f'{i}.html', 'Plays': i, 'Likes': 0, 'Favorites': 0,
+                                             'Tags': ['arcade']} for i in range(100)}}, path)
+    return GameCatalog(path, reload_check_interval=3600)
+
+
+def decoded(bodies):
+    if len(bodies['identity']) >= catalog_cache.MIN_COMPRESS_SIZE:
+        assert gzip.decompress(bodies['gzip']) == bodies['identity']
+    return json.loads(bodies['identity'])
+
+
+def test_delta_holds_only_changed_games(catalog):
+    cache = CatalogResponseCache(catalog)
+    since = cache.current().token
+    catalog.increment('game-3', 'Plays', 2)
+    catalog.increment('game-7', 'Likes')
+    delta = decoded(cache.delta(since))
+    assert delta['delta'] and delta['since'] == since and delta['version'] == cache.current().token
+    assert {name: game['Plays'] for name, game in delta['games'].items()} == {'game-3': 5, 'game-7': 7}
+    assert cache.delta('unknown') is None
+
+    since = cache.current().token
+    catalog.increment_many([(f'game-{i}', 'Plays', 1) for i in range(100)])
+    assert len(decoded(cache.delta(since))['games']) == 100  # checks the gzip body too
+
+
+def test_delta_bodies_are_built_once_per_version(catalog, monkeypatch):
+    cache = CatalogResponseCache(catalog)
+    first = cache.current().token
+    catalog.increment('game-1', 'Plays')
+    second = cache.current().token
+    catalog.increment('game-2', 'Plays')
+
+    built = []
+    compress = catalog_cache._compress
+    monkeypatch.setattr(catalog_cache, '_compress', lambda body: built.append(body) or compress(body))
+    bodies = cache.delta(first)
+    assert all(cache.delta(first) is bodies for _ in range(10))
+    assert sorted(decoded(cache.delta(second))['games']) == ['game-2']
+    assert len(built) == 3  # the current rendition, then one delta per since
+
+    catalog.increment('game-1', 'Plays')
+    fresh = cache.delta(first)
+    assert fresh is not bodies and sorted(decoded(fresh)['games']) == ['game-1', 'game-2']
+    assert cache.current().deltas.keys() == {first}  # older memos went with their rendition
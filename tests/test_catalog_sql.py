@@ -0,0 +1,123 @@
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.pool import StaticPool
+
+import migrations
+from catalog_sql import SQLCatalog
+from migrations import migrate_games
+from models import db, Game, Tag, game_tags, catalog_meta
+
+GAMES = {
+    'Alpha': {'Location': 'alpha.html', 'Thumbnail': 'a.png', 'Likes': 1, 'Favorites': 2, 'Plays': 10,
+              'Tags': ['arcade', 'retro']},
+    'Beta': {'Location': 'beta.html', 'Thumbnail': 'b.png', 'Likes': 0, 'Favorites': 0, 'Plays': 5,
+             'Tags': ['puzzle', 'arcade', 'puzzle']},
+    'Gamma': {'Location': 'gamma.html', 'Thumbnail': '', 'Tags': []},
+}
+
+
+@pytest.fixture
+def engine():
+    # One in-memory database shared by every connection
+    engine = create_engine('sqlite://', poolclass=StaticPool, connect_args={'check_same_thread': False})
+    db.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+def db_version(engine):
+    with engine.connect() as conn:
+        return conn.execute(select(catalog_meta.c.version)).scalar_one()
+
+
+def db_rows(engine):
+    games = Game.__table__
+    with engine.connect() as conn:
+        rows = {row.name: (row.location, row.thumbnail, row.likes, row.favorites, row.plays)
+                for row in conn.execute(select(games))}
+        links = conn.execute(select(games.c.name, Tag.__table__.c.name, game_tags.c.position)
+                             .join(game_tags, game_tags.c.game_id == games.c.id)
+                             .join(Tag.__table__, Tag.__table__.c.id == game_tags.c.tag_id)
+                             .order_by(games.c.name, game_tags.c.position)).all()
+    return rows, [tuple(link) for link in links]
+
+
+@pytest.fixture(params=['upsert', 'portable'])
+def migrate(request, monkeypatch):
+    if request.param == 'portable':  # the path for databases without ON CONFLICT
+        monkeypatch.setattr(migrations, '_upsert', lambda engine, table: None)
+    return migrate_games
+
+
+def test_migration_is_idempotent(engine, migrate):
+    assert migrate(engine, GAMES, batch_size=2) == 3
+    first = db_rows(engine)
+    assert first[0]['Alpha'] == ('alpha.html', 'a.png', 1, 2, 10)
+    assert first[0]['Gamma'] == ('gamma.html', '', 0, 0, 0)
+    assert [link for link in first[1] if link[0] == 'Beta'] == [('Beta', 'puzzle', 0), ('Beta', 'arcade', 1)]
+
+    assert migrate(engine, GAMES, batch_size=2) == 3
+    assert db_rows(engine) == first
+    assert db_version(engine) == 0
+    with engine.connect() as conn:
+        assert conn.execute(select(Tag.__table__.c.name).order_by(Tag.__table__.c.name)).scalars().all() == \
+            ['arcade', 'puzzle', 'retro']
+
+
+def test_migration_updates_games_but_keeps_counters(engine, migrate):
+    migrate(engine, GAMES)
+    catalog = SQLCatalog(engine)
+    catalog.increment('Alpha', 'Plays', 4)
+    assert catalog.flush()
+
+    changed = dict(GAMES, Alpha=dict(GAMES['Alpha'], Location='alpha2.html', Plays=0, Tags=['retro']))
+    migrate(engine, changed)
+    rows, links = db_rows(engine)
+    assert rows['Alpha'] == ('alpha2.html', 'a.png', 1, 2, 14)
+    assert [link for link in links if link[0] == 'Alpha'] == [('Alpha', 'retro', 0)]
+
+
+def test_flush_increments_atomically(engine):
+    migrate_games(engine, GAMES)
+    # Two workers sharing the database
+    first = SQLCatalog(engine, reload_check_interval=0)
+    second = SQLCatalog(engine, reload_check_interval=0)
+    assert first.get('Alpha')['Tags'] == ['arcade', 'retro']
+
+    first.increment('Alpha', 'Plays', 3)
+    first.increment('Beta', 'Likes')
+    second.increment('Alpha', 'Plays', 2)
+    second.increment('Alpha', 'Favorites', -1)
+    assert first.flush() and second.flush()
+
+    rows, _ = db_rows(engine)
+    assert rows['Alpha'][2:] == (1, 1, 15)  # neither worker overwrote the other's increments
+    assert rows['Beta'][2:] == (1, 0, 5)
+    assert db_version(engine) == 2
+
+    # The first worker sees a version it did not write and reloads
+    assert first.get('Alpha')['Plays'] == 15 and first.get('Alpha')['Favorites'] == 1
+    assert second.get('Alpha')['Plays'] == 15
+
+    # Nothing pending: no UPDATE and no version bump
+    assert first.flush() and second.flush()
+    assert db_version(engine) == 2
+
+    second.increment('Gamma', 'Plays')
+    assert second.flush()
+    assert db_version(engine) == 3 and db_rows(engine)[0]['Gamma'][4] == 1
+    assert first.get('Gamma')['Plays'] == 1
+
+
+def test_failed_flush_keeps_the_deltas(engine):
+    migrate_games(engine, GAMES)
+    catalog = SQLCatalog(engine)
+    catalog.increment('Beta', 'Plays', 7)
+    with engine.begin() as conn:
+        conn.exec_driver_sql('ALTER TABLE games RENAME TO games_away')
+    assert not catalog.flush()
+    assert catalog.get('Beta')['Plays'] == 12
+    with engine.begin() as conn:
+        conn.exec_driver_sql('ALTER TABLE games_away RENAME TO games')
+    assert catalog.flush()
+    assert db_rows(engine)[0]['Beta'][4] == 12 and db_version(engine) == 1
@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+
+from tests.standin import StandInOrigin, load_sub_server
+
+aiohttp = pytest.importorskip('aiohttp')
+from aiohttp import web  # noqa: E402
+
+CSS = b'.tile { background: url(img/tile.png); }\n' * 50
+LARGE = bytes(range(256)) * 4096 * 4  # 4 MiB
+
+
+@pytest.fixture(scope='module')
+def fluxify():
+    return load_sub_server('fluxify')
+
+
+@pytest.fixture(scope='module')
+def async_server(fluxify):
+    import server_fluxify.async_server as async_server
+    return async_server
+
+
+@pytest.fixture
+def origin(fluxify, monkeypatch):
+    monkeypatch.setattr(fluxify, 'response_cache', fluxify.ResponseCache(max_bytes=0))
+    routes = {
+        '/style.css': (200, {'Content-Type': 'text/css'}, CSS),
+        '/big.bin': (200, {'Content-Type': 'application/octet-stream'}, LARGE),
+        '/gone': (410, {'Content-Type': 'text/plain'}, b'gone'),
+    }
+    with StandInOrigin(routes) as origin:
+        yield origin
+
+
+def serve(async_server, check, **options):
+    """Run ``check(session, base_url)`` against the async app on an ephemeral port"""
+    async def run():
+        runner = web.AppRunner(async_server.create_app(**options))
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        try:
+            async with aiohttp.ClientSession() as session:
+                return await check(session, f'http://127.0.0.1:{port}/other/fluxify')
+        finally:
+            await runner.cleanup()
+    return asyncio.run(run())
+
+
+def test_bodies_match_the_threaded_app(fluxify, async_server, origin):
+    client = fluxify.app.test_client()
+
+    async def check(session, base):
+        for path in ('/style.css', '/big.bin', '/gone'):
+            encoded = fluxify.encode_url(origin.url + path)
+            threaded = client.get('/go/' + encoded)
+            async with session.get(f'{base}/go/{encoded}') as resp:
+                assert resp.status == threaded.status_code, path
+                assert await resp.read() == threaded.data, path
+                assert resp.headers['Content-Type'] == threaded.headers['Content-Type'], path
+        async with session.get(f'{base}/go/not-base64!') as resp:
+            assert resp.status == 400
+        async with session.get(f'{base}/') as resp:  # the Flask app answers the other routes
+            assert resp.status == 200 and 'Fluxify' in await resp.text()
+        async with session.get(f'{base}/cache/stats') as resp:
+            assert 'url_rewrites' in await resp.json()
+
+    serve(async_server, check)
+    assert b'/other/fluxify/go/' in client.get('/go/' + fluxify.encode_url(origin.url + '/style.css')).data
+
+
+def test_origin_concurrency_is_bounded(fluxify, async_server, origin):
+    origin.delay = 0.3
+    path = '/go/' + fluxify.encode_url(origin.url + '/style.css')
+
+    async def check(session, base):
+        async def fetch():
+            async with session.get(base + path) as resp:
+                await resp.read()
+                return resp.status, resp.headers.get('Retry-After')
+        return await asyncio.gather(*[fetch() for _ in range(6)])
+
+    results = serve(async_server, check, per_origin=2, max_waiting=2, queue_timeout=5)
+    # Two in flight and two waiting; the rest are turned away at once
+    assert sorted(results) == [(200, None)] * 4 + [(503, '1')] * 2
+    assert origin.connections <= 2
+
+    results = serve(async_server, check, per_origin=2, max_waiting=10, queue_timeout=0.1)
+    assert sorted(results) == [(200, None)] * 2 + [(503, '1')] * 4  # waited too long
+
+
+def test_slow_clients_hold_back_upstream_reads(fluxify, async_server, origin):
+    path = '/go/' + fluxify.encode_url(origin.url + '/big.bin')
+
+    async def check(session, base):
+        async with session.get(base + path) as resp:
+            first = await resp.content.readexactly(64 * 1024)
+            await asyncio.sleep(0.2)  # read nothing; the server must not buffer the rest
+            rest = await resp.content.read()
+        return first + rest
+
+    assert serve(async_server, check) == LARGE
@@ -0,0 +1,177 @@
+import os
+
+import pytest
+
+from tests.standin import StandInOrigin, load_sub_server
+
+CSS = b'body { color: red; }\n'
+
+
+@pytest.fixture(scope='module')
+def fluxify():
+    return load_sub_server('fluxify')
+
+
+@pytest.fixture(scope='module')
+def cache_module(fluxify):
+    import server_fluxify.cache as cache_module
+    return cache_module
+
+
+def entry(cache_module, body=b'', headers=None, request_headers=None, now=1000.0):
+    made = cache_module.CacheEntry.from_response(200, 'text/css', headers or {'Cache-Control': 'max-age=60'},
+                                                 request_headers or {}, now=now)
+    made.body = body
+    return made
+
+
+# -- CacheEntry and the storage rules ----------------------------------------
+
+def test_freshness_and_refresh(cache_module):
+    stored = entry(cache_module, headers={'Cache-Control': 'max-age=60', 'ETag': '"v1"'})
+    assert stored.is_fresh(now=1059) and not stored.is_fresh(now=1061)
+    assert stored.validators() == {'If-None-Match': '"v1"'}
+
+    refreshed = stored.refreshed({'Cache-Control': 'max-age=30'}, now=1100)
+    assert refreshed.is_fresh(now=1129) and not refreshed.is_fresh(now=1131)
+    assert refreshed.headers['ETag'] == '"v1"' and refreshed.body == stored.body
+    assert not stored.is_fresh(now=1100)  # the original is left alone
+
+
+@pytest.mark.parametrize('headers, storable', [
+    ({}, True),
+    ({'Cache-Control': 'public, max-age=60'}, True),
+    ({'Cache-Control': 'no-store'}, False),
+    ({'Cache-Control': 'private, max-age=60'}, False),
+    ({'Set-Cookie': 'session=1'}, False),
+    ({'Vary': '*'}, False),
+    ({'Cache-Control': 'no-cache'}, False),
+    ({'Cache-Control': 'no-cache', 'ETag': '"v1"'}, True),
+])
+def test_storable(cache_module, headers, storable):
+    assert cache_module.is_storable(200, headers) is storable
+
+
+def test_request_directives(cache_module):
+    assert cache_module.request_wants_revalidation({'Cache-Control': 'no-cache'})
+    assert cache_module.request_wants_revalidation({'Cache-Control': 'max-age=0'})
+    assert cache_module.request_wants_revalidation({'Pragma': 'no-cache'})
+    assert not cache_module.request_wants_revalidation({'Cache-Control': 'max-age=5'})
+    assert cache_module.request_bypasses_cache({'Cache-Control': 'no-store'})
+
+
+def test_vary_selects_the_variant(cache_module):
+    stored = entry(cache_module, headers={'Cache-Control': 'max-age=60', 'Vary': 'Accept-Language, Accept-Encoding'},
+                   request_headers={'Accept-Language': 'en'})
+    assert stored.matches({'Accept-Language': 'en', 'Accept-Encoding': 'br'})
+    assert not stored.matches({'Accept-Language': 'fr'})
+
+
+# -- ResponseCache ------------------------------------------------------------
+
+def test_lru_eviction_is_bounded_by_bytes(cache_module):
+    size = cache_module.ENTRY_OVERHEAD + 100
+    cache = cache_module.ResponseCache(max_bytes=3 * size, max_entry_bytes=2 * size)
+    for key in 'abc':
+        cache.put(key, entry(cache_module, b'x' * 100))
+    assert cache.get('a') is not None  # now the most recently used
+    cache.put('d', entry(cache_module, b'x' * 100))
+    assert cache.get('b') is None
+    assert all(cache.get(key) is not None for key in 'acd')
+
+    cache.put('e', entry(cache_module, b'x' * (size + 100)))  # evicts two to fit
+    stats = cache.stats()
+    assert stats['bytes'] <= 3 * size and stats['evictions'] == 3
+    cache.put('f', entry(cache_module, b'x' * 3 * size))
+    assert cache.get('f') is None and cache.stats()['too_large'] == 1
+
+
+def test_disk_tier_round_trip(cache_module, tmp_path):
+    stored = entry(cache_module, b'\x00body\n' * 10, headers={'Cache-Control': 'max-age=60', 'ETag': '"v1"',
+                                                          'Vary': 'Accept'}, request_headers={'Accept': 'text/css'})
+    cache = cache_module.ResponseCache(disk_dir=str(tmp_path))
+    cache.put('k', stored)
+    assert len(os.listdir(tmp_path)) == 1
+
+    restarted = cache_module.ResponseCache(disk_dir=str(tmp_path))
+    loaded = restarted.get('k')
+    assert {name: getattr(loaded, name) for name in cache_module.CacheEntry.__slots__} == \
+        {name: getattr(stored, name) for name in cache_module.CacheEntry.__slots__}
+    assert restarted.stats()['disk_hits'] == 1 and restarted.get('missing') is None
+
+    path = os.path.join(tmp_path, os.listdir(tmp_path)[0])
+    with open(path, 'wb') as f:
+        f.write(b'not json\n')
+    assert cache_module.ResponseCache(disk_dir=str(tmp_path)).get('k') is None
+    assert not os.path.exists(path)  # unreadable files are dropped
+
+
+def test_disk_tier_is_bounded(cache_module, tmp_path):
+    size = len(entry(cache_module, b'x' * 1000).dumps())
+    cache = cache_module.ResponseCache(disk_dir=str(tmp_path), disk_max_bytes=2 * size)
+    for key in 'abc':
+        cache.put(key, entry(cache_module, b'x' * 1000))
+    assert len(os.listdir(tmp_path)) == 2 and cache.stats()['disk_evictions'] == 1
+    assert cache_module.ResponseCache(disk_dir=str(tmp_path)).get('a') is None
+
+
+# -- Through the /go/ route ---------------------------------------------------
+
+@pytest.fixture
+def origin():
+    routes = {
+        '/fresh.css': (200, {'Content-Type': 'text/css', 'Cache-Control': 'max-age=60'}, CSS),
+        '/stale.css': (200, {'Content-Type': 'text/css', 'Cache-Control': 'max-age=0', 'ETag': '"v1"'}, CSS),
+        '/no-store.css': (200, {'Content-Type': 'text/css', 'Cache-Control': 'no-store'}, CSS),
+        '/private.css': (200, {'Content-Type': 'text/css', 'Cache-Control': 'private, max-age=60'}, CSS),
+    }
+    with StandInOrigin(routes) as origin:
+        yield origin
+
+
+@pytest.fixture
+def client(fluxify, monkeypatch):
+    monkeypatch.setattr(fluxify, 'response_cache', fluxify.ResponseCache())
+    return fluxify.app.test_client()
+
+
+def fetch(fluxify, client, url, **headers):
+    resp = client.get('/go/' + fluxify.encode_url(url), headers=headers)
+    assert resp.status_code == 200 and resp.data.startswith(b'body')
+    return resp.headers['X-Fluxify-Cache']
+
+
+def test_fresh_hit(fluxify, origin, client):
+    url = origin.url + '/fresh.css'
+    assert [fetch(fluxify, client, url) for _ in range(3)] == ['MISS', 'HIT', 'HIT']
+    assert origin.requests == 1
+
+
+def test_stale_hit_is_revalidated(fluxify, origin, client):
+    url = origin.url + '/stale.css'
+    assert fetch(fluxify, client, url) == 'MISS'
+    assert fetch(fluxify, client, url) == 'REVALIDATED'
+    assert origin.requests == 2 and origin.not_modified == 1
+
+    # The 304's headers replace the stored ones: now it is fresh for a minute
+    origin.routes['/stale.css'][1]['Cache-Control'] = 'max-age=60'
+    assert fetch(fluxify, client, url) == 'REVALIDATED'
+    assert fetch(fluxify, client, url) == 'HIT'
+    assert origin.requests == 3 and origin.not_modified == 2
+
+
+@pytest.mark.parametrize('path', ['/no-store.css', '/private.css'])
+def test_uncacheable_responses_are_not_stored(fluxify, origin, client, path):
+    assert [fetch(fluxify, client, origin.url + path) for _ in range(2)] == ['MISS', 'MISS']
+    assert origin.requests == 2 and fluxify.response_cache.stats()['entries'] == 0
+
+
+def test_request_no_cache_forces_revalidation(fluxify, origin, client):
+    origin.routes['/fresh.css'][1]['ETag'] = '"v1"'
+    url = origin.url + '/fresh.css'
+    assert fetch(fluxify, client, url) == 'MISS'
+    assert fetch(fluxify, client, url, **{'Cache-Control': 'no-cache'}) == 'REVALIDATED'
+    assert fetch(fluxify, client, url, Pragma='no-cache') == 'REVALIDATED'
+    assert fetch(fluxify, client, url) == 'HIT'
+    assert origin.requests == 3 and origin.not_modified == 2
+    assert fetch(fluxify, client, url, **{'Cache-Control': 'no-store'}) == 'BYPASS'
@@ -0,0 +1,104 @@
+import sys
+import tracemalloc
+
+import pytest
+
+from tests.standin import StandInOrigin, load_sub_server
+
+SMALL = b'body { color: red; }\n' * 64
+LARGE = bytes(range(256)) * (4096 * 8)  # 8 MiB
+
+
+def echo_user_agent(handler):
+    return handler.headers.get('User-Agent', '').encode()
+
+
+@pytest.fixture(scope='module')
+def fluxify():
+    return load_sub_server('fluxify')
+
+
+@pytest.fixture
+def origin():
+    routes = {
+        '/style.css': (200, {'Content-Type': 'text/css'}, SMALL),
+        '/big.bin': (200, {'Content-Type': 'application/octet-stream'}, LARGE),
+        '/agent.bin': (200, {'Content-Type': 'application/octet-stream'}, echo_user_agent),
+        '/gone.bin': (410, {'Content-Type': 'application/octet-stream'}, b'gone'),
+    }
+    with StandInOrigin(routes) as origin:
+        yield origin
+
+
+@pytest.fixture
+def client(fluxify, monkeypatch):
+    # Every request goes to the origin, on a fresh pool
+    monkeypatch.setattr(fluxify, 'response_cache', fluxify.ResponseCache(max_bytes=0))
+    monkeypatch.setattr(fluxify, '_session', None)
+    return fluxify.app.test_client()
+
+
+def go(fluxify, url):
+    return '/go/' + fluxify.encode_url(url)
+
+
+def test_bodies_match_the_origin(fluxify, origin, client):
+    resp = client.get(go(fluxify, origin.url + '/big.bin'))
+    assert resp.status_code == 200 and resp.data == LARGE
+    assert resp.headers['Content-Type'] == 'application/octet-stream'
+    resp = client.get(go(fluxify, origin.url + '/gone.bin'))
+    assert resp.status_code == 410 and resp.data == b'gone'
+
+
+def test_request_headers_are_forwarded(fluxify, origin, client):
+    resp = client.get(go(fluxify, origin.url + '/agent.bin'), headers={'User-Agent': 'fluxify-test/1'})
+    assert resp.data == b'fluxify-test/1'
+
+
+def test_connections_are_pooled(fluxify, origin, client):
+    path = go(fluxify, origin.url + '/style.css')
+    for _ in range(20):
+        resp = client.get(path, buffered=False)
+        assert b''.join(resp.response).startswith(b'body')
+        resp.close()
+    assert origin.requests == 20
+    assert origin.connections == 1  # each drained response hands its connection back
+
+
+def test_large_body_is_streamed(fluxify, origin, client):
+    resp = client.get(go(fluxify, origin.url + '/big.bin'), buffered=False)
+    tracemalloc.start()
+    try:
+        size = sum(len(chunk) for chunk in resp.response)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        resp.close()
+    assert size == len(LARGE)
+    assert peak < len(LARGE) // 8, peak
+
+
+def test_bad_and_unreachable_urls(fluxify, origin, client):
+    assert client.get('/go/not-base64!').status_code == 400
+    origin_url = origin.url
+    origin.__exit__(None, None, None)  # nothing listens there any more
+    resp = client.get(go(fluxify, origin_url + '/style.css'))
+    assert resp.status_code == 500 and b'Error accessing URL' in resp.data
+
+
+def test_loaded_as_a_package(fluxify):
+    assert fluxify.__name__ == 'server_fluxify.main'
+    assert fluxify.ResponseCache is sys.modules['server_fluxify.cache'].ResponseCache
+    assert not {'cache', 'urls', 'rewrite'} & set(sys.modules)
+
+
+def test_injected_links_use_the_public_prefix(fluxify, origin, client):
+    from server_fluxify.rewrite import injected_script
+    assert "const prefix = \"/p/go/\";" in injected_script('/p/go/')
+    assert '</script>' not in injected_script('/p</script>/')
+
+    prefix = fluxify.PUBLIC_PREFIX
+    assert f'window.location.href = "{prefix}" + btoa(url)' in client.get('/').get_data(as_text=True)
+    origin.routes['/page.html'] = (200, {'Content-Type': 'text/html'}, b'<html><body><a href="/x">x</a></body></html>')
+    page = client.get(go(fluxify, origin.url + '/page.html')).get_data(as_text=True)
+    assert f'href="{prefix}' in page and f'const prefix = "{prefix}";' in page
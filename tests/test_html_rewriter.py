@@ -0,0 +1,54 @@
+import os
+import glob
+import random
+
+import pytest
+
+from tests.standin import REPO_ROOT, load_sub_server
+
+pytest.importorskip('bs4')
+from tests.soup_reference import rewrite_html_soup  # noqa: E402
+
+FIXTURES = sorted(glob.glob(os.path.join(REPO_ROOT, 'benchmarks', 'fixtures', 'html', '*.html')))
+BASE_URL = 'https://example.com/dir/page.html'
+CARDS = ''.join(
+    f'<div class="card" style="background-image: url(/thumbs/{i}.jpg)">'
+    f'<a href="/item/{i}?ref=list&amp;p={i}"><img src="img/{i}.png" srcset="/img/{i}-1x.png 1x, /img/{i}-2x.png 2x" '
+    f'alt="Item {i} &mdash; &pound;{i}"></a><p>Item&nbsp;{i} &lt;new&gt;</p></div>\n'
+    for i in range(40))
+PAGES = {os.path.basename(path): open(path, encoding='utf-8').read() for path in FIXTURES}
+PAGES['cards'] = (f'<!DOCTYPE html>\n<html><head><style>body {{ background: url("bg.png") }}</style></head>'
+                  f'<body>{CARDS}<form action="/search"><input name="q"></form></body></html>\n')
+
+
+@pytest.fixture(scope='module')
+def fluxify():
+    return load_sub_server('fluxify')
+
+
+def chunks(text, rng, max_size):
+    i = 0
+    while i < len(text):
+        size = rng.randint(1, max_size)
+        yield text[i:i + size]
+        i += size
+
+
+@pytest.mark.parametrize('name', sorted(PAGES))
+def test_streaming_rewriter_matches_soup(fluxify, name):
+    from server_fluxify.rewrite import rewrite_html_stream
+    page = PAGES[name]
+    expected = rewrite_html_soup(fluxify, page, BASE_URL)
+    assert '/go/' in expected
+
+    def rewrite(pieces):
+        return ''.join(rewrite_html_stream(pieces, BASE_URL, fluxify.rewrite_url, fluxify.INJECTED_SCRIPT))
+
+    assert rewrite([page]) == expected
+    for seed in range(20):
+        rng = random.Random(seed)
+        assert rewrite(chunks(page, rng, rng.choice([1, 7, 64, 4096]))) == expected, seed
+
+
+def test_fixtures_are_present():
+    assert len(FIXTURES) >= 4
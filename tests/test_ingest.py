@@ -0,0 +1,103 @@
+import json
+
+import pytest
+
+from catalog import GameCatalog
+from ingest import EventIngestor, BatchError
+from profiles import ProfileStore
+from shared_state import LocalState, SQLiteState
+
+
+@pytest.fixture(params=['local', 'sqlite'])
+def shared(request, tmp_path):
+    state = LocalState() if request.param == 'local' else SQLiteState(str(tmp_path / 'state.db'))
+    yield state
+    state.close()
+
+
+@pytest.fixture
+def ingestor(tmp_path, shared):
+    path = tmp_path / 'games.json'
+    path.write_text(json.dumps({'games': {name: {'Location': f'{name}.html', 'Plays': 0, 'Likes': 0}
+                                          for name in ('Alpha', 'Beta')}}))
+    catalog = GameCatalog(str(path))
+    profiles = ProfileStore(f"sqlite:///{tmp_path / 'profiles.db'}")
+    return EventIngestor(catalog, profiles, shared)
+
+
+def plays(ingestor, name):
+    return ingestor.catalog.get(name)['Plays']
+
+
+def test_duplicates_are_scoped_per_client(ingestor):
+    batch = [{'id': 'a', 'game': 'Alpha', 'action': 'play'}, {'id': 'a', 'game': 'Alpha', 'action': 'play'},
+             {'id': 'b', 'game': 'Beta', 'action': 'like'}]
+    assert ingestor.ingest(batch, 'client-1', machine_id='machine_1')['duplicates'] == ['a']
+    assert ingestor.ingest(batch, 'client-1')['duplicates'] == ['a', 'a', 'b']
+    # Another client generating the same ids is not deduplicated against the first
+    assert ingestor.ingest(batch, 'client-2')['accepted'] == [('play', 'Alpha'), ('like', 'Beta')]
+    assert plays(ingestor, 'Alpha') == 2 and ingestor.catalog.get('Beta')['Likes'] == 2
+    assert ingestor.profiles.get('machine_1') == {'played': ['Alpha'], 'likes': ['Beta'], 'favorites': []}
+
+
+def test_invalid_batch_applies_nothing(ingestor):
+    batch = [{'id': 'a', 'game': 'Alpha', 'action': 'play'}, {'id': 'b', 'game': 'Nope', 'action': 'play'},
+             {'id': 'c', 'game': 'Beta', 'action': 'dislike'}, 'x']
+    with pytest.raises(BatchError) as error:
+        ingestor.ingest(batch, 'client-1')
+    assert [e['index'] for e in error.value.errors] == [1, 2, 3]
+    assert plays(ingestor, 'Alpha') == 0
+    assert ingestor.ingest(batch[:1], 'client-1')['accepted'] == [('play', 'Alpha')]  # 'a' was not claimed
+    with pytest.raises(BatchError):
+        ingestor.ingest(batch[:1], '')
+    with pytest.raises(BatchError):
+        ingestor.ingest([batch[0]] * (ingestor.max_batch + 1), 'client-1')
+
+
+def test_failed_apply_releases_claims(ingestor, monkeypatch):
+    batch = [{'id': 'a', 'game': 'Alpha', 'action': 'play'}]
+
+    def broken(*args, **kwargs):
+        raise RuntimeError('disk full')
+
+    monkeypatch.setattr(ingestor.catalog, 'increment_many', broken)
+    with pytest.raises(RuntimeError):
+        ingestor.ingest(batch, 'client-1', machine_id='machine_1')
+    monkeypatch.undo()
+    # The retry is applied, not reported as a duplicate
+    assert ingestor.ingest(batch, 'client-1', machine_id='machine_1')['accepted'] == [('play', 'Alpha')]
+    assert plays(ingestor, 'Alpha') == 1
+    assert ingestor.profiles.get('machine_1')['played'] == ['Alpha']
+
+
+def test_claims_expire(shared):
+    assert shared.claim('k', ['x', 'y', 'x'], ttl=60) == ['x', 'y']
+    assert shared.claim('k', ['x', 'z'], ttl=60) == ['z']
+    shared.release('k', ['x'])
+    assert shared.claim('k', ['x'], ttl=0) == ['x']
+    assert shared.claim('k', ['x'], ttl=60) == ['x']  # the 0 s claim has already expired
+
+
+def test_socket_ack_says_which_batches_to_resend(app_module, monkeypatch):
+    game = next(iter(app_module.catalog.games()))
+    client = app_module.socketio.test_client(app_module.app)
+    batch = {'client': 'ack-test', 'events': [{'id': 'k1', 'game': game, 'action': 'like'}]}
+    before = app_module.catalog.get(game)['Likes']
+
+    ack = client.emit('game_actions', {'client': 'ack-test', 'events': [{'id': 'k0', 'action': 'dance'}]},
+                      callback=True)
+    assert ack['success'] is False and 'retry' not in ack and ack['errors']  # invalid: drop it
+
+    def broken(*args, **kwargs):
+        raise RuntimeError('database is locked')
+
+    monkeypatch.setattr(app_module.ingestor, 'ingest', broken)
+    ack = client.emit('game_actions', batch, callback=True)
+    assert ack == {'success': False, 'error': 'Could not apply the batch', 'retry': True}
+    monkeypatch.undo()
+
+    # The resent batch counts once
+    assert client.emit('game_actions', batch, callback=True)['accepted'] == 1
+    assert client.emit('game_actions', batch, callback=True)['duplicates'] == ['k1']
+    assert app_module.catalog.get(game)['Likes'] == before + 1
+    client.disconnect()
@@ -0,0 +1,99 @@
+import os
+import random
+
+import pytest
+
+from journal import EventJournal, SEGMENT_PREFIX, SNAPSHOT_PREFIX, _numbered
+
+FIELDS = ('plays', 'likes', 'favorites')
+
+
+def events(count, seed=3):
+    rng = random.Random(seed)
+    return [(f'game-{rng.randrange(20)}', rng.choice(FIELDS), rng.choice([1, 1, 1, -1, 5])) for _ in range(count)]
+
+
+def totals_of(evts, start=None):
+    totals = dict(start or {})
+    for game, field, amount in evts:
+        totals[(game, field)] = totals.get((game, field), 0) + amount
+    return totals
+
+
+def write(journal, evts, batch=7):
+    for i in range(0, len(evts), batch):
+        journal.append_many(evts[i:i + batch])
+        journal.sync()
+
+
+def last_segment(directory):
+    return os.path.join(directory, _numbered(directory, SEGMENT_PREFIX, '.log')[-1][1])
+
+
+def test_empty_journal_recovers_to_none(tmp_path):
+    assert EventJournal(str(tmp_path)).recover() is None
+
+
+@pytest.mark.parametrize('tail', [b'[41,1700000000.0,"game-1","pl', b'[41,1700000000.0,"game-1","plays",1,null]'])
+def test_torn_tail_is_cut_off(tmp_path, tail):
+    evts = events(40)
+    journal = EventJournal(str(tmp_path))
+    journal.seed({('game-1', 'plays'): 100})
+    write(journal, evts)
+    journal.close()
+    path = last_segment(tmp_path)
+    size = os.path.getsize(path)
+    with open(path, 'ab') as f:
+        f.write(tail)  # a crash mid-write, without the newline
+
+    recovered = EventJournal(str(tmp_path))
+    expected = totals_of(evts, {('game-1', 'plays'): 100})
+    assert recovered.recover() == expected
+    assert recovered.seq == 40 and recovered.snapshot_seq == 0
+    assert os.path.getsize(path) == size
+
+    # Appends after recovery carry on from seq 41 and replay cleanly
+    write(recovered, events(5, seed=4))
+    recovered.close()
+    again = EventJournal(str(tmp_path))
+    assert again.recover() == totals_of(events(5, seed=4), expected)
+    assert again.seq == 45
+    assert [event['seq'] for event in again.replay()] == list(range(1, 46))
+
+
+def test_compaction_matches_a_full_replay(tmp_path):
+    evts = events(500)
+    full = EventJournal(str(tmp_path / 'full'), snapshot_every=10 ** 9)
+    compacted = EventJournal(str(tmp_path / 'compacted'), snapshot_every=60, segment_bytes=512)
+    retained = EventJournal(str(tmp_path / 'retained'), snapshot_every=60, retain_segments=True)
+    for journal in (full, compacted, retained):
+        journal.seed({})
+        write(journal, evts)
+        journal.close()
+
+    expected = totals_of(evts)
+    states = []
+    for journal in (full, compacted, retained):
+        recovered = EventJournal(journal.directory)
+        states.append((recovered.recover(), recovered.seq))
+    assert states == [(expected, 500)] * 3
+
+    # Compaction left one snapshot and only the segments after it
+    snapshots = _numbered(compacted.directory, SNAPSHOT_PREFIX, '.json')
+    assert len(snapshots) == 1 and snapshots[0][0] > 0
+    assert all(first > snapshots[0][0] for first, _ in _numbered(compacted.directory, SEGMENT_PREFIX, '.log'))
+    # Retained segments still replay every event
+    assert totals_of((e['game'], e['field'], e['amount']) for e in retained.replay()) == expected
+
+
+def test_compaction_then_more_events(tmp_path):
+    journal = EventJournal(str(tmp_path), snapshot_every=10 ** 9)
+    journal.seed({('game-0', 'likes'): 3})
+    write(journal, events(50))
+    journal.compact()
+    write(journal, events(30, seed=9))
+    journal.close()
+
+    recovered = EventJournal(str(tmp_path))
+    assert recovered.recover() == totals_of(events(30, seed=9), totals_of(events(50), {('game-0', 'likes'): 3}))
+    assert (recovered.seq, recovered.snapshot_seq) == (80, 50)
@@ -0,0 +1,139 @@
+import random
+
+import pytest
+
+from leaderboard import Leaderboards, SlidingWindow, TopK
+
+WINDOWS = {'1m': (10, 6)}  # six 10-second buckets
+
+
+class StandInCatalog:
+    def __init__(self, games):
+        self.games = games
+        self.generation_count = 1
+
+    def generation(self):
+        return self.generation_count
+
+    def games_with_totals(self):
+        return self.games, {}
+
+
+class RecordingSocketIO:
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, event, payload, to=None):
+        self.emitted.append((event, payload, to))
+
+
+@pytest.fixture
+def boards():
+    catalog = StandInCatalog({name: {'Plays': plays, 'Likes': 0, 'Favorites': 0}
+                              for name, plays in [('alpha', 30), ('beta', 20), ('gamma', 10)]})
+    socketio = RecordingSocketIO()
+    return Leaderboards(catalog, socketio, push_n=3, windows=WINDOWS, clock=lambda: 0.0), socketio
+
+
+def names(ranking):
+    return [name for name, _ in ranking]
+
+
+def test_no_emit_when_the_ranking_is_unchanged(boards):
+    leaderboards, socketio = boards
+    assert names(leaderboards.top('plays')) == ['alpha', 'beta', 'gamma']
+
+    changed = leaderboards.on_deltas({'alpha': {'Plays': 5}, 'beta': {'Plays': 3}, 'gamma': {'Plays': 1}}, now=1)
+    assert set(changed) == {'plays:1m', 'plays:1m:trending'}  # the windows were empty; all-time kept its order
+    assert leaderboards.top('plays') == [('alpha', 35), ('beta', 23), ('gamma', 11)]
+    assert len(socketio.emitted) == 1
+
+    # Same order everywhere: scores moved, nothing is pushed
+    assert leaderboards.on_deltas({'alpha': {'Plays': 2}, 'beta': {'Plays': 1}}, now=2) == {}
+    assert leaderboards.on_deltas({}, now=3) == {}
+    assert len(socketio.emitted) == 1 and leaderboards.emits == 1
+
+
+def test_emits_only_the_boards_that_changed(boards):
+    leaderboards, socketio = boards
+    leaderboards.on_deltas({'alpha': {'Plays': 1}, 'beta': {'Plays': 1}, 'gamma': {'Plays': 1}}, now=1)
+    changed = leaderboards.on_deltas({'gamma': {'Plays': 25}}, now=2)
+    assert set(changed) == {'plays:all', 'plays:1m', 'plays:1m:trending'}
+    event, payload, room = socketio.emitted[-1]
+    assert (event, room) == ('leaderboard_updates', 'leaderboards')
+    assert payload['boards']['plays:all'][0] == {'name': 'gamma', 'score': 36}
+    assert leaderboards.snapshot()['boards']['plays:all'] == payload['boards']['plays:all']
+
+    # A negative delta counts all-time but never in a window
+    changed = leaderboards.on_deltas({'gamma': {'Plays': -30}}, now=3)
+    assert set(changed) == {'plays:all'}
+    assert names(leaderboards.top('plays', '1m')) == ['gamma', 'alpha', 'beta']
+
+
+def test_trending_counts_age_out(boards):
+    leaderboards, socketio = boards
+    leaderboards.on_deltas({'alpha': {'Likes': 6}}, now=0)
+    leaderboards.on_deltas({'beta': {'Likes': 5}}, now=30)
+    assert leaderboards.top('likes', '1m') == [('alpha', 6), ('beta', 5)]
+    trending = dict(leaderboards.top('likes', '1m', trending=True))
+    assert trending['alpha'] == pytest.approx(6 * 0.9 ** 3) and trending['beta'] == 5
+    assert names(leaderboards.top('likes', '1m', trending=True)) == ['beta', 'alpha']  # older counts weigh less
+
+    # alpha's bucket leaves the window; the rotation alone is pushed
+    changed = leaderboards.on_deltas({}, now=65)
+    assert changed['likes:1m'] == [('beta', 5)] and names(changed['likes:1m:trending']) == ['beta']
+    assert names(leaderboards.top('likes')) == ['alpha', 'beta', 'gamma']  # all-time keeps everything
+
+    changed = leaderboards.on_deltas({}, now=1000)
+    assert changed == {'likes:1m': [], 'likes:1m:trending': []}
+    assert socketio.emitted[-1][1]['boards'] == {'likes:1m': [], 'likes:1m:trending': []}
+
+
+def test_query_rotation_is_pushed_on_the_next_tick(boards):
+    leaderboards, socketio = boards
+    leaderboards.on_deltas({'alpha': {'Favorites': 2}}, now=0)
+    leaderboards.clock = lambda: 100.0
+    assert leaderboards.top('favorites', '1m') == []  # the query rotated the window
+    assert leaderboards.on_deltas({}, now=100) == {'favorites:1m': [], 'favorites:1m:trending': []}
+
+
+def test_catalog_reload_reseeds_all_time(boards):
+    leaderboards, _ = boards
+    leaderboards.catalog.games['gamma']['Plays'] = 99
+    leaderboards.catalog.generation_count += 1
+    changed = leaderboards.on_deltas({'gamma': {'Plays': 1}}, now=1)  # already in the reloaded totals
+    assert changed['plays:all'][0] == ('gamma', 99)
+
+
+def test_unknown_board(boards):
+    leaderboards, _ = boards
+    with pytest.raises(ValueError):
+        leaderboards.top('downloads')
+    with pytest.raises(ValueError):
+        leaderboards.top('plays', '1y')
+
+
+def test_sliding_window_matches_a_recount():
+    rng = random.Random(5)
+    window = SlidingWindow(10, 6, decay=0.5, now=0, k=5)
+    events = []
+    now = 0.0
+    for _ in range(2000):
+        now += rng.random() * 3
+        name, amount = f'game-{rng.randrange(12)}', rng.randint(1, 4)
+        window.add(name, amount, now)
+        events.append((now, name, amount))
+
+        if rng.random() < 0.05:
+            start = window.head_start - 50  # the six buckets ending with the current one
+            expected, decayed = {}, {}
+            for at, n, a in events:
+                if at >= start:
+                    expected[n] = expected.get(n, 0) + a
+                    age = int((window.head_start - (at - at % 10)) // 10)
+                    decayed[n] = decayed.get(n, 0) + a * 0.5 ** age
+            assert window.totals == expected
+            assert window.decayed == pytest.approx(decayed)
+            top = TopK(5)
+            top.reset(dict(expected))
+            assert window.best(5) == top.best(5)
@@ -0,0 +1,157 @@
+import os
+import json
+import socket
+import logging
+import threading
+import http.client
+
+import pytest
+from flask import Flask
+from werkzeug.serving import make_server
+
+from node_proxy import create_node_proxy, strip_hop_by_hop
+from tests.standin import StandInOrigin, UpgradeEchoBackend
+
+
+def echo(handler):
+    return json.dumps({
+        'method': handler.command,
+        'path': handler.path,
+        'body': getattr(handler, 'request_body', b'').decode(),
+        'headers': {name.lower(): value for name, value in handler.headers.items()},
+    }).encode()
+
+
+ROUTES = {
+    '/echo': (200, {'Content-Type': 'application/json'}, echo),
+    '/cookies': (200, [('Content-Type', 'text/plain'), ('Set-Cookie', 'a=1'), ('Set-Cookie', 'b=2'),
+                       ('Keep-Alive', 'timeout=5'), ('Connection', 'keep-alive, X-Backend-Only'),
+                       ('X-Backend-Only', 'secret')], b'ok'),
+    '/moved': (302, {'Location': '/echo?from=moved'}, b''),
+}
+
+
+def write_port(root, port):
+    path = os.path.join(root, 'node', 'port.txt')
+    stamp = os.stat(path).st_mtime_ns if os.path.exists(path) else 0
+    with open(path, 'w') as f:
+        f.write(f'{port}\n')
+    os.utime(path, ns=(stamp + 10 ** 9, stamp + 10 ** 9))  # a new stamp even within one clock tick
+
+
+@pytest.fixture
+def backend():
+    with StandInOrigin(ROUTES) as origin:
+        yield origin
+
+
+@pytest.fixture
+def proxy(tmp_path, backend):
+    """(portal port, NodeProxy) for a Node.js server 'node' whose port.txt names the backend"""
+    os.makedirs(tmp_path / 'node')
+    write_port(tmp_path, backend.server.server_address[1])
+    app = Flask('node_proxy_test')
+    bp = create_node_proxy('node', root=str(tmp_path))
+    app.register_blueprint(bp)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server.server_port, bp.node_proxy
+    server.shutdown()
+
+
+def request(port, method, path, body=None, headers=None):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    try:
+        conn.request(method, path, body=body, headers=headers or {})
+        resp = conn.getresponse()
+        return resp.status, resp.getheaders(), resp.read()
+    finally:
+        conn.close()
+
+
+def test_strip_hop_by_hop():
+    headers = [('Connection', 'close, X-Private'), ('X-Private', '1'), ('Keep-Alive', '5'), ('TE', 'trailers'),
+               ('Transfer-Encoding', 'chunked'), ('Upgrade', 'h2c'), ('Content-Type', 'text/plain'), ('X-Kept', '2')]
+    assert strip_hop_by_hop(headers) == [('Content-Type', 'text/plain'), ('X-Kept', '2')]
+
+
+def test_requests_are_forwarded(proxy):
+    port, _ = proxy
+    status, _, body = request(port, 'POST', '/other/node/echo?x=1&y=two', body=b'hello=world', headers={
+        'Content-Type': 'application/x-www-form-urlencoded', 'Connection': 'keep-alive, X-Client-Only',
+        'X-Client-Only': '1', 'TE': 'trailers', 'X-Forwarded-For': '203.0.113.9'})
+    seen = json.loads(body)
+    assert status == 200 and seen['method'] == 'POST' and seen['path'] == '/echo?x=1&y=two'
+    assert seen['body'] == 'hello=world' and seen['headers']['content-length'] == '11'
+    for name in ('connection', 'x-client-only', 'te', 'transfer-encoding', 'keep-alive'):
+        assert name not in seen['headers'], name
+    assert seen['headers']['x-forwarded-for'] == '203.0.113.9, 127.0.0.1'
+    assert seen['headers']['x-forwarded-prefix'] == '/other/node'
+    for method in ('PUT', 'PATCH', 'DELETE', 'OPTIONS'):
+        status, _, body = request(port, method, '/other/node/echo')
+        assert status == 200 and json.loads(body)['method'] == method, method
+
+
+def test_responses_drop_hop_by_hop_headers(proxy):
+    port, _ = proxy
+    status, headers, body = request(port, 'GET', '/other/node/cookies')
+    names = [name.lower() for name, _ in headers]
+    assert status == 200 and body == b'ok'
+    assert [value for name, value in headers if name.lower() == 'set-cookie'] == ['a=1', 'b=2']
+    assert 'keep-alive' not in names and 'x-backend-only' not in names
+
+    status, headers, _ = request(port, 'GET', '/other/node/moved')
+    assert status == 302 and dict(headers)['Location'] == '/other/node/echo?from=moved'
+
+
+def test_port_file_is_rechecked(proxy, tmp_path, backend):
+    port, node_proxy = proxy
+    node_proxy.port.check_interval = 0
+    with StandInOrigin({'/echo': (200, {'Content-Type': 'text/plain'}, b'second backend')}) as second:
+        write_port(tmp_path, second.server.server_address[1])
+        assert request(port, 'GET', '/other/node/echo')[2] == b'second backend'
+    write_port(tmp_path, backend.server.server_address[1])
+    assert json.loads(request(port, 'GET', '/other/node/echo')[2])['path'] == '/echo'
+
+    # Nothing listening: 502 rather than an exception
+    write_port(tmp_path, second.server.server_address[1])
+    assert request(port, 'GET', '/other/node/echo')[0] == 502
+
+
+def test_port_file_is_cached_between_checks(proxy, tmp_path):
+    port, node_proxy = proxy
+    node_proxy.port.check_interval = 3600
+    node_proxy.port.get()
+    write_port(tmp_path, 1)  # not seen until the next check
+    assert request(port, 'GET', '/other/node/echo')[0] == 200
+
+
+def test_websocket_relay(proxy, tmp_path):
+    port, node_proxy = proxy
+    node_proxy.port.check_interval = 0
+    backend = UpgradeEchoBackend()
+    write_port(tmp_path, backend.port)
+    try:
+        with socket.create_connection(('127.0.0.1', port), timeout=10) as client:
+            client.sendall(b'GET /other/node/socket?room=1 HTTP/1.1\r\nHost: example\r\nUpgrade: websocket\r\n'
+                           b'Connection: Upgrade\r\nSec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n'
+                           b'Sec-WebSocket-Version: 13\r\n\r\n')
+            reply = b''
+            while b'\r\n\r\n' not in reply:
+                reply += client.recv(4096)
+            assert reply.startswith(b'HTTP/1.1 101')
+            for message in (b'ping', b'x' * 200000):
+                client.sendall(message)
+                echoed = b''
+                while len(echoed) < len(message):
+                    echoed += client.recv(65536)
+                assert echoed == message
+    finally:
+        backend.close()
+    head = backend.request.decode('latin-1').split('\r\n')
+    assert head[0] == 'GET /socket?room=1 HTTP/1.1'
+    forwarded = {name.lower(): value for name, value in (line.split(': ', 1) for line in head[1:] if line)}
+    assert forwarded['upgrade'] == 'websocket' and forwarded['connection'] == 'Upgrade'
+    assert forwarded['sec-websocket-key'] == 'dGhlIHNhbXBsZSBub25jZQ=='
+    assert forwarded['x-forwarded-prefix'] == '/other/node'
@@ -0,0 +1,76 @@
+import pytest
+
+from presence import PresenceTracker, decode_cursor, encode_cursor
+from shared_state import LocalState, SQLiteState
+
+
+@pytest.fixture(params=['local', 'sqlite'])
+def shared(request, tmp_path):
+    state = LocalState() if request.param == 'local' else SQLiteState(str(tmp_path / 'state.db'))
+    yield state
+    state.close()
+
+
+def walk(presence, limit):
+    players, cursor, pages = [], None, 0
+    while True:
+        page, cursor = presence.players(cursor, limit)
+        players.extend(page)
+        pages += 1
+        if cursor is None:
+            return players, pages
+
+
+def test_pages_cover_every_player_once(shared):
+    presence = PresenceTracker(shared)
+    for number in range(250):
+        presence.join(f'sid-{number:04d}', f'machine_{number}', 'Alpha' if number % 2 else 'Beta')
+    for number in range(0, 250, 10):
+        presence.leave(f'sid-{number:04d}')
+    players, pages = walk(presence, 40)
+    assert sorted(player['machine_id'] for player in players) == sorted(
+        f'machine_{number}' for number in range(250) if number % 10)
+    assert pages == 6
+    assert walk(presence, 225) == (players, 1)
+    assert presence.counts() == {'Alpha': 125, 'Beta': 100}
+
+
+def test_hscan_is_keyset_paged(shared):
+    for field in ('c', 'a', 'd', 'b'):
+        shared.hset('h', field, field.upper())
+    assert shared.hscan('h', None, 2) == ({'a': 'A', 'b': 'B'}, 'b')
+    shared.hdel('h', 'a', 'b', 'missing')
+    shared.hset('h', 'bb', 'BB')  # after the cursor: still reached
+    assert shared.hscan('h', 'b', 2) == ({'bb': 'BB', 'c': 'C'}, 'c')
+    assert shared.hscan('h', 'c', 2) == ({'d': 'D'}, None)
+    with pytest.raises(ValueError):
+        shared.hscan('h', 5, 2)
+
+
+@pytest.mark.parametrize('cursor', ['abc', '-5', '0', encode_cursor(5)[:-2], 'W10', 'WzVd'])
+def test_bad_cursors_are_rejected(cursor):
+    with pytest.raises(ValueError):
+        PresenceTracker(LocalState()).players(cursor, 10)
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor('sid-1')) == 'sid-1'
+
+
+def test_view_rejects_bad_cursors(app_module):
+    client = app_module.app.test_client()
+    for cursor in ('abc', '-5'):
+        resp = client.get(f'/active-players?cursor={cursor}&format=json')
+        assert resp.status_code == 400 and resp.get_json() == {'error': 'invalid cursor'}
+    assert client.get('/active-players?cursor=abc').status_code == 400
+
+    for number in range(3):
+        app_module.presence.join(f'test-sid-{number}', f'machine_{number}', 'Alpha')
+    try:
+        first = client.get('/active-players?limit=2&format=json').get_json()
+        assert len(first['players']) == 2 and first['next_cursor']
+        rest = client.get(f"/active-players?limit=2&format=json&cursor={first['next_cursor']}").get_json()
+        assert len(rest['players']) == 1 and rest['next_cursor'] is None
+    finally:
+        for number in range(3):
+            app_module.presence.leave(f'test-sid-{number}')
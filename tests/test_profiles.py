@@ -0,0 +1,67 @@
+import threading
+
+import pytest
+
+from profiles import ProfileStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ProfileStore(f"sqlite:///{tmp_path / 'profiles.db'}", max_profiles=2)
+    yield store
+    store.close()
+
+
+def test_profiles_survive_eviction_and_restart(store, tmp_path):
+    assert store.record('machine_1', 'play', 'Alpha')
+    assert not store.record('machine_1', 'play', 'Alpha')
+    assert store.record_many('machine_1', [('like', 'Beta'), ('favorite', 'Alpha'), ('like', 'Beta')]) == 2
+    for number in range(2, 5):
+        store.record(f'machine_{number}', 'play', 'Gamma')  # pushes machine_1 out of the LRU
+    assert 'machine_1' not in store._profiles
+    assert store.get('machine_1') == {'played': ['Alpha'], 'likes': ['Beta'], 'favorites': ['Alpha']}
+
+    store.flush()
+    restarted = ProfileStore(f"sqlite:///{tmp_path / 'profiles.db'}")
+    assert restarted.get('machine_1') == {'played': ['Alpha'], 'likes': ['Beta'], 'favorites': ['Alpha']}
+    assert restarted.has('machine_4', 'play', 'Gamma') and not restarted.has('machine_4', 'like', 'Gamma')
+    assert restarted.get('machine_9') == {'played': [], 'likes': [], 'favorites': []}
+    assert restarted.highest_machine_number() == 4
+
+
+def test_database_reads_do_not_hold_the_lock(store, monkeypatch):
+    store.record('machine_slow', 'play', 'Alpha')
+    store.flush()
+    store._profiles.clear()
+
+    load = store._load
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow_load(machine_id):
+        calls.append(machine_id)
+        started.set()
+        assert release.wait(5)
+        return load(machine_id)
+
+    monkeypatch.setattr(store, '_load', slow_load)
+    readers = [threading.Thread(target=store.record, args=('machine_slow', 'like', 'Beta')) for _ in range(3)]
+    for reader in readers:
+        reader.start()
+    assert started.wait(5)
+    # Other machines and game IDs go ahead while the row is being read
+    monkeypatch.setattr(store, '_load', load)
+    assert store.record('machine_fast', 'play', 'Gamma')
+    release.set()
+    for reader in readers:
+        reader.join(5)
+    assert calls == ['machine_slow']  # the waiting threads used the loaded profile
+    assert store.get('machine_slow') == {'played': ['Alpha'], 'likes': ['Beta'], 'favorites': []}
+
+
+def test_game_ids_are_shared_between_stores(tmp_path):
+    url = f"sqlite:///{tmp_path / 'profiles.db'}"
+    first, second = ProfileStore(url), ProfileStore(url)
+    assert first.game_id('Alpha') == 0
+    assert second.game_id('Beta') == 1  # first's row is seen once the INSERT of ID 0 fails
+    assert first.game_id('Beta') == 1 and second.game_id('Alpha') == 0
@@ -0,0 +1,49 @@
+import json
+import base64
+
+import pytest
+
+from catalog import GameCatalog
+from search import SearchIndex, decode_cursor, encode_cursor
+
+
+def cursor(*parts):
+    return base64.urlsafe_b64encode(json.dumps(list(parts)).encode()).decode().rstrip('=')
+
+
+@pytest.fixture
+def index(tmp_path):
+    path = tmp_path / 'games.json'
+    path.write_text(json.dumps({'games': {f'Game {i}': {'Plays': i, 'Likes': 0, 'Favorites': 0, 'Tags': []}
+                                          for i in range(10)}}))
+    return SearchIndex(GameCatalog(str(path)))
+
+
+def test_cursor_round_trip(index):
+    names, total, next_cursor = index.search(sort='plays', limit=4)
+    assert total == 10 and names == ['Game 9', 'Game 8', 'Game 7', 'Game 6']
+    assert index.search(sort='plays', limit=4, cursor=next_cursor)[0] == ['Game 5', 'Game 4', 'Game 3', 'Game 2']
+    names, _, next_cursor = index.search(sort='name', limit=3)
+    assert index.search(sort='name', limit=3, cursor=next_cursor)[0] == ['Game 3', 'Game 4', 'Game 5']
+    assert decode_cursor(encode_cursor('name', ('game 1', 'Game 1')), 'name') == ('game 1', 'Game 1')
+
+
+@pytest.mark.parametrize('sort, value', [
+    ('plays', ['plays', 'x', 'y']),
+    ('plays', ['plays', -3, 4]),
+    ('plays', ['plays', True, 'Game 1']),
+    ('plays', ['plays', 1.5, 'Game 1']),
+    ('name', ['name', 3, 'Game 1']),
+    ('name', ['name', None, 'Game 1']),
+    ('plays', ['likes', -3, 'Game 1']),
+    ('plays', ['plays', -3]),
+])
+def test_malformed_cursor_is_value_error(index, sort, value):
+    with pytest.raises(ValueError):
+        index.search(sort=sort, cursor=cursor(*value))
+
+
+def test_garbage_cursor_is_value_error(index):
+    for bad in ('!!!', 'bm90IGpzb24', cursor({'a': 1})):
+        with pytest.raises(ValueError):
+            index.search(cursor=bad)
@@ -0,0 +1,160 @@
+import sys
+import json
+import threading
+
+import pytest
+from flask import Flask, request
+from werkzeug.test import Client
+
+import subservers
+from subservers import SubServerRegistry, SubServerDispatcher
+
+ECHO_SERVER = '''
+from flask import Flask, request
+
+from .helper import GREETING
+
+app = Flask(__name__)
+
+
+@app.route('/')
+def index():
+    return f'{GREETING} {request.script_root}'
+
+
+@app.route('/items/<int:item>', methods=['POST'])
+def item(item):
+    return {'item': item, 'path': request.path, 'script_root': request.script_root}
+'''
+
+
+@pytest.fixture
+def servers(tmp_path):
+    """A servers/ directory; sub-server packages it loads are dropped afterwards"""
+    yield tmp_path
+    for name in [name for name in sys.modules if name.startswith('server_sub')]:
+        del sys.modules[name]
+
+
+def add_server(root, name, files):
+    directory = root / name
+    directory.mkdir()
+    for file_name, text in files.items():
+        (directory / file_name).write_text(text)
+
+
+def write_manifest(root, manifest):
+    (root / subservers.MANIFEST_NAME).write_text(json.dumps(manifest))
+
+
+def main_app():
+    app = Flask('main')
+    app.add_url_rule('/', 'index', lambda: 'portal')
+    return app
+
+
+def test_manifest_discovery(servers):
+    add_server(servers, 'subecho', {'server.py': ECHO_SERVER, 'helper.py': 'GREETING = "hi"\n'})
+    add_server(servers, 'subnode', {'server.js': ''})
+    add_server(servers, 'subguess', {'main.py': 'app = None\n'})
+    add_server(servers, 'subunlisted', {'main.py': ''})
+    write_manifest(servers, {
+        'subecho': {'kind': 'python', 'entry': 'server.py', 'prefix': '/games/echo', 'preload': True},
+        'subnode': {},
+        'subguess': None,
+        'subgone': {'kind': 'python'},
+    })
+    registry = SubServerRegistry(str(servers))
+    found = registry.discover()
+    assert sorted(found) == ['subecho', 'subguess', 'subnode']  # subgone has no main.py
+    assert (found['subecho'].kind, found['subecho'].prefix, found['subecho'].preload) == ('python', '/games/echo', True)
+    assert (found['subnode'].kind, found['subnode'].prefix) == ('node', '/other/subnode')
+    assert found['subguess'].kind == 'python' and not found['subguess'].preload
+
+    assert registry.match('/games/echo/items/1') == (found['subecho'], '/items/1')
+    assert registry.match('/games/echo') == (found['subecho'], '')
+    assert registry.match('/games/echoes') == (None, None)
+
+
+def test_directory_scan_without_manifest(servers):
+    add_server(servers, 'subpy', {'main.py': ''})
+    add_server(servers, 'subjs', {'server.js': ''})
+    add_server(servers, 'subempty', {'README': ''})
+    found = SubServerRegistry(str(servers)).discover()
+    assert {name: server.kind for name, server in found.items()} == {'subjs': 'node', 'subpy': 'python'}
+
+
+def test_servers_load_lazily_and_dispatch(servers):
+    add_server(servers, 'subecho', {'server.py': ECHO_SERVER, 'helper.py': 'GREETING = "hi"\n'})
+    add_server(servers, 'subidle', {'main.py': 'raise RuntimeError("imported")\n'})
+    write_manifest(servers, {'subecho': {'entry': 'server.py'}, 'subidle': {}})
+    registry = SubServerRegistry(str(servers))
+    registry.discover()
+    app = main_app()
+    app.wsgi_app = SubServerDispatcher(app.wsgi_app, registry)
+    client = Client(app)
+
+    assert 'server_subecho' not in sys.modules
+    assert client.get('/').get_data(as_text=True) == 'portal'
+    assert 'server_subecho' not in sys.modules  # the portal's own routes load nothing
+
+    assert client.get('/other/subecho/').get_data(as_text=True) == 'hi /other/subecho'
+    resp = client.post('/other/subecho/items/7')
+    assert resp.get_json() == {'item': 7, 'path': '/items/7', 'script_root': '/other/subecho'}
+    assert client.get('/other/subecho/items/7').status_code == 405  # the sub-app's own routing
+    assert client.get('/other/subecho/nope').status_code == 404
+    assert 'server_subecho.server' in sys.modules and 'server_subidle' not in sys.modules
+
+    stats = registry.stats()['servers']
+    assert stats['subecho']['loaded'] and stats['subecho']['requests'] == 4
+    assert not stats['subidle']['loaded'] and stats['subidle']['requests'] == 0
+
+
+def test_request_counts_are_not_lost(servers):
+    add_server(servers, 'subecho', {'server.py': ECHO_SERVER, 'helper.py': 'GREETING = "hi"\n'})
+    write_manifest(servers, {'subecho': {'entry': 'server.py'}})
+    registry = SubServerRegistry(str(servers))
+    registry.discover()
+    dispatcher = SubServerDispatcher(main_app().wsgi_app, registry)
+
+    def hammer():
+        client = Client(dispatcher)
+        for _ in range(50):
+            client.get('/other/subecho/')
+
+    threads = [threading.Thread(target=hammer) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert registry.servers['subecho'].requests == 400
+
+
+def test_failed_load_is_retried_after_a_backoff(servers, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(subservers.time, 'monotonic', lambda: clock[0])
+    add_server(servers, 'subbroken', {'main.py': 'raise RuntimeError("not yet")\n'})
+    registry = SubServerRegistry(str(servers))
+    registry.discover()
+    client = Client(SubServerDispatcher(main_app().wsgi_app, registry))
+    server = registry.servers['subbroken']
+
+    resp = client.get('/other/subbroken/')
+    assert resp.status_code == 503 and b'subbroken' in resp.data
+    assert server.error == 'RuntimeError: not yet' and server.failures == 1
+
+    (servers / 'subbroken' / 'main.py').write_text('raise RuntimeError("still not")\n')
+    clock[0] += subservers.RETRY_BACKOFF / 2
+    assert client.get('/other/subbroken/').status_code == 503
+    assert server.failures == 1  # still backing off: not imported again
+
+    clock[0] += subservers.RETRY_BACKOFF
+    assert client.get('/other/subbroken/').status_code == 503
+    assert server.failures == 2 and server.error == 'RuntimeError: still not'
+    assert server.retry_at == clock[0] + 2 * subservers.RETRY_BACKOFF  # doubled
+
+    (servers / 'subbroken' / 'main.py').write_text('from flask import Flask\napp = Flask(__name__)\n'
+                                                    'app.add_url_rule("/", "i", lambda: "fixed")\n')
+    clock[0] = server.retry_at
+    assert client.get('/other/subbroken/').get_data(as_text=True) == 'fixed'
+    assert server.error is None and server.stats()['loaded']
@@ -0,0 +1,142 @@
+import io
+import json
+import os
+
+import pytest
+from flask import Flask
+
+import thumbnails
+from assets import IMMUTABLE_CACHE_CONTROL
+from thumbnails import ThumbnailStore
+
+Image = pytest.importorskip('PIL.Image')
+
+SIZES = {'40x30': (40, 30), '80x60': (80, 60)}
+
+
+def png(size=(200, 100), color=(200, 40, 40)):
+    out = io.BytesIO()
+    Image.new('RGB', size, color).save(out, 'PNG')
+    return out.getvalue()
+
+
+class FakeFetch:
+    """Serves generated images by URL; anything else raises like a failed download"""
+
+    def __init__(self, images):
+        self.images = images
+        self.calls = []
+
+    def __call__(self, url):
+        self.calls.append(url)
+        if url not in self.images:
+            raise ValueError('not an image')
+        return self.images[url]
+
+
+@pytest.fixture
+def fetch():
+    return FakeFetch({'https://cdn.example/a.png': png(), 'https://cdn.example/b.png': png(color=(0, 0, 255))})
+
+
+@pytest.fixture
+def store(tmp_path, fetch):
+    store = ThumbnailStore(str(tmp_path), sizes=SIZES, default_size='80x60', workers=1, fetch=fetch)
+    store.start()
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def client(store):
+    app = Flask(__name__)
+
+    @app.route('/thumbs/<name>')
+    def serve(name):
+        return store.send(name)
+
+    return app.test_client()
+
+
+def ingested(store, urls):
+    queued = store.ingest(urls)
+    assert store.wait(timeout=10)
+    return queued
+
+
+def test_variants_and_index_are_written(store, fetch, tmp_path):
+    url = 'https://cdn.example/a.png'
+    assert ingested(store, [url, url, '', 'games/local.png']) == 1
+    digest = store._index[url]
+    for size, (width, height) in SIZES.items():
+        for extension in ('webp', 'png'):
+            with Image.open(tmp_path / digest[:2] / f'{digest}-{size}.{extension}') as image:
+                assert image.size[0] <= width and image.size[1] <= height
+                assert max(image.size[0] / width, image.size[1] / height) == 1  # scaled to fit the box
+    assert json.loads((tmp_path / 'index.json').read_text()) == {url: digest}
+    assert store.version == 1
+
+    # Nothing is fetched again, now or after a restart
+    assert store.ingest([url]) == 0
+    restarted = ThumbnailStore(str(tmp_path), sizes=SIZES, default_size='80x60', fetch=fetch)
+    assert restarted.url_for(url) == f'/thumbs/{digest}-80x60'
+    assert fetch.calls == [url]
+
+
+def test_rewrite_points_at_local_variants(store):
+    url = 'https://cdn.example/b.png'
+    game = {'Thumbnail': url, 'Plays': 3}
+    assert store.rewrite(game) is game
+    ingested(store, [url])
+    digest = store._index[url]
+    assert store.rewrite(game) == {
+        'Thumbnail': f'/thumbs/{digest}-80x60', 'Plays': 3,
+        'Thumbnails': {'40x30': f'/thumbs/{digest}-40x30', '80x60': f'/thumbs/{digest}-80x60'},
+    }
+    assert game == {'Thumbnail': url, 'Plays': 3}
+
+
+def test_send_negotiates_webp(store, client):
+    ingested(store, ['https://cdn.example/a.png'])
+    name = f"{store._index['https://cdn.example/a.png']}-40x30"
+
+    resp = client.get(f'/thumbs/{name}', headers={'Accept': 'image/webp,image/*;q=0.8'})
+    assert resp.status_code == 200 and resp.mimetype == 'image/webp'
+    assert resp.data[8:12] == b'WEBP'
+    assert resp.headers['Cache-Control'] == IMMUTABLE_CACHE_CONTROL
+    assert resp.headers['Vary'] == 'Accept'
+    etag = resp.headers['ETag']
+    assert client.get(f'/thumbs/{name}', headers={'Accept': 'image/webp', 'If-None-Match': etag}).status_code == 304
+
+    for accept in ('image/*', 'image/png', 'image/webp;q=0,*/*'):
+        resp = client.get(f'/thumbs/{name}', headers={'Accept': accept})
+        assert resp.mimetype == 'image/png' and resp.data.startswith(b'\x89PNG'), accept
+
+
+def test_send_404s(store, client):
+    ingested(store, ['https://cdn.example/a.png'])
+    digest = store._index['https://cdn.example/a.png']
+    for name in ('0123456789abcdef-40x30', f'{digest}-999x999', f'{digest}-40x30.png', '../index.json', 'nope'):
+        assert client.get(f'/thumbs/{name}').status_code == 404, name
+
+
+def test_failed_sources_back_off(store, fetch, monkeypatch):
+    url = 'https://cdn.example/missing.png'
+    assert ingested(store, [url]) == 1
+    assert store.url_for(url) is None
+    assert store.ingest([url]) == 0  # within RETRY_AFTER of the failure
+    assert fetch.calls == [url]
+
+    monkeypatch.setattr(thumbnails, 'RETRY_AFTER', 0)
+    fetch.images[url] = png((10, 10))
+    assert ingested(store, [url]) == 1
+    assert store.url_for(url, '40x30') == f'/thumbs/{store._index[url]}-40x30'
+    assert fetch.calls == [url, url]
+
+
+def test_ingest_needs_a_started_store(tmp_path, fetch):
+    store = ThumbnailStore(str(tmp_path), sizes=SIZES, workers=1, fetch=fetch)
+    assert store.ingest(['https://cdn.example/a.png']) == 0
+    assert store.start() is True and store.start() is False
+    store.close()
+    assert fetch.calls == [] and not os.path.exists(tmp_path / 'index.json')
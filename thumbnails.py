@@ -0,0 +1,253 @@
+import os
+import io
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from flask import abort, request, send_file
+
+from assets import IMMUTABLE_CACHE_CONTROL, _write_atomic
+
+try:
+    from PIL import Image
+except ImportError:  # optional: without Pillow the catalog keeps its remote thumbnail URLs
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+THUMBNAILS_DIR = os.path.join('instance', 'thumbs')
+# Variant name -> bounding box; images are scaled down to fit, never up
+THUMBNAIL_SIZES = {
+    '160x120': (160, 120),
+    '320x240': (320, 240),
+    '480x360': (480, 360),
+}
+DEFAULT_SIZE = '320x240'
+# Served format per Accept, in order of preference
+FORMATS = (('image/webp', 'webp'), ('image/png', 'png'))
+
+MAX_SOURCE_BYTES = 10 * 1024 * 1024
+FETCH_TIMEOUT = 10
+RETRY_AFTER = 300  # seconds before a failed source is tried again
+
+_NAME_RE = re.compile(r'^([0-9a-f]{16})-(\d+x\d+)$')
+
+
+def fetch_source(url):
+    """Bytes of a remote image, refusing anything that is not an image or is too large"""
+    with requests.get(url, timeout=FETCH_TIMEOUT, stream=True) as resp:
+        resp.raise_for_status()
+        content_type = resp.headers.get('Content-Type', '')
+        if not content_type.startswith('image/'):
+            raise ValueError(f'not an image: {content_type or "no Content-Type"}')
+        body = bytearray()
+        for chunk in resp.iter_content(64 * 1024):
+            body += chunk
+            if len(body) > MAX_SOURCE_BYTES:
+                raise ValueError(f'larger than {MAX_SOURCE_BYTES} bytes')
+    return bytes(body)
+
+
+class ThumbnailStore:
+    """Local, resized copies of the catalog's remote thumbnails.
+
+    Each source URL is fetched once on a background worker pool; the image
+    is stored content-addressed (first 16 hex digits of its sha256) as WebP
+    and PNG variants for every size in ``sizes``, and an ``index.json``
+    mapping source URLs to hashes lets a restart skip work already done.
+    ``rewrite`` swaps a game's ``Thumbnail`` for ``/thumbs/<hash>-<size>``
+    once its variants exist, and ``send`` serves them with immutable
+    caching. ``version`` goes up whenever a new source becomes ready, so
+    cached catalog bodies know to rebuild.
+    """
+
+    def __init__(self, root=THUMBNAILS_DIR, sizes=None, default_size=DEFAULT_SIZE, workers=2,
+                 fetch=fetch_source, url_prefix='/thumbs/'):
+        self.root = root
+        self.sizes = dict(THUMBNAIL_SIZES if sizes is None else sizes)
+        self.default_size = default_size
+        self.fetch = fetch
+        self.url_prefix = url_prefix
+        self.enabled = Image is not None
+        self.version = 0
+        self._lock = threading.Lock()
+        self._index = {}  # {source URL: content hash}
+        self._pending = set()
+        self._failed = {}  # {source URL: time.monotonic() of the failure}
+        self._executor = None
+        self.workers = workers
+        if not self.enabled:
+            logger.warning("Pillow is not installed; thumbnails are served from their remote URLs")
+            return
+        os.makedirs(root, exist_ok=True)
+        self._load_index()
+
+    # -- storage --------------------------------------------------------
+
+    def _index_path(self):
+        return os.path.join(self.root, 'index.json')
+
+    def _load_index(self):
+        try:
+            with open(self._index_path()) as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.error(f"Error reading thumbnail index, rebuilding it: {e}")
+            return
+        self._index = {url: digest for url, digest in index.items() if self._complete(digest)}
+
+    def _save_index(self):
+        with self._lock:
+            data = json.dumps(self._index, sort_keys=True, indent=1).encode('utf-8')
+        _write_atomic(self._index_path(), data)
+
+    def _path(self, digest, size, extension):
+        return os.path.join(self.root, digest[:2], f'{digest}-{size}.{extension}')
+
+    def _complete(self, digest):
+        return all(os.path.exists(self._path(digest, size, extension))
+                   for size in self.sizes for _, extension in FORMATS)
+
+    # -- ingestion ------------------------------------------------------
+
+    def start(self):
+        """Start the worker pool; returns True only for the call that started it"""
+        if not self.enabled or self.workers <= 0:
+            return False
+        with self._lock:
+            if self._executor is not None:
+                return False
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='thumbnails')
+        return True
+
+    def close(self):
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def ingest(self, urls):
+        """Queue every http(s) URL that has no variants yet; returns the number queued"""
+        if self._executor is None:
+            return 0
+        now = time.monotonic()
+        queued = []
+        with self._lock:
+            for url in dict.fromkeys(urls):
+                if not url or not url.startswith(('http://', 'https://')):
+                    continue
+                if url in self._index or url in self._pending:
+                    continue
+                failed_at = self._failed.get(url)
+                if failed_at is not None and now - failed_at < RETRY_AFTER:
+                    continue
+                self._pending.add(url)
+                queued.append(url)
+        for url in queued:
+            self._executor.submit(self._ingest_one, url)
+        return len(queued)
+
+    def ingest_catalog(self, games):
+        return self.ingest(game.get('Thumbnail', '') for game in games.values())
+
+    def _ingest_one(self, url):
+        try:
+            source = self.fetch(url)
+            digest = hashlib.sha256(source).hexdigest()[:16]
+            if not self._complete(digest):  # another URL may have had the same image
+                self._write_variants(digest, source)
+        except Exception as e:
+            logger.warning(f"Could not build thumbnails for {url}: {e}")
+            with self._lock:
+                self._pending.discard(url)
+                self._failed[url] = time.monotonic()
+            return
+        with self._lock:
+            self._pending.discard(url)
+            self._failed.pop(url, None)
+            self._index[url] = digest
+            self.version += 1
+        self._save_index()
+        logger.debug(f"Thumbnails for {url} stored as {digest}")
+
+    def _write_variants(self, digest, source):
+        with Image.open(io.BytesIO(source)) as image:
+            image.load()
+            has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+            image = image.convert('RGBA' if has_alpha else 'RGB')
+        os.makedirs(os.path.join(self.root, digest[:2]), exist_ok=True)
+        for size, box in self.sizes.items():
+            variant = image.copy()
+            variant.thumbnail(box, Image.LANCZOS)
+            for _, extension in FORMATS:
+                out = io.BytesIO()
+                if extension == 'webp':
+                    variant.save(out, 'WEBP', quality=80, method=4)
+                else:
+                    variant.save(out, 'PNG', optimize=True)
+                _write_atomic(self._path(digest, size, extension), out.getvalue())
+
+    def wait(self, timeout=None):
+        """Block until nothing is queued (for scripts and benchmarks); returns True if idle"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._pending:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    # -- catalog --------------------------------------------------------
+
+    def url_for(self, source_url, size=None):
+        """Local URL of a source's variant, or None while it is not ingested"""
+        digest = self._index.get(source_url)
+        if digest is None:
+            return None
+        return f'{self.url_prefix}{digest}-{size or self.default_size}'
+
+    def rewrite(self, game):
+        """Copy of a catalog entry pointing ``Thumbnail`` at the local default size
+
+        ``Thumbnails`` maps every size to its URL (for ``srcset``). Entries whose
+        thumbnail is not ingested yet are returned unchanged.
+        """
+        digest = self._index.get(game.get('Thumbnail'))
+        if digest is None:
+            return game
+        game = dict(game)
+        game['Thumbnail'] = f'{self.url_prefix}{digest}-{self.default_size}'
+        game['Thumbnails'] = {size: f'{self.url_prefix}{digest}-{size}' for size in self.sizes}
+        return game
+
+    def rewrite_games(self, games):
+        if not self._index:
+            return games
+        return {name: self.rewrite(game) for name, game in games.items()}
+
+    # -- serving --------------------------------------------------------
+
+    def send(self, name):
+        """Flask response for ``<hash>-<size>``: WebP when accepted, PNG otherwise"""
+        match = _NAME_RE.match(name)
+        if match is None or match.group(2) not in self.sizes:
+            abort(404)
+        digest, size = match.groups()
+        # Only clients that name WebP get it; image/* alone does not promise support
+        accepted = {value for value, quality in request.accept_mimetypes if quality > 0}
+        mimetype, extension = next(((mimetype, extension) for mimetype, extension in FORMATS
+                                    if mimetype in accepted), FORMATS[-1])
+        path = self._path(digest, size, extension)
+        if not os.path.isfile(path):
+            abort(404)
+        response = send_file(path, mimetype=mimetype, etag=f'{digest}-{size}-{extension}',
+                             conditional=True, max_age=None)
+        # The name is the content hash, so the bytes behind it never change
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        response.headers['Vary'] = 'Accept'
+        return response